@@ -1,17 +1,19 @@
-import os
 import asyncio
 from typing import Dict, Any, List
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI
 from pydantic import BaseModel
 import httpx
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 import logging
 
 # Load environment variables
 load_dotenv()
 
+# Nạp sau .env: cấu hình model và thử lại đọc từ biến môi trường
+from models import describe as describe_models, invoke
+from resilience import attempts as llm_attempts, http_error
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,13 +21,6 @@ logger = logging.getLogger(__name__)
 # FastAPI app
 app = FastAPI(title="EduBot External Agent", version="1.0.0")
 
-# Initialize LLM
-llm = ChatOpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
-    temperature=0.7
-)
-
 class WebSearchRequest(BaseModel):
     query: str
     num_results: int = 5
@@ -55,9 +50,6 @@ class ExternalResourceResponse(BaseModel):
     status: str
 
 class ExternalAgent:
-    def __init__(self):
-        self.llm = llm
-    
     async def search_educational_content(self, query: str, subject: str = None) -> Dict[str, Any]:
         """Tìm kiếm nội dung giáo dục từ các nguồn bên ngoài"""
         try:
@@ -100,7 +92,7 @@ class ExternalAgent:
             """
             
             messages = [SystemMessage(content=system_prompt)]
-            response = await self.llm.ainvoke(messages)
+            response = await invoke("chat", messages, "wikipedia_summary")
             
             return {
                 "title": query,
@@ -204,7 +196,7 @@ class ExternalAgent:
             """
             
             messages = [SystemMessage(content=system_prompt)]
-            response = await self.llm.ainvoke(messages)
+            response = await invoke("chat", messages, "enrichment")
             
             # Extract sources from search results
             sources = []
@@ -316,7 +308,7 @@ async def web_search(request: WebSearchRequest):
         
     except Exception as e:
         logger.error(f"Error in web search: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise http_error(e)
 
 @app.post("/enrich-content", response_model=ContentEnrichmentResponse)
 async def enrich_content(request: ContentEnrichmentRequest):
@@ -335,7 +327,7 @@ async def enrich_content(request: ContentEnrichmentRequest):
         
     except Exception as e:
         logger.error(f"Error enriching content: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise http_error(e)
 
 @app.post("/get-resources", response_model=ExternalResourceResponse)
 async def get_external_resources(request: ExternalResourceRequest):
@@ -353,11 +345,11 @@ async def get_external_resources(request: ExternalResourceRequest):
         
     except Exception as e:
         logger.error(f"Error getting external resources: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise http_error(e)
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "external_agent"}
+    return {"status": "healthy", "service": "external_agent", "models": describe_models(), "llm_attempts": llm_attempts}
 
 @app.post("/translate")
 async def translate_content(
@@ -379,7 +371,7 @@ async def translate_content(
         """
         
         messages = [SystemMessage(content=system_prompt)]
-        response = await llm.ainvoke(messages)
+        response = await invoke("translation", messages)
         
         return {
             "translated_text": response.content,
@@ -390,7 +382,7 @@ async def translate_content(
         
     except Exception as e:
         logger.error(f"Error translating content: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise http_error(e)
 
 @app.post("/fact-check")
 async def fact_check(content: str, topic: str):
@@ -416,7 +408,7 @@ async def fact_check(content: str, topic: str):
         """
         
         messages = [SystemMessage(content=system_prompt)]
-        response = await llm.ainvoke(messages)
+        response = await invoke("fact_check", messages)
         
         return {
             "fact_check_result": response.content,
@@ -427,7 +419,7 @@ async def fact_check(content: str, topic: str):
         
     except Exception as e:
         logger.error(f"Error fact checking: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise http_error(e)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,11 +1,11 @@
 import os
 import asyncio
 from typing import Dict, Any, List, Optional
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import httpx
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
 from dotenv import load_dotenv
@@ -14,6 +14,10 @@ import logging
 # Load environment variables
 load_dotenv()
 
+# Nạp sau .env: cấu hình model và thử lại đọc từ biến môi trường
+from models import describe as describe_models, invoke
+from resilience import attempts as llm_attempts, http_error, request_deadline
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,12 +25,94 @@ logger = logging.getLogger(__name__)
 # FastAPI app
 app = FastAPI(title="EduBot Main Agent", version="1.0.0")
 
-# Initialize LLM
-llm = ChatOpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
-    temperature=0.7
-)
+# Deadline do backend gửi kèm: số mili giây còn lại của request gốc
+DEADLINE_HEADER = b"x-request-timeout-ms"
+# Giây tối đa cho request không có deadline; 0 để không giới hạn
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "0"))
+
+# Số request bị hủy theo lý do (disconnect, deadline), trả về ở /health
+cancellations: Dict[str, int] = {"disconnect": 0, "deadline": 0}
+
+class DeadlineMiddleware:
+    """
+    Hủy xử lý (kể cả lời gọi LLM đang chạy) khi backend đóng kết nối hoặc hết
+    deadline, để request đã bị bỏ không tiếp tục tốn quota LLM.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        budget = REQUEST_TIMEOUT or None
+        for name, value in scope["headers"]:
+            if name == DEADLINE_HEADER:
+                try:
+                    requested = max(0.0, int(value) / 1000)
+                except ValueError:
+                    break
+                budget = min(budget, requested) if budget else requested
+                break
+
+        # Đọc receive liên tục để thấy http.disconnect; handler nhận message qua hàng đợi
+        messages = asyncio.Queue()
+        disconnected = asyncio.Event()
+        response_started = False
+
+        async def pump():
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    return
+
+        async def queued_receive():
+            message = await messages.get()
+            if message["type"] == "http.disconnect":
+                messages.put_nowait(message)
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        # Task handler chép context lúc tạo: models.invoke đọc deadline để chia thời gian cho chuỗi model
+        token = request_deadline.set(asyncio.get_running_loop().time() + budget) if budget else None
+        try:
+            handler = asyncio.create_task(self.app(scope, queued_receive, tracked_send))
+        finally:
+            if token is not None:
+                request_deadline.reset(token)
+        pumping = asyncio.create_task(pump())
+        watcher = asyncio.create_task(disconnected.wait())
+        try:
+            done, _ = await asyncio.wait(
+                {handler, watcher}, timeout=budget, return_when=asyncio.FIRST_COMPLETED
+            )
+            if handler in done:
+                handler.result()
+                return
+
+            reason = "disconnect" if watcher in done else "deadline"
+            handler.cancel()
+            await asyncio.gather(handler, return_exceptions=True)
+            cancellations[reason] += 1
+            logger.info(f"Cancelled {scope['path']}: {reason}")
+            if reason == "deadline" and not response_started:
+                response = JSONResponse({"detail": "Deadline exceeded"}, status_code=504)
+                await response(scope, queued_receive, send)
+        finally:
+            if not handler.done():
+                handler.cancel()
+            pumping.cancel()
+            watcher.cancel()
+
+app.add_middleware(DeadlineMiddleware)
 
 # Backend API URL
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000/api/v1")
@@ -46,6 +132,15 @@ class LectureGenerationRequest(BaseModel):
     grade: str = None
     requirements: str
     user_preferences: Dict[str, Any] = {}
+    references: List[Dict[str, Any]] = []  # Đoạn trích từ tài liệu của giáo viên
+    course_context: str = None  # Dàn ý khóa học và các bài liên quan (sinh theo khóa học)
+
+class CourseOutlineRequest(BaseModel):
+    title: str
+    subject: str
+    grade: str = None
+    requirements: str
+    lectures: List[Dict[str, Any]]  # [{"title", "description"}]
 
 class SlideGenerationRequest(BaseModel):
     title: str
@@ -64,6 +159,28 @@ class SlideFromLectureRequest(BaseModel):
     include_questions: bool = False
     slide_style: str = "professional"
 
+class SectionRegenerationRequest(BaseModel):
+    lecture_title: str
+    subject: str
+    grade: str = None
+    section_title: str
+    section_content: str
+    outline: List[str] = []  # Tiêu đề các phần của bài giảng
+    previous_context: str = ""  # Cuối phần trước
+    next_context: str = ""  # Đầu phần sau
+    instructions: str = None
+
+class SlideRegenerationRequest(BaseModel):
+    deck_title: str
+    subject: str
+    presentation_type: str = None
+    slide: Dict[str, Any]
+    slide_number: int
+    total_slides: int
+    previous_slide: Dict[str, Any] = None
+    next_slide: Dict[str, Any] = None
+    instructions: str = None
+
 # Agent State
 class AgentState(BaseModel):
     message: str
@@ -78,7 +195,6 @@ class AgentState(BaseModel):
 class EduBotAgent:
     def __init__(self):
         self.backend_url = BACKEND_URL
-        self.llm = llm
         self.graph = self._create_graph()
     
     def _create_graph(self):
@@ -145,7 +261,7 @@ class EduBotAgent:
                 HumanMessage(content=f"Tin nhắn user: {state.message}")
             ]
             
-            response = await self.llm.ainvoke(messages)
+            response = await invoke("intent", messages)
             
             # Parse response (simplified - in real app would use structured output)
             import json
@@ -202,7 +318,7 @@ class EduBotAgent:
                 HumanMessage(content=state.message)
             ]
             
-            response = await self.llm.ainvoke(messages)
+            response = await invoke("chat", messages)
             state.response = response.content
             state.tools_used.append("chat_completion")
             
@@ -257,7 +373,7 @@ class EduBotAgent:
                 HumanMessage(content=f"Yêu cầu: {state.message}")
             ]
             
-            response = await self.llm.ainvoke(messages)
+            response = await invoke("lecture", messages, "lecture_draft")
             
             # Parse and create lecture (simplified)
             import json
@@ -352,7 +468,7 @@ class EduBotAgent:
                 HumanMessage(content=f"Yêu cầu: {state.message}")
             ]
             
-            response = await self.llm.ainvoke(messages)
+            response = await invoke("slides", messages, "slide_draft")
             
             # Parse and create slide
             import json
@@ -415,38 +531,40 @@ class EduBotAgent:
     async def handle_search(self, state: AgentState) -> AgentState:
         """Xử lý tìm kiếm"""
         try:
-            # Search both lectures and slides
+            # Search both lectures and slides (hybrid BM25 + embedding, lọc theo môn/cấp độ)
+            entities = state.entities or {}
+            query = " ".join(
+                part for part in [entities.get("topic"), state.message] if part
+            )
+            payload = {
+                "query": query,
+                "user_id": state.user_id,
+                "subject": entities.get("subject") or None,
+                "grade": entities.get("grade") or None,
+                "limit": 3
+            }
+            
             async with httpx.AsyncClient() as client:
-                # Search lectures
-                lecture_response = await client.post(
-                    f"{self.backend_url}/tools/search-lectures",
-                    json={
-                        "query": state.message,
-                        "user_id": state.user_id,
-                        "limit": 3
-                    }
-                )
-                
-                # Search slides
-                slide_response = await client.post(
-                    f"{self.backend_url}/tools/search-slides",
-                    json={
-                        "query": state.message,
-                        "user_id": state.user_id,
-                        "limit": 3
-                    }
-                )
+                search_response = await client.post(f"{self.backend_url}/tools/hybrid-search", json=payload)
                 
                 lectures = []
                 slides = []
                 
-                if lecture_response.status_code == 200:
-                    lecture_data = lecture_response.json()
-                    lectures = lecture_data.get("lectures", [])
+                if search_response.status_code == 200:
+                    search_data = search_response.json()
+                    lectures = search_data.get("lectures", [])
+                    slides = search_data.get("slides", [])
                 
-                if slide_response.status_code == 200:
-                    slide_data = slide_response.json()
-                    slides = slide_data.get("slides", [])
+                # Bộ lọc trích xuất từ tin nhắn có thể quá chặt: thử lại không lọc
+                if not lectures and not slides and (payload["subject"] or payload["grade"]):
+                    search_response = await client.post(
+                        f"{self.backend_url}/tools/hybrid-search",
+                        json={**payload, "subject": None, "grade": None}
+                    )
+                    if search_response.status_code == 200:
+                        search_data = search_response.json()
+                        lectures = search_data.get("lectures", [])
+                        slides = search_data.get("slides", [])
                 
                 # Format response
                 if lectures or slides:
@@ -520,12 +638,36 @@ async def process_message(request: ProcessRequest):
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "main_agent"}
+    return {"status": "healthy", "service": "main_agent", "cancellations": cancellations, "models": describe_models(), "llm_attempts": llm_attempts}
 
 @app.post("/generate/lecture")
 async def generate_lecture(request: LectureGenerationRequest):
     """Generate lecture content"""
     try:
+        grounding = ""
+        if request.references:
+            reference_text = "\n\n".join(
+                f"[{ref['ref']}] ({ref.get('filename', '')}, trang {ref.get('page') or '?'}): {ref['text']}"
+                for ref in request.references
+            )
+            grounding = f"""
+        Tài liệu tham khảo của giáo viên (trích từ sách giáo khoa):
+        {reference_text}
+        
+        Hãy bám sát nội dung tài liệu trên. Sau mỗi ý lấy từ tài liệu, ghi trích dẫn dạng [số]
+        tương ứng với đoạn trích. Không bịa trích dẫn không có trong danh sách.
+        """
+        
+        course = ""
+        if request.course_context:
+            course = f"""
+        Bài giảng này thuộc một khóa học:
+        {request.course_context}
+        
+        Bám theo vị trí và mục tiêu của bài trong dàn ý, không lặp lại nội dung các bài
+        khác đã dạy; có thể nhắc lại ngắn gọn kiến thức cần dùng từ bài trước.
+        """
+        
         system_prompt = f"""
         Bạn là chuyên gia giáo dục. Hãy tạo một bài giảng chi tiết với các yêu cầu sau:
         
@@ -540,21 +682,81 @@ async def generate_lecture(request: LectureGenerationRequest):
         3. Phương pháp giảng dạy phù hợp
         4. Bài tập và câu hỏi kiểm tra
         5. Tài liệu tham khảo
-        
+        {course}{grounding}
         Hãy viết bài giảng đầy đủ và chuyên nghiệp.
         """
         
         messages = [SystemMessage(content=system_prompt)]
-        response = await llm.ainvoke(messages)
+        response = await invoke("lecture", messages)
+        
+        # Các trích dẫn [n] thực sự xuất hiện trong nội dung
+        import re
+        valid_refs = {ref["ref"] for ref in request.references}
+        citations = sorted({int(n) for n in re.findall(r"\[(\d+)\]", response.content)} & valid_refs)
         
         return {
             "content": response.content,
+            "citations": citations,
             "status": "success"
         }
         
     except Exception as e:
         logger.error(f"Error generating lecture: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise http_error(e)
+
+@app.post("/generate/course-outline")
+async def generate_course_outline(request: CourseOutlineRequest):
+    """Generate a course outline shared by all lectures of the course"""
+    try:
+        import json
+        import re
+
+        lectures = "\n".join(
+            f"{number}. {lecture.get('title', '')}" + (f" - {lecture['description']}" if lecture.get("description") else "")
+            for number, lecture in enumerate(request.lectures, 1)
+        )
+        system_prompt = f"""
+        Bạn là chuyên gia xây dựng chương trình học. Hãy lập dàn ý cho khóa học sau:
+        
+        Khóa học: {request.title}
+        Môn học: {request.subject}
+        Cấp độ: {request.grade or "Không xác định"}
+        Yêu cầu: {request.requirements}
+        Danh sách bài giảng:
+        {lectures}
+        
+        Với mỗi bài (giữ đúng thứ tự và số lượng), nêu mục tiêu học tập và nội dung chính,
+        sao cho các bài nối tiếp nhau, không trùng lặp.
+        
+        Trả về JSON format:
+        {{
+            "summary": "Tổng quan khóa học (2-3 câu)",
+            "lectures": [
+                {{"title": "Tiêu đề bài", "objectives": "Mục tiêu", "summary": "Nội dung chính"}}
+            ]
+        }}
+        """
+        
+        messages = [SystemMessage(content=system_prompt)]
+        response = await invoke("lecture", messages, "course_outline")
+        
+        try:
+            outline = json.loads(response.content)
+        except json.JSONDecodeError:
+            json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
+            if not json_match:
+                raise ValueError("No JSON found in course outline")
+            outline = json.loads(json_match.group(0))
+        
+        return {
+            "summary": outline.get("summary", ""),
+            "lectures": outline.get("lectures", [])[:len(request.lectures)],
+            "status": "success"
+        }
+        
+    except Exception as e:
+        logger.error(f"Error generating course outline: {e}")
+        raise http_error(e)
 
 @app.post("/generate/slide")
 async def generate_slide(request: SlideGenerationRequest):
@@ -588,7 +790,7 @@ async def generate_slide(request: SlideGenerationRequest):
         """
         
         messages = [SystemMessage(content=system_prompt)]
-        response = await llm.ainvoke(messages)
+        response = await invoke("slides", messages, "slide")
         
         # Parse slides (simplified - would need better parsing)
         try:
@@ -625,7 +827,7 @@ async def generate_slide(request: SlideGenerationRequest):
         
     except Exception as e:
         logger.error(f"Error generating slide: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise http_error(e)
 
 @app.post("/generate/slide-from-lecture")
 async def generate_slide_from_lecture(request: SlideFromLectureRequest):
@@ -656,7 +858,7 @@ async def generate_slide_from_lecture(request: SlideFromLectureRequest):
         """
         
         messages = [SystemMessage(content=system_prompt)]
-        response = await llm.ainvoke(messages)
+        response = await invoke("slides", messages, "slide_from_lecture")
         
         # Parse slides
         try:
@@ -692,7 +894,114 @@ async def generate_slide_from_lecture(request: SlideFromLectureRequest):
         
     except Exception as e:
         logger.error(f"Error generating slide from lecture: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise http_error(e)
+
+@app.post("/generate/lecture-section")
+async def generate_lecture_section(request: SectionRegenerationRequest):
+    """Regenerate a single lecture section"""
+    try:
+        outline = "\n".join(f"- {title}" for title in request.outline)
+        system_prompt = f"""
+        Bạn là chuyên gia giáo dục. Hãy viết lại MỘT phần của bài giảng, giữ nguyên vai trò
+        của phần đó trong bài và nối tiếp tự nhiên với các phần xung quanh.
+        
+        Bài giảng: {request.lecture_title}
+        Môn học: {request.subject}
+        Cấp độ: {request.grade or "Không xác định"}
+        Dàn ý bài giảng:
+        {outline}
+        
+        Cuối phần trước:
+        {request.previous_context or "(không có)"}
+        
+        Đầu phần sau:
+        {request.next_context or "(không có)"}
+        
+        Phần cần viết lại: {request.section_title}
+        Nội dung hiện tại:
+        {request.section_content}
+        
+        Yêu cầu: {request.instructions or "Viết lại rõ ràng, đầy đủ và chính xác hơn"}
+        
+        Chỉ trả về nội dung mới của phần này bằng Markdown, giữ nguyên dòng tiêu đề (nếu có),
+        không viết lại các phần khác.
+        """
+        
+        messages = [SystemMessage(content=system_prompt)]
+        response = await invoke("lecture", messages, "lecture_section")
+        
+        return {
+            "content": response.content,
+            "status": "success"
+        }
+        
+    except Exception as e:
+        logger.error(f"Error regenerating lecture section: {e}")
+        raise http_error(e)
+
+@app.post("/generate/slide-item")
+async def generate_slide_item(request: SlideRegenerationRequest):
+    """Regenerate a single slide"""
+    try:
+        import json
+        import re
+
+        def describe(slide: Optional[Dict[str, Any]]) -> str:
+            if not slide:
+                return "(không có)"
+            return f"{slide.get('title', '')}\n{slide.get('content', '')}"
+
+        system_prompt = f"""
+        Bạn là chuyên gia thiết kế slide giáo dục. Hãy viết lại MỘT slide trong bộ slide.
+        
+        Bộ slide: {request.deck_title}
+        Môn học: {request.subject}
+        Loại thuyết trình: {request.presentation_type or "Bài giảng"}
+        Slide số {request.slide_number}/{request.total_slides}
+        
+        Slide trước:
+        {describe(request.previous_slide)}
+        
+        Slide sau:
+        {describe(request.next_slide)}
+        
+        Slide hiện tại (JSON):
+        {json.dumps(request.slide, ensure_ascii=False)}
+        
+        Yêu cầu: {request.instructions or "Viết lại rõ ràng, súc tích hơn"}
+        
+        Trả về DUY NHẤT một object JSON với format:
+        {{
+            "title": "Tiêu đề slide",
+            "content": "Nội dung slide",
+            "slide_type": "title/content/image/conclusion",
+            "notes": "Ghi chú cho giáo viên"
+        }}
+        """
+        
+        messages = [SystemMessage(content=system_prompt)]
+        response = await invoke("slides", messages, "slide_item")
+        
+        response_text = response.content
+        try:
+            slide = json.loads(response_text)
+        except json.JSONDecodeError:
+            # Try to extract JSON object
+            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+            if not json_match:
+                raise ValueError("No JSON found")
+            slide = json.loads(json_match.group(0))
+        if not isinstance(slide, dict) or not slide.get("title"):
+            raise ValueError("Invalid slide JSON")
+        
+        return {
+            "slide": slide,
+            "status": "success"
+        }
+        
+    except Exception as e:
+        logger.error(f"Error regenerating slide: {e}")
+        raise http_error(e)
 
 if __name__ == "__main__":
     import uvicorn
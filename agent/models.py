@@ -0,0 +1,139 @@
+"""
+Chọn model LLM theo tác vụ, kèm chuỗi model dự phòng.
+
+Mỗi tác vụ (intent, chat, lecture, slides, translation, fact_check) có model,
+temperature, max_tokens và timeout riêng. Mặc định tác vụ trên đường nóng
+(intent, chat, translation) dùng model nhanh LLM_FAST_MODEL, tác vụ sinh nội
+dung dùng model mạnh LLM_STRONG_MODEL; cả hai mặc định là OPENAI_MODEL.
+
+Ghi đè từng tác vụ bằng biến môi trường LLM_<TÁC_VỤ>_MODEL, _TEMPERATURE,
+_MAX_TOKENS, _TIMEOUT và _FALLBACKS (danh sách model dự phòng cách nhau bởi dấu
+phẩy; mặc định là model của nhóm còn lại, để trống để không dự phòng). Model
+lỗi sau các lần thử lại (hoặc circuit đang mở) thì chuyển sang model kế tiếp.
+
+Thời gian của một tác vụ bị giới hạn bởi deadline backend gửi kèm
+(X-Request-Timeout-Ms) và LLM_CALL_BUDGET. Model chính được dùng gần hết
+thời gian đó, chỉ chừa LLM_FALLBACK_RESERVE giây cho các model dự phòng;
+phần chừa lại được chia đều cho các model dự phòng chưa thử.
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from langchain_openai import ChatOpenAI
+
+from resilience import ainvoke, record_attempt, remaining
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+FAST_MODEL = os.getenv("LLM_FAST_MODEL", DEFAULT_MODEL)
+STRONG_MODEL = os.getenv("LLM_STRONG_MODEL", DEFAULT_MODEL)
+# Giây tối đa cho một tác vụ (cả chuỗi model); dưới timeout 60s của httpx client ở backend
+LLM_CALL_BUDGET = float(os.getenv("LLM_CALL_BUDGET", "55"))
+# Giây tối thiểu chừa cho các model dự phòng khi model chính bị timeout
+LLM_FALLBACK_RESERVE = float(os.getenv("LLM_FALLBACK_RESERVE", "15"))
+
+
+@dataclass
+class TaskConfig:
+    models: List[str]  # Model chính rồi tới các model dự phòng
+    temperature: float
+    max_tokens: int
+    timeout: float  # Giây tối đa mỗi lần gọi
+
+
+# Tác vụ -> (model, temperature, max_tokens, timeout)
+_DEFAULTS: Dict[str, Tuple[str, float, int, float]] = {
+    "intent": (FAST_MODEL, 0.0, 300, 15.0),  # Trích xuất JSON: cần ổn định
+    "chat": (FAST_MODEL, 0.7, 800, 30.0),
+    "lecture": (STRONG_MODEL, 0.7, 4000, 55.0),
+    "slides": (STRONG_MODEL, 0.5, 3000, 60.0),
+    "translation": (FAST_MODEL, 0.2, 2000, 60.0),
+    "fact_check": (STRONG_MODEL, 0.0, 1500, 60.0),
+}
+
+
+def _task_config(task: str) -> TaskConfig:
+    model, temperature, max_tokens, timeout = _DEFAULTS[task]
+    prefix = f"LLM_{task.upper()}_"
+    model = os.getenv(f"{prefix}MODEL", model)
+    fallbacks = os.getenv(f"{prefix}FALLBACKS")
+    if fallbacks is None:
+        fallback_models = [STRONG_MODEL if model == FAST_MODEL else FAST_MODEL]
+    else:
+        fallback_models = [name.strip() for name in fallbacks.split(",") if name.strip()]
+    return TaskConfig(
+        models=list(dict.fromkeys([model, *fallback_models])),
+        temperature=float(os.getenv(f"{prefix}TEMPERATURE", temperature)),
+        max_tokens=int(os.getenv(f"{prefix}MAX_TOKENS", max_tokens)),
+        timeout=float(os.getenv(f"{prefix}TIMEOUT", timeout))
+    )
+
+
+TASKS: Dict[str, TaskConfig] = {task: _task_config(task) for task in _DEFAULTS}
+
+# Client theo (model, temperature, max_tokens, timeout), dùng chung giữa các tác vụ giống nhau
+_clients: Dict[Tuple[str, float, int, float], ChatOpenAI] = {}
+
+
+def get_llm(model: str, config: TaskConfig) -> ChatOpenAI:
+    key = (model, config.temperature, config.max_tokens, config.timeout)
+    if key not in _clients:
+        _clients[key] = ChatOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            model=model,
+            temperature=config.temperature,
+            max_tokens=config.max_tokens,
+            request_timeout=config.timeout,
+            max_retries=0  # Thử lại trong resilience.ainvoke (có jitter và circuit breaker)
+        )
+    return _clients[key]
+
+
+async def invoke(task: str, messages, label: str = None):
+    """
+    Gọi LLM cho tác vụ, lần lượt theo chuỗi model của tác vụ đó.
+
+    label: tên dùng khi đếm số lần gọi (mặc định là tên tác vụ).
+    Mỗi model được tối đa timeout của tác vụ; model chính không dùng tới
+    LLM_FALLBACK_RESERVE giây cuối, các model dự phòng chia đều thời gian còn lại.
+    """
+    config = TASKS[task]
+    label = label or task
+    loop = asyncio.get_running_loop()
+    budget = remaining()
+    if LLM_CALL_BUDGET > 0:
+        budget = LLM_CALL_BUDGET if budget is None else min(budget, LLM_CALL_BUDGET)
+    ends_at = None if budget is None else loop.time() + budget
+    for index, model in enumerate(config.models):
+        timeout = config.timeout
+        if ends_at is not None:
+            left = max(0.0, ends_at - loop.time())
+            if index == 0 and len(config.models) > 1 and left > LLM_FALLBACK_RESERVE:
+                left -= LLM_FALLBACK_RESERVE
+            elif index > 0:
+                left /= len(config.models) - index
+            timeout = min(timeout, left)
+        try:
+            return await asyncio.wait_for(ainvoke(get_llm(model, config), messages, label), timeout)
+        except Exception as e:
+            if index == len(config.models) - 1:
+                raise
+            record_attempt(label, "fallback")
+            logger.warning(f"LLM task {label} failed on {model} ({str(e) or type(e).__name__}), falling back to {config.models[index + 1]}")
+
+
+def describe() -> Dict[str, Dict]:
+    """Cấu hình model theo tác vụ (trả về ở /health)"""
+    return {
+        task: {
+            "models": config.models,
+            "temperature": config.temperature,
+            "max_tokens": config.max_tokens,
+            "timeout": config.timeout
+        }
+        for task, config in TASKS.items()
+    }
@@ -0,0 +1,163 @@
+"""
+Thử lại có jitter và circuit breaker cho lời gọi LLM của agent.
+
+Lỗi tạm thời của provider (mất kết nối, timeout, 429, 5xx) được thử lại tối đa
+LLM_RETRY_ATTEMPTS lần với backoff ngẫu nhiên; lỗi khác (prompt sai, hết hạn
+mức...) ném ra ngay. Mỗi model có một circuit breaker: sau LLM_CIRCUIT_FAILURES
+lỗi tạm thời liên tiếp, lời gọi tới model đó bị từ chối ngay trong
+LLM_CIRCUIT_RESET_SECONDS giây rồi mới cho một request thử lại.
+
+Endpoint chuyển lỗi thành HTTP bằng http_error: lỗi tạm thời (hoặc circuit đang
+mở) trả 503 kèm Retry-After để backend biết có nên thử lại; lỗi khác trả 500 và
+backend không thử lại.
+"""
+import asyncio
+import logging
+import math
+import os
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+import openai
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+LLM_RETRY_MAX_BACKOFF = float(os.getenv("LLM_RETRY_MAX_BACKOFF", "8"))
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", "5"))
+LLM_CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+
+# Số lần gọi LLM theo tác vụ và kết quả, trả về ở /health
+attempts: Dict[str, Dict[str, int]] = {}
+
+# Thời điểm hết hạn (theo loop.time()) của request đang xử lý, do DeadlineMiddleware đặt
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+def remaining() -> Optional[float]:
+    """Số giây còn lại tới deadline của request hiện tại (None nếu không có deadline)"""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - asyncio.get_running_loop().time())
+
+
+class CircuitOpenError(Exception):
+    """Circuit của model đang mở: không gọi"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after  # Số giây tới khi circuit cho request thử
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Lỗi tạm thời của provider (thử lại được)"""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    def __init__(self):
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self) -> bool:
+        if LLM_CIRCUIT_FAILURES <= 0:
+            return True
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < LLM_CIRCUIT_RESET_SECONDS:
+                return False
+            self.state = "half_open"
+            self.probing = False
+        if self.state == "half_open":
+            if self.probing:
+                return False
+            self.probing = True
+        return True
+
+    def retry_after(self) -> float:
+        """Số giây còn lại trước khi circuit mở cho request thử"""
+        if self.state != "open":
+            return 1.0
+        return max(1.0, LLM_CIRCUIT_RESET_SECONDS - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= LLM_CIRCUIT_FAILURES > 0:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+
+breakers: Dict[str, CircuitBreaker] = {}
+
+
+def record_attempt(task: str, outcome: str):
+    counts = attempts.setdefault(task, {})
+    counts[outcome] = counts.get(outcome, 0) + 1
+
+
+async def ainvoke(llm, messages, task: str) -> Any:
+    """Gọi llm.ainvoke(messages) với thử lại và circuit breaker theo model"""
+    model = getattr(llm, "model_name", "llm")
+    breaker = breakers.setdefault(model, CircuitBreaker())
+    max_attempts = max(1, LLM_RETRY_ATTEMPTS)
+
+    for attempt in range(max_attempts):
+        if not breaker.allow():
+            record_attempt(task, "rejected")
+            raise CircuitOpenError(f"Model {model} tạm ngưng do lỗi liên tiếp", breaker.retry_after())
+        try:
+            response = await llm.ainvoke(messages)
+        except asyncio.CancelledError:
+            breaker.probing = False
+            record_attempt(task, "cancelled")
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                breaker.probing = False
+                record_attempt(task, "error")
+                raise
+            breaker.record_failure()
+            record_attempt(task, "retryable_error")
+            if attempt == max_attempts - 1:
+                raise
+            delay = random.uniform(0, min(LLM_RETRY_MAX_BACKOFF, LLM_RETRY_BACKOFF * 2 ** attempt))
+            logger.warning(f"LLM call {task} ({model}) attempt {attempt + 1} failed: {e}; retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            record_attempt(task, "success")
+            return response
+
+
+def http_error(error: Exception) -> HTTPException:
+    """
+    Lỗi trả về cho backend: 503 kèm Retry-After nếu lỗi tạm thời (backend thử lại
+    được), 500 nếu lỗi cố định (thử lại cũng không khỏi).
+    """
+    if isinstance(error, HTTPException):
+        return error
+    if isinstance(error, CircuitOpenError):
+        retry_after = error.retry_after
+    elif is_retryable(error):
+        retry_after = 1.0
+    else:
+        return HTTPException(status_code=500, detail=str(error))
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(int(math.ceil(retry_after)))}
+    )
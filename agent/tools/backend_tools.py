@@ -64,6 +64,33 @@ class BackendTools:
             logger.error(f"Error searching lectures: {e}")
             return {"success": False, "error": str(e)}
     
+    async def hybrid_search(self,
+                            query: str,
+                            user_id: Optional[str] = None,
+                            subject: Optional[str] = None,
+                            grade: Optional[str] = None,
+                            content_types: Optional[List[str]] = None,
+                            limit: int = 5) -> Dict[str, Any]:
+        """Tìm kiếm bài giảng và slides theo độ liên quan"""
+        try:
+            async with httpx.AsyncClient() as client:
+                response = await client.post(
+                    f"{self.backend_url}/tools/hybrid-search",
+                    json={
+                        "query": query,
+                        "user_id": user_id,
+                        "subject": subject,
+                        "grade": grade,
+                        "content_types": content_types or ["lectures", "slides"],
+                        "limit": limit
+                    }
+                )
+                response.raise_for_status()
+                return response.json()
+        except Exception as e:
+            logger.error(f"Error in hybrid search: {e}")
+            return {"success": False, "error": str(e)}
+    
     async def get_lecture_content(self, lecture_id: str) -> Dict[str, Any]:
         """Lấy nội dung bài giảng"""
         try:
@@ -1,11 +1,16 @@
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import chat, lectures, slides, tools
+from app.api.v1.endpoints import chat, lectures, courses, slides, tools, documents, notifications, admin, bulk
 
 api_router = APIRouter()
 
 # Include các endpoint routers
 api_router.include_router(chat.router, prefix="/chat", tags=["chat"])
 api_router.include_router(lectures.router, prefix="/lectures", tags=["lectures"])
+api_router.include_router(courses.router, prefix="/courses", tags=["courses"])
 api_router.include_router(slides.router, prefix="/slides", tags=["slides"])
 api_router.include_router(tools.router, prefix="/tools", tags=["tools"])
+api_router.include_router(documents.router, prefix="/documents", tags=["documents"])
+api_router.include_router(notifications.router, prefix="/notifications", tags=["notifications"])
+api_router.include_router(bulk.router, prefix="/bulk", tags=["bulk"])
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Query
+import logging
+
+from app.core.config import settings
+from app.db.profiler import query_profiler
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=1000, description="Số truy vấn muốn lấy"),
+    order: str = Query("duration", pattern="^(duration|recent)$", description="Sắp xếp: duration (chậm nhất trước) hoặc recent")
+):
+    """
+    Truy vấn MongoDB chậm gần đây (filter đã che giá trị) kèm kế hoạch explain
+    nếu vượt PROFILER_EXPLAIN_MS, thống kê theo loại lệnh/collection và tình
+    trạng connection pool.
+    """
+    return {
+        "slow_threshold_ms": settings.PROFILER_SLOW_MS,
+        "explain_threshold_ms": settings.PROFILER_EXPLAIN_MS,
+        "queries": query_profiler.slow_queries(limit, order),
+        "commands": query_profiler.command_stats(),
+        "pool": query_profiler.pool_monitor.stats()
+    }
+
+@router.delete("/slow-queries")
+async def reset_slow_queries():
+    """Xóa danh sách truy vấn chậm và thống kê (histogram trên /metrics giữ nguyên)"""
+    query_profiler.reset()
+    return {"message": "Đã xóa danh sách truy vấn chậm"}
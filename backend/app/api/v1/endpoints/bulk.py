@@ -0,0 +1,88 @@
+from typing import Optional
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+import logging
+import secrets
+
+from app.core.config import settings
+from app.services.transfer_service import transfer_service, iter_lines, BulkImportError, EXPORT_KINDS
+
+logger = logging.getLogger(__name__)
+
+
+async def require_admin(x_admin_key: Optional[str] = Header(None)):
+    """Xuất/nhập đọc và ghi đè dữ liệu của mọi user: chỉ cho phép khi có ADMIN_API_KEY"""
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Xuất/nhập hàng loạt chưa được bật (ADMIN_API_KEY)")
+    if not x_admin_key or not secrets.compare_digest(x_admin_key, settings.ADMIN_API_KEY):
+        raise HTTPException(status_code=401, detail="Sai hoặc thiếu X-Admin-Key")
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.get("/export")
+async def export_documents(
+    kinds: str = Query(",".join(EXPORT_KINDS), description="Loại dữ liệu: lectures,slides,chats"),
+    user_id: Optional[str] = Query(None, description="Chỉ xuất dữ liệu của user này"),
+    resume_after: Optional[str] = Query(None, description="Xuất tiếp sau bản ghi <kind>:<id> (lần trước bị ngắt)"),
+    format: str = Query("ndjson", pattern="^(ndjson|zstd)$", description="ndjson hoặc zstd (file .ndjson.zst)")
+):
+    """
+    Xuất bài giảng, slide và chat dạng NDJSON (MongoDB Extended JSON), đọc theo
+    cursor nên bộ nhớ không phụ thuộc số lượng tài liệu.
+
+    Mỗi dòng là {"type": ..., "data": document}; chat gồm dòng chat_session
+    và các dòng chat_message của nó (kể cả tin nhắn đã lưu trữ). Nếu tải bị
+    ngắt, gọi lại với resume_after=<kind>:<_id của dòng lecture/slide/chat_session cuối cùng>.
+    """
+    selected = [kind.strip() for kind in kinds.split(",") if kind.strip()]
+    compress = format == "zstd"
+    try:
+        stream = transfer_service.export_stream(selected, user_id, resume_after, compress=compress)
+        # Kiểm tra tham số trước khi gửi header 200
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = b""
+    except BulkImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error exporting documents: {e}")
+        raise HTTPException(status_code=500, detail="Không thể xuất dữ liệu")
+
+    async def body():
+        if first:
+            yield first
+        async for chunk in stream:
+            yield chunk
+
+    filename = f"edubot-export-{datetime.utcnow():%Y%m%d-%H%M%S}.ndjson" + (".zst" if compress else "")
+    return StreamingResponse(
+        body(),
+        media_type="application/zstd" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/import")
+async def import_documents(
+    request: Request,
+    mode: str = Query("upsert", pattern="^(insert|upsert)$", description="insert: bỏ qua _id đã có; upsert: ghi đè theo _id"),
+    ordered: bool = Query(False, description="Ghi theo thứ tự trong mỗi lô"),
+    batch_size: int = Query(1000, ge=1, le=10000, description="Số bản ghi mỗi lần bulk_write"),
+    skip: int = Query(0, ge=0, description="Bỏ qua số dòng đầu (checkpoint của lần import trước)")
+):
+    """
+    Nhập file NDJSON (định dạng của /bulk/export) gửi trong body, có thể nén
+    (Content-Encoding: zstd hoặc gzip). Mỗi dòng được kiểm tra theo model,
+    dòng lỗi được ghi vào báo cáo. Báo cáo trả về checkpoint: nếu bị ngắt,
+    gửi lại file với skip=checkpoint. File rất lớn nên dùng
+    `python -m scripts.bulk_import` để xem tiến độ.
+    """
+    try:
+        lines = iter_lines(request.stream(), request.headers.get("content-encoding"))
+        return await transfer_service.import_lines(lines, mode=mode, ordered=ordered, batch_size=batch_size, skip=skip)
+    except BulkImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error importing documents: {e}")
+        raise HTTPException(status_code=500, detail="Không thể nhập dữ liệu")
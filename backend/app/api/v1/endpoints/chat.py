@@ -1,22 +1,35 @@
 from typing import List, Optional
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
 import logging
 
+from app.core.http_cache import document_etag, if_match_versions
 from app.models.chat import ChatMessageRequest, ChatMessageResponse, ChatHistoryResponse, ChatSessionResponse
-from app.services.chat_service import chat_service
+from app.services.chat_service import chat_service, ChatSessionConflictError
+from app.api.v1.idempotency import run_idempotent
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 @router.post("/message", response_model=ChatMessageResponse)
-async def send_message(request: ChatMessageRequest):
+async def send_message(
+    request: ChatMessageRequest,
+    http_request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, description="Gửi lại cùng khóa khi thử lại để không gọi agent lần nữa")
+):
     """
     Gửi tin nhắn chat và nhận phản hồi từ AI
+
+    Có Idempotency-Key: request lặp lại nhận đúng phản hồi của lần đầu (chờ nếu
+    lần đầu vẫn đang xử lý) thay vì lưu và gửi tin nhắn thêm một lần.
     """
     try:
-        response = await chat_service.process_message(request)
-        return response
+        return await run_idempotent(
+            http_request, response, idempotency_key, "chat.message", request, lambda: chat_service.process_message(request)
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in send_message: {e}")
         raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi xử lý tin nhắn")
@@ -45,16 +58,20 @@ async def create_chat_session(user_id: Optional[str] = "anonymous"):
 @router.get("/history/{session_id}", response_model=ChatHistoryResponse)
 async def get_chat_history(
     session_id: str,
+    response: Response,
     limit: int = Query(50, ge=1, le=100, description="Số lượng tin nhắn muốn lấy")
 ):
     """
     Lấy lịch sử chat của một session
+
+    ETag của response dùng cho If-Match khi xóa session.
     """
     try:
         # Kiểm tra session tồn tại
         session = await chat_service.get_session(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Không tìm thấy session")
+        response.headers["ETag"] = document_etag(session_id, session.get("updated_at"))
         
         messages = await chat_service.get_chat_history(session_id, limit)
         
@@ -82,6 +99,9 @@ async def get_chat_sessions(
         db = await get_database()
         pipeline = [
             {"$match": {"status": {"$ne": "deleted"}}},
+            # Sắp xếp và giới hạn trước $lookup: chỉ đếm tin nhắn của các session được trả về
+            {"$sort": {"updated_at": -1}},
+            {"$limit": limit},
             {"$addFields": {"session_id": {"$toString": "$_id"}}},
             {
                 "$lookup": {
@@ -92,8 +112,9 @@ async def get_chat_sessions(
                 }
             },
             {
+                # Tin nhắn đã chuyển vào chat_archives được đếm qua archived_messages
                 "$addFields": {
-                    "message_count": {"$size": "$messages"}
+                    "message_count": {"$add": [{"$size": "$messages"}, {"$ifNull": ["$archived_messages", 0]}]}
                 }
             },
             {
@@ -104,9 +125,7 @@ async def get_chat_sessions(
                     "updated_at": 1,
                     "message_count": 1
                 }
-            },
-            {"$sort": {"updated_at": -1}},
-            {"$limit": limit}
+            }
         ]
 
         results = []
@@ -130,24 +149,24 @@ async def get_chat_sessions(
         raise HTTPException(status_code=500, detail="Không thể lấy danh sách sessions")
 
 @router.delete("/session/{session_id}")
-async def delete_chat_session(session_id: str):
+async def delete_chat_session(
+    session_id: str,
+    if_match: Optional[str] = Header(None, description="ETag từ lịch sử chat đang xem")
+):
     """
     Xóa một session chat (chuyển status thành deleted)
+
+    Gửi If-Match để chỉ xóa khi session không có tin nhắn mới; không khớp -> 412.
     """
     try:
-        # Kiểm tra session tồn tại
-        session = await chat_service.get_session(session_id)
-        if not session:
-            raise HTTPException(status_code=404, detail="Không tìm thấy session")
-        
-        # Xóa session
-        success = await chat_service.delete_session(session_id)
-        
+        success = await chat_service.delete_session(session_id, if_match_versions(if_match, session_id))
         if not success:
-            raise HTTPException(status_code=404, detail="Không thể xóa session")
+            raise HTTPException(status_code=404, detail="Không tìm thấy session")
         
         return {"message": "Session đã được xóa thành công"}
         
+    except ChatSessionConflictError:
+        raise HTTPException(status_code=412, detail="Session đã có thay đổi mới")
     except HTTPException:
         raise
     except Exception as e:
@@ -0,0 +1,102 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+import logging
+
+from app.models.course import (
+    Course,
+    CourseCreateRequest,
+    CourseListResponse,
+    CourseProgress,
+    CourseResponse
+)
+from app.services.course_service import (
+    course_service,
+    summarize_progress,
+    CourseBusyError,
+    CourseNotFoundError,
+    CourseValidationError
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _course_response(course: Course) -> CourseResponse:
+    return CourseResponse(
+        id=str(course.id),
+        title=course.title,
+        subject=course.subject,
+        grade=course.grade,
+        description=course.description,
+        status=course.status,
+        outline=course.outline,
+        items=course.items,
+        progress=CourseProgress(**summarize_progress([item.model_dump() for item in course.items])),
+        created_at=course.created_at,
+        updated_at=course.updated_at
+    )
+
+@router.post("/create", response_model=dict)
+async def create_course(request: CourseCreateRequest, http_request: Request):
+    """
+    Tạo cả khóa học: sinh dàn ý trước, sau đó các bài giảng song song ở nền.
+
+    Trả về ngay course_id và lecture_id của từng bài; theo dõi tiến độ bằng
+    GET /courses/{id}. Mỗi bài đang sinh chiếm một chỗ trong giới hạn số request
+    gọi LLM đang chạy của user (RATE_LIMIT_MAX_INFLIGHT).
+    """
+    try:
+        course_id, lecture_ids = await course_service.create_course(
+            request, getattr(http_request.state, "rate_limit_identity", None)
+        )
+        return {
+            "course_id": course_id,
+            "lecture_ids": lecture_ids,
+            "message": "Khóa học đang được tạo. Các bài giảng sẽ lần lượt hoàn tất.",
+            "status": "generating"
+        }
+    except CourseValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error creating course: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{course_id}", response_model=CourseResponse)
+async def get_course(course_id: str):
+    """
+    Lấy khóa học cùng trạng thái sinh của từng bài giảng
+    """
+    course = await course_service.get_course(course_id)
+    if not course:
+        raise HTTPException(status_code=404, detail="Không tìm thấy khóa học")
+    return _course_response(course)
+
+@router.get("", response_model=CourseListResponse)
+async def get_courses(
+    user_id: Optional[str] = Query(None, description="ID của user"),
+    limit: int = Query(20, ge=1, le=100, description="Số khóa học muốn lấy")
+):
+    """
+    Lấy danh sách khóa học
+    """
+    courses, total_count = await course_service.get_courses(user_id, limit)
+    return CourseListResponse(
+        courses=[_course_response(course) for course in courses],
+        total_count=total_count
+    )
+
+@router.post("/{course_id}/retry")
+async def retry_course(course_id: str):
+    """
+    Sinh lại các bài giảng bị lỗi (và các bài bị chặn vì phụ thuộc bài lỗi)
+    """
+    try:
+        count = await course_service.retry_failed(course_id)
+        return {"message": f"Đang sinh lại {count} bài giảng", "retried": count}
+    except CourseNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except CourseBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error retrying course {course_id}: {e}")
+        raise HTTPException(status_code=500, detail="Không thể sinh lại khóa học")
@@ -0,0 +1,114 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+import logging
+
+from app.core.config import settings
+from app.models.document import Document, DocumentResponse, DocumentListResponse
+from app.services.document_service import (
+    document_service,
+    DocumentTooLargeError,
+    UnsupportedDocumentError
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _document_response(document: Document) -> DocumentResponse:
+    return DocumentResponse(
+        id=str(document.id),
+        filename=document.filename,
+        content_type=document.content_type,
+        sha256=document.sha256,
+        size=document.size,
+        status=document.status,
+        chunk_count=document.chunk_count,
+        error=document.error,
+        created_at=document.created_at,
+        updated_at=document.updated_at
+    )
+
+@router.post("/upload", response_model=DocumentResponse)
+async def upload_document(
+    request: Request,
+    filename: str = Query(..., description="Tên file (.pdf, .docx, .txt, .md)"),
+    user_id: Optional[str] = Query(None, description="ID của user")
+):
+    """
+    Upload tài liệu (sách giáo khoa, giáo trình) để làm căn cứ sinh bài giảng.
+
+    Body là nội dung file (không dùng multipart) để có thể ghi trực tiếp xuống
+    đĩa theo từng chunk.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail="File vượt quá dung lượng cho phép")
+
+    try:
+        document = await document_service.save_upload(
+            request.stream(),
+            filename=filename,
+            content_type=request.headers.get("content-type"),
+            user_id=user_id
+        )
+        document_service.schedule_ingestion(str(document.id))
+        return _document_response(document)
+    except DocumentTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedDocumentError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error uploading document: {e}")
+        raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi upload tài liệu")
+
+@router.get("", response_model=DocumentListResponse)
+async def get_documents(
+    user_id: Optional[str] = Query(None, description="ID của user"),
+    limit: int = Query(50, ge=1, le=100, description="Số tài liệu muốn lấy")
+):
+    """
+    Lấy danh sách tài liệu đã upload
+    """
+    try:
+        documents, total_count = await document_service.get_documents(user_id, limit)
+        return DocumentListResponse(
+            documents=[_document_response(document) for document in documents],
+            total_count=total_count
+        )
+    except Exception as e:
+        logger.error(f"Error getting documents: {e}")
+        raise HTTPException(status_code=500, detail="Không thể lấy danh sách tài liệu")
+
+@router.get("/{document_id}", response_model=DocumentResponse)
+async def get_document(document_id: str):
+    """
+    Lấy thông tin và trạng thái ingestion của tài liệu
+    """
+    document = await document_service.get_document(document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Không tìm thấy tài liệu")
+    return _document_response(document)
+
+@router.post("/{document_id}/ingest")
+async def reingest_document(document_id: str):
+    """
+    Chạy lại ingestion (ví dụ sau khi bị lỗi); tiếp tục từ checkpoint gần nhất
+    """
+    document = await document_service.get_document(document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Không tìm thấy tài liệu")
+    if document.status == "ready":
+        return {"message": "Tài liệu đã sẵn sàng", "status": document.status}
+
+    document_service.schedule_ingestion(document_id)
+    return {"message": "Đang xử lý tài liệu", "status": "ingesting"}
+
+@router.delete("/{document_id}")
+async def delete_document(document_id: str):
+    """
+    Xóa tài liệu
+    """
+    success = await document_service.delete_document(document_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="Không tìm thấy tài liệu")
+    return {"message": "Xóa tài liệu thành công"}
@@ -1,56 +1,99 @@
 from typing import List, Optional
-from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi import APIRouter, Header, HTTPException, Path, Query, Request, Response
 import logging
 
 from app.models.lecture import (
+    Lecture,
     LectureCreateRequest, 
     LectureUpdateRequest, 
     LectureResponse, 
-    LectureListResponse
+    LectureListResponse,
+    LectureSection,
+    LectureSectionListResponse,
+    LectureSectionRegenerateRequest,
+    LectureSectionResponse
 )
-from app.services.lecture_service import lecture_service
+from app.models.version import VersionInfo, VersionListResponse, VersionResponse, VersionRestoreResponse
+from app.core.http_cache import (
+    CACHE_DOCUMENT, CACHE_IMMUTABLE, CACHE_LIST, CACHE_SUGGESTIONS,
+    document_etag, etag_matches, if_match_versions, list_etag, not_modified, set_cache_headers
+)
+from app.core.fast_json import DocumentSerializer, FastJSONResponse
+from app.core.ranges import file_response
+from app.services.export_service import export_service
+from app.api.v1.idempotency import run_idempotent
+from app.services.lecture_service import lecture_service, LectureConflictError, LectureSectionNotFoundError
+from app.services.version_service import version_service, VersionNotFoundError
+from app.services.rendering import FORMATS, TEMPLATES, normalize_format
+from app.services.suggestion_service import suggestion_service
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Document MongoDB -> JSON theo LectureResponse, không dựng model Pydantic
+_lecture_json = DocumentSerializer(LectureResponse, Lecture)
+
+def _created(lecture_id: str) -> dict:
+    return {
+        "lecture_id": lecture_id,
+        "message": "Bài giảng đang được tạo. Vui lòng chờ trong giây lát.",
+        "status": "generating"
+    }
+
 @router.post("/create", response_model=dict)
-async def create_lecture(request: LectureCreateRequest):
+async def create_lecture(
+    request: LectureCreateRequest,
+    http_request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, description="Gửi lại cùng khóa khi thử lại để không sinh trùng")
+):
     """
     Tạo bài giảng mới
+
+    Có Idempotency-Key: request lặp lại trả về kết quả của lần đầu (hoặc 202 với
+    lecture_id nếu lần đầu vẫn đang sinh) thay vì sinh thêm một bài giảng.
     """
+    async def create():
+        return _created(await lecture_service.create_lecture(request))
+
     try:
-        lecture_id = await lecture_service.create_lecture(request)
-        return {
-            "lecture_id": lecture_id,
-            "message": "Bài giảng đang được tạo. Vui lòng chờ trong giây lát.",
-            "status": "generating"
-        }
+        return await run_idempotent(
+            http_request, response, idempotency_key, "lectures.create", request, create, job_response=_created
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating lecture: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{lecture_id}", response_model=LectureResponse)
-async def get_lecture(lecture_id: str):
+async def get_lecture(lecture_id: str, request: Request):
     """
     Lấy chi tiết bài giảng
+
+    Hỗ trợ If-None-Match: trả về 304 nếu bài giảng không đổi kể từ lần đọc
+    trước, chỉ với một truy vấn đọc updated_at.
     """
     try:
-        lecture = await lecture_service.get_lecture(lecture_id)
+        if request.headers.get("if-none-match"):
+            header = await lecture_service.get_lecture_header(lecture_id, use_cache=True)
+            if not header:
+                raise HTTPException(status_code=404, detail="Không tìm thấy bài giảng")
+            etag = document_etag(lecture_id, header.get("updated_at"))
+            if etag_matches(request, etag):
+                return not_modified(etag, CACHE_DOCUMENT)
+        
+        lecture = await lecture_service.get_lecture_document(lecture_id)
         if not lecture:
             raise HTTPException(status_code=404, detail="Không tìm thấy bài giảng")
         
-        return LectureResponse(
-            id=str(lecture.id),
-            title=lecture.title,
-            subject=lecture.subject,
-            grade=lecture.grade,
-            description=lecture.description,
-            requirements=lecture.requirements,
-            content=lecture.content,
-            status=lecture.status,
-            created_at=lecture.created_at,
-            updated_at=lecture.updated_at
+        return FastJSONResponse(
+            _lecture_json(lecture),
+            headers={
+                "ETag": document_etag(lecture_id, lecture.get("updated_at")),
+                "Cache-Control": CACHE_DOCUMENT
+            }
         )
     except HTTPException:
         raise
@@ -60,6 +103,7 @@ async def get_lecture(lecture_id: str):
 
 @router.get("", response_model=LectureListResponse)
 async def get_lectures(
+    request: Request,
     user_id: Optional[str] = Query(None, description="ID của user"),
     page: int = Query(1, ge=1, description="Số trang"),
     per_page: int = Query(20, ge=1, le=50, description="Số bài giảng mỗi trang"),
@@ -69,9 +113,16 @@ async def get_lectures(
     Lấy danh sách bài giảng với phân trang và tìm kiếm
     """
     try:
+        if not search and request.headers.get("if-none-match"):
+            # Kiểm tra ETag chỉ với (id, updated_at) của trang, không tải nội dung
+            headers, total_count = await lecture_service.get_lecture_page_headers(user_id, page, per_page)
+            etag = list_etag(headers, total_count, user_id, page, per_page)
+            if etag_matches(request, etag):
+                return not_modified(etag, CACHE_LIST)
+        
         if search:
             # Tìm kiếm
-            lectures = await lecture_service.search_lectures(search, user_id)
+            lectures = await lecture_service.search_lecture_documents(search, user_id, _lecture_json.projection)
             total_count = len(lectures)
             # Áp dụng phân trang cho kết quả tìm kiếm
             start = (page - 1) * per_page
@@ -79,50 +130,50 @@ async def get_lectures(
             lectures = lectures[start:end]
         else:
             # Lấy danh sách thông thường
-            lectures, total_count = await lecture_service.get_lectures(user_id, page, per_page)
+            lectures, total_count = await lecture_service.get_lecture_documents(user_id, page, per_page, _lecture_json.projection)
         
-        lecture_responses = [
-            LectureResponse(
-                id=str(lecture.id),
-                title=lecture.title,
-                subject=lecture.subject,
-                grade=lecture.grade,
-                description=lecture.description,
-                requirements=lecture.requirements,
-                content=lecture.content,
-                status=lecture.status,
-                created_at=lecture.created_at,
-                updated_at=lecture.updated_at
-            )
-            for lecture in lectures
-        ]
+        etag = list_etag(
+            [(str(lecture["_id"]), lecture.get("updated_at")) for lecture in lectures], total_count,
+            user_id, page, per_page, *([search] if search else [])
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag, CACHE_LIST)
         
-        return LectureListResponse(
-            lectures=lecture_responses,
-            total_count=total_count,
-            page=page,
-            per_page=per_page
+        return FastJSONResponse(
+            {
+                "lectures": [_lecture_json(lecture) for lecture in lectures],
+                "total_count": total_count,
+                "page": page,
+                "per_page": per_page
+            },
+            headers={"ETag": etag, "Cache-Control": CACHE_LIST}
         )
     except Exception as e:
         logger.error(f"Error getting lectures: {e}")
         raise HTTPException(status_code=500, detail="Không thể lấy danh sách bài giảng")
 
 @router.put("/{lecture_id}", response_model=dict)
-async def update_lecture(lecture_id: str, request: LectureUpdateRequest):
+async def update_lecture(
+    lecture_id: str,
+    request: LectureUpdateRequest,
+    response: Response,
+    if_match: Optional[str] = Header(None, description="ETag của phiên bản đang sửa")
+):
     """
     Cập nhật bài giảng
+
+    Gửi If-Match (ETag từ lần đọc trước) để chỉ ghi khi bài giảng chưa bị sửa;
+    không khớp -> 412. Response có ETag của phiên bản mới.
     """
     try:
-        # Kiểm tra bài giảng tồn tại
-        lecture = await lecture_service.get_lecture(lecture_id)
-        if not lecture:
+        updated_at = await lecture_service.update_lecture(lecture_id, request, if_match_versions(if_match, lecture_id))
+        if updated_at is None:
             raise HTTPException(status_code=404, detail="Không tìm thấy bài giảng")
         
-        success = await lecture_service.update_lecture(lecture_id, request)
-        if not success:
-            raise HTTPException(status_code=400, detail="Không thể cập nhật bài giảng")
-        
-        return {"message": "Cập nhật bài giảng thành công"}
+        response.headers["ETag"] = document_etag(lecture_id, updated_at)
+        return {"message": "Cập nhật bài giảng thành công", "updated_at": updated_at}
+    except LectureConflictError:
+        raise HTTPException(status_code=412, detail="Bài giảng đã được chỉnh sửa bởi người khác")
     except HTTPException:
         raise
     except Exception as e:
@@ -130,58 +181,202 @@ async def update_lecture(lecture_id: str, request: LectureUpdateRequest):
         raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi cập nhật bài giảng")
 
 @router.delete("/{lecture_id}")
-async def delete_lecture(lecture_id: str):
+async def delete_lecture(
+    lecture_id: str,
+    if_match: Optional[str] = Header(None, description="ETag của phiên bản đang xem")
+):
     """
     Xóa bài giảng
+
+    Gửi If-Match để chỉ xóa khi bài giảng chưa bị sửa; không khớp -> 412.
     """
     try:
-        # Kiểm tra bài giảng tồn tại
-        lecture = await lecture_service.get_lecture(lecture_id)
-        if not lecture:
+        deleted = await lecture_service.delete_lecture(lecture_id, if_match_versions(if_match, lecture_id))
+        if not deleted:
             raise HTTPException(status_code=404, detail="Không tìm thấy bài giảng")
         
-        success = await lecture_service.delete_lecture(lecture_id)
-        if not success:
-            raise HTTPException(status_code=400, detail="Không thể xóa bài giảng")
-        
         return {"message": "Xóa bài giảng thành công"}
+    except LectureConflictError:
+        raise HTTPException(status_code=412, detail="Bài giảng đã được chỉnh sửa bởi người khác")
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error deleting lecture: {e}")
         raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi xóa bài giảng")
 
+@router.get("/{lecture_id}/sections", response_model=LectureSectionListResponse)
+async def get_lecture_sections(lecture_id: str):
+    """
+    Lấy dàn ý bài giảng (các phần có thể sinh lại riêng)
+    """
+    try:
+        result = await lecture_service.get_sections(lecture_id)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Không tìm thấy bài giảng")
+        
+        sections, updated_at = result
+        return LectureSectionListResponse(
+            lecture_id=lecture_id,
+            sections=[
+                LectureSection(number=i, title=section["title"], content=section["text"])
+                for i, section in enumerate(sections, start=1)
+            ],
+            updated_at=updated_at
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting lecture sections: {e}")
+        raise HTTPException(status_code=500, detail="Không thể lấy dàn ý bài giảng")
+
+@router.post("/{lecture_id}/sections/{section_number}/regenerate", response_model=LectureSectionResponse)
+async def regenerate_lecture_section(
+    lecture_id: str,
+    request: LectureSectionRegenerateRequest,
+    section_number: int = Path(..., ge=1)
+):
+    """
+    Sinh lại một phần của bài giảng.
+
+    Chỉ phần được chọn (cùng dàn ý và đoạn ngắn của phần trước/sau) được gửi
+    cho agent; kết quả được ghép vào đúng vị trí. Trả về 409 nếu bài giảng
+    bị sửa trong lúc sinh.
+    """
+    try:
+        result = await lecture_service.regenerate_section(lecture_id, section_number - 1, request)
+        return LectureSectionResponse(
+            lecture_id=lecture_id,
+            total_sections=result["total_sections"],
+            section=LectureSection(number=section_number, title=result["title"], content=result["content"]),
+            updated_at=result["updated_at"]
+        )
+    except LectureSectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except LectureConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error regenerating lecture section: {e}")
+        raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi sinh lại phần bài giảng")
+
+@router.get("/{lecture_id}/versions", response_model=VersionListResponse)
+async def get_lecture_versions(
+    response: Response,
+    lecture_id: str,
+    page: int = Query(1, ge=1, description="Số trang"),
+    per_page: int = Query(20, ge=1, le=100, description="Số phiên bản mỗi trang")
+):
+    """
+    Lấy lịch sử phiên bản của bài giảng (mới nhất trước)
+    """
+    try:
+        versions, total_count = await version_service.list_versions("lectures", lecture_id, page, per_page)
+        set_cache_headers(response, None, CACHE_LIST)
+        return VersionListResponse(
+            doc_id=lecture_id,
+            versions=[VersionInfo(**version) for version in versions],
+            total_count=total_count,
+            page=page,
+            per_page=per_page
+        )
+    except Exception as e:
+        logger.error(f"Error getting lecture versions: {e}")
+        raise HTTPException(status_code=500, detail="Không thể lấy lịch sử phiên bản")
+
+@router.get("/{lecture_id}/versions/{version}", response_model=VersionResponse)
+async def get_lecture_version(
+    request: Request,
+    response: Response,
+    lecture_id: str,
+    version: int = Path(..., ge=1)
+):
+    """
+    Lấy nội dung bài giảng tại một phiên bản (không đổi, client được cache lâu dài)
+    """
+    try:
+        entry = await version_service.get_version("lectures", lecture_id, version)
+        etag = document_etag(f"{lecture_id}-v{version}", entry["created_at"])
+        if etag_matches(request, etag):
+            return not_modified(etag, CACHE_IMMUTABLE)
+        set_cache_headers(response, etag, CACHE_IMMUTABLE)
+        return VersionResponse(
+            doc_id=lecture_id,
+            version=version,
+            source=entry["source"],
+            created_at=entry["created_at"],
+            content=entry["state"]
+        )
+    except VersionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting lecture version: {e}")
+        raise HTTPException(status_code=500, detail="Không thể lấy phiên bản")
+
+@router.post("/{lecture_id}/versions/{version}/restore", response_model=VersionRestoreResponse)
+async def restore_lecture_version(
+    lecture_id: str,
+    version: int = Path(..., ge=1)
+):
+    """
+    Khôi phục bài giảng về một phiên bản cũ.
+
+    Nội dung khôi phục được lưu thành phiên bản mới nên có thể hoàn tác.
+    """
+    try:
+        result = await lecture_service.restore_version(lecture_id, version)
+        return VersionRestoreResponse(doc_id=lecture_id, **result)
+    except VersionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error restoring lecture version: {e}")
+        raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi khôi phục phiên bản")
+
 @router.get("/{lecture_id}/export")
 async def export_lecture(
+    request: Request,
     lecture_id: str,
-    format: str = Query("pdf", description="Định dạng file: pdf, docx")
+    format: str = Query("pdf", description="Định dạng file: pdf, docx, markdown, html"),
+    template: str = Query("default", description="Mẫu trình bày: default, compact")
 ):
     """
-    Xuất bài giảng ra file
+    Xuất bài giảng ra file.
+
+    File được render một lần cho mỗi phiên bản bài giảng và lưu cache trên
+    đĩa; các lần tải sau chỉ đọc file. Hỗ trợ header Range để tải tiếp.
     """
+    fmt = normalize_format(format)
+    if not fmt:
+        raise HTTPException(status_code=400, detail="Định dạng file không được hỗ trợ")
+    if template not in TEMPLATES:
+        raise HTTPException(status_code=400, detail="Mẫu trình bày không tồn tại")
+    
     try:
-        # Kiểm tra bài giảng tồn tại
-        lecture = await lecture_service.get_lecture(lecture_id)
-        if not lecture:
+        exported = await export_service.export_lecture(lecture_id, fmt, template)
+        if not exported:
             raise HTTPException(status_code=404, detail="Không tìm thấy bài giảng")
         
-        # TODO: Implement file export logic
-        # Hiện tại trả về thông báo placeholder
-        return {
-            "message": "Chức năng xuất file đang được phát triển",
-            "lecture_id": lecture_id,
-            "format": format,
-            "download_url": f"/api/v1/lectures/{lecture_id}/download?format={format}"
-        }
-        
+        path, filename = exported
+        return file_response(request, path, FORMATS[fmt][1], filename)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error exporting lecture: {e}")
         raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi xuất file")
 
+@router.get("/{lecture_id}/download")
+async def download_lecture(
+    request: Request,
+    lecture_id: str,
+    format: str = Query("pdf", description="Định dạng file: pdf, docx, markdown, html"),
+    template: str = Query("default", description="Mẫu trình bày: default, compact")
+):
+    """
+    Tải file bài giảng (tương tự /export)
+    """
+    return await export_lecture(request, lecture_id, format, template)
+
 @router.get("/search/suggestions")
 async def get_search_suggestions(
+    response: Response,
     query: str = Query(..., min_length=2, description="Từ khóa tìm kiếm"),
     user_id: Optional[str] = Query(None, description="ID của user"),
     limit: int = Query(5, ge=1, le=10, description="Số gợi ý")
@@ -189,7 +384,12 @@ async def get_search_suggestions(
     """
     Lấy gợi ý tìm kiếm cho bài giảng
     """
+    set_cache_headers(response, None, CACHE_SUGGESTIONS)
     try:
+        if suggestion_service.ready:
+            return {"suggestions": suggestion_service.suggest("lectures", query, user_id, limit)}
+        
+        # Index gợi ý chưa sẵn sàng: dùng tìm kiếm regex
         lectures = await lecture_service.search_lectures(query, user_id)
         
         # Tạo gợi ý từ kết quả tìm kiếm
@@ -0,0 +1,107 @@
+from typing import Optional, Set
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
+import logging
+
+from app.core.config import settings
+from app.services.notification_service import notification_service, NOTIFY_KINDS
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _parse_kinds(kinds: Optional[str]) -> Set[str]:
+    if not kinds:
+        return set(NOTIFY_KINDS)
+    selected = {kind.strip() for kind in kinds.split(",") if kind.strip()}
+    if not selected or not selected <= set(NOTIFY_KINDS):
+        raise ValueError(f"Unknown kinds: {kinds}")
+    return selected
+
+def _parse_event_id(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+@router.get("/stream")
+async def stream_notifications(
+    request: Request,
+    user_id: Optional[str] = Query(None, description="ID của user"),
+    kinds: Optional[str] = Query(None, description="Loại tài liệu: lectures,slides")
+):
+    """
+    Nhận thay đổi trạng thái bài giảng/slide qua Server-Sent Events.
+
+    Mỗi event có id; EventSource tự gửi Last-Event-ID khi kết nối lại để
+    nhận tiếp các event bị lỡ. Event "reset" nghĩa là client cần tải lại dữ
+    liệu vì có thể đã lỡ thay đổi.
+    """
+    try:
+        selected = _parse_kinds(kinds)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Loại tài liệu không hợp lệ")
+
+    subscriber = notification_service.subscribe(
+        user_id, selected, _parse_event_id(request.headers.get("last-event-id"))
+    )
+
+    async def events():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=settings.NOTIFY_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # Heartbeat giữ kết nối qua proxy và phát hiện client đã ngắt
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            notification_service.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/ws")
+async def notifications_socket(
+    websocket: WebSocket,
+    user_id: Optional[str] = None,
+    kinds: Optional[str] = None,
+    last_event_id: Optional[str] = None
+):
+    """
+    Nhận thay đổi trạng thái bài giảng/slide qua WebSocket (cùng định dạng event với /stream)
+    """
+    try:
+        selected = _parse_kinds(kinds)
+    except ValueError:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    subscriber = notification_service.subscribe(user_id, selected, _parse_event_id(last_event_id))
+
+    async def send():
+        while True:
+            await websocket.send_json(await subscriber.queue.get())
+
+    async def receive():
+        # Client không cần gửi gì; đọc để phát hiện khi kết nối đóng
+        while True:
+            await websocket.receive_text()
+
+    tasks = [asyncio.create_task(send()), asyncio.create_task(receive())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        notification_service.unsubscribe(subscriber)
@@ -1,42 +1,100 @@
 from typing import List, Optional
-from fastapi import APIRouter, HTTPException, Query
+from datetime import datetime
+from fastapi import APIRouter, Header, HTTPException, Path, Query, Request, Response
+from fastapi.responses import JSONResponse
 import logging
 
+from app.core.config import settings
+from app.core.http_cache import (
+    CACHE_DOCUMENT, CACHE_IMMUTABLE, CACHE_LIST, CACHE_SUGGESTIONS,
+    document_etag, etag_matches, if_match_versions, list_etag, not_modified, set_cache_headers
+)
+from app.core.fast_json import DocumentSerializer, FastJSONResponse
+from app.core.ranges import file_response
+
 from app.models.slide import (
+    Slide,
+    SlideContent,
     SlideCreateRequest,
     SlideUpdateRequest,
     SlideFromLectureRequest,
     SlideResponse,
-    SlideListResponse
+    SlideListResponse,
+    SlideExportRequest,
+    SlideExportResponse,
+    SlideItemUpdateRequest,
+    SlideItemInsertRequest,
+    SlideItemMoveRequest,
+    SlideItemRegenerateRequest,
+    SlideItemResponse
 )
-from app.services.slide_service import slide_service
+from app.models.version import VersionInfo, VersionListResponse, VersionResponse, VersionRestoreResponse
+from app.services.export_service import export_service
+from app.api.v1.idempotency import run_idempotent
+from app.services.slide_service import slide_service, SlideConflictError, SlideItemNotFoundError
+from app.services.version_service import version_service, VersionNotFoundError
+from app.services.slide_rendering import SLIDE_FORMATS, SLIDE_TEMPLATES, normalize_slide_template
+from app.services.suggestion_service import suggestion_service
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Document MongoDB -> JSON theo SlideResponse, không dựng model Pydantic
+_slide_json = DocumentSerializer(SlideResponse, Slide, nested={"slides": SlideContent})
+
+# Số giây client nên chờ trước khi hỏi lại file đang render
+_RETRY_AFTER = 2
+
+def _created(slide_id: str) -> dict:
+    return {
+        "slide_id": slide_id,
+        "message": "Slide đang được tạo. Vui lòng chờ trong giây lát.",
+        "status": "generating"
+    }
+
+def _created_from_lecture(slide_id: str) -> dict:
+    return {
+        "slide_id": slide_id,
+        "message": "Slide từ bài giảng đang được tạo. Vui lòng chờ trong giây lát.",
+        "status": "generating"
+    }
+
 @router.post("/create", response_model=dict)
-async def create_slide(request: SlideCreateRequest):
+async def create_slide(
+    request: SlideCreateRequest,
+    http_request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, description="Gửi lại cùng khóa khi thử lại để không sinh trùng")
+):
     """
     Tạo slide thuyết trình mới
     """
+    async def create():
+        return _created(await slide_service.create_slide(request))
+
     try:
-        slide_id = await slide_service.create_slide(request)
-        return {
-            "slide_id": slide_id,
-            "message": "Slide đang được tạo. Vui lòng chờ trong giây lát.",
-            "status": "generating"
-        }
+        return await run_idempotent(
+            http_request, response, idempotency_key, "slides.create", request, create, job_response=_created
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating slide: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/from-lecture/{lecture_id}", response_model=dict)
-async def create_slide_from_lecture(lecture_id: str, options: dict = {}):
+async def create_slide_from_lecture(
+    lecture_id: str,
+    http_request: Request,
+    response: Response,
+    options: dict = {},
+    idempotency_key: Optional[str] = Header(None, description="Gửi lại cùng khóa khi thử lại để không sinh trùng")
+):
     """
     Tạo slide từ bài giảng có sẵn
     """
-    try:
+    async def create():
         request = SlideFromLectureRequest(
             lecture_id=lecture_id,
             include_intro=options.get("include_intro", True),
@@ -45,41 +103,45 @@ async def create_slide_from_lecture(lecture_id: str, options: dict = {}):
             slide_style=options.get("slide_style", "professional"),
             user_id=options.get("user_id")
         )
-        
-        slide_id = await slide_service.create_slide_from_lecture(request)
-        return {
-            "slide_id": slide_id,
-            "message": "Slide từ bài giảng đang được tạo. Vui lòng chờ trong giây lát.",
-            "status": "generating"
-        }
+        return _created_from_lecture(await slide_service.create_slide_from_lecture(request))
+
+    try:
+        return await run_idempotent(
+            http_request, response, idempotency_key, f"slides.from-lecture.{lecture_id}", options, create, job_response=_created_from_lecture
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating slide from lecture: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{slide_id}", response_model=SlideResponse)
-async def get_slide(slide_id: str):
+async def get_slide(slide_id: str, request: Request):
     """
     Lấy chi tiết slide
+
+    Hỗ trợ If-None-Match: trả về 304 nếu slide không đổi kể từ lần đọc
+    trước, chỉ với một truy vấn đọc updated_at.
     """
     try:
-        slide = await slide_service.get_slide(slide_id)
+        if request.headers.get("if-none-match"):
+            header = await slide_service.get_slide_header(slide_id, use_cache=True)
+            if not header:
+                raise HTTPException(status_code=404, detail="Không tìm thấy slide")
+            etag = document_etag(slide_id, header.get("updated_at"))
+            if etag_matches(request, etag):
+                return not_modified(etag, CACHE_DOCUMENT)
+        
+        slide = await slide_service.get_slide_document(slide_id)
         if not slide:
             raise HTTPException(status_code=404, detail="Không tìm thấy slide")
         
-        return SlideResponse(
-            id=str(slide.id),
-            title=slide.title,
-            subject=slide.subject,
-            presentation_type=slide.presentation_type,
-            duration=slide.duration,
-            description=slide.description,
-            requirements=slide.requirements,
-            slides=slide.slides,
-            slide_count=slide.slide_count,
-            status=slide.status,
-            created_at=slide.created_at,
-            updated_at=slide.updated_at,
-            source_lecture_id=slide.source_lecture_id
+        return FastJSONResponse(
+            _slide_json(slide),
+            headers={
+                "ETag": document_etag(slide_id, slide.get("updated_at")),
+                "Cache-Control": CACHE_DOCUMENT
+            }
         )
     except HTTPException:
         raise
@@ -89,6 +151,7 @@ async def get_slide(slide_id: str):
 
 @router.get("", response_model=SlideListResponse)
 async def get_slides(
+    request: Request,
     user_id: Optional[str] = Query(None, description="ID của user"),
     page: int = Query(1, ge=1, description="Số trang"),
     per_page: int = Query(20, ge=1, le=50, description="Số slide mỗi trang"),
@@ -98,9 +161,16 @@ async def get_slides(
     Lấy danh sách slides với phân trang và tìm kiếm
     """
     try:
+        if not search and request.headers.get("if-none-match"):
+            # Kiểm tra ETag chỉ với (id, updated_at) của trang, không tải nội dung
+            headers, total_count = await slide_service.get_slide_page_headers(user_id, page, per_page)
+            etag = list_etag(headers, total_count, user_id, page, per_page)
+            if etag_matches(request, etag):
+                return not_modified(etag, CACHE_LIST)
+        
         if search:
             # Tìm kiếm
-            slides = await slide_service.search_slides(search, user_id)
+            slides = await slide_service.search_slide_documents(search, user_id, _slide_json.projection)
             total_count = len(slides)
             # Áp dụng phân trang cho kết quả tìm kiếm
             start = (page - 1) * per_page
@@ -108,53 +178,50 @@ async def get_slides(
             slides = slides[start:end]
         else:
             # Lấy danh sách thông thường
-            slides, total_count = await slide_service.get_slides(user_id, page, per_page)
+            slides, total_count = await slide_service.get_slide_documents(user_id, page, per_page, _slide_json.projection)
         
-        slide_responses = [
-            SlideResponse(
-                id=str(slide.id),
-                title=slide.title,
-                subject=slide.subject,
-                presentation_type=slide.presentation_type,
-                duration=slide.duration,
-                description=slide.description,
-                requirements=slide.requirements,
-                slides=slide.slides,
-                slide_count=slide.slide_count,
-                status=slide.status,
-                created_at=slide.created_at,
-                updated_at=slide.updated_at,
-                source_lecture_id=slide.source_lecture_id
-            )
-            for slide in slides
-        ]
+        etag = list_etag(
+            [(str(slide["_id"]), slide.get("updated_at")) for slide in slides], total_count,
+            user_id, page, per_page, *([search] if search else [])
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag, CACHE_LIST)
         
-        return SlideListResponse(
-            slides=slide_responses,
-            total_count=total_count,
-            page=page,
-            per_page=per_page
+        return FastJSONResponse(
+            {
+                "slides": [_slide_json(slide) for slide in slides],
+                "total_count": total_count,
+                "page": page,
+                "per_page": per_page
+            },
+            headers={"ETag": etag, "Cache-Control": CACHE_LIST}
         )
     except Exception as e:
         logger.error(f"Error getting slides: {e}")
         raise HTTPException(status_code=500, detail="Không thể lấy danh sách slides")
 
 @router.put("/{slide_id}", response_model=dict)
-async def update_slide(slide_id: str, request: SlideUpdateRequest):
+async def update_slide(
+    slide_id: str,
+    request: SlideUpdateRequest,
+    response: Response,
+    if_match: Optional[str] = Header(None, description="ETag của phiên bản đang sửa")
+):
     """
     Cập nhật slide
+
+    Gửi If-Match (ETag từ lần đọc trước) để chỉ ghi khi slide chưa bị sửa;
+    không khớp -> 412. Response có ETag của phiên bản mới.
     """
     try:
-        # Kiểm tra slide tồn tại
-        slide = await slide_service.get_slide(slide_id)
-        if not slide:
+        updated_at = await slide_service.update_slide(slide_id, request, if_match_versions(if_match, slide_id))
+        if updated_at is None:
             raise HTTPException(status_code=404, detail="Không tìm thấy slide")
         
-        success = await slide_service.update_slide(slide_id, request)
-        if not success:
-            raise HTTPException(status_code=400, detail="Không thể cập nhật slide")
-        
-        return {"message": "Cập nhật slide thành công"}
+        response.headers["ETag"] = document_etag(slide_id, updated_at)
+        return {"message": "Cập nhật slide thành công", "updated_at": updated_at}
+    except SlideConflictError:
+        raise HTTPException(status_code=412, detail="Slide đã được chỉnh sửa bởi người khác")
     except HTTPException:
         raise
     except Exception as e:
@@ -162,76 +229,194 @@ async def update_slide(slide_id: str, request: SlideUpdateRequest):
         raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi cập nhật slide")
 
 @router.delete("/{slide_id}")
-async def delete_slide(slide_id: str):
+async def delete_slide(
+    slide_id: str,
+    if_match: Optional[str] = Header(None, description="ETag của phiên bản đang xem")
+):
     """
     Xóa slide
+
+    Gửi If-Match để chỉ xóa khi slide chưa bị sửa; không khớp -> 412.
     """
     try:
-        # Kiểm tra slide tồn tại
-        slide = await slide_service.get_slide(slide_id)
-        if not slide:
+        deleted = await slide_service.delete_slide(slide_id, if_match_versions(if_match, slide_id))
+        if not deleted:
             raise HTTPException(status_code=404, detail="Không tìm thấy slide")
         
-        success = await slide_service.delete_slide(slide_id)
-        if not success:
-            raise HTTPException(status_code=400, detail="Không thể xóa slide")
-        
         return {"message": "Xóa slide thành công"}
+    except SlideConflictError:
+        raise HTTPException(status_code=412, detail="Slide đã được chỉnh sửa bởi người khác")
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error deleting slide: {e}")
         raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi xóa slide")
 
-@router.get("/{slide_id}/export")
+def _export_request(slide_id: str, format: str, template: str) -> SlideExportRequest:
+    fmt = (format or "").lower().strip()
+    if fmt not in SLIDE_FORMATS:
+        raise HTTPException(status_code=400, detail="Định dạng file không được hỗ trợ")
+    template = normalize_slide_template(template)
+    if template not in SLIDE_TEMPLATES:
+        raise HTTPException(status_code=400, detail="Mẫu slide không tồn tại")
+    return SlideExportRequest(slide_id=slide_id, format=fmt, template=template)
+
+def _export_status(request: SlideExportRequest, ready: bool) -> SlideExportResponse:
+    return SlideExportResponse(
+        slide_id=request.slide_id,
+        format=request.format,
+        template=request.template,
+        status="ready" if ready else "rendering",
+        download_url=f"{settings.API_V1_STR}/slides/{request.slide_id}/download?format={request.format}&template={request.template}"
+    )
+
+@router.get("/{slide_id}/versions", response_model=VersionListResponse)
+async def get_slide_versions(
+    response: Response,
+    slide_id: str,
+    page: int = Query(1, ge=1, description="Số trang"),
+    per_page: int = Query(20, ge=1, le=100, description="Số phiên bản mỗi trang")
+):
+    """
+    Lấy lịch sử phiên bản của slide (mới nhất trước)
+    """
+    try:
+        versions, total_count = await version_service.list_versions("slides", slide_id, page, per_page)
+        set_cache_headers(response, None, CACHE_LIST)
+        return VersionListResponse(
+            doc_id=slide_id,
+            versions=[VersionInfo(**version) for version in versions],
+            total_count=total_count,
+            page=page,
+            per_page=per_page
+        )
+    except Exception as e:
+        logger.error(f"Error getting slide versions: {e}")
+        raise HTTPException(status_code=500, detail="Không thể lấy lịch sử phiên bản")
+
+@router.get("/{slide_id}/versions/{version}", response_model=VersionResponse)
+async def get_slide_version(
+    request: Request,
+    response: Response,
+    slide_id: str,
+    version: int = Path(..., ge=1)
+):
+    """
+    Lấy nội dung slide tại một phiên bản (không đổi, client được cache lâu dài)
+    """
+    try:
+        entry = await version_service.get_version("slides", slide_id, version)
+        etag = document_etag(f"{slide_id}-v{version}", entry["created_at"])
+        if etag_matches(request, etag):
+            return not_modified(etag, CACHE_IMMUTABLE)
+        set_cache_headers(response, etag, CACHE_IMMUTABLE)
+        return VersionResponse(
+            doc_id=slide_id,
+            version=version,
+            source=entry["source"],
+            created_at=entry["created_at"],
+            content=entry["state"]
+        )
+    except VersionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting slide version: {e}")
+        raise HTTPException(status_code=500, detail="Không thể lấy phiên bản")
+
+@router.post("/{slide_id}/versions/{version}/restore", response_model=VersionRestoreResponse)
+async def restore_slide_version(
+    slide_id: str,
+    version: int = Path(..., ge=1)
+):
+    """
+    Khôi phục slide về một phiên bản cũ.
+
+    Nội dung khôi phục được lưu thành phiên bản mới nên có thể hoàn tác.
+    """
+    try:
+        result = await slide_service.restore_version(slide_id, version)
+        return VersionRestoreResponse(doc_id=slide_id, **result)
+    except VersionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error restoring slide version: {e}")
+        raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi khôi phục phiên bản")
+
+@router.get("/{slide_id}/export", response_model=SlideExportResponse)
 async def export_slide(
+    response: Response,
     slide_id: str,
-    format: str = Query("pptx", description="Định dạng file: pptx, pdf")
+    format: str = Query("pptx", description="Định dạng file: pptx, pdf"),
+    template: str = Query("default", description="Mẫu slide: default, creative, minimal")
 ):
     """
-    Xuất slide ra file PowerPoint hoặc PDF
+    Chuẩn bị file PowerPoint hoặc PDF của slide.
+
+    Bộ slide nhỏ được render ngay; bộ slide lớn được render nền và trả về 202
+    với status "rendering" cho tới khi file sẵn sàng tại download_url.
     """
+    export_request = _export_request(slide_id, format, template)
     try:
-        # Kiểm tra slide tồn tại
-        slide = await slide_service.get_slide(slide_id)
-        if not slide:
+        exported = await export_service.export_slides(export_request)
+        if not exported:
             raise HTTPException(status_code=404, detail="Không tìm thấy slide")
         
-        # TODO: Implement file export logic
-        # Hiện tại trả về thông báo placeholder
-        return {
-            "message": "Chức năng xuất file đang được phát triển",
-            "slide_id": slide_id,
-            "format": format,
-            "download_url": f"/api/v1/slides/{slide_id}/download?format={format}"
-        }
-        
+        ready = exported[2]
+        if not ready:
+            response.status_code = 202
+            response.headers["Retry-After"] = str(_RETRY_AFTER)
+        return _export_status(export_request, ready)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error exporting slide: {e}")
         raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi xuất file")
 
+@router.get("/{slide_id}/download")
+async def download_slide(
+    request: Request,
+    slide_id: str,
+    format: str = Query("pptx", description="Định dạng file: pptx, pdf"),
+    template: str = Query("default", description="Mẫu slide: default, creative, minimal")
+):
+    """
+    Tải file slide (hỗ trợ header Range); trả về 202 nếu file đang được render
+    """
+    export_request = _export_request(slide_id, format, template)
+    try:
+        exported = await export_service.export_slides(export_request)
+        if not exported:
+            raise HTTPException(status_code=404, detail="Không tìm thấy slide")
+        
+        path, filename, ready = exported
+        if not ready:
+            return JSONResponse(
+                status_code=202,
+                content=_export_status(export_request, ready).model_dump(),
+                headers={"Retry-After": str(_RETRY_AFTER)}
+            )
+        return file_response(request, path, SLIDE_FORMATS[export_request.format][1], filename)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error downloading slide: {e}")
+        raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi tải file")
+
 @router.get("/{slide_id}/preview")
 async def preview_slide(slide_id: str, slide_number: int = Query(1, ge=1)):
     """
     Xem trước một slide cụ thể
     """
     try:
-        slide = await slide_service.get_slide(slide_id)
-        if not slide:
-            raise HTTPException(status_code=404, detail="Không tìm thấy slide")
-        
-        if not slide.slides or slide_number > len(slide.slides):
+        item = await slide_service.get_slide_item(slide_id, slide_number - 1)
+        if not item:
             raise HTTPException(status_code=404, detail="Không tìm thấy slide số này")
         
-        preview_slide = slide.slides[slide_number - 1]
-        
         return {
             "slide_number": slide_number,
-            "total_slides": len(slide.slides),
-            "slide_content": preview_slide,
-            "slide_title": slide.title
+            "total_slides": item["total_slides"],
+            "slide_content": item["slide"],
+            "slide_title": item["title"]
         }
         
     except HTTPException:
@@ -240,8 +425,140 @@ async def preview_slide(slide_id: str, slide_number: int = Query(1, ge=1)):
         logger.error(f"Error previewing slide: {e}")
         raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi xem trước slide")
 
+@router.get("/{slide_id}/slides/{slide_number}", response_model=SlideItemResponse)
+async def get_slide_item(slide_id: str, slide_number: int = Path(..., ge=1)):
+    """
+    Lấy một slide trong bộ slide (không tải cả bộ)
+    """
+    try:
+        item = await slide_service.get_slide_item(slide_id, slide_number - 1)
+        if not item:
+            raise HTTPException(status_code=404, detail="Không tìm thấy slide số này")
+        
+        return SlideItemResponse(
+            slide_id=slide_id,
+            slide_number=slide_number,
+            total_slides=item["total_slides"],
+            slide=item["slide"],
+            updated_at=item["updated_at"]
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting slide item: {e}")
+        raise HTTPException(status_code=500, detail="Không thể lấy thông tin slide")
+
+@router.patch("/{slide_id}/slides/{slide_number}", response_model=SlideItemResponse)
+async def update_slide_item(slide_id: str, request: SlideItemUpdateRequest, slide_number: int = Path(..., ge=1)):
+    """
+    Cập nhật một slide.
+
+    Gửi kèm updated_at của phiên bản đang sửa để tránh ghi đè thay đổi của
+    người khác (trả về 409 nếu bộ slide đã thay đổi).
+    """
+    try:
+        item = await slide_service.update_slide_item(slide_id, slide_number - 1, request)
+        return SlideItemResponse(
+            slide_id=slide_id,
+            slide_number=slide_number,
+            total_slides=item["total_slides"],
+            slide=item["slide"],
+            updated_at=item["updated_at"]
+        )
+    except SlideItemNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SlideConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error updating slide item: {e}")
+        raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi cập nhật slide")
+
+@router.post("/{slide_id}/slides/{slide_number}/regenerate", response_model=SlideItemResponse)
+async def regenerate_slide_item(slide_id: str, request: SlideItemRegenerateRequest, slide_number: int = Path(..., ge=1)):
+    """
+    Sinh lại nội dung một slide.
+
+    Agent chỉ nhận slide này cùng slide liền trước/sau làm ngữ cảnh; các
+    slide khác giữ nguyên. Trả về 409 nếu bộ slide bị sửa trong lúc sinh.
+    """
+    try:
+        item = await slide_service.regenerate_slide_item(slide_id, slide_number - 1, request)
+        return SlideItemResponse(
+            slide_id=slide_id,
+            slide_number=slide_number,
+            total_slides=item["total_slides"],
+            slide=item["slide"],
+            updated_at=item["updated_at"]
+        )
+    except SlideItemNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SlideConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error regenerating slide item: {e}")
+        raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi sinh lại slide")
+
+@router.post("/{slide_id}/slides", response_model=SlideItemResponse)
+async def insert_slide_item(slide_id: str, request: SlideItemInsertRequest):
+    """
+    Chèn một slide mới vào bộ slide (mặc định thêm vào cuối)
+    """
+    try:
+        slide_number, total_slides, updated_at = await slide_service.insert_slide_item(slide_id, request)
+        return SlideItemResponse(
+            slide_id=slide_id,
+            slide_number=slide_number,
+            total_slides=total_slides,
+            slide=request.slide,
+            updated_at=updated_at
+        )
+    except SlideItemNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SlideConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error inserting slide item: {e}")
+        raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi thêm slide")
+
+@router.delete("/{slide_id}/slides/{slide_number}")
+async def delete_slide_item(
+    slide_id: str,
+    slide_number: int = Path(..., ge=1),
+    updated_at: Optional[datetime] = Query(None, description="Phiên bản đang sửa (optimistic concurrency)")
+):
+    """
+    Xóa một slide khỏi bộ slide
+    """
+    try:
+        new_updated_at = await slide_service.delete_slide_item(slide_id, slide_number - 1, updated_at)
+        return {"message": "Xóa slide thành công", "updated_at": new_updated_at}
+    except SlideItemNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SlideConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error deleting slide item: {e}")
+        raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi xóa slide")
+
+@router.post("/{slide_id}/slides/{slide_number}/move")
+async def move_slide_item(slide_id: str, request: SlideItemMoveRequest, slide_number: int = Path(..., ge=1)):
+    """
+    Di chuyển một slide tới vị trí mới
+    """
+    try:
+        updated_at = await slide_service.move_slide_item(slide_id, slide_number - 1, request)
+        return {"message": "Di chuyển slide thành công", "updated_at": updated_at}
+    except SlideItemNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SlideConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error moving slide item: {e}")
+        raise HTTPException(status_code=500, detail="Có lỗi xảy ra khi di chuyển slide")
+
 @router.get("/search/suggestions")
 async def get_search_suggestions(
+    response: Response,
     query: str = Query(..., min_length=2, description="Từ khóa tìm kiếm"),
     user_id: Optional[str] = Query(None, description="ID của user"),
     limit: int = Query(5, ge=1, le=10, description="Số gợi ý")
@@ -249,7 +566,12 @@ async def get_search_suggestions(
     """
     Lấy gợi ý tìm kiếm cho slides
     """
+    set_cache_headers(response, None, CACHE_SUGGESTIONS)
     try:
+        if suggestion_service.ready:
+            return {"suggestions": suggestion_service.suggest("slides", query, user_id, limit)}
+        
+        # Index gợi ý chưa sẵn sàng: dùng tìm kiếm regex
         slides = await slide_service.search_slides(query, user_id)
         
         # Tạo gợi ý từ kết quả tìm kiếm
@@ -5,6 +5,7 @@ import logging
 from app.services.chat_service import chat_service
 from app.services.lecture_service import lecture_service
 from app.services.slide_service import slide_service
+from app.services.search_service import search_service
 
 logger = logging.getLogger(__name__)
 
@@ -83,6 +84,57 @@ async def search_lectures_tool(
         logger.error(f"Error in search_lectures_tool: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/hybrid-search")
+async def hybrid_search_tool(
+    query: str = Body(...),
+    user_id: Optional[str] = Body(None),
+    subject: Optional[str] = Body(None),
+    grade: Optional[str] = Body(None),
+    content_types: List[str] = Body(["lectures", "slides"]),
+    limit: int = Body(5)
+):
+    """
+    Tool cho agent: Tìm kiếm bài giảng và slides theo độ liên quan (BM25 + embedding)
+    """
+    try:
+        kinds = [kind for kind in content_types if kind in ("lectures", "slides")]
+        if not search_service.ready:
+            # Index chưa build xong: dùng tìm kiếm regex
+            results = {}
+            if "lectures" in kinds:
+                lectures = await lecture_service.search_lectures(query, user_id)
+                results["lectures"] = [
+                    {"id": str(l.id), "title": l.title, "subject": l.subject, "grade": l.grade,
+                     "description": l.description, "status": l.status, "created_at": l.created_at.isoformat()}
+                    for l in lectures[:limit]
+                ]
+            if "slides" in kinds:
+                slides = await slide_service.search_slides(query, user_id)
+                results["slides"] = [
+                    {"id": str(s.id), "title": s.title, "subject": s.subject, "description": s.description,
+                     "slide_count": s.slide_count, "status": s.status, "created_at": s.created_at.isoformat()}
+                    for s in slides[:limit]
+                ]
+        else:
+            results = await search_service.search(
+                query,
+                kinds=kinds,
+                limit=limit,
+                subject=subject,
+                grade=grade,
+                user_id=user_id
+            )
+        
+        return {
+            "success": True,
+            "lectures": results.get("lectures", []),
+            "slides": results.get("slides", []),
+            "count": sum(len(items) for items in results.values())
+        }
+    except Exception as e:
+        logger.error(f"Error in hybrid_search_tool: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/get-lecture-content")
 async def get_lecture_content_tool(lecture_id: str = Body(...)):
     """
@@ -181,7 +233,8 @@ async def create_lecture_draft_tool(
     requirements: str = Body(...),
     user_id: Optional[str] = Body(None),
     grade: Optional[str] = Body(None),
-    description: Optional[str] = Body(None)
+    description: Optional[str] = Body(None),
+    document_ids: Optional[List[str]] = Body(None)
 ):
     """
     Tool cho agent: Tạo draft bài giảng nhanh
@@ -195,7 +248,8 @@ async def create_lecture_draft_tool(
             requirements=requirements,
             user_id=user_id,
             grade=grade,
-            description=description
+            description=description,
+            document_ids=document_ids
         )
         
         lecture_id = await lecture_service.create_lecture(request)
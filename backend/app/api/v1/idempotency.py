@@ -0,0 +1,56 @@
+"""
+Idempotency-Key cho các endpoint tạo (sinh bài giảng/slide, chat).
+
+Gắn khóa với người gọi, đặt header phát lại và chuyển lỗi của
+idempotency_service thành HTTPException ở một chỗ cho mọi endpoint.
+"""
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import HTTPException, Request, Response
+
+from app.core.config import settings
+from app.core.rate_limit import client_identity
+from app.services.idempotency_service import (
+    idempotency_service,
+    IdempotencyInProgressError,
+    IdempotencyKeyError,
+    IdempotencyMismatchError
+)
+
+
+def caller_key(request: Request) -> str:
+    """Người gọi theo rate limiter: user id nếu client gửi, không thì IP"""
+    identity = getattr(request.state, "rate_limit_identity", None)
+    if identity is None:
+        identity = client_identity(request.scope, request.headers, None)
+    return identity.split("|")[-1]
+
+
+async def run_idempotent(
+    request: Request,
+    response: Response,
+    key: Optional[str],
+    scope: str,
+    payload: Any,
+    execute: Callable[[], Awaitable[Any]],
+    job_response: Optional[Callable[[str], Any]] = None
+) -> Any:
+    """
+    Chạy execute() qua idempotency_service; request lặp lại nhận kết quả đã lưu
+    (header Idempotent-Replayed) hoặc 202 với job đang chạy.
+    """
+    try:
+        result, replayed = await idempotency_service.run(
+            key, scope, payload, execute, job_response=job_response, caller=caller_key(request)
+        )
+    except IdempotencyKeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IdempotencyMismatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": str(settings.RATE_LIMIT_BUSY_RETRY_AFTER)})
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+        if replayed == "in_progress":
+            response.status_code = 202
+    return result
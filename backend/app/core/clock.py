@@ -0,0 +1,8 @@
+from datetime import datetime
+
+
+def utcnow_ms() -> datetime:
+    """Thời điểm hiện tại (UTC) cắt tới millisecond"""
+    # MongoDB lưu datetime tới millisecond; cắt bớt để client so sánh updated_at chính xác
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
@@ -0,0 +1,245 @@
+"""
+Nén response theo Accept-Encoding (zstd, br, gzip).
+
+Middleware ASGI thuần: response một phần (JSON) chỉ được nén khi lớn hơn
+ngưỡng; response streaming được nén theo từng chunk và flush ngay nên client
+nhận dữ liệu không bị trễ. SSE (text/event-stream), file nhị phân, 206 và
+response đã có Content-Encoding được gửi nguyên.
+"""
+import zlib
+from typing import Callable, Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli là tùy chọn
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard là tùy chọn
+    zstandard = None
+
+# Loại nội dung dạng text (nén tốt); các loại khác (PDF, PPTX, ảnh) đã nén sẵn
+_COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+# Không nén: client cần nhận từng event ngay và proxy không được buffer
+_EXCLUDED_TYPES = ("text/event-stream",)
+
+
+class _Encoder:
+    """Nén tăng dần: compress() cho từng chunk, flush() đẩy dữ liệu đã nén ra ngay, finish() kết thúc"""
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def flush(self) -> bytes:
+        raise NotImplementedError
+
+    def finish(self) -> bytes:
+        raise NotImplementedError
+
+
+class _GzipEncoder(_Encoder):
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder(_Encoder):
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdEncoder(_Encoder):
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def available_encodings(gzip_level: int, brotli_level: int, zstd_level: int) -> Dict[str, Callable[[], _Encoder]]:
+    """Các encoding hỗ trợ theo thứ tự ưu tiên của server (tỉ lệ nén/tốc độ tốt nhất trước)"""
+    encodings: Dict[str, Callable[[], _Encoder]] = {}
+    if zstandard is not None:
+        encodings["zstd"] = lambda: _ZstdEncoder(zstd_level)
+    if brotli is not None:
+        encodings["br"] = lambda: _BrotliEncoder(brotli_level)
+    encodings["gzip"] = lambda: _GzipEncoder(gzip_level)
+    return encodings
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Accept-Encoding -> {encoding: q}"""
+    accepted = {}
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+def negotiate_encoding(header: Optional[str], supported: List[str]) -> Optional[str]:
+    """Chọn encoding có q cao nhất; bằng nhau thì theo thứ tự ưu tiên của server"""
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in supported:
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _compressible(headers: Headers) -> bool:
+    content_type = headers.get("content-type", "").lower()
+    if content_type.startswith(_EXCLUDED_TYPES):
+        return False
+    return content_type.startswith(_COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_level: int = 4,
+        zstd_level: int = 3
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = available_encodings(gzip_level, brotli_level, zstd_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"), list(self.encodings))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self.encodings[encoding], self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send: Send, encoding: str, encoder_factory: Callable[[], _Encoder], minimum_size: int):
+        self._send = send
+        self._encoding = encoding
+        self._encoder_factory = encoder_factory
+        self._minimum_size = minimum_size
+        self._start: Optional[Message] = None
+        self._encoder: Optional[_Encoder] = None
+        self._passthrough = False
+
+    async def send(self, message: Message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if (
+                message["status"] in (204, 206, 304)
+                or "content-encoding" in headers
+                or "content-range" in headers
+                or not _compressible(headers)
+            ):
+                # Gửi header ngay (SSE cần mở kết nối không chờ event đầu tiên)
+                self._passthrough = True
+                await self._send(message)
+            else:
+                # Chờ chunk body đầu tiên để biết kích thước / có phải streaming không
+                self._start = message
+            return
+        if message_type != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        if self._start is not None:
+            start, self._start = self._start, None
+            await self._begin(start, message)
+            return
+
+        body = self._encoder.compress(message.get("body", b""))
+        more_body = message.get("more_body", False)
+        body += self._encoder.flush() if more_body else self._encoder.finish()
+        await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    async def _begin(self, start: Message, message: Message):
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        content_length = Headers(raw=start["headers"]).get("content-length")
+
+        if (
+            (not more_body and len(body) < self._minimum_size)
+            or (more_body and content_length is not None and int(content_length) < self._minimum_size)
+        ):
+            # Response nhỏ hơn ngưỡng: nén không đáng
+            self._passthrough = True
+            await self._send(start)
+            await self._send(message)
+            return
+
+        self._encoder = self._encoder_factory()
+        compressed = self._encoder.compress(body)
+        compressed += self._encoder.flush() if more_body else self._encoder.finish()
+
+        mutable = MutableHeaders(raw=start["headers"])
+        mutable["Content-Encoding"] = self._encoding
+        mutable.add_vary_header("Accept-Encoding")
+        # Bản nén là một biểu diễn khác: ETag mạnh phải đổi thành ETag yếu
+        etag = mutable.get("etag")
+        if etag and not etag.startswith("W/"):
+            mutable["ETag"] = f"W/{etag}"
+        if more_body:
+            del mutable["content-length"]
+        else:
+            mutable["Content-Length"] = str(len(compressed))
+
+        await self._send(start)
+        await self._send({"type": "http.response.body", "body": compressed, "more_body": more_body})
@@ -6,10 +6,24 @@ import os
 class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     SECRET_KEY: str = "your-secret-key-here-change-in-production"
+    ADMIN_API_KEY: str = ""  # Khóa cho /bulk/* (header X-Admin-Key); để trống thì tắt các API này
     
     # Database
     MONGODB_URL: str = "mongodb://localhost:27017"
     DATABASE_NAME: str = "edubot"
+    MONGODB_MAX_POOL_SIZE: int = 10
+    MONGODB_MIN_POOL_SIZE: int = 10
+    MONGODB_MAX_IDLE_TIME_MS: int = 0  # 0: không đóng connection rảnh
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = 0  # Thời gian chờ connection rảnh trong pool; 0: không giới hạn
+    MONGODB_CONNECT_TIMEOUT_MS: int = 10000
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 30000
+    MONGODB_SOCKET_TIMEOUT_MS: int = 0  # 0: không giới hạn
+    MONGODB_COMPRESSORS: str = "zstd,zlib"  # Nén giao thức; snappy cần gói python-snappy
+    # Read preference theo workload (primary, primaryPreferred, secondary, secondaryPreferred, nearest)
+    MONGODB_READ_PREFERENCE_LIST: str = "secondaryPreferred"  # Danh sách/tìm kiếm theo trang
+    MONGODB_READ_PREFERENCE_SEARCH: str = "secondaryPreferred"  # Nạp/đồng bộ index tìm kiếm
+    MONGODB_READ_PREFERENCE_SUGGEST: str = "secondaryPreferred"  # Nạp index gợi ý
+    MONGODB_MAX_STALENESS_SECONDS: int = 90  # Độ trễ tối đa của secondary được đọc (>= 90); 0: không giới hạn (đồng bộ index vẫn lùi mốc 90 giây)
     
     # CORS
     BACKEND_CORS_ORIGINS: str = "http://localhost:3000,http://127.0.0.1:3000"
@@ -24,7 +38,110 @@ class Settings(BaseSettings):
     
     # File storage
     UPLOAD_DIRECTORY: str = "uploads"
-    MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
+    MAX_UPLOAD_SIZE: int = 200 * 1024 * 1024  # 200MB (sách giáo khoa dạng PDF)
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # 1MB mỗi lần ghi xuống đĩa
+    
+    # Document ingestion (RAG)
+    INGEST_CHUNK_WORDS: int = 220
+    INGEST_CHUNK_OVERLAP: int = 40
+    INGEST_BATCH_SIZE: int = 64  # Số chunk ghi mỗi lần (checkpoint)
+    EMBEDDING_DIM: int = 256
+    RAG_TOP_K: int = 6
+    
+    # Search
+    SEARCH_SYNC_INTERVAL: int = 60  # Giây; 0 để tắt đồng bộ định kỳ
+    SEARCH_REFRESH_DELAY: float = 5.0  # Giây gộp các lần sửa từng slide trước khi cập nhật index
+    INDEX_DIRECTORY: str = "data/indexes"  # Snapshot của index gợi ý
+    SUGGEST_SNAPSHOT_INTERVAL: int = 300  # Giây; 0 để chỉ ghi khi tắt
+    
+    # Export (PDF/DOCX/Markdown/HTML)
+    EXPORT_CACHE_DIRECTORY: str = "data/exports"
+    EXPORT_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024  # 1GB; 0 để không giới hạn
+    EXPORT_WORKERS: int = 2  # Số process render; 0 để render trong thread
+    EXPORT_BACKGROUND_SLIDES: int = 40  # Bộ slide lớn hơn được render nền (trả 202)
+    EXPORT_FONT_DIRECTORY: str = "/usr/share/fonts/truetype/dejavu"  # Font Unicode cho PDF
+    
+    # Lịch sử phiên bản bài giảng/slide
+    VERSION_SNAPSHOT_INTERVAL: int = 20  # Số phiên bản tối đa giữa hai snapshot đầy đủ
+    VERSION_MAX_COUNT: int = 100  # Số phiên bản giữ lại mỗi tài liệu; 0 để không giới hạn
+    VERSION_MAX_AGE_DAYS: int = 180  # Xóa phiên bản cũ hơn (trừ phiên bản mới nhất); 0 để giữ mãi
+    VERSION_RECORD_DELAY: float = 30.0  # Giây gộp các lần sửa từng slide thành một phiên bản
+    
+    # Thông báo thay đổi (SSE/WebSocket)
+    NOTIFY_POLL_INTERVAL: float = 2.0  # Giây; chỉ dùng khi MongoDB không hỗ trợ change stream
+    NOTIFY_QUEUE_SIZE: int = 100  # Số event chờ tối đa mỗi client trước khi gửi "reset"
+    NOTIFY_BUFFER_SIZE: int = 1000  # Số event gần nhất giữ lại cho client kết nối lại
+    NOTIFY_HEARTBEAT: float = 15.0  # Giây giữa các heartbeat SSE
+    NOTIFY_RETRY_DELAY: float = 5.0  # Giây chờ trước khi mở lại change stream bị lỗi
+    
+    # Cache document bài giảng/slide (đọc qua, xóa khi ghi)
+    CACHE_MAX_ENTRIES: int = 1000  # Số document tối đa trong cache của mỗi worker; 0 để tắt cache
+    CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # 64MB (kích thước BSON) mỗi worker
+    CACHE_TTL: float = 300.0  # Giây; giới hạn thời gian dữ liệu cũ nếu MongoDB bị sửa ngoài API
+    CACHE_REDIS_URL: str = ""  # Ví dụ redis://localhost:6379/0 để dùng chung cache giữa các worker
+    
+    # Nén response (zstd/br/gzip theo Accept-Encoding)
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # Byte; response nhỏ hơn được gửi nguyên
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_LEVEL: int = 4  # 0-11; mức thấp đủ nhanh để nén mỗi request
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    
+    # Lưu trữ lạnh tin nhắn chat (chat_archives, NDJSON nén zstd)
+    CHAT_ARCHIVE_AFTER_DAYS: int = 30  # Lưu trữ session không hoạt động quá số ngày này; 0 để chỉ lưu trữ session đã xóa
+    CHAT_PURGE_DELETED_AFTER_DAYS: int = 30  # Xóa hẳn session đã xóa sau số ngày này; -1 để giữ mãi
+    CHAT_ARCHIVE_INTERVAL: int = 3600  # Giây giữa hai lần chạy; 0 để tắt
+    CHAT_ARCHIVE_BATCH_SIZE: int = 200  # Số session tối đa mỗi lần chạy
+    CHAT_ARCHIVE_ZSTD_LEVEL: int = 10  # Dữ liệu lạnh: ưu tiên tỉ lệ nén
+    
+    # Theo dõi truy vấn MongoDB chậm (GET /api/v1/admin/slow-queries)
+    PROFILER_SLOW_MS: float = 100.0  # Lệnh chậm hơn được ghi vào danh sách truy vấn chậm; 0 để tắt
+    PROFILER_BUFFER_SIZE: int = 200  # Số truy vấn chậm gần nhất giữ lại
+    PROFILER_EXPLAIN_MS: float = 500.0  # Tự chạy explain cho truy vấn đọc chậm hơn; 0 để tắt
+    
+    # Giới hạn tần suất theo user và loại endpoint (429 + Retry-After); PER_MINUTE 0 để không giới hạn
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_GENERATION_PER_MINUTE: float = 6.0  # Sinh bài giảng/slide/khóa học, sinh lại từng phần
+    RATE_LIMIT_GENERATION_BURST: int = 3
+    RATE_LIMIT_CHAT_PER_MINUTE: float = 20.0
+    RATE_LIMIT_CHAT_BURST: int = 10
+    RATE_LIMIT_BULK_PER_MINUTE: float = 6.0  # Xuất/nhập hàng loạt
+    RATE_LIMIT_BULK_BURST: int = 2
+    RATE_LIMIT_DEFAULT_PER_MINUTE: float = 600.0  # Các API còn lại
+    RATE_LIMIT_DEFAULT_BURST: int = 100
+    RATE_LIMIT_MAX_INFLIGHT: int = 2  # Số request gọi LLM đang chạy tối đa mỗi user; 0 để không giới hạn
+    RATE_LIMIT_IP_FACTOR: int = 5  # Request có user id: giới hạn theo IP gấp bấy nhiêu lần giới hạn mỗi user (nhiều user sau một NAT)
+    RATE_LIMIT_GLOBAL_INFLIGHT: int = 64  # Tổng số request gọi LLM đang chạy, vượt thì trả 503; 0 để không giới hạn
+    RATE_LIMIT_BUSY_RETRY_AFTER: int = 5  # Giây gợi ý chờ khi bị từ chối vì đang có request chạy
+    RATE_LIMIT_REDIS_URL: str = ""  # Ví dụ redis://localhost:6379/1 để dùng chung giới hạn giữa các replica
+    RATE_LIMIT_TRUSTED_PROXIES: str = "127.0.0.1"  # IP/CIDR của reverse proxy (cách nhau bởi dấu phẩy); lấy IP client từ X-Forwarded-For/X-Real-IP
+    
+    # Idempotency-Key cho các API tạo (sinh bài giảng/slide, chat)
+    IDEMPOTENCY_TTL: int = 86400  # Giây giữ kết quả theo khóa; 0 để bỏ qua header
+    IDEMPOTENCY_WAIT_SECONDS: float = 30.0  # Giây chờ kết quả khi request cùng khóa đang chạy, quá thì trả 409
+    IDEMPOTENCY_LOCK_SECONDS: int = 600  # Khóa in_progress cũ hơn được coi là của worker đã chết
+    
+    # Deadline của request gọi LLM: hết hạn (504) hoặc client ngắt kết nối thì hủy cả lời gọi agent
+    REQUEST_DEADLINE_ENABLED: bool = True
+    REQUEST_DEADLINE_GENERATION: float = 120.0  # Giây tối đa cho request sinh nội dung/sinh lại từng phần
+    REQUEST_DEADLINE_CHAT: float = 60.0  # Giây tối đa cho một tin nhắn chat
+    
+    # Gọi agent: thử lại có jitter, circuit breaker theo endpoint, hedged request
+    AGENT_RETRY_ATTEMPTS: int = 3  # Số lần gọi tối đa cho lời gọi sinh nội dung; /process chỉ gọi một lần
+    AGENT_RETRY_BACKOFF: float = 0.5  # Giây chờ tối đa trước lần thử lại đầu (jitter ngẫu nhiên), nhân đôi mỗi lần
+    AGENT_RETRY_MAX_BACKOFF: float = 8.0
+    AGENT_CIRCUIT_FAILURES: int = 5  # Số lỗi liên tiếp thì mở circuit; 0 để tắt
+    AGENT_CIRCUIT_RESET_SECONDS: float = 30.0  # Giây circuit mở trước khi cho một request thử lại
+    AGENT_HEDGE_ENABLED: bool = False  # Gửi thêm một lần gọi khi lần đầu chậm hơn p95 (tốn thêm quota LLM)
+    AGENT_HEDGE_MIN_SAMPLES: int = 20  # Số lần gọi thành công tối thiểu trước khi tính p95 để hedge
+    
+    # Sinh lại từng phần bài giảng / từng slide
+    REGENERATION_CONTEXT_CHARS: int = 800  # Số ký tự của phần trước/sau gửi kèm làm ngữ cảnh
+    
+    # Sinh cả khóa học (POST /api/v1/courses/create)
+    COURSE_MAX_LECTURES: int = 60  # Số bài giảng tối đa mỗi khóa học
+    COURSE_MAX_PARALLEL: int = 4  # Số bài giảng sinh đồng thời mỗi khóa học
+    COURSE_CONTEXT_CHARS: int = 600  # Số ký tự đầu của mỗi bài phụ thuộc gửi kèm làm ngữ cảnh
+    COURSE_LEASE_SECONDS: int = 60  # Lease của worker đang sinh khóa học (gia hạn mỗi 1/3 thời gian); hết hạn thì worker khác sinh tiếp
     
     def get_cors_origins(self) -> List[str]:
         """Parse CORS origins from string to list"""
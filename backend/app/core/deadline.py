@@ -0,0 +1,147 @@
+"""
+Deadline và hủy request gọi LLM khi client bỏ đi.
+
+Request sinh nội dung/chat có một deadline (REQUEST_DEADLINE_<LOẠI>, client có
+thể rút ngắn bằng header X-Request-Timeout-Ms). Handler chạy trong một task
+riêng; khi client ngắt kết nối (đóng tab) hoặc hết deadline, task bị hủy nên
+lời gọi httpx tới agent bị đóng giữa chừng, kết quả không được lưu và slot
+rate limit được trả lại ngay. Hết deadline trả 504.
+
+Thời gian còn lại được gửi tiếp cho agent qua cùng header (số mili giây còn
+lại, không phụ thuộc đồng hồ giữa các máy) để agent tự hủy lời gọi LLM.
+"""
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.core.rate_limit import LLM_CLASSES, classify
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+# Thời điểm hết hạn (theo loop.time()) của request đang xử lý trong task hiện tại
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+_cancellations = registry.counter(
+    "edubot_request_cancellations_total",
+    "Số request gọi LLM bị hủy theo loại endpoint và lý do (disconnect, deadline)",
+    ("endpoint_class", "reason")
+)
+
+
+def remaining() -> Optional[float]:
+    """Số giây còn lại tới deadline của request hiện tại (None nếu không có deadline)"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - asyncio.get_running_loop().time())
+
+
+def headers() -> Dict[str, str]:
+    """Header truyền deadline còn lại cho agent (rỗng nếu không có deadline)"""
+    seconds = remaining()
+    if seconds is None:
+        return {}
+    return {DEADLINE_HEADER: str(int(seconds * 1000))}
+
+
+def class_deadline(endpoint_class: Optional[str]) -> Optional[float]:
+    """Deadline mặc định (giây) của loại endpoint; None nếu loại đó không có deadline"""
+    if endpoint_class not in LLM_CLASSES:
+        return None
+    seconds = getattr(settings, f"REQUEST_DEADLINE_{endpoint_class.upper()}")
+    return seconds if seconds > 0 else None
+
+
+def _requested_deadline(headers: Headers) -> Optional[float]:
+    value = headers.get(DEADLINE_HEADER)
+    if value is None:
+        return None
+    try:
+        return max(0.0, int(value) / 1000)
+    except ValueError:
+        return None
+
+
+class DeadlineMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not settings.REQUEST_DEADLINE_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        endpoint_class = classify(scope["method"], scope["path"])
+        budget = class_deadline(endpoint_class)
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+        requested = _requested_deadline(Headers(scope=scope))
+        if requested is not None:
+            budget = min(budget, requested)
+
+        # Đọc receive liên tục để thấy http.disconnect ngay khi client đóng kết nối;
+        # handler nhận lại các message qua hàng đợi
+        messages: "asyncio.Queue[Message]" = asyncio.Queue()
+        disconnected = asyncio.Event()
+        response_started = False
+
+        async def pump():
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    return
+
+        async def queued_receive() -> Message:
+            message = await messages.get()
+            if message["type"] == "http.disconnect":
+                messages.put_nowait(message)  # Các lần đọc sau vẫn thấy disconnect
+            return message
+
+        async def tracked_send(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        token = _deadline.set(asyncio.get_running_loop().time() + budget)
+        try:
+            handler = asyncio.create_task(self.app(scope, queued_receive, tracked_send))
+        finally:
+            _deadline.reset(token)
+        pumping = asyncio.create_task(pump())
+        watcher = asyncio.create_task(disconnected.wait())
+        try:
+            done, _ = await asyncio.wait(
+                {handler, watcher}, timeout=budget, return_when=asyncio.FIRST_COMPLETED
+            )
+            if handler in done:
+                handler.result()
+                return
+
+            reason = "disconnect" if watcher in done else "deadline"
+            handler.cancel()
+            await asyncio.gather(handler, return_exceptions=True)
+            _cancellations.inc(endpoint_class=endpoint_class, reason=reason)
+            logger.info(f"Cancelled {scope['method']} {scope['path']}: {reason} after at most {budget:.1f}s")
+            if reason == "deadline" and not response_started:
+                response = JSONResponse(
+                    {"detail": "Yêu cầu xử lý quá thời gian cho phép, vui lòng thử lại"},
+                    status_code=504
+                )
+                await response(scope, queued_receive, send)
+        finally:
+            if not handler.done():
+                handler.cancel()
+            pumping.cancel()
+            watcher.cancel()
@@ -0,0 +1,49 @@
+import zlib
+from collections import Counter
+from typing import Iterable, List
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.text import tokenize
+
+
+class HashingEmbedder:
+    """
+    Sinh embedding cục bộ bằng feature hashing (unigram + bigram).
+
+    Không cần model hay GPU, kết quả ổn định giữa các process nên có thể
+    lưu vector xuống đĩa và dùng lại.
+    """
+
+    def __init__(self, dim: int = None):
+        self.dim = dim or settings.EMBEDDING_DIM
+
+    def _features(self, text: str) -> Counter:
+        tokens = tokenize(text, drop_stopwords=True)
+        features = Counter(tokens)
+        features.update(f"{a}_{b}" for a, b in zip(tokens, tokens[1:]))
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embedding cho một đoạn văn bản (đã chuẩn hóa L2)"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, count in self._features(text).items():
+            h = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if (h >> 31) & 1 else -1.0
+            vector[h % self.dim] += sign * (1.0 + np.log(count))
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def embed_many(self, texts: Iterable[str]) -> np.ndarray:
+        """Embedding cho nhiều đoạn văn bản, trả về ma trận (n, dim)"""
+        rows: List[np.ndarray] = [self.embed(text) for text in texts]
+        if not rows:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.vstack(rows)
+
+
+# Singleton instance
+embedder = HashingEmbedder()
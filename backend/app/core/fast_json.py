@@ -0,0 +1,95 @@
+"""
+Đường trả JSON nhanh cho các API đọc bài giảng/slide.
+
+Thay vì dựng model Pydantic từ document MongoDB, chép sang model response
+rồi để FastAPI kiểm tra lại qua response_model (ba lượt trên mảng slides),
+document thô được chọn field theo model response và ghi thẳng ra bytes bằng
+orjson. response_model trên route vẫn giữ nguyên để sinh OpenAPI schema;
+FastAPI không kiểm tra lại khi endpoint trả về Response.
+"""
+from typing import Any, Dict, Optional, Type
+
+import orjson
+from bson import ObjectId
+from fastapi import Response
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
+
+
+def _default(value: Any):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(value: Any) -> bytes:
+    """JSON bytes: datetime theo ISO 8601 (giống Pydantic), ObjectId thành chuỗi"""
+    return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _field_defaults(model: Type[BaseModel], fallback: Optional[Type[BaseModel]] = None) -> Dict[str, Any]:
+    """Giá trị mặc định của từng field; field bắt buộc lấy mặc định của model document (nếu có)"""
+    defaults = {}
+    for name, field in model.model_fields.items():
+        source = field
+        if field.is_required() and fallback is not None and name in fallback.model_fields:
+            source = fallback.model_fields[name]
+        if source.default_factory is not None:
+            defaults[name] = source.default_factory
+        elif source.default is PydanticUndefined:
+            defaults[name] = None
+        else:
+            default = source.default
+            # Mặc định kiểu {} / [] phải được sao chép cho mỗi document
+            defaults[name] = (lambda value=default: value.copy()) if isinstance(default, (dict, list)) else default
+    return defaults
+
+
+class DocumentSerializer:
+    """
+    Chuyển document MongoDB thành dict đúng cấu trúc của model response
+    (id dạng chuỗi, field thiếu lấy giá trị mặc định, bỏ field thừa).
+
+    nested: field là danh sách object con, mỗi phần tử được chọn field theo
+    model tương ứng (ví dụ slides -> SlideContent).
+    """
+
+    def __init__(
+        self,
+        response_model: Type[BaseModel],
+        document_model: Optional[Type[BaseModel]] = None,
+        nested: Optional[Dict[str, Type[BaseModel]]] = None
+    ):
+        self._defaults = _field_defaults(response_model, document_model)
+        self._defaults.pop("id", None)
+        self._nested = {
+            field: _field_defaults(model) for field, model in (nested or {}).items()
+        }
+        # Chỉ đọc các field cần trả về
+        self.projection = {name: 1 for name in self._defaults}
+
+    @staticmethod
+    def _pick(doc: dict, defaults: Dict[str, Any]) -> dict:
+        result = {}
+        for name, default in defaults.items():
+            if name in doc:
+                result[name] = doc[name]
+            else:
+                result[name] = default() if callable(default) else default
+        return result
+
+    def __call__(self, doc: dict) -> dict:
+        result = {"id": str(doc["_id"])}
+        result.update(self._pick(doc, self._defaults))
+        for field, defaults in self._nested.items():
+            items = result.get(field)
+            if items:
+                result[field] = [self._pick(item, defaults) for item in items]
+        return result
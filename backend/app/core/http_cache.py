@@ -0,0 +1,94 @@
+"""
+ETag và Cache-Control cho các API đọc bài giảng/slide.
+
+ETag được tính từ _id + updated_at nên chỉ cần một truy vấn projection để
+biết tài liệu có đổi hay không; client gửi lại ETag qua If-None-Match và
+nhận 304 (không có body) khi nội dung vẫn như cũ.
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from fastapi import Request, Response
+
+# Phiên bản định dạng response; tăng khi đổi cấu trúc JSON để ETag cũ hết hiệu lực
+_ETAG_VERSION = 1
+
+# Cache-Control theo loại endpoint
+CACHE_DOCUMENT = "private, no-cache"  # Luôn kiểm tra lại bằng ETag (rẻ khi không đổi)
+CACHE_LIST = "private, no-cache"
+CACHE_IMMUTABLE = "private, max-age=31536000, immutable"  # Nội dung không bao giờ đổi (phiên bản cũ)
+CACHE_SUGGESTIONS = "private, max-age=30"
+
+
+_EPOCH = datetime(1970, 1, 1)
+_MILLISECOND = timedelta(milliseconds=1)
+
+
+def _millis(updated_at: Optional[datetime]) -> int:
+    """Mốc thời gian (UTC, MongoDB trả về datetime không có tzinfo) tính bằng millisecond"""
+    if not updated_at:
+        return 0
+    if updated_at.tzinfo is not None:
+        updated_at = updated_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return (updated_at - _EPOCH) // _MILLISECOND
+
+
+def document_etag(doc_id: str, updated_at: Optional[datetime]) -> str:
+    """ETag của một tài liệu"""
+    return f'"{doc_id}-{_millis(updated_at):x}-{_ETAG_VERSION}"'
+
+
+def list_etag(items: Iterable[Tuple[str, Optional[datetime]]], total: int, *params) -> str:
+    """ETag của một trang danh sách: các (id, updated_at) trong trang, tổng số và tham số truy vấn"""
+    digest = hashlib.sha1(f"{_ETAG_VERSION}|{total}|{params}".encode())
+    for doc_id, updated_at in items:
+        digest.update(f"|{doc_id}-{_millis(updated_at)}".encode())
+    return f'"{digest.hexdigest()[:24]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match có chứa etag (so sánh yếu theo RFC 7232)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+def if_match_versions(header: Optional[str], doc_id: str) -> Optional[List[datetime]]:
+    """
+    Các updated_at mà If-Match chấp nhận, dùng làm điều kiện trong lệnh ghi.
+
+    None khi không có If-Match hoặc là "*" (chỉ cần tài liệu tồn tại). ETag yếu
+    (W/) cũng được chấp nhận vì chỉ do middleware nén tạo ra từ cùng nội dung.
+    Danh sách rỗng nghĩa là không ETag nào thuộc tài liệu này (luôn 412).
+    """
+    if not header or header.strip() == "*":
+        return None
+    versions = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        parts = tag.strip('"').rsplit("-", 2)
+        if len(parts) != 3 or parts[0] != doc_id:
+            continue
+        try:
+            versions.append(_EPOCH + int(parts[1], 16) * _MILLISECOND)
+        except ValueError:
+            continue
+    return versions
+
+
+def set_cache_headers(response: Response, etag: Optional[str], cache_control: str):
+    if etag:
+        response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """Response 304 kèm lại ETag và Cache-Control"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
@@ -0,0 +1,261 @@
+"""
+Index tìm kiếm in-memory kết hợp BM25 và embedding (reciprocal-rank fusion).
+
+Postings được lưu dạng array (int32 slot, uint16 tf) chỉ ghi thêm, nên có
+thể đọc trực tiếp bằng numpy mà không cần copy. Khi cập nhật một tài liệu,
+slot cũ được đánh dấu đã xóa và tài liệu được ghi vào slot mới; index tự
+compact khi số slot chết vượt ngưỡng.
+"""
+import math
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.embedding import HashingEmbedder
+from app.core.text import fold_text, tokenize
+
+_FILTER_FIELDS = ("subject", "grade", "user_id")
+
+
+class HybridIndex:
+    K1 = 1.2
+    B = 0.75
+    RRF_K = 60
+    CANDIDATES = 100  # Số ứng viên lấy từ mỗi bộ xếp hạng trước khi fusion
+    MIN_SIMILARITY = 0.05  # Bỏ các kết quả vector chỉ trùng do va chạm hash
+    COMPACT_RATIO = 0.3
+
+    def __init__(self, embedder: Optional[HashingEmbedder] = None):
+        self.embedder = embedder or HashingEmbedder()
+        self.dim = self.embedder.dim
+        self._reset(capacity=1024)
+
+    def _reset(self, capacity: int):
+        self._ids: List[Optional[str]] = []
+        self._meta: List[Optional[dict]] = []
+        self._slots: Dict[str, int] = {}
+        self._size = 0
+        self._alive_count = 0
+        self._total_length = 0.0
+        self._vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._lengths = np.zeros(capacity, dtype=np.float32)
+        self._filters = {field: np.full(capacity, -1, dtype=np.int32) for field in _FILTER_FIELDS}
+        self._codes: Dict[str, Dict[str, int]] = {field: {} for field in _FILTER_FIELDS}
+        self._postings: Dict[str, Tuple[array, array]] = {}
+
+    def __len__(self) -> int:
+        return self._alive_count
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._slots
+
+    def _grow(self):
+        capacity = self._alive.shape[0] * 2
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        self._vectors = vectors
+        self._alive = np.resize(self._alive, capacity)
+        self._alive[self._size:] = False
+        self._lengths = np.resize(self._lengths, capacity)
+        for field in _FILTER_FIELDS:
+            codes = np.full(capacity, -1, dtype=np.int32)
+            codes[:self._size] = self._filters[field][:self._size]
+            self._filters[field] = codes
+
+    def _code(self, field: str, value: Optional[str]) -> int:
+        if not value:
+            return -1
+        key = value if field == "user_id" else fold_text(value).strip()
+        codes = self._codes[field]
+        if key not in codes:
+            codes[key] = len(codes)
+        return codes[key]
+
+    def upsert(
+        self,
+        doc_id: str,
+        title: str,
+        body: str,
+        meta: dict,
+        subject: Optional[str] = None,
+        grade: Optional[str] = None,
+        user_id: Optional[str] = None
+    ):
+        """Thêm hoặc cập nhật một tài liệu"""
+        self.remove(doc_id)
+        if self._size == self._alive.shape[0]:
+            self._grow()
+
+        slot = self._size
+        self._size += 1
+        self._ids.append(doc_id)
+        self._meta.append(meta)
+        self._slots[doc_id] = slot
+
+        # Tiêu đề được nhân đôi trọng số
+        tokens = tokenize(title, drop_stopwords=True) * 2 + tokenize(f"{subject or ''} {body}", drop_stopwords=True)
+        for term, tf in Counter(tokens).items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = (array("i"), array("H"))
+                self._postings[term] = postings
+            postings[0].append(slot)
+            postings[1].append(min(tf, 65535))
+
+        self._vectors[slot] = self.embedder.embed(f"{title}. {title}. {subject or ''}. {body}")
+        self._lengths[slot] = len(tokens)
+        self._alive[slot] = True
+        for field, value in (("subject", subject), ("grade", grade), ("user_id", user_id)):
+            self._filters[field][slot] = self._code(field, value)
+
+        self._alive_count += 1
+        self._total_length += len(tokens)
+
+    def remove(self, doc_id: str) -> bool:
+        """Xóa tài liệu khỏi index (slot được thu hồi khi compact)"""
+        slot = self._slots.pop(doc_id, None)
+        if slot is None:
+            return False
+
+        self._alive[slot] = False
+        self._ids[slot] = None
+        self._meta[slot] = None
+        self._alive_count -= 1
+        self._total_length -= float(self._lengths[slot])
+
+        dead = self._size - self._alive_count
+        if self._size > 1000 and dead > self._size * self.COMPACT_RATIO:
+            self.compact()
+        return True
+
+    def compact(self):
+        """Thu gọn index: bỏ các slot đã xóa và đánh lại số slot"""
+        n = self._size
+        alive = self._alive[:n]
+        remap = np.full(n, -1, dtype=np.int32)
+        remap[alive] = np.arange(int(alive.sum()), dtype=np.int32)
+
+        postings = {}
+        for term, (slots, tfs) in self._postings.items():
+            slot_arr = np.frombuffer(slots, dtype=np.int32)
+            keep = alive[slot_arr]
+            if not keep.any():
+                continue
+            postings[term] = (
+                array("i", remap[slot_arr[keep]].tobytes()),
+                array("H", np.frombuffer(tfs, dtype=np.uint16)[keep].tobytes())
+            )
+
+        vectors = self._vectors[:n][alive]
+        lengths = self._lengths[:n][alive]
+        filters = {field: self._filters[field][:n][alive] for field in _FILTER_FIELDS}
+        ids = [doc_id for doc_id in self._ids if doc_id is not None]
+        meta = [m for doc_id, m in zip(self._ids, self._meta) if doc_id is not None]
+        codes = self._codes
+
+        self._reset(capacity=max(1024, len(ids) * 2))
+        count = len(ids)
+        self._vectors[:count] = vectors
+        self._lengths[:count] = lengths
+        self._alive[:count] = True
+        for field in _FILTER_FIELDS:
+            self._filters[field][:count] = filters[field]
+        self._codes = codes
+        self._ids = ids
+        self._meta = meta
+        self._slots = {doc_id: slot for slot, doc_id in enumerate(ids)}
+        self._postings = postings
+        self._size = self._alive_count = count
+        self._total_length = float(lengths.sum())
+
+    def _filter_mask(self, subject: Optional[str], grade: Optional[str], user_id: Optional[str]) -> np.ndarray:
+        n = self._size
+        mask = self._alive[:n].copy()
+
+        if user_id:
+            code = self._codes["user_id"].get(user_id)
+            if code is None:
+                return np.zeros(n, dtype=bool)
+            mask &= self._filters["user_id"][:n] == code
+        if subject:
+            # Khớp theo chuỗi con để "toán" khớp "Toán học"
+            needle = fold_text(subject).strip()
+            codes = [c for value, c in self._codes["subject"].items() if needle in value]
+            mask &= np.isin(self._filters["subject"][:n], codes)
+        if grade:
+            code = self._codes["grade"].get(fold_text(grade).strip())
+            if code is None:
+                return np.zeros(n, dtype=bool)
+            mask &= self._filters["grade"][:n] == code
+        return mask
+
+    def _top(self, scores: np.ndarray, candidates: np.ndarray, limit: int) -> np.ndarray:
+        if candidates.shape[0] > limit:
+            part = np.argpartition(-scores[candidates], limit - 1)[:limit]
+            candidates = candidates[part]
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+    def lexical_scores(self, query: str) -> np.ndarray:
+        """Điểm BM25 cho mọi slot"""
+        n = self._size
+        scores = np.zeros(n, dtype=np.float32)
+        if not self._alive_count:
+            return scores
+
+        avg_length = max(self._total_length / self._alive_count, 1.0)
+        norm = self.K1 * (1 - self.B + self.B * self._lengths[:n] / avg_length)
+        for term in set(tokenize(query, drop_stopwords=True)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            slots = np.frombuffer(postings[0], dtype=np.int32)
+            df = int(self._alive[slots].sum())
+            if df == 0:
+                continue
+            tfs = np.frombuffer(postings[1], dtype=np.uint16).astype(np.float32)
+            idf = math.log(1 + (self._alive_count - df + 0.5) / (df + 0.5))
+            scores[slots] += idf * tfs * (self.K1 + 1) / (tfs + norm[slots])
+        return scores
+
+    def vector_scores(self, query: str) -> np.ndarray:
+        """Cosine giữa query và mọi slot"""
+        return self._vectors[:self._size] @ self.embedder.embed(query)
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        subject: Optional[str] = None,
+        grade: Optional[str] = None,
+        user_id: Optional[str] = None,
+        mode: str = "hybrid"
+    ) -> List[Tuple[str, float, dict]]:
+        """
+        Tìm kiếm, trả về [(doc_id, score, meta)].
+
+        mode: "hybrid" (RRF của BM25 và vector), "lexical" hoặc "vector".
+        """
+        if not self._alive_count or not query.strip():
+            return []
+
+        mask = self._filter_mask(subject, grade, user_id)
+        if not mask.any():
+            return []
+
+        fused: Dict[int, float] = {}
+        if mode in ("hybrid", "lexical"):
+            lexical = self.lexical_scores(query)
+            ranked = self._top(lexical, np.flatnonzero(mask & (lexical > 0)), self.CANDIDATES)
+            for rank, slot in enumerate(ranked):
+                fused[int(slot)] = fused.get(int(slot), 0.0) + 1.0 / (self.RRF_K + rank + 1)
+        if mode in ("hybrid", "vector"):
+            similarity = self.vector_scores(query)
+            ranked = self._top(similarity, np.flatnonzero(mask & (similarity > self.MIN_SIMILARITY)), self.CANDIDATES)
+            for rank, slot in enumerate(ranked):
+                fused[int(slot)] = fused.get(int(slot), 0.0) + 1.0 / (self.RRF_K + rank + 1)
+
+        best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(self._ids[slot], score, self._meta[slot]) for slot, score in best]
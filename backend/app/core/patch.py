@@ -0,0 +1,126 @@
+"""
+Diff/patch cho dữ liệu JSON (lịch sử phiên bản bài giảng, slide).
+
+Patch là danh sách thao tác theo JSON Patch (RFC 6902) gồm add, remove,
+replace với đường dẫn JSON Pointer. Chuỗi dài (nội dung Markdown) dùng thêm
+thao tác "text" chỉ lưu các dòng thay đổi, nên kích thước patch tỉ lệ với
+lượng chỉnh sửa chứ không với độ dài tài liệu.
+"""
+import copy
+import difflib
+import json
+from typing import Any, List
+
+# Chuỗi ngắn hơn thì thay cả chuỗi, không cần diff theo dòng
+TEXT_DIFF_MIN_CHARS = 200
+
+
+def _escape(token: Any) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def _key(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def json_size(value: Any) -> int:
+    """Số byte của value khi serialize JSON (ước lượng dung lượng lưu trữ)"""
+    return len(_key(value).encode("utf-8"))
+
+
+def diff_text(old: str, new: str) -> list:
+    """Các đoạn dòng thay đổi: [[dòng đầu, dòng cuối (không gồm), các dòng mới], ...]"""
+    a = old.splitlines(keepends=True)
+    b = new.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    return [[i1, i2, b[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+
+
+def apply_text(old: str, edits: list) -> str:
+    lines = old.splitlines(keepends=True)
+    # Áp dụng từ cuối lên để số dòng của các đoạn phía trước không đổi
+    for i1, i2, new_lines in reversed(edits):
+        lines[i1:i2] = new_lines
+    return "".join(lines)
+
+
+def _list_patch(old: list, new: list, path: str) -> List[dict]:
+    ops: List[dict] = []
+    matcher = difflib.SequenceMatcher(None, [_key(x) for x in old], [_key(x) for x in new], autojunk=False)
+    # Sinh thao tác từ cuối mảng để chỉ số của các đoạn phía trước không đổi
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == "equal":
+            continue
+        if tag == "replace" and i2 - i1 == j2 - j1:
+            # Phần tử bị sửa tại chỗ (ví dụ một slide): diff từng phần tử
+            for k in range(i2 - i1):
+                ops.extend(make_patch(old[i1 + k], new[j1 + k], f"{path}/{i1 + k}"))
+            continue
+        for k in range(i2 - 1, i1 - 1, -1):
+            ops.append({"op": "remove", "path": f"{path}/{k}"})
+        for k in range(j1, j2):
+            ops.append({"op": "add", "path": f"{path}/{i1 + k - j1}", "value": new[k]})
+    return ops
+
+
+def make_patch(old: Any, new: Any, path: str = "") -> List[dict]:
+    """Patch biến old thành new"""
+    if type(old) is type(new) and old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = [{"op": "remove", "path": f"{path}/{_escape(key)}"} for key in old if key not in new]
+        for key, value in new.items():
+            if key in old:
+                ops.extend(make_patch(old[key], value, f"{path}/{_escape(key)}"))
+            else:
+                ops.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": value})
+        return ops
+    if isinstance(old, list) and isinstance(new, list):
+        return _list_patch(old, new, path)
+    if isinstance(old, str) and isinstance(new, str) and len(old) + len(new) >= TEXT_DIFF_MIN_CHARS:
+        edits = diff_text(old, new)
+        if json_size(edits) < json_size(new):
+            return [{"op": "text", "path": path, "edits": edits}]
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def apply_patch(document: Any, patch: List[dict]) -> Any:
+    """Áp dụng patch, trả về bản sao đã sửa (không đổi document)"""
+    document = copy.deepcopy(document)
+    for op in patch:
+        kind = op["op"]
+        tokens = [_unescape(token) for token in op["path"].split("/")[1:]]
+        if not tokens:
+            if kind == "text":
+                document = apply_text(document, op["edits"])
+            elif kind in ("add", "replace"):
+                document = copy.deepcopy(op["value"])
+            else:
+                raise ValueError(f"Invalid patch operation on document root: {kind}")
+            continue
+
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last: Any = tokens[-1]
+        if isinstance(parent, list):
+            last = int(last)
+
+        if kind == "add":
+            if isinstance(parent, list):
+                parent.insert(last, copy.deepcopy(op["value"]))
+            else:
+                parent[last] = copy.deepcopy(op["value"])
+        elif kind == "remove":
+            del parent[last]
+        elif kind == "replace":
+            parent[last] = copy.deepcopy(op["value"])
+        elif kind == "text":
+            parent[last] = apply_text(parent[last], op["edits"])
+        else:
+            raise ValueError(f"Unknown patch operation: {kind}")
+    return document
@@ -0,0 +1,133 @@
+"""
+Prefix trie cho gợi ý tìm kiếm (typeahead).
+
+Mỗi tài liệu được chèn với một key cho mỗi vị trí bắt đầu từ trong tiêu đề
+và môn học (đã bỏ dấu), nên "so" khớp cả "Phân số". Mỗi node cache top-K
+kết quả; cache được tính lazy khi truy vấn và bị xóa dọc theo đường đi của
+key khi có thay đổi.
+"""
+from typing import Dict, List, Optional, Tuple
+
+from app.core.text import fold_text, tokenize
+
+MAX_KEY_CHARS = 32
+TOP_K = 10
+
+# Trọng số vị trí khớp: đầu tiêu đề > từ trong tiêu đề > môn học
+_TITLE_START = 3
+_TITLE_WORD = 2
+_SUBJECT = 1
+
+
+class _Node:
+    __slots__ = ("children", "entries", "top")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.entries: Dict[str, int] = {}  # doc_id -> trọng số
+        self.top: Optional[List[Tuple[tuple, str]]] = None
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.root = _Node()
+        self.docs: Dict[str, dict] = {}
+        self._keys: Dict[str, List[Tuple[str, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    @staticmethod
+    def _doc_keys(title: str, subject: str) -> Dict[str, int]:
+        keys: Dict[str, int] = {}
+        for field_text, first_weight, weight in ((title, _TITLE_START, _TITLE_WORD), (subject, _SUBJECT, _SUBJECT)):
+            words = tokenize(field_text)
+            for i in range(len(words)):
+                key = " ".join(words[i:])[:MAX_KEY_CHARS]
+                w = first_weight if i == 0 else weight
+                if keys.get(key, 0) < w:
+                    keys[key] = w
+        return keys
+
+    def add(self, doc_id: str, title: str, subject: str, meta: dict, rank: float = 0.0):
+        """Thêm/cập nhật tài liệu; rank lớn hơn (ví dụ updated_at) được ưu tiên"""
+        self.remove(doc_id)
+        self.docs[doc_id] = {**meta, "_rank": rank}
+
+        keys = self._doc_keys(title or "", subject or "")
+        self._keys[doc_id] = list(keys.items())
+        for key, weight in keys.items():
+            node = self.root
+            node.top = None
+            for ch in key:
+                node = node.children.setdefault(ch, _Node())
+                node.top = None
+            node.entries[doc_id] = weight
+
+    def remove(self, doc_id: str) -> bool:
+        if doc_id not in self.docs:
+            return False
+        del self.docs[doc_id]
+
+        for key, _ in self._keys.pop(doc_id, []):
+            path = [self.root]
+            node = self.root
+            for ch in key:
+                node = node.children.get(ch)
+                if node is None:
+                    break
+                path.append(node)
+            else:
+                node.entries.pop(doc_id, None)
+            for n in path:
+                n.top = None
+            # Dọn các node rỗng từ lá lên gốc
+            for depth in range(len(path) - 1, 0, -1):
+                child = path[depth]
+                if child.entries or child.children:
+                    break
+                del path[depth - 1].children[key[depth - 1]]
+        return True
+
+    def _compute_top(self, node: _Node) -> List[Tuple[tuple, str]]:
+        if node.top is not None:
+            return node.top
+
+        best: Dict[str, tuple] = {}
+        for doc_id, weight in node.entries.items():
+            score = (weight, self.docs[doc_id]["_rank"])
+            if best.get(doc_id, (0, 0)) < score:
+                best[doc_id] = score
+        for child in node.children.values():
+            for score, doc_id in self._compute_top(child):
+                if best.get(doc_id, (0, 0)) < score:
+                    best[doc_id] = score
+
+        node.top = sorted(((score, doc_id) for doc_id, score in best.items()), reverse=True)[:TOP_K]
+        return node.top
+
+    def warm(self):
+        """Tính sẵn cache top-K cho toàn bộ trie (sau khi nạp hàng loạt)"""
+        self._compute_top(self.root)
+
+    def suggest(self, prefix: str, limit: int = 5) -> List[dict]:
+        """Trả về danh sách meta của các tài liệu khớp prefix, đã xếp hạng"""
+        key = " ".join(tokenize(prefix))
+        # Giữ khoảng trắng cuối để "phan " không khớp "phang"
+        if fold_text(prefix).endswith(" ") and key:
+            key += " "
+        if not key:
+            return []
+
+        node = self.root
+        for ch in key[:MAX_KEY_CHARS]:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+
+        results = []
+        for _, doc_id in self._compute_top(node)[:limit]:
+            meta = dict(self.docs[doc_id])
+            meta.pop("_rank", None)
+            results.append(meta)
+        return results
@@ -0,0 +1,104 @@
+"""
+Trả file từ đĩa dạng streaming, hỗ trợ HTTP Range (tải tiếp, tua video/PDF).
+
+Chỉ hỗ trợ một khoảng byte mỗi request; với nhiều khoảng (multipart/byteranges)
+thì trả toàn bộ file, điều mà RFC 7233 cho phép.
+"""
+import os
+import re
+from email.utils import formatdate
+from typing import AsyncIterator, Optional, Tuple
+from urllib.parse import quote
+
+import aiofiles
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+from app.core.http_cache import CACHE_DOCUMENT, etag_matches, not_modified
+from app.core.text import fold_text
+
+STREAM_CHUNK_SIZE = 256 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse header Range, trả về (start, end) bao gồm cả end.
+
+    Trả None nếu không có header hoặc header không áp dụng được (trả toàn bộ
+    file), raise ValueError nếu khoảng nằm ngoài file (416).
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N: N byte cuối
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def content_disposition(filename: str) -> str:
+    """Header Content-Disposition với tên ASCII dự phòng và tên UTF-8 đầy đủ"""
+    stem, ext = os.path.splitext(filename)
+    fallback = re.sub(r"[^a-z0-9]+", "-", fold_text(stem)).strip("-") or "download"
+    return f"attachment; filename=\"{fallback}{ext}\"; filename*=UTF-8''{quote(filename)}"
+
+
+async def _iter_file(path: str, start: int, length: int) -> AsyncIterator[bytes]:
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(request: Request, path: str, media_type: str, filename: str) -> Response:
+    """Stream file với Accept-Ranges, hỗ trợ Range, If-Range và If-None-Match"""
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{int(stat.st_mtime):x}-{size:x}"'
+    if etag_matches(request, etag):
+        return not_modified(etag, CACHE_DOCUMENT)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": CACHE_DOCUMENT,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Content-Disposition": content_disposition(filename),
+    }
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    # If-Range không khớp (file đã đổi): bỏ qua Range và trả toàn bộ file
+    if not if_range or if_range in (etag, headers["Last-Modified"]):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}", "Accept-Ranges": "bytes"})
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_iter_file(path, 0, size), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(_iter_file(path, start, length), status_code=206, media_type=media_type, headers=headers)
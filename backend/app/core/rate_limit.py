@@ -0,0 +1,465 @@
+"""
+Giới hạn tần suất request theo user và loại endpoint (429 + Retry-After).
+
+Mỗi (user, loại endpoint) có một token bucket: RATE_LIMIT_<LOẠI>_PER_MINUTE
+token được nạp lại mỗi phút, tối đa RATE_LIMIT_<LOẠI>_BURST token. Các
+endpoint gọi LLM (sinh nội dung, chat) còn bị giới hạn số request đang chạy
+của mỗi user (RATE_LIMIT_MAX_INFLIGHT) để một user không chiếm hết năng lực
+sinh của mọi người, và tổng số request đang chạy (RATE_LIMIT_GLOBAL_INFLIGHT,
+vượt thì trả 503) để backend không nhận thêm việc khi agent đã quá tải.
+
+Trạng thái nằm trong process; với nhiều replica, đặt RATE_LIMIT_REDIS_URL để
+dùng chung qua Redis (mỗi lần kiểm tra là một script Lua nguyên tử). Redis
+lỗi thì tạm dùng giới hạn trong process thay vì chặn request.
+
+Mọi request bị giới hạn theo địa chỉ IP. Request đi qua reverse proxy trong
+RATE_LIMIT_TRUSTED_PROXIES được tính theo IP client thật (X-Forwarded-For/
+X-Real-IP) thay vì IP của proxy. User id do client gửi (header X-User-Id,
+query user_id, field user_id trong body JSON của endpoint sinh nội dung/chat)
+chỉ thu hẹp thêm: request có user id bị giới hạn theo user và theo IP với
+giới hạn gấp RATE_LIMIT_IP_FACTOR lần (nhiều giáo viên sau cùng một NAT), nên
+đổi user id mỗi request không lách được giới hạn theo IP.
+"""
+import asyncio
+import ipaddress
+import json
+import logging
+import math
+import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - redis là tùy chọn
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+# Loại endpoint gọi LLM: bị giới hạn thêm số request đang chạy
+LLM_CLASSES = ("generation", "chat")
+
+# (method, đường dẫn sau API_V1_STR) -> loại endpoint; không khớp -> "default"
+_RULES: List[Tuple[str, "re.Pattern", str]] = [
+    ("POST", re.compile(r"^/lectures/create$"), "generation"),
+    ("POST", re.compile(r"^/lectures/[^/]+/sections/[^/]+/regenerate$"), "generation"),
+    ("POST", re.compile(r"^/slides/create$"), "generation"),
+    ("POST", re.compile(r"^/slides/from-lecture/[^/]+$"), "generation"),
+    ("POST", re.compile(r"^/slides/[^/]+/slides/[^/]+/regenerate$"), "generation"),
+    ("POST", re.compile(r"^/courses/create$"), "generation"),
+    ("POST", re.compile(r"^/courses/[^/]+/retry$"), "generation"),
+    ("POST", re.compile(r"^/chat/message$"), "chat"),
+    ("*", re.compile(r"^/bulk/"), "bulk"),
+]
+
+# Body lớn hơn không được đọc để tìm user_id
+_MAX_IDENTITY_BODY = 64 * 1024
+# Số bucket tối đa giữ trong process (bucket ít dùng nhất bị bỏ, coi như đầy lại)
+_MAX_BUCKETS = 10000
+# Khóa đếm request đang chạy trên Redis tự hết hạn nếu replica chết giữa chừng
+_INFLIGHT_TTL = 600
+_REDIS_PREFIX = "edubot:ratelimit:"
+# Giây giữa hai lần xin chỗ chạy của việc chạy nền khi đã đủ chỗ
+_HOLD_POLL_INTERVAL = 1.0
+
+_rejections = registry.counter(
+    "edubot_rate_limit_rejections_total",
+    "Số request bị từ chối theo loại endpoint và lý do (rate, inflight, overload)",
+    ("endpoint_class", "reason")
+)
+
+# Token bucket: trả về {allowed, số giây chờ}; dùng giờ của Redis để các replica thống nhất
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(wait)}
+"""
+
+# Giữ một chỗ chạy: 1 = được, 0 = một khóa (IP/user) đã đủ, -1 = toàn hệ thống đã đủ.
+# KEYS: bộ đếm của từng khóa rồi bộ đếm toàn hệ thống; ARGV: giới hạn tương ứng rồi TTL
+_ACQUIRE_SCRIPT = """
+local n = #KEYS
+local ttl = tonumber(ARGV[n + 1])
+for i = 1, n - 1 do
+  local limit = tonumber(ARGV[i])
+  if limit > 0 and (tonumber(redis.call('GET', KEYS[i])) or 0) >= limit then
+    return 0
+  end
+end
+local global_limit = tonumber(ARGV[n])
+if global_limit > 0 and (tonumber(redis.call('GET', KEYS[n])) or 0) >= global_limit then
+  return -1
+end
+for i = 1, n do
+  redis.call('INCR', KEYS[i])
+  redis.call('EXPIRE', KEYS[i], ttl)
+end
+return 1
+"""
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """Loại endpoint của request; None nếu không thuộc API (health, metrics, docs)"""
+    prefix = settings.API_V1_STR
+    if not path.startswith(prefix + "/"):
+        return None
+    route = path[len(prefix):]
+    for rule_method, pattern, endpoint_class in _RULES:
+        if rule_method in ("*", method) and pattern.match(route):
+            return endpoint_class
+    return "default"
+
+
+def class_limits(endpoint_class: str) -> Tuple[float, int]:
+    """(token mỗi giây, burst) của loại endpoint; rate 0 = không giới hạn"""
+    name = endpoint_class.upper()
+    per_minute = getattr(settings, f"RATE_LIMIT_{name}_PER_MINUTE")
+    burst = getattr(settings, f"RATE_LIMIT_{name}_BURST")
+    return per_minute / 60.0, max(1, burst)
+
+
+def identity_keys(identity: str) -> List[Tuple[str, int]]:
+    """
+    Các khóa giới hạn của một identity ("ip:<addr>" hoặc "ip:<addr>|user:<id>")
+    kèm hệ số nhân giới hạn: khóa IP của request có user id được gấp
+    RATE_LIMIT_IP_FACTOR lần, các khóa còn lại giới hạn bình thường.
+    """
+    keys = identity.split("|")
+    factor = max(1, settings.RATE_LIMIT_IP_FACTOR) if len(keys) > 1 else 1
+    return [(key, factor if key.startswith("ip:") else 1) for key in keys]
+
+
+class MemoryRateLimitStore:
+    """Token bucket và bộ đếm request đang chạy trong process"""
+
+    def __init__(self):
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._inflight: Dict[str, int] = {}
+        self.inflight_total = 0
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """Lấy một token; trả về 0 nếu được, ngược lại số giây cần chờ"""
+        now = time.monotonic()
+        bucket = self._buckets.pop(key, None) or [float(burst), now]
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = [tokens, now]
+        while len(self._buckets) > _MAX_BUCKETS:
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def acquire(self, limits: List[Tuple[str, int]], global_limit: int) -> Optional[str]:
+        """
+        Giữ một chỗ chạy cho mọi khóa trong limits [(khóa, giới hạn)]; trả về None
+        nếu được, "inflight" / "overload" nếu đã đủ
+        """
+        if any(limit > 0 and self._inflight.get(key, 0) >= limit for key, limit in limits):
+            return "inflight"
+        if global_limit > 0 and self.inflight_total >= global_limit:
+            return "overload"
+        for key, _ in limits:
+            self._inflight[key] = self._inflight.get(key, 0) + 1
+        self.inflight_total += 1
+        return None
+
+    async def release(self, keys: List[str]):
+        for key in keys:
+            count = self._inflight.get(key, 0) - 1
+            if count > 0:
+                self._inflight[key] = count
+            else:
+                self._inflight.pop(key, None)
+        self.inflight_total = max(0, self.inflight_total - 1)
+
+
+class RedisRateLimitStore:
+    """Token bucket và bộ đếm request đang chạy dùng chung giữa các replica qua Redis"""
+
+    def __init__(self, url: str):
+        self._redis = aioredis.from_url(url)
+        self._take = self._redis.register_script(_TAKE_SCRIPT)
+        self._acquire = self._redis.register_script(_ACQUIRE_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        allowed, wait = await self._take(keys=[f"{_REDIS_PREFIX}bucket:{key}"], args=[rate, burst])
+        return 0.0 if int(allowed) else float(wait)
+
+    async def acquire(self, limits: List[Tuple[str, int]], global_limit: int) -> Optional[str]:
+        result = int(await self._acquire(
+            keys=[f"{_REDIS_PREFIX}inflight:{key}" for key, _ in limits] + [f"{_REDIS_PREFIX}inflight"],
+            args=[limit for _, limit in limits] + [global_limit, _INFLIGHT_TTL]
+        ))
+        if result == 0:
+            return "inflight"
+        if result < 0:
+            return "overload"
+        return None
+
+    async def release(self, keys: List[str]):
+        pipe = self._redis.pipeline(transaction=True)
+        for key in keys:
+            pipe.decr(f"{_REDIS_PREFIX}inflight:{key}")
+        pipe.decr(f"{_REDIS_PREFIX}inflight")
+        await pipe.execute()
+
+    async def close(self):
+        await self._redis.close()
+
+
+class RateLimiter:
+    """Chọn store (Redis nếu có cấu hình, ngược lại trong process) và áp giới hạn"""
+
+    def __init__(self):
+        self.local = MemoryRateLimitStore()
+        self.shared: Optional[RedisRateLimitStore] = None
+        registry.gauge(
+            "edubot_rate_limit_inflight",
+            "Số request gọi LLM đang chạy trong process",
+            callback=lambda: {(): self.local.inflight_total}
+        )
+
+    def start(self):
+        """Kết nối Redis dùng chung (nếu có cấu hình)"""
+        if not settings.RATE_LIMIT_REDIS_URL or self.shared is not None:
+            return
+        if aioredis is None:
+            logger.warning("RATE_LIMIT_REDIS_URL is set but the redis package is not installed; using per-process limits")
+            return
+        self.shared = RedisRateLimitStore(settings.RATE_LIMIT_REDIS_URL)
+
+    async def stop(self):
+        if self.shared is not None:
+            await self.shared.close()
+            self.shared = None
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        if self.shared is not None:
+            try:
+                return await self.shared.take(key, rate, burst)
+            except Exception as e:
+                logger.warning(f"Shared rate limit store unavailable, using per-process limits: {e}")
+        return await self.local.take(key, rate, burst)
+
+    async def take_all(self, endpoint_class: str, identity: str) -> float:
+        """Lấy một token ở bucket của mọi khóa của identity; trả về 0 nếu được, ngược lại số giây cần chờ"""
+        rate, burst = class_limits(endpoint_class)
+        if rate <= 0:
+            return 0.0
+        for key, factor in identity_keys(identity):
+            wait = await self.take(f"{endpoint_class}:{key}", rate * factor, burst * factor)
+            if wait > 0:
+                return wait
+        return 0.0
+
+    async def acquire(self, identity: str) -> Tuple[Optional[str], bool]:
+        """Giữ một chỗ chạy; trả về (lý do từ chối hoặc None, có dùng store dùng chung không)"""
+        limits = [(key, settings.RATE_LIMIT_MAX_INFLIGHT * factor) for key, factor in identity_keys(identity)]
+        global_limit = settings.RATE_LIMIT_GLOBAL_INFLIGHT
+        if self.shared is not None:
+            try:
+                return await self.shared.acquire(limits, global_limit), True
+            except Exception as e:
+                logger.warning(f"Shared rate limit store unavailable, using per-process limits: {e}")
+        return await self.local.acquire(limits, global_limit), False
+
+    async def release(self, identity: str, shared: bool):
+        keys = [key for key, _ in identity_keys(identity)]
+        if shared and self.shared is not None:
+            try:
+                await self.shared.release(keys)
+                return
+            except Exception as e:
+                # Khóa đếm trên Redis tự hết hạn sau _INFLIGHT_TTL giây
+                logger.warning(f"Could not release shared in-flight slot for {identity}: {e}")
+                return
+        await self.local.release(keys)
+
+    @asynccontextmanager
+    async def hold(self, identity: str) -> AsyncIterator[None]:
+        """
+        Giữ một chỗ chạy cho việc gọi LLM ở nền (vd. từng bài của khóa học),
+        chờ tới khi user/IP và toàn hệ thống còn chỗ thay vì từ chối.
+        """
+        if not settings.RATE_LIMIT_ENABLED:
+            yield
+            return
+        while True:
+            reason, shared = await self.acquire(identity)
+            if reason is None:
+                break
+            await asyncio.sleep(_HOLD_POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            await self.release(identity, shared)
+
+
+# Singleton instance
+rate_limiter = RateLimiter()
+
+
+async def _buffer_body(receive: Receive) -> Tuple[bytes, List[Message]]:
+    """Đọc hết body (để tìm user_id) và giữ lại các message để phát lại cho ứng dụng"""
+    messages, chunks = [], []
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks), messages
+
+
+def _replay(messages: List[Message], receive: Receive) -> Receive:
+    async def replayed() -> Message:
+        if messages:
+            return messages.pop(0)
+        return await receive()
+    return replayed
+
+
+_trusted_cache: Tuple[str, List] = ("", [])
+
+
+def _trusted_networks() -> List:
+    global _trusted_cache
+    if _trusted_cache[0] != settings.RATE_LIMIT_TRUSTED_PROXIES:
+        networks = []
+        for value in settings.RATE_LIMIT_TRUSTED_PROXIES.split(","):
+            if value.strip():
+                try:
+                    networks.append(ipaddress.ip_network(value.strip(), strict=False))
+                except ValueError:
+                    logger.warning(f"Ignoring invalid trusted proxy {value.strip()!r}")
+        _trusted_cache = (settings.RATE_LIMIT_TRUSTED_PROXIES, networks)
+    return _trusted_cache[1]
+
+
+def _is_trusted(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in _trusted_networks())
+
+
+def client_ip(scope: Scope, headers: Headers) -> str:
+    """IP client; qua proxy tin cậy thì lấy địa chỉ gần nhất chưa phải proxy trong X-Forwarded-For"""
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    if not _is_trusted(address):
+        return address
+    forwarded = [part.strip() for part in headers.get("x-forwarded-for", "").split(",") if part.strip()]
+    for hop in reversed(forwarded):
+        if not _is_trusted(hop):
+            return hop
+    return headers.get("x-real-ip") or (forwarded[0] if forwarded else address)
+
+
+def client_identity(scope: Scope, headers: Headers, body: Optional[bytes]) -> str:
+    """Identity của request: luôn có IP, thêm user id nếu client gửi (xem identity_keys)"""
+    user_id = headers.get("x-user-id") or QueryParams(scope.get("query_string", b"")).get("user_id")
+    if not user_id and body:
+        try:
+            data = json.loads(body)
+            if isinstance(data, dict) and isinstance(data.get("user_id"), str):
+                user_id = data["user_id"]
+        except ValueError:
+            pass
+    identity = f"ip:{client_ip(scope, headers)}"
+    if user_id:
+        identity += f"|user:{user_id}"
+    return identity
+
+
+class RateLimitMiddleware:
+    def __init__(self, app: ASGIApp, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        endpoint_class = classify(scope["method"], scope["path"])
+        if endpoint_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        body = None
+        if endpoint_class in LLM_CLASSES and not headers.get("x-user-id"):
+            content_length = headers.get("content-length")
+            if (
+                "json" in headers.get("content-type", "")
+                and content_length is not None and content_length.isdigit()
+                and int(content_length) <= _MAX_IDENTITY_BODY
+            ):
+                body, messages = await _buffer_body(receive)
+                receive = _replay(messages, receive)
+        identity = client_identity(scope, headers, body)
+        # Cho handler biết user (việc chạy nền như sinh khóa học tính vào cùng giới hạn)
+        scope.setdefault("state", {})["rate_limit_identity"] = identity
+
+        held, shared = False, False
+        if endpoint_class in LLM_CLASSES:
+            reason, shared = await self.limiter.acquire(identity)
+            if reason is not None:
+                await self._reject(scope, receive, send, endpoint_class, reason, settings.RATE_LIMIT_BUSY_RETRY_AFTER)
+                return
+            held = True
+
+        try:
+            wait = await self.limiter.take_all(endpoint_class, identity)
+            if wait > 0:
+                await self._reject(scope, receive, send, endpoint_class, "rate", wait)
+                return
+            await self.app(scope, receive, send)
+        finally:
+            if held:
+                await self.limiter.release(identity, shared)
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send, endpoint_class: str, reason: str, retry_after: float):
+        _rejections.inc(endpoint_class=endpoint_class, reason=reason)
+        messages = {
+            "rate": "Bạn gửi quá nhiều yêu cầu, vui lòng thử lại sau",
+            "inflight": "Bạn đang có quá nhiều yêu cầu đang xử lý, vui lòng chờ hoàn tất",
+            "overload": "Hệ thống đang quá tải, vui lòng thử lại sau",
+        }
+        response = JSONResponse(
+            {"detail": messages[reason]},
+            status_code=503 if reason == "overload" else 429,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,252 @@
+"""
+Thử lại, circuit breaker và hedged request cho lời gọi tới agent.
+
+Mỗi đích (endpoint của agent) có một circuit breaker riêng: sau
+AGENT_CIRCUIT_FAILURES lỗi liên tiếp (lỗi mạng, timeout, 429/502/503/504) circuit mở,
+các lời gọi bị từ chối ngay trong AGENT_CIRCUIT_RESET_SECONDS giây, sau đó một
+request được cho qua để thử; thành công thì đóng lại.
+
+Lời gọi idempotent (sinh nội dung, không có tác dụng phụ ở agent) được thử lại
+tối đa AGENT_RETRY_ATTEMPTS lần với backoff jitter ngẫu nhiên, không vượt quá
+deadline của request; agent trả 503 kèm Retry-After thì chờ ít nhất chừng đó.
+Agent đã tự thử lại lời gọi LLM, nên 500 (lỗi không tạm thời) không được thử
+lại. Nếu bật AGENT_HEDGE_ENABLED, lần gọi chậm hơn p95 độ trễ
+gần đây của đích sẽ có thêm một lần gọi song song; lần nào xong trước thì dùng.
+Lời gọi không idempotent (/process có thể tạo slide nháp) chỉ gọi một lần.
+
+Mọi lần gọi được đếm trong edubot_agent_attempts_total{destination, kind, outcome}.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+import httpx
+
+from app.core import deadline
+from app.core.config import settings
+from app.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Mã lỗi tạm thời: được thử lại và tính là lỗi của đích (500 là lỗi cố định của request)
+RETRYABLE_STATUS = {429, 502, 503, 504}
+# Số độ trễ thành công gần nhất dùng để tính p95 cho hedged request
+_LATENCY_WINDOW = 200
+
+_CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+_attempts = registry.counter(
+    "edubot_agent_attempts_total",
+    "Số lần gọi agent theo đích, loại (primary, retry, hedge) và kết quả",
+    ("destination", "kind", "outcome")
+)
+_attempt_seconds = registry.histogram(
+    "edubot_agent_attempt_seconds",
+    "Thời gian mỗi lần gọi agent (giây)",
+    ("destination",),
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+)
+
+
+def _retry_after(response: Optional[httpx.Response]) -> Optional[float]:
+    """Số giây trong header Retry-After (None nếu không có hoặc không phải số)"""
+    if response is None:
+        return None
+    try:
+        return max(0.0, float(response.headers["retry-after"]))
+    except (KeyError, ValueError):
+        return None
+
+
+class CircuitOpenError(httpx.RequestError):
+    """Circuit của đích đang mở: không gọi, xử lý như không kết nối được"""
+
+
+class CircuitBreaker:
+    def __init__(self):
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Cho phép gọi không (ở half_open chỉ một request thử tại một thời điểm)"""
+        if settings.AGENT_CIRCUIT_FAILURES <= 0:
+            return True
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < settings.AGENT_CIRCUIT_RESET_SECONDS:
+                return False
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open":
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self._failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == "half_open" or self._failures >= settings.AGENT_CIRCUIT_FAILURES > 0:
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """Lần gọi thử kết thúc không rõ kết quả (bị hủy): cho request khác thử"""
+        self._probing = False
+
+
+class _Destination:
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.latencies: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < settings.AGENT_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class ResilientCaller:
+    def __init__(self):
+        self._destinations: Dict[str, _Destination] = {}
+        registry.gauge(
+            "edubot_agent_circuit_state",
+            "Trạng thái circuit breaker theo đích (0 closed, 1 half_open, 2 open)",
+            ("destination",),
+            callback=lambda: {
+                (name,): _CIRCUIT_STATES[state.breaker.state]
+                for name, state in self._destinations.items()
+            }
+        )
+
+    async def call(
+        self,
+        destination: str,
+        send: Callable[[], Awaitable[httpx.Response]],
+        idempotent: bool = True
+    ) -> httpx.Response:
+        """
+        Gọi send() qua circuit breaker của destination, thử lại/hedge nếu idempotent.
+
+        send phải tạo request mới mỗi lần gọi (header deadline được tính lại).
+        Trả về response cuối cùng (có thể vẫn là mã lỗi, bên gọi tự raise_for_status);
+        lỗi mạng của lần cuối được ném ra, circuit mở thì ném CircuitOpenError.
+        """
+        state = self._destinations.setdefault(destination, _Destination())
+        attempts = max(1, settings.AGENT_RETRY_ATTEMPTS) if idempotent else 1
+
+        for attempt in range(attempts):
+            kind = "retry" if attempt else "primary"
+            if not state.breaker.allow():
+                _attempts.inc(destination=destination, kind=kind, outcome="rejected")
+                raise CircuitOpenError(f"Dịch vụ {destination} đang tạm ngưng do lỗi liên tiếp")
+
+            response, error = None, None
+            try:
+                if idempotent and settings.AGENT_HEDGE_ENABLED:
+                    response = await self._hedged(state, destination, send, kind)
+                else:
+                    response = await self._attempt(state, destination, send, kind)
+            except httpx.TransportError as e:
+                error = e
+            if response is not None and response.status_code not in RETRYABLE_STATUS:
+                return response
+
+            delay = random.uniform(0, min(settings.AGENT_RETRY_MAX_BACKOFF, settings.AGENT_RETRY_BACKOFF * 2 ** attempt))
+            retry_after = _retry_after(response)
+            if retry_after is not None:
+                if retry_after > settings.AGENT_RETRY_MAX_BACKOFF:
+                    break  # Agent báo còn lâu mới phục hồi (vd. circuit LLM đang mở)
+                delay = max(delay, retry_after)
+            remaining = deadline.remaining()
+            if attempt == attempts - 1 or (remaining is not None and remaining <= delay):
+                break
+            logger.warning(
+                f"Agent call {destination} attempt {attempt + 1} failed "
+                f"({error or response.status_code}), retrying in {delay:.2f}s"
+            )
+            await asyncio.sleep(delay)
+
+        if response is not None:
+            return response
+        raise error
+
+    async def _attempt(
+        self,
+        state: _Destination,
+        destination: str,
+        send: Callable[[], Awaitable[httpx.Response]],
+        kind: str
+    ) -> httpx.Response:
+        started = time.monotonic()
+        try:
+            response = await send()
+        except httpx.TransportError as e:
+            state.breaker.record_failure()
+            outcome = "timeout" if isinstance(e, httpx.TimeoutException) else "transport_error"
+            _attempts.inc(destination=destination, kind=kind, outcome=outcome)
+            raise
+        except BaseException as e:
+            state.breaker.release()
+            outcome = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+            _attempts.inc(destination=destination, kind=kind, outcome=outcome)
+            raise
+
+        elapsed = time.monotonic() - started
+        _attempt_seconds.observe(elapsed, destination=destination)
+        if response.status_code in RETRYABLE_STATUS:
+            state.breaker.record_failure()
+            _attempts.inc(destination=destination, kind=kind, outcome="server_error")
+        else:
+            # Đích vẫn phản hồi (kể cả lỗi cố định như 500/4xx): không tính vào circuit
+            state.breaker.record_success()
+            state.latencies.append(elapsed)
+            _attempts.inc(destination=destination, kind=kind, outcome="success" if response.status_code < 400 else "error")
+        return response
+
+    async def _hedged(
+        self,
+        state: _Destination,
+        destination: str,
+        send: Callable[[], Awaitable[httpx.Response]],
+        kind: str
+    ) -> httpx.Response:
+        """Gửi thêm một lần gọi nếu lần đầu chưa xong sau p95; dùng kết quả tốt đến trước"""
+        delay = state.p95()
+        if delay is None or state.breaker.state != "closed":
+            return await self._attempt(state, destination, send, kind)
+
+        first = asyncio.ensure_future(self._attempt(state, destination, send, kind))
+        pending = {first}
+        fallback = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+
+            pending.add(asyncio.ensure_future(self._attempt(state, destination, send, "hedge")))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code not in RETRYABLE_STATUS:
+                        return task.result()
+                    fallback = fallback or task
+            return fallback.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+# Singleton instance
+resilient_caller = ResilientCaller()
@@ -0,0 +1,31 @@
+import re
+import unicodedata
+from typing import List
+
+# Tách từ theo ký tự chữ/số (sau khi đã bỏ dấu)
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+
+# Một số từ xuất hiện quá nhiều, không có giá trị khi xếp hạng
+STOPWORDS = frozenset({
+    "va", "la", "cua", "cho", "cac", "nhung", "mot", "trong", "voi", "ve",
+    "de", "co", "khong", "duoc", "nay", "do", "thi", "tu", "toi", "ban",
+    "the", "a", "an", "of", "and", "or", "to", "in", "on", "for", "is",
+})
+
+
+def fold_text(text: str) -> str:
+    """Chuẩn hóa chuỗi: bỏ dấu tiếng Việt, chuyển về chữ thường"""
+    if not text:
+        return ""
+    text = text.replace("đ", "d").replace("Đ", "D")
+    normalized = unicodedata.normalize("NFKD", text)
+    stripped = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return stripped.lower()
+
+
+def tokenize(text: str, drop_stopwords: bool = False) -> List[str]:
+    """Tách chuỗi thành danh sách token đã bỏ dấu"""
+    tokens = _TOKEN_RE.findall(fold_text(text))
+    if drop_stopwords:
+        return [t for t in tokens if t not in STOPWORDS]
+    return tokens
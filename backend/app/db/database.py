@@ -1,37 +1,106 @@
 import motor.motor_asyncio
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from typing import Dict, Optional
+import asyncio
 import logging
 
 from app.core.config import settings
+from app.db.indexes import ensure_indexes
+from app.db.profiler import query_profiler
 
 logger = logging.getLogger(__name__)
 
 class Database:
     client: AsyncIOMotorClient = None
     database: AsyncIOMotorDatabase = None
+    index_task: Optional[asyncio.Task] = None
+    # Handle database theo workload đọc (read preference riêng)
+    workloads: Dict[str, AsyncIOMotorDatabase] = {}
 
 db = Database()
 
-async def get_database() -> AsyncIOMotorDatabase:
+_READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+def _workload_read_preferences() -> Dict[str, str]:
+    """
+    Workload đọc có thể chuyển sang secondary: danh sách/tìm kiếm theo trang
+    (list), nạp index tìm kiếm (search) và index gợi ý (suggest). Ghi và đọc
+    ngay sau khi ghi (chi tiết, refresh index, thăm dò thông báo) luôn dùng
+    handle mặc định trên primary.
+    """
+    return {
+        "list": settings.MONGODB_READ_PREFERENCE_LIST,
+        "search": settings.MONGODB_READ_PREFERENCE_SEARCH,
+        "suggest": settings.MONGODB_READ_PREFERENCE_SUGGEST,
+    }
+
+def _read_preference(mode: str):
+    if mode not in _READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {mode}")
+    if mode == "primary":
+        return Primary()
+    staleness = settings.MONGODB_MAX_STALENESS_SECONDS
+    return _READ_PREFERENCES[mode](max_staleness=staleness if staleness > 0 else -1)
+
+async def get_database(workload: Optional[str] = None) -> AsyncIOMotorDatabase:
+    if workload is not None:
+        return db.workloads.get(workload, db.database)
     return db.database
 
+def read_lag(workload: str) -> float:
+    """Độ trễ tối đa (giây) của dữ liệu đọc theo workload; dùng để lùi mốc đồng bộ tăng dần"""
+    if _workload_read_preferences().get(workload, "primary") == "primary":
+        return 0.0
+    # Không giới hạn độ trễ: lùi theo mức tối thiểu MongoDB cho phép đặt
+    return float(settings.MONGODB_MAX_STALENESS_SECONDS if settings.MONGODB_MAX_STALENESS_SECONDS > 0 else 90)
+
+def _client_options() -> dict:
+    """Tùy chọn pool/timeout/nén; giá trị 0 hoặc rỗng nghĩa là dùng mặc định của driver"""
+    options = {
+        "maxPoolSize": settings.MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGODB_MIN_POOL_SIZE,
+        "connectTimeoutMS": settings.MONGODB_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+    }
+    optional = {
+        "maxIdleTimeMS": settings.MONGODB_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        "socketTimeoutMS": settings.MONGODB_SOCKET_TIMEOUT_MS,
+        "compressors": settings.MONGODB_COMPRESSORS,
+    }
+    options.update({key: value for key, value in optional.items() if value})
+    return options
+
 async def connect_to_db():
     """Create database connection"""
     logger.info("Connecting to MongoDB...")
     try:
         db.client = AsyncIOMotorClient(
             settings.MONGODB_URL,
-            maxPoolSize=10,
-            minPoolSize=10,
+            event_listeners=[query_profiler, query_profiler.pool_monitor],
+            **_client_options()
         )
+        query_profiler.attach(db.client)
         db.database = db.client[settings.DATABASE_NAME]
+        db.workloads = {
+            workload: db.client.get_database(settings.DATABASE_NAME, read_preference=_read_preference(mode))
+            for workload, mode in _workload_read_preferences().items()
+            if mode != "primary"
+        }
         
         # Test connection
         await db.client.admin.command('ping')
         logger.info(f"Connected to MongoDB: {settings.DATABASE_NAME}")
         
-        # Create indexes
-        await create_indexes()
+        # Tạo index ở nền: build index trên collection lớn không chặn khởi động
+        db.index_task = asyncio.create_task(create_indexes())
         
     except Exception as e:
         logger.error(f"Failed to connect to MongoDB: {e}")
@@ -40,30 +109,19 @@ async def connect_to_db():
 async def close_db_connection():
     """Close database connection"""
     logger.info("Closing connection to MongoDB...")
+    if db.index_task and not db.index_task.done():
+        db.index_task.cancel()
+        await asyncio.gather(db.index_task, return_exceptions=True)
     if db.client:
+        query_profiler.detach()
         db.client.close()
+        db.workloads = {}
 
 async def create_indexes():
-    """Create database indexes for better performance"""
+    """Tạo các index khai báo trong app.db.indexes (index đã có được bỏ qua)"""
     try:
-        # Chat sessions indexes
-        await db.database.chat_sessions.create_index("user_id")
-        await db.database.chat_sessions.create_index("created_at")
-        
-        # Chat messages indexes
-        await db.database.chat_messages.create_index([("session_id", 1), ("created_at", 1)])
-        
-        # Lectures indexes
-        await db.database.lectures.create_index("user_id")
-        await db.database.lectures.create_index("subject")
-        await db.database.lectures.create_index("created_at")
-        
-        # Slides indexes
-        await db.database.slides.create_index("user_id")
-        await db.database.slides.create_index("subject")
-        await db.database.slides.create_index("created_at")
-        
-        logger.info("Database indexes created successfully")
+        created = await ensure_indexes(db.database)
+        logger.info(f"Database indexes ensured: {sum(len(names) for names in created.values())} indexes")
         
     except Exception as e:
         logger.error(f"Failed to create indexes: {e}")
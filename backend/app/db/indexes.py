@@ -0,0 +1,308 @@
+"""
+Danh mục index của MongoDB, suy ra từ các truy vấn của service.
+
+INDEXES là nguồn duy nhất: create_indexes() khi khởi động, database/init.js
+và lệnh đối chiếu (python -m scripts.manage_indexes) đều dựa trên nó. Mỗi
+index ghi rõ truy vấn mà nó phục vụ; QUERY_SHAPES liệt kê dạng truy vấn của
+từng service để kiểm tra bằng explain() rằng không truy vấn nào phải quét
+toàn bộ collection (COLLSCAN).
+
+Khi thêm truy vấn mới vào service: thêm dạng truy vấn vào QUERY_SHAPES, thêm
+index nếu cần, rồi chạy `python -m scripts.manage_indexes js` để cập nhật
+init.js.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from pymongo import IndexModel
+
+IndexKeys = Sequence[Tuple[str, int]]
+
+
+def index_name(keys: IndexKeys) -> str:
+    """Tên mặc định MongoDB đặt cho index (user_id_1_created_at_-1)"""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+class IndexSpec:
+    """Một index khai báo: collection, khóa, tùy chọn và truy vấn mà nó phục vụ"""
+
+    def __init__(self, collection: str, keys: IndexKeys, serves: str, unique: bool = False, expire_after_seconds: Optional[int] = None):
+        self.collection = collection
+        self.keys = [tuple(key) for key in keys]
+        self.serves = serves
+        self.unique = unique
+        self.expire_after_seconds = expire_after_seconds  # Index TTL: MongoDB tự xóa document hết hạn
+
+    @property
+    def name(self) -> str:
+        return index_name(self.keys)
+
+    def model(self) -> IndexModel:
+        # background chỉ có tác dụng với MongoDB < 4.2; bản mới luôn build không khóa collection
+        options: Dict[str, Any] = {"name": self.name, "background": True}
+        if self.unique:
+            options["unique"] = True
+        if self.expire_after_seconds is not None:
+            options["expireAfterSeconds"] = self.expire_after_seconds
+        return IndexModel(self.keys, **options)
+
+    def to_js(self) -> str:
+        keys = ", ".join(f"{field}: {direction}" for field, direction in self.keys)
+        options = []
+        if self.unique:
+            options.append("unique: true")
+        if self.expire_after_seconds is not None:
+            options.append(f"expireAfterSeconds: {self.expire_after_seconds}")
+        suffix = f", {{ {', '.join(options)} }}" if options else ""
+        return f"db.{self.collection}.createIndex({{ {keys} }}{suffix});"
+
+
+INDEXES: List[IndexSpec] = [
+    # Chat
+    IndexSpec("chat_sessions", [("user_id", 1), ("status", 1), ("updated_at", -1)],
+              "chat_service.get_user_sessions: session của user theo status, mới cập nhật trước"),
+    IndexSpec("chat_sessions", [("updated_at", -1)],
+              "GET /chat/sessions: tất cả session chưa xóa, mới cập nhật trước"),
+    IndexSpec("chat_sessions", [("archived_at", 1), ("updated_at", 1)],
+              "archive_service.archive_inactive: session chưa lưu trữ, không hoạt động"),
+    IndexSpec("chat_sessions", [("status", 1), ("updated_at", 1)],
+              "archive_service.purge_deleted: session đã xóa quá hạn"),
+    IndexSpec("chat_messages", [("session_id", 1), ("created_at", 1)],
+              "chat_service.get_chat_history, đếm tin nhắn, $lookup và lưu trữ theo session_id"),
+    IndexSpec("chat_archives", [("session_id", 1), ("part", 1)],
+              "archive_service: đọc/ghi/xóa bản lưu trữ theo session", unique=True),
+
+    # Bài giảng / slide
+    IndexSpec("lectures", [("user_id", 1), ("created_at", -1)],
+              "lecture_service.get_lectures/search_lectures lọc theo user, mới tạo trước"),
+    IndexSpec("lectures", [("created_at", -1)],
+              "lecture_service.get_lectures/search_lectures không lọc user"),
+    IndexSpec("lectures", [("updated_at", 1)],
+              "notification_service (thăm dò thay đổi), search/suggestion đồng bộ theo updated_at"),
+    IndexSpec("slides", [("user_id", 1), ("created_at", -1)],
+              "slide_service.get_slides/search_slides lọc theo user, mới tạo trước"),
+    IndexSpec("slides", [("created_at", -1)],
+              "slide_service.get_slides/search_slides không lọc user"),
+    IndexSpec("slides", [("updated_at", 1)],
+              "notification_service (thăm dò thay đổi), search/suggestion đồng bộ theo updated_at"),
+
+    # Lịch sử phiên bản
+    IndexSpec("lecture_versions", [("doc_id", 1), ("version", 1)],
+              "version_service: mọi truy vấn theo doc_id (+ version / type / created_at)", unique=True),
+    IndexSpec("slide_versions", [("doc_id", 1), ("version", 1)],
+              "version_service: mọi truy vấn theo doc_id (+ version / type / created_at)", unique=True),
+
+    # Khóa học (sinh nhiều bài giảng)
+    IndexSpec("courses", [("user_id", 1), ("created_at", -1)],
+              "course_service.get_courses lọc theo user"),
+    IndexSpec("courses", [("created_at", -1)],
+              "course_service.get_courses không lọc user"),
+    IndexSpec("courses", [("status", 1)],
+              "course_service.resume_pending_courses"),
+
+    # Tài liệu upload (RAG)
+    IndexSpec("documents", [("user_id", 1), ("created_at", -1)],
+              "document_service.list_documents lọc theo user"),
+    IndexSpec("documents", [("created_at", -1)],
+              "document_service.list_documents không lọc user"),
+    IndexSpec("documents", [("sha256", 1), ("status", 1)],
+              "document_service: tìm bản đã ingest cùng nội dung, đếm tham chiếu khi xóa"),
+    IndexSpec("documents", [("status", 1)],
+              "document_service.resume_pending_ingestions"),
+    IndexSpec("document_chunks", [("sha256", 1), ("seq", 1)],
+              "document_service: đọc/xóa chunk theo tài liệu", unique=True),
+
+    # Idempotency-Key của các API tạo (TTL theo expires_at)
+    IndexSpec("idempotency_keys", [("expires_at", 1)],
+              "MongoDB tự xóa khóa hết hạn (IDEMPOTENCY_TTL)", expire_after_seconds=0),
+
+    # Người dùng (chưa có service, giữ ràng buộc email duy nhất)
+    IndexSpec("users", [("email", 1)], "ràng buộc email duy nhất", unique=True),
+]
+
+
+class QueryShape:
+    """Dạng truy vấn của một service (giá trị mẫu) để kiểm tra kế hoạch thực thi"""
+
+    def __init__(
+        self,
+        collection: str,
+        filter: Dict[str, Any],
+        source: str,
+        sort: Optional[IndexKeys] = None
+    ):
+        self.collection = collection
+        self.filter = filter
+        self.source = source
+        self.sort = [tuple(key) for key in sort] if sort else None
+
+    def command(self) -> Dict[str, Any]:
+        """Lệnh find tương ứng để chạy explain"""
+        command: Dict[str, Any] = {"find": self.collection, "filter": self.filter}
+        if self.sort:
+            command["sort"] = dict(self.sort)
+        return command
+
+
+_USER = "user_sample"
+_OID = ObjectId("000000000000000000000000")
+_SHA = "0" * 64
+_SINCE = datetime(2024, 1, 1)
+_SEARCH = {"$or": [
+    {"title": {"$regex": "đại số", "$options": "i"}},
+    {"subject": {"$regex": "đại số", "$options": "i"}},
+    {"description": {"$regex": "đại số", "$options": "i"}},
+]}
+
+# Các lần nạp toàn bộ collection khi khởi động (search_service, suggestion_service)
+# cố ý quét hết nên không có trong danh sách này.
+QUERY_SHAPES: List[QueryShape] = [
+    QueryShape("chat_sessions", {"user_id": _USER, "status": "active"},
+               "chat_service.get_user_sessions", sort=[("updated_at", -1)]),
+    QueryShape("chat_sessions", {"user_id": _USER, "status": {"$ne": "deleted"}},
+               "chat_service.get_user_sessions (aggregate)", sort=[("updated_at", -1)]),
+    QueryShape("chat_sessions", {"status": {"$ne": "deleted"}},
+               "GET /chat/sessions", sort=[("updated_at", -1)]),
+    QueryShape("chat_sessions", {"archived_at": None, "$or": [{"status": "deleted"}, {"updated_at": {"$lt": _SINCE}}]},
+               "archive_service.archive_inactive"),
+    QueryShape("chat_sessions", {"status": "deleted", "updated_at": {"$lt": _SINCE}}, "archive_service.purge_deleted"),
+    QueryShape("chat_messages", {"session_id": str(_OID)},
+               "chat_service.get_chat_history", sort=[("created_at", 1)]),
+    QueryShape("chat_archives", {"session_id": str(_OID)}, "archive_service._load_archive", sort=[("part", 1)]),
+
+    QueryShape("lectures", {"user_id": _USER}, "lecture_service.get_lectures", sort=[("created_at", -1)]),
+    QueryShape("lectures", {}, "lecture_service.get_lectures", sort=[("created_at", -1)]),
+    QueryShape("lectures", dict(_SEARCH, user_id=_USER), "lecture_service.search_lectures", sort=[("created_at", -1)]),
+    QueryShape("lectures", _SEARCH, "lecture_service.search_lectures", sort=[("created_at", -1)]),
+    QueryShape("lectures", {"updated_at": {"$gte": _SINCE}}, "notification_service._poll", sort=[("updated_at", 1)]),
+    QueryShape("slides", {"user_id": _USER}, "slide_service.get_slides", sort=[("created_at", -1)]),
+    QueryShape("slides", {}, "slide_service.get_slides", sort=[("created_at", -1)]),
+    QueryShape("slides", dict(_SEARCH, user_id=_USER), "slide_service.search_slides", sort=[("created_at", -1)]),
+    QueryShape("slides", _SEARCH, "slide_service.search_slides", sort=[("created_at", -1)]),
+    QueryShape("slides", {"updated_at": {"$gte": _SINCE}}, "notification_service._poll", sort=[("updated_at", 1)]),
+
+    QueryShape("lecture_versions", {"doc_id": _OID}, "version_service.list_versions", sort=[("version", -1)]),
+    QueryShape("lecture_versions", {"doc_id": _OID, "type": "snapshot", "version": {"$lte": 5}},
+               "version_service._state_at", sort=[("version", -1)]),
+    QueryShape("lecture_versions", {"doc_id": _OID, "created_at": {"$gte": _SINCE}},
+               "version_service._apply_retention", sort=[("version", 1)]),
+    QueryShape("slide_versions", {"doc_id": _OID, "version": 3}, "version_service.get_version"),
+
+    QueryShape("courses", {"user_id": _USER}, "course_service.get_courses", sort=[("created_at", -1)]),
+    QueryShape("courses", {}, "course_service.get_courses", sort=[("created_at", -1)]),
+    QueryShape("courses", {"status": "generating"}, "course_service.resume_pending_courses"),
+
+    QueryShape("documents", {"user_id": _USER}, "document_service.list_documents", sort=[("created_at", -1)]),
+    QueryShape("documents", {}, "document_service.list_documents", sort=[("created_at", -1)]),
+    QueryShape("documents", {"sha256": _SHA, "status": "ready"}, "document_service._ingest"),
+    QueryShape("documents", {"sha256": _SHA}, "document_service.delete_document"),
+    QueryShape("documents", {"status": {"$in": ["pending", "ingesting"]}}, "document_service.resume_pending_ingestions"),
+    QueryShape("document_chunks", {"sha256": _SHA, "seq": {"$gte": 10}}, "document_service._ingest"),
+    QueryShape("document_chunks", {"$or": [{"sha256": _SHA, "seq": 1}, {"sha256": _SHA, "seq": 2}]},
+               "document_service.retrieve"),
+]
+
+
+def indexes_by_collection() -> Dict[str, List[IndexSpec]]:
+    grouped: Dict[str, List[IndexSpec]] = {}
+    for spec in INDEXES:
+        grouped.setdefault(spec.collection, []).append(spec)
+    return grouped
+
+
+async def ensure_indexes(database) -> Dict[str, List[str]]:
+    """Tạo các index còn thiếu (createIndexes bỏ qua index đã có), trả về tên theo collection"""
+    created = {}
+    for collection, specs in indexes_by_collection().items():
+        created[collection] = await database[collection].create_indexes([spec.model() for spec in specs])
+    return created
+
+
+def _key_list(info: dict) -> List[Tuple[str, Any]]:
+    return [tuple(key) for key in (info["key"].items() if isinstance(info["key"], dict) else info["key"])]
+
+
+def _is_prefix(shorter: List[Tuple[str, Any]], longer: List[Tuple[str, Any]]) -> bool:
+    return len(shorter) < len(longer) and longer[:len(shorter)] == shorter
+
+
+async def reconcile(database) -> Dict[str, List[dict]]:
+    """
+    Đối chiếu index thực tế với INDEXES.
+
+    - missing: khai báo nhưng chưa có trong database
+    - extra: có trong database nhưng không khai báo (ứng viên để xóa)
+    - unused: có nhưng chưa được dùng lần nào từ khi mongod khởi động ($indexStats)
+    - redundant: khóa là tiền tố của index khác (index dài hơn đã phục vụ được), trừ index unique
+    """
+    report: Dict[str, List[dict]] = {"missing": [], "extra": [], "unused": [], "redundant": []}
+    declared = indexes_by_collection()
+    existing_collections = set(await database.list_collection_names())
+
+    for collection in sorted(set(declared) | existing_collections):
+        specs = declared.get(collection, [])
+        actual: Dict[str, dict] = {}
+        stats: Dict[str, dict] = {}
+        if collection in existing_collections:
+            actual = {info["name"]: info async for info in database[collection].list_indexes()}
+            try:
+                async for stat in database[collection].aggregate([{"$indexStats": {}}]):
+                    stats[stat["name"]] = stat
+            except Exception:
+                # $indexStats cần quyền clusterMonitor hoặc không được hỗ trợ (bản mock)
+                stats = {}
+
+        declared_keys = {tuple(spec.keys) for spec in specs}
+        actual_keys = {tuple(_key_list(info)) for info in actual.values()}
+        for spec in specs:
+            if tuple(spec.keys) not in actual_keys:
+                report["missing"].append({"collection": collection, "name": spec.name, "serves": spec.serves})
+
+        for name, info in actual.items():
+            if name == "_id_":
+                continue
+            keys = _key_list(info)
+            entry = {"collection": collection, "name": name}
+            if tuple(keys) not in declared_keys:
+                report["extra"].append(entry)
+            stat = stats.get(name)
+            # Index TTL được dùng bởi tiến trình xóa nền, không tính trong $indexStats
+            if stat is not None and stat.get("accesses", {}).get("ops", 0) == 0 and "expireAfterSeconds" not in info:
+                report["unused"].append(dict(entry, since=stat["accesses"].get("since")))
+            if not info.get("unique"):
+                covering = [
+                    other_name for other_name, other in actual.items()
+                    if other_name != name and _is_prefix(keys, _key_list(other))
+                ]
+                if covering:
+                    report["redundant"].append(dict(entry, covered_by=covering))
+    return report
+
+
+def _stages(plan: dict):
+    yield plan.get("stage")
+    for child in ("inputStage", "outerStage", "innerStage"):
+        if child in plan:
+            yield from _stages(plan[child])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+async def explain_query_shapes(database) -> List[dict]:
+    """Chạy explain cho từng dạng truy vấn, trả về kế hoạch thắng và có COLLSCAN hay không"""
+    results = []
+    for shape in QUERY_SHAPES:
+        explained = await database.command({"explain": shape.command(), "verbosity": "queryPlanner"})
+        winning = explained["queryPlanner"]["winningPlan"]
+        # MongoDB 7 dùng slot-based engine: kế hoạch nằm trong queryPlan
+        winning = winning.get("queryPlan", winning)
+        stages = [stage for stage in _stages(winning) if stage]
+        results.append({
+            "collection": shape.collection,
+            "source": shape.source,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return results
@@ -0,0 +1,382 @@
+"""
+Theo dõi truy vấn MongoDB chậm qua command monitoring của pymongo.
+
+QueryProfiler được đăng ký làm event listener của AsyncIOMotorClient: đo thời
+gian từng lệnh theo loại lệnh và collection (histogram trên /metrics), giữ
+vòng đệm các truy vấn vượt PROFILER_SLOW_MS kèm filter đã che giá trị, và tự
+chạy explain (queryPlanner, không thực thi lại truy vấn) cho truy vấn đọc vượt
+PROFILER_EXPLAIN_MS. PoolMonitor đo thời gian chờ lấy connection từ pool để
+biết khi nào maxPoolSize là nút thắt.
+
+Listener được pymongo gọi trong thread của Motor nên mọi trạng thái dùng chung
+đều được bảo vệ bằng khóa; explain được đẩy về event loop.
+"""
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import threading
+import time
+
+from pymongo import monitoring
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Lệnh đọc được explain (explain lệnh ghi ở chế độ queryPlanner không ghi nhưng không cần thiết)
+_EXPLAINABLE = ("find", "aggregate", "count", "distinct")
+# Field chứa điều kiện lọc trong từng loại lệnh
+_FILTER_FIELDS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "aggregate": "pipeline",
+}
+# Field của driver/phiên, bỏ khi dựng lại lệnh để explain
+_DRIVER_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "autocommit", "startTransaction", "signature"}
+# Không giữ nội dung các lệnh này (xác thực, handshake)
+_IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "authenticate", "endSessions", "buildInfo", "explain"}
+# Khoảng thời gian tối thiểu giữa hai lần explain cùng một dạng truy vấn
+_EXPLAIN_COOLDOWN = 300.0
+
+_command_duration = registry.histogram(
+    "edubot_mongo_command_duration_seconds",
+    "Thời gian thực hiện lệnh MongoDB theo loại lệnh và collection",
+    ("command", "collection")
+)
+_command_failures = registry.counter(
+    "edubot_mongo_command_failures_total",
+    "Số lệnh MongoDB lỗi theo loại lệnh và collection",
+    ("command", "collection")
+)
+_slow_queries = registry.counter(
+    "edubot_mongo_slow_queries_total",
+    "Số lệnh MongoDB vượt ngưỡng PROFILER_SLOW_MS",
+    ("command", "collection")
+)
+_pool_wait = registry.histogram(
+    "edubot_mongo_pool_wait_seconds",
+    "Thời gian chờ lấy connection từ pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+_pool_checkout_failures = registry.counter(
+    "edubot_mongo_pool_checkout_failures_total",
+    "Số lần không lấy được connection từ pool theo lý do",
+    ("reason",)
+)
+
+
+def redact(value: Any, depth: int = 0) -> Any:
+    """Giữ cấu trúc (tên field, toán tử), thay mọi giá trị bằng '?' ; mảng dài chỉ giữ vài phần tử"""
+    if depth > 8:
+        return "?"
+    if isinstance(value, dict):
+        return {key: redact(item, depth + 1) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [redact(item, depth + 1) for item in value[:3]]
+        if len(value) > 3:
+            items.append(f"... {len(value) - 3} more")
+        return items
+    return "?"
+
+
+def _redact_pipeline(pipeline: List[dict]) -> List[dict]:
+    """Pipeline: giữ nguyên các stage định hình ($sort, $limit, $project...), chỉ che giá trị lọc"""
+    result = []
+    for stage in pipeline:
+        name = next(iter(stage), None)
+        if name in ("$match", "$lookup", "$addFields", "$set", "$facet", "$graphLookup", "$unionWith"):
+            result.append({name: redact(stage[name])})
+        else:
+            result.append(stage)
+    return result
+
+
+def _collection_of(command_name: str, command: dict) -> str:
+    if command_name == "getMore":
+        return str(command.get("collection", ""))
+    target = command.get(command_name)
+    return target if isinstance(target, str) else ""
+
+
+class _Pending:
+    __slots__ = ("collection", "summary", "command")
+
+    def __init__(self, collection: str, summary: dict, command: Optional[dict]):
+        self.collection = collection
+        self.summary = summary
+        self.command = command
+
+
+class QueryProfiler(monitoring.CommandListener):
+    """Đo thời gian lệnh MongoDB, giữ danh sách truy vấn chậm và kế hoạch explain"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[int, Any], _Pending] = {}
+        self._slow: deque = deque(maxlen=max(settings.PROFILER_BUFFER_SIZE, 1))
+        self._stats: Dict[Tuple[str, str], List[float]] = {}  # [count, total_ms, max_ms]
+        self._explained_at: Dict[str, float] = {}
+        self._client = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.pool_monitor = PoolMonitor()
+
+    def attach(self, client):
+        """Gắn client (để chạy explain) và event loop hiện tại; gọi sau khi tạo client"""
+        self._client = client
+        self._loop = asyncio.get_running_loop()
+        self.pool_monitor.max_pool_size = client.options.pool_options.max_pool_size
+
+    def detach(self):
+        self._client = None
+        self._loop = None
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if event.command_name in _IGNORED_COMMANDS:
+            return
+        command = event.command
+        collection = _collection_of(event.command_name, command)
+        summary = self._summarize(event.command_name, command)
+        keep_command = settings.PROFILER_EXPLAIN_MS > 0 and event.command_name in _EXPLAINABLE
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = _Pending(
+                collection, summary, command if keep_command else None
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        with self._lock:
+            pending = self._pending.pop((event.request_id, event.connection_id), None)
+        if pending is None:
+            return
+        self._record(event, pending, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        with self._lock:
+            pending = self._pending.pop((event.request_id, event.connection_id), None)
+        if pending is None:
+            return
+        _command_failures.inc(command=event.command_name, collection=pending.collection)
+        self._record(event, pending, failed=True)
+
+    def slow_queries(self, limit: int = 50, order: str = "duration") -> List[dict]:
+        with self._lock:
+            entries = [dict(entry) for entry in self._slow]
+        if order == "duration":
+            entries.sort(key=lambda entry: entry["duration_ms"], reverse=True)
+        else:
+            entries.reverse()
+        return entries[:limit]
+
+    def command_stats(self) -> List[dict]:
+        with self._lock:
+            items = [(key, list(values)) for key, values in self._stats.items()]
+        stats = [
+            {
+                "command": command,
+                "collection": collection,
+                "count": int(count),
+                "total_ms": round(total, 3),
+                "avg_ms": round(total / count, 3) if count else 0.0,
+                "max_ms": round(maximum, 3),
+            }
+            for (command, collection), (count, total, maximum) in items
+        ]
+        stats.sort(key=lambda item: item["total_ms"], reverse=True)
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self._slow.clear()
+            self._stats.clear()
+            self._explained_at.clear()
+
+    def _summarize(self, command_name: str, command: dict) -> dict:
+        summary: Dict[str, Any] = {}
+        field = _FILTER_FIELDS.get(command_name)
+        if field == "pipeline":
+            summary["pipeline"] = _redact_pipeline(command.get("pipeline", []))
+        elif field and field in command:
+            summary["filter"] = redact(command[field])
+        elif command_name in ("update", "delete"):
+            statements = command.get("updates" if command_name == "update" else "deletes") or []
+            if statements:
+                summary["filter"] = redact(statements[0].get("q", {}))
+                summary["statements"] = len(statements)
+        elif command_name == "insert":
+            summary["documents"] = len(command.get("documents") or [])
+        for key in ("sort", "limit", "skip"):
+            if key in command:
+                summary[key] = command[key]
+        return summary
+
+    def _record(self, event, pending: _Pending, failed: bool):
+        command_name = event.command_name
+        duration_ms = event.duration_micros / 1000
+        _command_duration.observe(duration_ms / 1000, command=command_name, collection=pending.collection)
+
+        with self._lock:
+            stats = self._stats.setdefault((command_name, pending.collection), [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += duration_ms
+            stats[2] = max(stats[2], duration_ms)
+
+        if settings.PROFILER_SLOW_MS <= 0 or duration_ms < settings.PROFILER_SLOW_MS:
+            return
+        _slow_queries.inc(command=command_name, collection=pending.collection)
+        entry = {
+            "command": command_name,
+            "database": event.database_name,
+            "collection": pending.collection,
+            "duration_ms": round(duration_ms, 3),
+            "failed": failed,
+            "at": datetime.utcnow(),
+            **pending.summary,
+        }
+        if not failed and command_name in ("find", "aggregate", "getMore"):
+            cursor = (event.reply or {}).get("cursor") or {}
+            batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+            if batch is not None:
+                entry["returned"] = len(batch)
+        with self._lock:
+            self._slow.append(entry)
+
+        if (
+            pending.command is not None
+            and not failed
+            and settings.PROFILER_EXPLAIN_MS > 0
+            and duration_ms >= settings.PROFILER_EXPLAIN_MS
+            and self._loop is not None
+        ):
+            shape = f"{command_name}:{pending.collection}:{pending.summary}"
+            now = time.monotonic()
+            with self._lock:
+                if now - self._explained_at.get(shape, float("-inf")) < _EXPLAIN_COOLDOWN:
+                    return
+                self._explained_at[shape] = now
+            command = {key: value for key, value in pending.command.items() if key not in _DRIVER_FIELDS}
+            try:
+                self._loop.call_soon_threadsafe(self._start_explain, entry, event.database_name, command)
+            except RuntimeError:
+                # Event loop đã đóng (đang tắt ứng dụng)
+                pass
+
+    def _start_explain(self, entry: dict, database_name: str, command: dict):
+        asyncio.ensure_future(self._explain(entry, database_name, command))
+
+    async def _explain(self, entry: dict, database_name: str, command: dict):
+        if self._client is None:
+            return
+        try:
+            explained = await self._client[database_name].command(
+                {"explain": command, "verbosity": "queryPlanner"}
+            )
+            winning = explained.get("queryPlanner", {}).get("winningPlan", {})
+            winning = winning.get("queryPlan", winning)
+            stages, indexes = [], []
+            _walk_plan(winning, stages, indexes)
+            plan = {"stages": stages, "indexes": indexes, "collscan": "COLLSCAN" in stages}
+        except Exception as e:
+            logger.error(f"Error explaining slow {entry['command']} on {entry['collection']}: {e}")
+            plan = {"error": str(e)}
+        with self._lock:
+            entry["plan"] = plan
+        if plan.get("collscan"):
+            logger.warning(
+                f"Slow {entry['command']} on {entry['collection']} ({entry['duration_ms']} ms) uses COLLSCAN: "
+                f"{entry.get('filter', entry.get('pipeline'))}"
+            )
+
+
+def _walk_plan(plan: dict, stages: List[str], indexes: List[str]):
+    if not plan:
+        return
+    if plan.get("stage"):
+        stages.append(plan["stage"])
+    if plan.get("indexName"):
+        indexes.append(plan["indexName"])
+    for child in ("inputStage", "outerStage", "innerStage"):
+        if child in plan:
+            _walk_plan(plan[child], stages, indexes)
+    for child in plan.get("inputStages", []):
+        _walk_plan(child, stages, indexes)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Thời gian chờ lấy connection và số connection đang được dùng"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.max_pool_size: Optional[int] = None
+        registry.gauge(
+            "edubot_mongo_pool_connections_in_use", "Số connection MongoDB đang được dùng",
+            callback=lambda: {(): self.in_use}
+        )
+        registry.gauge(
+            "edubot_mongo_pool_max_size", "maxPoolSize của client MongoDB",
+            callback=lambda: {(): self.max_pool_size} if self.max_pool_size else {}
+        )
+
+    def stats(self) -> dict:
+        count = _pool_wait.count()
+        total = _pool_wait.total()
+        return {
+            "in_use": self.in_use,
+            "max_pool_size": self.max_pool_size,
+            "checkouts": int(count),
+            "avg_wait_ms": round(total / count * 1000, 3) if count else 0.0,
+            "total_wait_ms": round(total * 1000, 3),
+        }
+
+    def connection_check_out_started(self, event):
+        # Lấy connection và sự kiện kết thúc luôn diễn ra trên cùng một thread
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        self._observe_wait()
+        with self._lock:
+            self.in_use += 1
+
+    def connection_check_out_failed(self, event):
+        self._observe_wait()
+        _pool_checkout_failures.inc(reason=str(event.reason))
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def _observe_wait(self):
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            _pool_wait.observe(time.perf_counter() - started)
+            self._local.started = None
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+
+# Singleton instance
+query_profiler = QueryProfiler()
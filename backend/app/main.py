@@ -1,11 +1,26 @@
 from fastapi import FastAPI, HTTPException, Depends
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import logging
 
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
+from app.core.deadline import DeadlineMiddleware
+from app.core.fast_json import FastJSONResponse
+from app.core.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, registry as metrics_registry
+from app.core.rate_limit import RateLimitMiddleware, rate_limiter
 from app.db.database import close_db_connection, connect_to_db
 from app.api.v1.api import api_router
+from app.services.archive_service import archive_service
+from app.services.cache_service import cache_service
+from app.services.course_service import course_service
+from app.services.document_service import document_service
+from app.services.export_service import export_service
+from app.services.notification_service import notification_service
+from app.services.search_service import search_service
+from app.services.suggestion_service import suggestion_service
+from app.services.version_service import version_service
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,9 +31,27 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up...")
     await connect_to_db()
+    cache_service.start()
+    rate_limiter.start()
+    await document_service.resume_pending_ingestions()
+    course_service.start()
+    search_service.start()
+    suggestion_service.start()
+    notification_service.start()
+    archive_service.start()
     yield
     # Shutdown
     logger.info("Shutting down...")
+    await notification_service.stop()
+    await archive_service.stop()
+    await search_service.stop()
+    await suggestion_service.stop()
+    await document_service.cancel_ingestions()
+    await course_service.cancel_courses()
+    export_service.shutdown()
+    await version_service.flush()
+    await cache_service.stop()
+    await rate_limiter.stop()
     await close_db_connection()
 
 app = FastAPI(
@@ -26,9 +59,18 @@ app = FastAPI(
     description="API for Educational Chatbot - Hỗ trợ giáo viên soạn giảng",
     version="1.0.0",
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    default_response_class=FastJSONResponse,
     lifespan=lifespan
 )
 
+# Hủy request gọi LLM khi client ngắt kết nối hoặc hết deadline (504); nằm trong
+# rate limit để slot đang chạy được trả lại ngay khi request bị hủy
+app.add_middleware(DeadlineMiddleware)
+
+# Giới hạn tần suất theo user trước khi request tới handler (429/503 + Retry-After);
+# thêm trước CORS để response bị từ chối vẫn có header CORS
+app.add_middleware(RateLimitMiddleware)
+
 # Set all CORS enabled origins
 if settings.BACKEND_CORS_ORIGINS:
     app.add_middleware(
@@ -37,8 +79,18 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["Retry-After"],
     )
 
+# Nén response theo Accept-Encoding (thêm sau cùng để bọc ngoài các middleware khác)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_level=settings.COMPRESSION_BROTLI_LEVEL,
+    zstd_level=settings.COMPRESSION_ZSTD_LEVEL
+)
+
 # Include routers
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
@@ -55,6 +107,11 @@ async def root():
 async def health_check():
     return {"status": "healthy", "message": "Service is running"}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Số liệu theo định dạng text của Prometheus (cache hit/miss...)"""
+    return PlainTextResponse(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -9,7 +9,10 @@ class PyObjectId(ObjectId):
         from pydantic_core import core_schema
         return core_schema.no_info_after_validator_function(
             cls.validate,
-            core_schema.str_schema(),
+            core_schema.union_schema([
+                core_schema.is_instance_schema(ObjectId),
+                core_schema.str_schema()
+            ]),
             serialization=core_schema.to_string_ser_schema()
         )
 
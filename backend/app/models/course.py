@@ -0,0 +1,92 @@
+from typing import Optional, List
+from pydantic import BaseModel, Field
+from datetime import datetime
+from bson import ObjectId
+
+from app.models.lecture import PyObjectId
+
+class CourseItem(BaseModel):
+    """Một bài giảng trong khóa học và trạng thái sinh của nó"""
+    number: int  # Vị trí (1-based) trong khóa học
+    title: str
+    description: Optional[str] = None
+    requirements: Optional[str] = None
+    lecture_id: str
+    depends_on: List[int] = []  # Số thứ tự các bài cần sinh trước (dùng làm ngữ cảnh)
+    status: str = "pending"  # pending, running, completed, error, blocked
+    attempts: int = 0
+    error: Optional[str] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class Course(BaseModel):
+    id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
+    user_id: Optional[str] = None
+    title: str
+    subject: str
+    grade: Optional[str] = None
+    description: Optional[str] = None
+    requirements: str
+    document_ids: List[str] = []
+    outline: Optional[dict] = None  # {"summary": str, "lectures": [{"title", "objectives", "summary"}]}
+    items: List[CourseItem] = []
+    status: str = "generating"  # generating, completed, partial, error
+    rate_limit_key: Optional[str] = None  # User (theo rate limiter) đã tạo; các bài sinh ở nền tính vào giới hạn của user này
+    lease_owner: Optional[str] = None  # Worker đang sinh khóa học
+    lease_until: Optional[datetime] = None  # Hết hạn thì worker khác được nhận sinh tiếp
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        populate_by_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+# Request/Response models
+class CourseLectureSpec(BaseModel):
+    title: str
+    description: Optional[str] = None
+    requirements: Optional[str] = None  # Mặc định dùng yêu cầu chung của khóa học
+    depends_on: List[int] = []  # Số thứ tự (1-based) các bài giảng cần sinh trước
+
+class CourseCreateRequest(BaseModel):
+    title: str
+    subject: str
+    grade: Optional[str] = None
+    description: Optional[str] = None
+    requirements: str
+    user_id: Optional[str] = None
+    document_ids: Optional[List[str]] = None  # Tài liệu dùng làm căn cứ cho mọi bài giảng
+    lectures: List[CourseLectureSpec]
+
+class CourseProgress(BaseModel):
+    total: int
+    pending: int = 0
+    running: int = 0
+    completed: int = 0
+    error: int = 0
+    blocked: int = 0
+
+class CourseResponse(BaseModel):
+    id: str
+    title: str
+    subject: str
+    grade: Optional[str] = None
+    description: Optional[str] = None
+    status: str
+    outline: Optional[dict] = None
+    items: List[CourseItem]
+    progress: CourseProgress
+    created_at: datetime
+    updated_at: datetime
+
+class CourseListResponse(BaseModel):
+    courses: List[CourseResponse]
+    total_count: int
+
+class CourseOutlineRequest(BaseModel):
+    title: str
+    subject: str
+    grade: Optional[str] = None
+    requirements: str
+    lectures: List[dict]  # [{"title", "description"}]
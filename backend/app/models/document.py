@@ -0,0 +1,52 @@
+from typing import Optional, List
+from pydantic import BaseModel, Field
+from datetime import datetime
+from bson import ObjectId
+
+from app.models.lecture import PyObjectId
+
+class Document(BaseModel):
+    id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
+    user_id: Optional[str] = None
+    filename: str
+    content_type: Optional[str] = None
+    sha256: str  # File được lưu theo hash nội dung
+    size: int = 0
+    status: str = "pending"  # pending, ingesting, ready, error
+    chunk_count: int = 0
+    ingestion: Optional[dict] = {}  # Checkpoint: {"segment": int, "chunk_count": int}
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    metadata: Optional[dict] = {}
+
+    class Config:
+        populate_by_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+# Request/Response models
+class DocumentResponse(BaseModel):
+    id: str
+    filename: str
+    content_type: Optional[str] = None
+    sha256: str
+    size: int
+    status: str
+    chunk_count: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+class DocumentListResponse(BaseModel):
+    documents: List[DocumentResponse]
+    total_count: int
+
+class DocumentReference(BaseModel):
+    """Đoạn trích từ tài liệu dùng để sinh bài giảng có trích dẫn"""
+    ref: int
+    document_id: str
+    filename: str
+    page: Optional[int] = None
+    text: str
+    score: float = 0.0
@@ -52,6 +52,7 @@ class LectureCreateRequest(BaseModel):
     description: Optional[str] = None
     requirements: str
     user_id: Optional[str] = None
+    document_ids: Optional[List[str]] = None  # Tài liệu upload dùng làm căn cứ (RAG)
 
 class LectureUpdateRequest(BaseModel):
     title: Optional[str] = None
@@ -73,6 +74,7 @@ class LectureResponse(BaseModel):
     status: str
     created_at: datetime
     updated_at: datetime
+    metadata: Optional[dict] = {}
 
 class LectureListResponse(BaseModel):
     lectures: List[LectureResponse]
@@ -86,3 +88,36 @@ class LectureGenerationRequest(BaseModel):
     grade: Optional[str] = None
     requirements: str
     user_preferences: Optional[dict] = {}
+    references: Optional[List[dict]] = []  # Đoạn trích từ tài liệu của giáo viên
+    course_context: Optional[str] = None  # Dàn ý khóa học và các bài liên quan (sinh theo khóa học)
+
+class LectureSection(BaseModel):
+    number: int  # Vị trí (1-based) trong dàn ý
+    title: str
+    content: str
+
+class LectureSectionListResponse(BaseModel):
+    lecture_id: str
+    sections: List[LectureSection]
+    updated_at: datetime
+
+class LectureSectionRegenerateRequest(BaseModel):
+    instructions: Optional[str] = None  # Yêu cầu thêm cho lần sinh lại
+    updated_at: Optional[datetime] = None  # Phiên bản đang sửa; khác phiên bản hiện tại -> 409
+
+class LectureSectionResponse(BaseModel):
+    lecture_id: str
+    total_sections: int
+    section: LectureSection
+    updated_at: datetime
+
+class LectureSectionGenerationRequest(BaseModel):
+    lecture_title: str
+    subject: str
+    grade: Optional[str] = None
+    section_title: str
+    section_content: str
+    outline: List[str] = []
+    previous_context: str = ""
+    next_context: str = ""
+    instructions: Optional[str] = None
@@ -9,7 +9,10 @@ class PyObjectId(ObjectId):
         from pydantic_core import core_schema
         return core_schema.no_info_after_validator_function(
             cls.validate,
-            core_schema.str_schema(),
+            core_schema.union_schema([
+                core_schema.is_instance_schema(ObjectId),
+                core_schema.str_schema()
+            ]),
             serialization=core_schema.to_string_ser_schema()
         )
 
@@ -70,6 +73,33 @@ class SlideUpdateRequest(BaseModel):
     slides: Optional[List[SlideContent]] = None
     status: Optional[str] = None
 
+class SlideItemUpdateRequest(BaseModel):
+    title: Optional[str] = None
+    content: Optional[str] = None
+    slide_type: Optional[str] = None
+    notes: Optional[str] = None
+    updated_at: Optional[datetime] = None  # Phiên bản đang sửa; khác phiên bản hiện tại -> 409
+
+class SlideItemInsertRequest(BaseModel):
+    slide: SlideContent
+    position: Optional[int] = Field(None, ge=1)  # Vị trí (1-based); mặc định thêm vào cuối
+    updated_at: Optional[datetime] = None
+
+class SlideItemMoveRequest(BaseModel):
+    to_position: int = Field(..., ge=1)
+    updated_at: Optional[datetime] = None
+
+class SlideItemRegenerateRequest(BaseModel):
+    instructions: Optional[str] = None  # Yêu cầu thêm cho lần sinh lại
+    updated_at: Optional[datetime] = None
+
+class SlideItemResponse(BaseModel):
+    slide_id: str
+    slide_number: int
+    total_slides: int
+    slide: Optional[SlideContent] = None
+    updated_at: datetime
+
 class SlideFromLectureRequest(BaseModel):
     lecture_id: str
     include_intro: bool = True
@@ -107,7 +137,25 @@ class SlideGenerationRequest(BaseModel):
     requirements: str
     user_preferences: Optional[dict] = {}
 
+class SlideItemGenerationRequest(BaseModel):
+    deck_title: str
+    subject: str
+    presentation_type: Optional[str] = None
+    slide: dict
+    slide_number: int
+    total_slides: int
+    previous_slide: Optional[dict] = None
+    next_slide: Optional[dict] = None
+    instructions: Optional[str] = None
+
 class SlideExportRequest(BaseModel):
     slide_id: str
     format: str = "pptx"  # pptx, pdf
     template: Optional[str] = "default"
+
+class SlideExportResponse(BaseModel):
+    slide_id: str
+    format: str
+    template: str
+    status: str  # ready, rendering
+    download_url: str
@@ -0,0 +1,31 @@
+from typing import List, Optional
+from pydantic import BaseModel
+from datetime import datetime
+
+# Request/Response models
+class VersionInfo(BaseModel):
+    version: int
+    type: str  # snapshot, delta
+    source: str  # initial, generate, edit, regenerate, restore
+    size: int  # Kích thước nội dung của phiên bản (byte)
+    created_at: datetime
+
+class VersionListResponse(BaseModel):
+    doc_id: str
+    versions: List[VersionInfo]
+    total_count: int
+    page: int = 1
+    per_page: int = 20
+
+class VersionResponse(BaseModel):
+    doc_id: str
+    version: int
+    source: str
+    created_at: datetime
+    content: dict  # Các field được lưu lịch sử (title, content/slides, ...)
+
+class VersionRestoreResponse(BaseModel):
+    doc_id: str
+    version: Optional[int] = None  # Phiên bản mới chứa nội dung đã khôi phục
+    restored_from: int
+    updated_at: datetime
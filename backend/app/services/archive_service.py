@@ -0,0 +1,252 @@
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import zlib
+
+from bson import Binary, ObjectId, json_util
+from pymongo.errors import BulkWriteError
+
+from app.db.database import get_database
+from app.core.config import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard là tùy chọn
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Mỗi phần lưu tối đa chừng này byte NDJSON trước khi nén (document MongoDB tối đa 16MB)
+_PART_RAW_BYTES = 8 * 1024 * 1024
+_DUPLICATE_KEY = 11000
+
+
+def _compress(data: bytes) -> tuple:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=settings.CHAT_ARCHIVE_ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, 9)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd chat archives")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def encode_parts(messages: List[dict]) -> List[dict]:
+    """Tin nhắn -> các phần NDJSON (Extended JSON, giữ ObjectId/datetime) đã nén"""
+    parts, lines, size = [], [], 0
+    for message in messages:
+        line = json_util.dumps(message, json_options=json_util.RELAXED_JSON_OPTIONS).encode() + b"\n"
+        if lines and size + len(line) > _PART_RAW_BYTES:
+            parts.append(lines)
+            lines, size = [], 0
+        lines.append(line)
+        size += len(line)
+    if lines:
+        parts.append(lines)
+
+    encoded = []
+    for lines in parts:
+        raw = b"".join(lines)
+        codec, data = _compress(raw)
+        encoded.append({"codec": codec, "data": Binary(data), "count": len(lines), "raw_bytes": len(raw)})
+    return encoded
+
+
+def decode_part(part: dict) -> List[dict]:
+    raw = _decompress(part["codec"], bytes(part["data"]))
+    return [json_util.loads(line) for line in raw.splitlines() if line]
+
+
+class ArchiveService:
+    """
+    Lưu trữ lạnh tin nhắn chat.
+
+    Tin nhắn của session không hoạt động quá CHAT_ARCHIVE_AFTER_DAYS ngày hoặc
+    đã bị xóa được gom theo session, nén zstd dạng NDJSON vào collection
+    chat_archives rồi xóa khỏi chat_messages, để collection nóng và index của
+    nó đủ nhỏ nằm trong RAM. Khi session được mở lại, lịch sử được đưa về
+    chat_messages (rehydrate). Session đã xóa quá CHAT_PURGE_DELETED_AFTER_DAYS
+    ngày bị xóa hẳn cùng bản lưu trữ.
+
+    Mỗi bước đều làm lại được khi bị gián đoạn: bản lưu trữ được ghi đè từ hợp
+    của bản cũ và tin nhắn nóng (khử trùng theo _id) trước khi xóa tin nhắn nóng.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._rehydrating: Dict[str, asyncio.Future] = {}
+
+    def start(self):
+        """Chạy lưu trữ định kỳ trong background (gọi khi khởi động)"""
+        if self._task is None and settings.CHAT_ARCHIVE_INTERVAL > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.CHAT_ARCHIVE_INTERVAL)
+            try:
+                archived = await self.archive_inactive()
+                purged = await self.purge_deleted()
+                if archived or purged:
+                    logger.info(f"Chat archive: archived {archived} sessions, purged {purged} deleted sessions")
+            except Exception as e:
+                logger.error(f"Error running chat archive: {e}")
+
+    async def archive_inactive(self, limit: int = None) -> int:
+        """Lưu trữ các session không hoạt động / đã xóa chưa được lưu trữ, trả về số session đã xử lý"""
+        db = await get_database()
+        conditions: List[dict] = [{"status": "deleted"}]
+        if settings.CHAT_ARCHIVE_AFTER_DAYS > 0:
+            cutoff = datetime.utcnow() - timedelta(days=settings.CHAT_ARCHIVE_AFTER_DAYS)
+            # Session vừa được mở lại (rehydrate) chưa bị lưu trữ lại ngay
+            conditions.append({"updated_at": {"$lt": cutoff}, "rehydrated_at": {"$not": {"$gte": cutoff}}})
+        cursor = db.chat_sessions.find(
+            {"archived_at": None, "$or": conditions},
+            projection={"updated_at": 1}
+        ).limit(limit or settings.CHAT_ARCHIVE_BATCH_SIZE)
+
+        count = 0
+        async for session in cursor:
+            try:
+                if await self.archive_session(str(session["_id"]), session.get("updated_at")):
+                    count += 1
+            except Exception as e:
+                logger.error(f"Error archiving chat session {session['_id']}: {e}")
+        return count
+
+    async def archive_session(self, session_id: str, expected_updated_at: Optional[datetime] = None) -> bool:
+        """
+        Chuyển tin nhắn của một session vào chat_archives.
+
+        expected_updated_at: session có tin nhắn mới trong lúc lưu trữ thì bỏ qua
+        (tin nhắn nóng được giữ nguyên, lần chạy sau gộp lại).
+        """
+        db = await get_database()
+        hot = [message async for message in db.chat_messages.find({"session_id": session_id})]
+        existing = await self._load_archive(db, session_id)
+
+        merged = {message["_id"]: message for message in existing}
+        merged.update((message["_id"], message) for message in hot)
+        messages = sorted(merged.values(), key=lambda message: (message.get("created_at") or datetime.min, str(message["_id"])))
+
+        parts = encode_parts(messages)
+        for index, part in enumerate(parts):
+            await db.chat_archives.replace_one(
+                {"session_id": session_id, "part": index},
+                dict(part, session_id=session_id, part=index, archived_at=datetime.utcnow()),
+                upsert=True
+            )
+        await db.chat_archives.delete_many({"session_id": session_id, "part": {"$gte": len(parts)}})
+
+        filter_query = {"_id": ObjectId(session_id)}
+        if expected_updated_at is not None:
+            filter_query["updated_at"] = expected_updated_at
+        result = await db.chat_sessions.update_one(
+            filter_query,
+            {"$set": {
+                "archived_at": datetime.utcnow(),
+                "archived_messages": len(messages),
+                "archived_bytes": sum(len(part["data"]) for part in parts)
+            }}
+        )
+        if result.matched_count == 0:
+            return False
+
+        if hot:
+            await db.chat_messages.delete_many({"_id": {"$in": [message["_id"] for message in hot]}})
+        return True
+
+    async def ensure_hot(self, session_id: str):
+        """Đưa lịch sử đã lưu trữ của session về chat_messages (nếu có) trước khi đọc"""
+        if not ObjectId.is_valid(session_id):
+            return
+        db = await get_database()
+        session = await db.chat_sessions.find_one(
+            {"_id": ObjectId(session_id), "archived_at": {"$ne": None}},
+            projection={"_id": 1}
+        )
+        if session is None:
+            return
+
+        # Các request cùng lúc cho một session chỉ rehydrate một lần
+        future = self._rehydrating.get(session_id)
+        if future is not None:
+            await asyncio.shield(future)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._rehydrating[session_id] = future
+        try:
+            await self._rehydrate(db, session_id)
+            future.set_result(None)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._rehydrating[session_id]
+
+    async def _rehydrate(self, db, session_id: str):
+        messages = await self._load_archive(db, session_id)
+        if messages:
+            try:
+                await db.chat_messages.insert_many(messages, ordered=False)
+            except BulkWriteError as e:
+                # Tin nhắn đã có (lần rehydrate trước bị gián đoạn) được bỏ qua
+                if any(error.get("code") != _DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                    raise
+        await db.chat_archives.delete_many({"session_id": session_id})
+        await db.chat_sessions.update_one(
+            {"_id": ObjectId(session_id)},
+            {
+                "$set": {"rehydrated_at": datetime.utcnow()},
+                "$unset": {"archived_at": "", "archived_messages": "", "archived_bytes": ""}
+            }
+        )
+        logger.info(f"Rehydrated {len(messages)} archived messages for chat session {session_id}")
+
+    async def purge_deleted(self, older_than_days: Optional[int] = None) -> int:
+        """Xóa hẳn session đã xóa (status deleted) quá hạn cùng tin nhắn và bản lưu trữ"""
+        days = settings.CHAT_PURGE_DELETED_AFTER_DAYS if older_than_days is None else older_than_days
+        if days < 0:
+            return 0
+        db = await get_database()
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        cursor = db.chat_sessions.find(
+            {"status": "deleted", "updated_at": {"$lt": cutoff}},
+            projection={"_id": 1}
+        ).limit(settings.CHAT_ARCHIVE_BATCH_SIZE)
+
+        count = 0
+        async for session in cursor:
+            session_id = str(session["_id"])
+            await db.chat_messages.delete_many({"session_id": session_id})
+            await db.chat_archives.delete_many({"session_id": session_id})
+            # Xóa session sau cùng: bị gián đoạn thì lần chạy sau xóa tiếp
+            await db.chat_sessions.delete_one({"_id": session["_id"], "status": "deleted"})
+            count += 1
+        return count
+
+    async def archived_messages(self, session_id: str) -> List[dict]:
+        """Tin nhắn đã lưu trữ của session (không rehydrate), theo thứ tự thời gian"""
+        db = await get_database()
+        return await self._load_archive(db, session_id)
+
+    async def _load_archive(self, db, session_id: str) -> List[dict]:
+        messages: List[dict] = []
+        async for part in db.chat_archives.find({"session_id": session_id}).sort("part", 1):
+            messages.extend(decode_part(part))
+        return messages
+
+# Singleton instance
+archive_service = ArchiveService()
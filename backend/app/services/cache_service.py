@@ -0,0 +1,263 @@
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import logging
+import time
+
+import bson
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - redis là tùy chọn
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_KINDS = ("lectures", "slides")
+
+# Kênh pub/sub báo các worker khác xóa bản cache cục bộ
+_INVALIDATION_CHANNEL = "edubot:cache:invalidate"
+_REDIS_PREFIX = "edubot:doc:"
+
+# Các field nhỏ giữ cạnh bản BSON để kiểm tra ETag không cần decode cả document
+_HEADER_FIELDS = ("updated_at", "status", "slide_count")
+
+_requests = registry.counter(
+    "edubot_document_cache_requests_total",
+    "Số lần đọc tài liệu qua cache theo kết quả (hit, shared_hit, coalesced, miss)",
+    ("kind", "result")
+)
+_invalidations = registry.counter(
+    "edubot_document_cache_invalidations_total",
+    "Số lần xóa tài liệu khỏi cache do ghi",
+    ("kind",)
+)
+_evictions = registry.counter(
+    "edubot_document_cache_evictions_total",
+    "Số tài liệu bị đẩy khỏi cache cục bộ do vượt giới hạn",
+)
+
+
+class _Entry:
+    __slots__ = ("data", "header", "expires_at")
+
+    def __init__(self, data: bytes, header: dict, expires_at: float):
+        self.data = data
+        self.header = header
+        self.expires_at = expires_at
+
+
+class CacheService:
+    """
+    Cache đọc qua (read-through) cho document bài giảng/slide.
+
+    Tầng 1 là LRU trong process giới hạn theo số document và tổng byte; tầng 2
+    (tùy chọn, CACHE_REDIS_URL) là Redis dùng chung giữa các worker. Document
+    được lưu dạng BSON nên mỗi lần đọc trả về một bản sao độc lập. Các lần đọc
+    trượt cùng lúc một document chỉ truy vấn MongoDB một lần (single-flight).
+    Mọi lệnh ghi gọi invalidate(); với Redis, lệnh xóa được phát tới các worker
+    khác qua pub/sub.
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        # Số thứ tự của lần invalidate gần nhất theo key: lần tải bắt đầu trước đó không được ghi vào cache
+        self._seq = 0
+        self._invalidated: Dict[Tuple[str, str], int] = {}
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+
+        registry.gauge(
+            "edubot_document_cache_entries", "Số document trong cache cục bộ", ("kind",),
+            callback=lambda: self._count_by_kind()
+        )
+        registry.gauge(
+            "edubot_document_cache_bytes", "Tổng kích thước BSON trong cache cục bộ",
+            callback=lambda: {(): self._bytes}
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CACHE_MAX_ENTRIES > 0 and settings.CACHE_TTL > 0
+
+    def start(self):
+        """Kết nối Redis (nếu có cấu hình) và nghe lệnh xóa từ các worker khác"""
+        if not settings.CACHE_REDIS_URL or self._redis is not None:
+            return
+        if aioredis is None:
+            logger.warning("CACHE_REDIS_URL is set but the redis package is not installed; using the local cache only")
+            return
+        self._redis = aioredis.from_url(settings.CACHE_REDIS_URL)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+    async def get(self, kind: str, doc_id: str, loader: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        """Đọc document từ cache, trượt thì gọi loader() (đọc MongoDB) và lưu lại"""
+        if not self.enabled:
+            return await loader()
+
+        key = (kind, doc_id)
+        entry = self._lookup(key)
+        if entry is not None:
+            _requests.inc(kind=kind, result="hit")
+            return bson.decode(entry.data)
+
+        future = self._inflight.get(key)
+        if future is not None:
+            _requests.inc(kind=kind, result="coalesced")
+            data = await asyncio.shield(future)
+            return bson.decode(data) if data is not None else None
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            data = await self._load(key, loader)
+            future.set_result(data)
+        except BaseException as e:
+            future.set_exception(e)
+            # Tránh cảnh báo "exception was never retrieved" khi không có ai chờ
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+            if not self._inflight:
+                self._invalidated.clear()
+        return bson.decode(data) if data is not None else None
+
+    def peek_header(self, kind: str, doc_id: str) -> Optional[dict]:
+        """updated_at/status của document nếu đang có trong cache cục bộ (không truy vấn)"""
+        if not self.enabled:
+            return None
+        entry = self._lookup((kind, doc_id))
+        return dict(entry.header) if entry is not None else None
+
+    async def invalidate(self, kind: str, doc_id: str):
+        """Xóa document khỏi cache (gọi sau mỗi lệnh ghi)"""
+        self._evict_local((kind, doc_id))
+        _invalidations.inc(kind=kind)
+        if self._redis is not None:
+            try:
+                await self._redis.delete(self._redis_key(kind, doc_id))
+                await self._redis.publish(_INVALIDATION_CHANNEL, f"{kind}:{doc_id}")
+            except Exception as e:
+                logger.error(f"Error invalidating shared cache for {kind}/{doc_id}: {e}")
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    async def _load(self, key: Tuple[str, str], loader) -> Optional[bytes]:
+        kind, doc_id = key
+        started = self._seq
+
+        data = await self._shared_get(kind, doc_id)
+        if data is not None:
+            _requests.inc(kind=kind, result="shared_hit")
+            if self._invalidated.get(key, -1) < started:
+                self._store(key, data, bson.decode(data))
+            return data
+
+        _requests.inc(kind=kind, result="miss")
+        doc = await loader()
+        if doc is None:
+            return None
+        data = bson.encode(doc)
+        # Document đã bị ghi trong lúc tải: bản vừa đọc có thể đã cũ, không lưu
+        if self._invalidated.get(key, -1) < started:
+            self._store(key, data, doc)
+            await self._shared_set(kind, doc_id, data)
+        return data
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: Tuple[str, str], data: bytes, doc: dict):
+        if len(data) > settings.CACHE_MAX_BYTES:
+            return
+        self._drop(key)
+        header = {field: doc[field] for field in _HEADER_FIELDS if field in doc}
+        self._entries[key] = _Entry(data, header, time.monotonic() + settings.CACHE_TTL)
+        self._bytes += len(data)
+        while len(self._entries) > settings.CACHE_MAX_ENTRIES or self._bytes > settings.CACHE_MAX_BYTES:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            _evictions.inc()
+
+    def _drop(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.data)
+
+    def _evict_local(self, key: Tuple[str, str]):
+        self._drop(key)
+        self._seq += 1
+        if key in self._inflight:
+            self._invalidated[key] = self._seq
+
+    def _count_by_kind(self) -> Dict[Tuple[str, ...], float]:
+        counts = {(kind,): 0 for kind in CACHE_KINDS}
+        for kind, _ in self._entries:
+            counts[(kind,)] = counts.get((kind,), 0) + 1
+        return counts
+
+    def _redis_key(self, kind: str, doc_id: str) -> str:
+        return f"{_REDIS_PREFIX}{kind}:{doc_id}"
+
+    async def _shared_get(self, kind: str, doc_id: str) -> Optional[bytes]:
+        if self._redis is None:
+            return None
+        try:
+            return await self._redis.get(self._redis_key(kind, doc_id))
+        except Exception as e:
+            logger.error(f"Error reading shared cache for {kind}/{doc_id}: {e}")
+            return None
+
+    async def _shared_set(self, kind: str, doc_id: str, data: bytes):
+        if self._redis is None or len(data) > settings.CACHE_MAX_BYTES:
+            return
+        try:
+            await self._redis.set(self._redis_key(kind, doc_id), data, ex=int(settings.CACHE_TTL))
+        except Exception as e:
+            logger.error(f"Error writing shared cache for {kind}/{doc_id}: {e}")
+
+    async def _listen(self):
+        """Nhận lệnh xóa từ worker khác và xóa bản cục bộ"""
+        while True:
+            try:
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(_INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    kind, _, doc_id = message["data"].decode().partition(":")
+                    self._evict_local((kind, doc_id))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Có thể đã lỡ lệnh xóa trong lúc mất kết nối: bỏ toàn bộ cache cục bộ
+                logger.error(f"Cache invalidation listener error: {e}")
+                self.clear()
+                await asyncio.sleep(1)
+
+# Singleton instance
+cache_service = CacheService()
@@ -5,11 +5,18 @@ import httpx
 import logging
 
 from app.db.database import get_database
+from app.services.archive_service import archive_service
 from app.models.chat import ChatMessage, ChatSession, ChatMessageRequest, ChatMessageResponse
+from app.core import deadline
 from app.core.config import settings
+from app.core.resilience import resilient_caller
 
 logger = logging.getLogger(__name__)
 
+class ChatSessionConflictError(Exception):
+    """Session đã thay đổi kể từ phiên bản client đang giữ (If-Match)"""
+
+
 class ChatService:
     def __init__(self):
         self.agent_url = settings.AGENT_MAIN_URL
@@ -67,10 +74,11 @@ class ChatService:
         return str(result.inserted_id)
     
     async def get_chat_history(self, session_id: str, limit: int = 50) -> List[dict]:
-        """Lấy lịch sử chat của session"""
+        """Lấy lịch sử chat của session (lịch sử đã lưu trữ được đưa về trước khi đọc)"""
         db = await get_database()
         
         try:
+            await archive_service.ensure_hot(session_id)
             cursor = db.chat_messages.find(
                 {"session_id": session_id}
             ).sort("created_at", 1).limit(limit)
@@ -194,16 +202,22 @@ class ChatService:
                     "chat_history": chat_history[-10:]  # Lấy 10 tin nhắn gần nhất
                 }
                 
-                response = await client.post(
-                    f"{self.agent_url}/process",
-                    json=payload
+                # /process có thể tạo slide nháp: không thử lại/hedge, chỉ qua circuit breaker
+                response = await resilient_caller.call(
+                    "agent.process",
+                    lambda: client.post(
+                        f"{self.agent_url}/process",
+                        json=payload,
+                        headers=deadline.headers()
+                    ),
+                    idempotent=False
                 )
                 response.raise_for_status()
                 
                 return response.json()
                 
         except httpx.RequestError as e:
-            logger.error(f"Error calling agent: {e.message}")
+            logger.error(f"Error calling agent: {e}")
             return {
                 "reply": "Xin lỗi, tôi đang gặp sự cố kỹ thuật. Vui lòng thử lại sau.",
                 "metadata": {"error": True, "error_type": "agent_unavailable"}
@@ -232,7 +246,8 @@ class ChatService:
         try:
             db = await get_database()
             
-            # Aggregation pipeline để lấy sessions cùng với message count
+            # Aggregation pipeline để lấy sessions cùng với message count.
+            # Sắp xếp và giới hạn trước $lookup: chỉ đếm tin nhắn của các session được trả về
             pipeline = [
                 {
                     "$match": {
@@ -240,18 +255,28 @@ class ChatService:
                         "status": {"$ne": "deleted"}  # Không lấy sessions đã xóa
                     }
                 },
+                {
+                    "$sort": {"updated_at": -1}
+                },
+                {
+                    "$limit": limit
+                },
+                {
+                    # chat_messages.session_id là chuỗi
+                    "$addFields": {"session_id": {"$toString": "$_id"}}
+                },
                 {
                     "$lookup": {
                         "from": "chat_messages",
-                        "localField": "_id",
+                        "localField": "session_id",
                         "foreignField": "session_id",
                         "as": "messages"
                     }
                 },
                 {
+                    # Tin nhắn đã chuyển vào chat_archives được đếm qua archived_messages
                     "$addFields": {
-                        "message_count": {"$size": "$messages"},
-                        "session_id": {"$toString": "$_id"}
+                        "message_count": {"$add": [{"$size": "$messages"}, {"$ifNull": ["$archived_messages", 0]}]}
                     }
                 },
                 {
@@ -262,12 +287,6 @@ class ChatService:
                         "updated_at": 1,
                         "message_count": 1
                     }
-                },
-                {
-                    "$sort": {"updated_at": -1}
-                },
-                {
-                    "$limit": limit
                 }
             ]
             
@@ -296,19 +315,34 @@ class ChatService:
             logger.error(f"Error getting session: {e}")
             raise
 
-    async def delete_session(self, session_id: str) -> bool:
-        """Xóa session (chuyển status thành deleted)"""
+    async def delete_session(self, session_id: str, expected_updated_at: Optional[List[datetime]] = None) -> bool:
+        """
+        Xóa session (chuyển status thành deleted) trong một lệnh find_one_and_update.
+        
+        expected_updated_at: các phiên bản client chấp nhận (If-Match); session
+        đã có tin nhắn mới hoặc bị sửa -> ChatSessionConflictError.
+        """
+        if not ObjectId.is_valid(session_id):
+            return False
         try:
             db = await get_database()
-            from datetime import datetime
             
-            result = await db.chat_sessions.update_one(
-                {"_id": ObjectId(session_id)},
-                {"$set": {"status": "deleted", "updated_at": datetime.utcnow()}}
+            filter_query = {"_id": ObjectId(session_id)}
+            if expected_updated_at is not None:
+                filter_query["updated_at"] = {"$in": expected_updated_at}
+            session = await db.chat_sessions.find_one_and_update(
+                filter_query,
+                {"$set": {"status": "deleted", "updated_at": datetime.utcnow()}},
+                projection={"_id": 1}
             )
             
-            return result.modified_count > 0
+            if session is None and expected_updated_at is not None:
+                if await db.chat_sessions.find_one({"_id": ObjectId(session_id)}, projection={"_id": 1}):
+                    raise ChatSessionConflictError("Session đã thay đổi")
+            return session is not None
             
+        except ChatSessionConflictError:
+            raise
         except Exception as e:
             logger.error(f"Error deleting session: {e}")
             raise
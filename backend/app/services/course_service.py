@@ -0,0 +1,496 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from bson import ObjectId
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import socket
+import uuid
+
+import httpx
+
+from app.db.database import get_database
+from app.models.course import Course, CourseCreateRequest, CourseItem, CourseOutlineRequest
+from app.models.lecture import Lecture, LectureCreateRequest
+from app.core.config import settings
+from app.core.rate_limit import rate_limiter
+from app.core.resilience import resilient_caller
+from app.services.cache_service import cache_service
+from app.services.lecture_service import lecture_service
+
+logger = logging.getLogger(__name__)
+
+# Trạng thái bài giảng cần (sinh) lại khi chạy tiếp khóa học
+_RUNNABLE = ("pending", "running")
+
+
+def _lease_free(now: datetime) -> dict:
+    """Điều kiện khóa học không có worker nào đang giữ lease"""
+    return {"$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]}
+
+
+class CourseValidationError(Exception):
+    """Danh sách bài giảng của khóa học không hợp lệ (rỗng, quá dài, phụ thuộc sai hoặc vòng)"""
+
+
+class CourseNotFoundError(Exception):
+    """Không tìm thấy khóa học"""
+
+
+class CourseBusyError(Exception):
+    """Khóa học đang được sinh, chưa thể chạy lại bài lỗi"""
+
+
+def topological_order(items: List[dict]) -> List[int]:
+    """
+    Thứ tự sinh các bài giảng (số thứ tự 1-based) sao cho mỗi bài đứng sau
+    các bài nó phụ thuộc; ném CourseValidationError nếu phụ thuộc sai hoặc có vòng.
+    """
+    numbers = {item["number"] for item in items}
+    remaining = {}
+    dependents: Dict[int, List[int]] = {number: [] for number in numbers}
+    for item in items:
+        deps = set(item.get("depends_on") or [])
+        unknown = deps - numbers
+        if unknown or item["number"] in deps:
+            raise CourseValidationError(f"Bài {item['number']} phụ thuộc bài không hợp lệ: {sorted(unknown or deps)}")
+        remaining[item["number"]] = len(deps)
+        for dep in deps:
+            dependents[dep].append(item["number"])
+
+    ready = sorted(number for number, count in remaining.items() if count == 0)
+    order = []
+    while ready:
+        number = ready.pop(0)
+        order.append(number)
+        for dependent in dependents[number]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+    if len(order) != len(items):
+        cycle = sorted(number for number, count in remaining.items() if count > 0)
+        raise CourseValidationError(f"Phụ thuộc giữa các bài giảng tạo thành vòng: {cycle}")
+    return order
+
+
+def summarize_progress(items: List[dict]) -> dict:
+    progress = {"total": len(items), "pending": 0, "running": 0, "completed": 0, "error": 0, "blocked": 0}
+    for item in items:
+        status = item.get("status", "pending")
+        progress[status] = progress.get(status, 0) + 1
+    return progress
+
+
+class CourseService:
+    """
+    Sinh cả khóa học theo một đồ thị phụ thuộc (DAG).
+
+    Dàn ý khóa học được sinh trước (một lần gọi agent) và dùng làm ngữ cảnh
+    chung cho mọi bài; sau đó các bài giảng được sinh song song, tối đa
+    COURSE_MAX_PARALLEL bài cùng lúc, mỗi bài chờ các bài trong depends_on
+    và nhận phần đầu nội dung của chúng làm ngữ cảnh. Lỗi tạm thời khi gọi
+    agent được thử lại trong resilient_caller; bài vẫn lỗi được đánh dấu error
+    (chạy lại bằng retry_failed), bài phụ thuộc bài lỗi bị đánh dấu blocked.
+    Trạng thái từng bài được ghi vào collection courses nên có thể theo dõi
+    tiến độ, chạy lại bài lỗi và tiếp tục sau khi khởi động lại.
+
+    Với nhiều worker/replica, mỗi khóa học chỉ được một worker sinh: worker
+    phải giành lease (lease_owner, lease_until) trước khi chạy và gia hạn nó
+    trong lúc chạy; lease hết hạn (worker chết) thì worker khác tiếp tục.
+    """
+
+    def __init__(self):
+        self.agent_url = settings.AGENT_MAIN_URL
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        # Chủ của lease khóa học: mỗi process (worker/replica) một id riêng
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    async def create_course(self, request: CourseCreateRequest, rate_limit_key: Optional[str] = None) -> Tuple[str, List[str]]:
+        """
+        Tạo khóa học và các bài giảng (status generating), chạy sinh nội dung ở nền
+
+        rate_limit_key: identity theo rate limiter (IP và user); mỗi lời gọi sinh
+        ở nền giữ một chỗ chạy của IP/user này (và của toàn hệ thống) như request thường.
+        """
+        if not request.lectures:
+            raise CourseValidationError("Khóa học cần ít nhất một bài giảng")
+        if len(request.lectures) > settings.COURSE_MAX_LECTURES:
+            raise CourseValidationError(f"Khóa học tối đa {settings.COURSE_MAX_LECTURES} bài giảng")
+        specs = [dict(spec.model_dump(), number=number) for number, spec in enumerate(request.lectures, 1)]
+        topological_order(specs)
+
+        db = await get_database()
+        lectures = [
+            Lecture(
+                user_id=request.user_id,
+                title=spec["title"],
+                subject=request.subject,
+                grade=request.grade,
+                description=spec["description"],
+                requirements=spec["requirements"] or request.requirements,
+                status="generating",
+                metadata={"course_number": spec["number"]}
+            )
+            for spec in specs
+        ]
+        course = Course(
+            user_id=request.user_id,
+            title=request.title,
+            subject=request.subject,
+            grade=request.grade,
+            description=request.description,
+            requirements=request.requirements,
+            document_ids=request.document_ids or [],
+            rate_limit_key=rate_limit_key,
+            items=[
+                CourseItem(
+                    number=spec["number"],
+                    title=spec["title"],
+                    description=spec["description"],
+                    requirements=spec["requirements"],
+                    lecture_id=str(lecture.id),
+                    depends_on=sorted(set(spec["depends_on"]))
+                )
+                for spec, lecture in zip(specs, lectures)
+            ]
+        )
+        course_id = str(course.id)
+        for lecture in lectures:
+            lecture.metadata["course_id"] = course_id
+
+        # Ghi khóa học trước: bài giảng mồ côi khi lỗi giữa chừng vẫn truy ra được
+        await db.courses.insert_one(course.model_dump(by_alias=True))
+        await db.lectures.insert_many([lecture.model_dump(by_alias=True) for lecture in lectures])
+
+        self.schedule(course_id)
+        return course_id, [str(lecture.id) for lecture in lectures]
+
+    async def get_course(self, course_id: str) -> Optional[Course]:
+        if not ObjectId.is_valid(course_id):
+            return None
+        db = await get_database()
+        course_data = await db.courses.find_one({"_id": ObjectId(course_id)})
+        return Course(**course_data) if course_data else None
+
+    async def get_courses(self, user_id: Optional[str] = None, limit: int = 20) -> Tuple[List[Course], int]:
+        db = await get_database("list")
+        try:
+            filter_query = {}
+            if user_id:
+                filter_query["user_id"] = user_id
+            total_count = await db.courses.count_documents(filter_query)
+            cursor = db.courses.find(filter_query).sort("created_at", -1).limit(limit)
+            return [Course(**course_data) async for course_data in cursor], total_count
+        except Exception as e:
+            logger.error(f"Error getting courses: {e}")
+            return [], 0
+
+    async def retry_failed(self, course_id: str) -> int:
+        """Đưa các bài lỗi / bị chặn về pending và chạy lại, trả về số bài sẽ sinh lại"""
+        course = await self.get_course(course_id)
+        if course is None:
+            raise CourseNotFoundError("Không tìm thấy khóa học")
+        task = self._tasks.get(course_id)
+        if task and not task.done():
+            raise CourseBusyError("Khóa học đang được sinh, vui lòng chờ hoàn tất")
+
+        numbers = [item.number for item in course.items if item.status in ("error", "blocked")]
+        if numbers or course.status != "completed":
+            db = await get_database()
+            update_data = {"status": "generating", "updated_at": datetime.utcnow()}
+            for number in numbers:
+                update_data[f"items.{number - 1}.status"] = "pending"
+                update_data[f"items.{number - 1}.attempts"] = 0
+                update_data[f"items.{number - 1}.error"] = None
+            # Worker khác đang giữ lease (đang sinh khóa học này) thì không đụng tới
+            result = await db.courses.update_one(
+                {"_id": ObjectId(course_id), **_lease_free(datetime.utcnow())},
+                {"$set": update_data}
+            )
+            if result.matched_count == 0:
+                raise CourseBusyError("Khóa học đang được sinh, vui lòng chờ hoàn tất")
+            await db.lectures.update_many(
+                {"_id": {"$in": [ObjectId(course.items[number - 1].lecture_id) for number in numbers]}},
+                {"$set": {"status": "generating", "updated_at": datetime.utcnow()}}
+            )
+            for number in numbers:
+                await cache_service.invalidate("lectures", course.items[number - 1].lecture_id)
+            self.schedule(course_id)
+        return len(numbers)
+
+    def schedule(self, course_id: str):
+        """Chạy sinh khóa học trong background (bỏ qua nếu đang chạy)"""
+        task = self._tasks.get(course_id)
+        if task and not task.done():
+            return
+
+        # Context rỗng: không kế thừa deadline/Idempotency-Key của request tạo khóa học
+        task = asyncio.create_task(self.run_course(course_id), context=contextvars.Context())
+        self._tasks[course_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(course_id, None))
+
+    async def resume_pending_courses(self):
+        """Tiếp tục các khóa học đang sinh dở mà không worker nào giữ lease"""
+        db = await get_database()
+
+        cursor = db.courses.find(
+            {"status": "generating", **_lease_free(datetime.utcnow())},
+            projection={"_id": 1}
+        )
+        count = 0
+        async for course_data in cursor:
+            course_id = str(course_data["_id"])
+            if course_id not in self._tasks:
+                self.schedule(course_id)
+                count += 1
+        if count:
+            logger.info(f"Resuming generation for {count} courses")
+
+    async def _sweep(self):
+        # Định kỳ nhận các khóa học có lease hết hạn (worker giữ nó đã dừng)
+        while True:
+            try:
+                await self.resume_pending_courses()
+            except Exception as e:
+                logger.error(f"Error resuming courses: {e}")
+            await asyncio.sleep(max(1, settings.COURSE_LEASE_SECONDS))
+
+    def start(self):
+        """Tiếp tục các khóa học đang sinh dở, rồi kiểm tra lại định kỳ (gọi khi khởi động)"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def cancel_courses(self):
+        """Dừng các khóa học đang sinh (gọi khi tắt ứng dụng)"""
+        tasks = list(self._tasks.values())
+        if self._sweeper:
+            tasks.append(self._sweeper)
+            self._sweeper = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _claim(self, course_id: str) -> bool:
+        """Giành lease của khóa học đang sinh; False nếu worker khác đang giữ"""
+        db = await get_database()
+        now = datetime.utcnow()
+        course = await db.courses.find_one_and_update(
+            {
+                "_id": ObjectId(course_id),
+                "status": "generating",
+                "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}, {"lease_owner": self.worker_id}]
+            },
+            {"$set": {"lease_owner": self.worker_id, "lease_until": now + timedelta(seconds=settings.COURSE_LEASE_SECONDS)}},
+            projection={"_id": 1}
+        )
+        return course is not None
+
+    async def _renew_lease(self, course_id: str, runner: asyncio.Task):
+        """Gia hạn lease trong lúc sinh; mất lease (worker khác đã nhận) thì dừng runner"""
+        db = await get_database()
+        while True:
+            await asyncio.sleep(settings.COURSE_LEASE_SECONDS / 3)
+            try:
+                result = await db.courses.update_one(
+                    {"_id": ObjectId(course_id), "lease_owner": self.worker_id},
+                    {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=settings.COURSE_LEASE_SECONDS)}}
+                )
+            except Exception as e:
+                logger.warning(f"Could not renew lease of course {course_id}: {e}")
+                continue
+            if result.matched_count == 0:
+                logger.warning(f"Lost lease of course {course_id}, stopping generation")
+                runner.cancel()
+                return
+
+    async def _release(self, course_id: str):
+        db = await get_database()
+        await db.courses.update_one(
+            {"_id": ObjectId(course_id), "lease_owner": self.worker_id},
+            {"$set": {"lease_owner": None, "lease_until": None}}
+        )
+
+    async def run_course(self, course_id: str):
+        """Giành lease rồi sinh khóa học; bỏ qua nếu worker khác đang sinh"""
+        if not await self._claim(course_id):
+            return
+        renewer = asyncio.create_task(self._renew_lease(course_id, asyncio.current_task()))
+        try:
+            await self._run_course(course_id)
+        finally:
+            renewer.cancel()
+            # Trả lease ngay (kể cả khi tắt ứng dụng) để worker khác tiếp tục không phải chờ hết hạn
+            await asyncio.shield(self._release(course_id))
+
+    async def _run_course(self, course_id: str):
+        """Sinh dàn ý rồi các bài giảng còn lại của khóa học theo thứ tự phụ thuộc"""
+        course = await self.get_course(course_id)
+        if course is None or course.status != "generating":
+            return
+
+        logger.info(f"Generating course {course_id}: {len(course.items)} lectures")
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            if course.outline is None:
+                async with rate_limiter.hold(self._rate_limit_key(course)):
+                    course.outline = await self._generate_outline(course, client)
+                await self._update(course_id, {"outline": course.outline})
+
+            # Kết quả của từng bài: nội dung (thành công) hoặc None (lỗi / bị chặn)
+            results: Dict[int, asyncio.Future] = {}
+            loop = asyncio.get_running_loop()
+            for item in course.items:
+                results[item.number] = loop.create_future()
+            semaphore = asyncio.Semaphore(max(1, settings.COURSE_MAX_PARALLEL))
+
+            tasks = []
+            for item in course.items:
+                if item.status == "completed":
+                    results[item.number].set_result(await self._lecture_content(item.lecture_id))
+                elif item.status in _RUNNABLE:
+                    tasks.append(asyncio.create_task(self._run_item(course, item, results, semaphore, client)))
+                else:
+                    results[item.number].set_result(None)
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        course = await self.get_course(course_id)
+        progress = summarize_progress([item.model_dump() for item in course.items])
+        if progress["completed"] == progress["total"]:
+            status = "completed"
+        elif progress["completed"]:
+            status = "partial"
+        else:
+            status = "error"
+        await self._update(course_id, {"status": status})
+        logger.info(f"Course {course_id} finished: {status} ({progress['completed']}/{progress['total']} lectures)")
+
+    async def _run_item(self, course: Course, item: CourseItem, results: Dict[int, asyncio.Future], semaphore: asyncio.Semaphore, client: httpx.AsyncClient):
+        course_id = str(course.id)
+        prefix = f"items.{item.number - 1}"
+        try:
+            dependencies = {number: await asyncio.shield(results[number]) for number in item.depends_on}
+            failed = [number for number, content in dependencies.items() if content is None]
+            if failed:
+                await self._update(course_id, {
+                    f"{prefix}.status": "blocked",
+                    f"{prefix}.error": f"Bài phụ thuộc bị lỗi: {failed}"
+                })
+                await lecture_service.mark_error(item.lecture_id)
+                results[item.number].set_result(None)
+                return
+
+            request = LectureCreateRequest(
+                title=item.title,
+                subject=course.subject,
+                grade=course.grade,
+                description=item.description,
+                requirements=item.requirements or course.requirements,
+                user_id=course.user_id,
+                document_ids=course.document_ids or None
+            )
+            context = self._lecture_context(course, item, dependencies)
+
+            async with semaphore:
+                await self._update(course_id, {f"{prefix}.status": "running", f"{prefix}.started_at": datetime.utcnow()})
+                content, error = None, None
+                await self._update(course_id, {f"{prefix}.attempts": item.attempts + 1})
+                # Lỗi tạm thời đã được thử lại trong resilient_caller; lỗi còn lại thì báo luôn
+                try:
+                    async with rate_limiter.hold(self._rate_limit_key(course)):
+                        content = await lecture_service.generate_content(item.lecture_id, request, context, client)
+                except Exception as e:
+                    error = str(e)
+                    logger.warning(f"Course {course_id} lecture {item.number} failed: {e}")
+
+            if content is None:
+                await lecture_service.mark_error(item.lecture_id)
+                await self._update(course_id, {
+                    f"{prefix}.status": "error",
+                    f"{prefix}.error": error,
+                    f"{prefix}.finished_at": datetime.utcnow()
+                })
+            else:
+                await self._update(course_id, {
+                    f"{prefix}.status": "completed",
+                    f"{prefix}.error": None,
+                    f"{prefix}.finished_at": datetime.utcnow()
+                })
+            results[item.number].set_result(content)
+        except asyncio.CancelledError:
+            # Giữ status pending/running để lần khởi động sau sinh tiếp
+            raise
+        except Exception as e:
+            logger.error(f"Error generating lecture {item.number} of course {course_id}: {e}")
+            await self._update(course_id, {f"{prefix}.status": "error", f"{prefix}.error": str(e)})
+            if not results[item.number].done():
+                results[item.number].set_result(None)
+
+    def _rate_limit_key(self, course: Course) -> str:
+        """Khóa in-flight của rate limiter cho các lời gọi sinh ở nền của khóa học"""
+        if course.rate_limit_key:
+            return course.rate_limit_key
+        return f"user:{course.user_id}" if course.user_id else f"course:{course.id}"
+
+    def _lecture_context(self, course: Course, item: CourseItem, dependencies: Dict[int, str]) -> str:
+        """Ngữ cảnh chung (dàn ý khóa học) và phần đầu các bài phụ thuộc gửi kèm khi sinh một bài"""
+        outline = course.outline or {}
+        entries = outline.get("lectures") or []
+        lines = [f"Khóa học: {course.title} ({len(course.items)} bài)"]
+        if outline.get("summary"):
+            lines.append(f"Tổng quan: {outline['summary']}")
+        lines.append("Dàn ý khóa học:")
+        for other in course.items:
+            marker = " <- bài này" if other.number == item.number else ""
+            lines.append(f"{other.number}. {other.title}{marker}")
+        entry = entries[item.number - 1] if item.number <= len(entries) else {}
+        if entry.get("objectives"):
+            lines.append(f"Mục tiêu của bài này: {entry['objectives']}")
+        if entry.get("summary"):
+            lines.append(f"Nội dung chính của bài này: {entry['summary']}")
+        for number, content in sorted(dependencies.items()):
+            title = course.items[number - 1].title
+            lines.append(f"Bài {number} ({title}) đã dạy:\n{content[:settings.COURSE_CONTEXT_CHARS]}")
+        return "\n".join(lines)
+
+    async def _generate_outline(self, course: Course, client: httpx.AsyncClient) -> dict:
+        """Gọi agent sinh dàn ý khóa học (thử lại trong resilient_caller); lỗi thì dùng danh sách tiêu đề"""
+        payload = CourseOutlineRequest(
+            title=course.title,
+            subject=course.subject,
+            grade=course.grade,
+            requirements=course.requirements,
+            lectures=[{"title": item.title, "description": item.description} for item in course.items]
+        ).model_dump()
+
+        try:
+            response = await resilient_caller.call(
+                "agent.course_outline",
+                lambda: client.post(f"{self.agent_url}/generate/course-outline", json=payload)
+            )
+            response.raise_for_status()
+            result = response.json()
+            return {"summary": result.get("summary") or "", "lectures": result.get("lectures") or []}
+        except (httpx.HTTPError, json.JSONDecodeError) as e:
+            logger.error(f"Could not generate outline for course {course.id}, using lecture titles only: {e}")
+            return {"summary": "", "lectures": []}
+
+    async def _lecture_content(self, lecture_id: str) -> Optional[str]:
+        lecture = await lecture_service.get_lecture_document(lecture_id)
+        content = (lecture or {}).get("content")
+        if content is None:
+            return None
+        return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False, default=str)
+
+    async def _update(self, course_id: str, update_data: dict):
+        db = await get_database()
+        update_data["updated_at"] = datetime.utcnow()
+        await db.courses.update_one({"_id": ObjectId(course_id)}, {"$set": update_data})
+
+# Singleton instance
+course_service = CourseService()
@@ -0,0 +1,374 @@
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from datetime import datetime
+from bson import ObjectId
+import asyncio
+import hashlib
+import heapq
+import logging
+import os
+import uuid
+import weakref
+
+import aiofiles
+import numpy as np
+
+from app.db.database import get_database
+from app.models.document import Document, DocumentReference
+from app.core.config import settings
+from app.core.embedding import embedder
+from app.services.ingestion import chunk_text, detect_kind, iter_segments
+
+logger = logging.getLogger(__name__)
+
+# Số vector đọc mỗi lần khi tính điểm tương đồng (giới hạn bộ nhớ)
+_SCORE_BLOCK_ROWS = 65536
+
+
+class DocumentTooLargeError(Exception):
+    """File upload vượt quá MAX_UPLOAD_SIZE"""
+
+
+class UnsupportedDocumentError(Exception):
+    """Định dạng file không hỗ trợ trích xuất văn bản"""
+
+
+class DocumentService:
+    def __init__(self):
+        self.upload_dir = settings.UPLOAD_DIRECTORY
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # Lock theo sha256; tự bị xóa khi không còn lần ingest nào giữ hoặc chờ
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.upload_dir, "blobs", sha256[:2], sha256)
+
+    def _vector_path(self, sha256: str) -> str:
+        return os.path.join(self.upload_dir, "index", f"{sha256}.f32")
+
+    async def save_upload(
+        self,
+        stream: AsyncIterator[bytes],
+        filename: str,
+        content_type: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> Document:
+        """Ghi file upload xuống đĩa theo từng chunk, lưu theo hash nội dung"""
+        if not detect_kind(filename, content_type):
+            raise UnsupportedDocumentError("Định dạng tài liệu không được hỗ trợ")
+
+        tmp_dir = os.path.join(self.upload_dir, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+
+        hasher = hashlib.sha256()
+        size = 0
+        buffer = bytearray()
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                async for data in stream:
+                    size += len(data)
+                    if size > settings.MAX_UPLOAD_SIZE:
+                        raise DocumentTooLargeError("File vượt quá dung lượng cho phép")
+                    hasher.update(data)
+                    buffer.extend(data)
+                    if len(buffer) >= settings.UPLOAD_CHUNK_SIZE:
+                        await f.write(bytes(buffer))
+                        buffer.clear()
+                if buffer:
+                    await f.write(bytes(buffer))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        sha256 = hasher.hexdigest()
+        blob_path = self._blob_path(sha256)
+        if os.path.exists(blob_path):
+            # Nội dung đã tồn tại, không cần lưu thêm bản sao
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(tmp_path, blob_path)
+
+        document = Document(
+            user_id=user_id,
+            filename=filename,
+            content_type=content_type,
+            sha256=sha256,
+            size=size,
+            status="pending"
+        )
+
+        db = await get_database()
+        await db.documents.insert_one(document.model_dump(by_alias=True))
+        return document
+
+    async def get_document(self, document_id: str) -> Optional[Document]:
+        """Lấy thông tin tài liệu"""
+        db = await get_database()
+
+        try:
+            document_data = await db.documents.find_one({"_id": ObjectId(document_id)})
+            if document_data:
+                return Document(**document_data)
+            return None
+        except Exception as e:
+            logger.error(f"Error getting document {document_id}: {e}")
+            return None
+
+    async def get_documents(self, user_id: Optional[str] = None, limit: int = 50) -> Tuple[List[Document], int]:
+        """Lấy danh sách tài liệu của user"""
+        db = await get_database()
+
+        try:
+            filter_query = {}
+            if user_id:
+                filter_query["user_id"] = user_id
+
+            total_count = await db.documents.count_documents(filter_query)
+            cursor = db.documents.find(filter_query).sort("created_at", -1).limit(limit)
+
+            documents = []
+            async for document_data in cursor:
+                documents.append(Document(**document_data))
+
+            return documents, total_count
+        except Exception as e:
+            logger.error(f"Error getting documents: {e}")
+            return [], 0
+
+    async def delete_document(self, document_id: str) -> bool:
+        """Xóa tài liệu; xóa file và index nếu không còn tài liệu nào dùng chung nội dung"""
+        db = await get_database()
+
+        try:
+            document_data = await db.documents.find_one_and_delete(
+                {"_id": ObjectId(document_id)},
+                projection={"sha256": 1}
+            )
+            if not document_data:
+                return False
+
+            sha256 = document_data["sha256"]
+            if await db.documents.count_documents({"sha256": sha256}, limit=1) == 0:
+                await db.document_chunks.delete_many({"sha256": sha256})
+                for path in (self._blob_path(sha256), self._vector_path(sha256)):
+                    if os.path.exists(path):
+                        os.remove(path)
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting document {document_id}: {e}")
+            return False
+
+    def schedule_ingestion(self, document_id: str):
+        """Chạy ingestion trong background (bỏ qua nếu đang chạy)"""
+        task = self._tasks.get(document_id)
+        if task and not task.done():
+            return
+
+        task = asyncio.create_task(self.ingest_document(document_id))
+        self._tasks[document_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(document_id, None))
+
+    async def resume_pending_ingestions(self):
+        """Tiếp tục các ingestion dở dang (gọi khi khởi động)"""
+        db = await get_database()
+
+        cursor = db.documents.find(
+            {"status": {"$in": ["pending", "ingesting"]}},
+            projection={"_id": 1}
+        )
+        count = 0
+        async for document_data in cursor:
+            self.schedule_ingestion(str(document_data["_id"]))
+            count += 1
+        if count:
+            logger.info(f"Resuming ingestion for {count} documents")
+
+    async def cancel_ingestions(self):
+        """Dừng các ingestion đang chạy (gọi khi tắt ứng dụng)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def ingest_document(self, document_id: str):
+        """Trích xuất văn bản, chia chunk, sinh embedding và ghi index"""
+        db = await get_database()
+
+        document_data = await db.documents.find_one({"_id": ObjectId(document_id)})
+        if not document_data or document_data.get("status") == "ready":
+            return
+
+        document = Document(**document_data)
+        lock = self._locks.setdefault(document.sha256, asyncio.Lock())
+        async with lock:
+            # Cùng nội dung đã được ingest bởi một lần upload khác
+            ready = await db.documents.find_one(
+                {"sha256": document.sha256, "status": "ready"},
+                projection={"chunk_count": 1}
+            )
+            if ready:
+                await self._set_status(document_id, "ready", chunk_count=ready.get("chunk_count", 0))
+                return
+
+            kind = detect_kind(document.filename, document.content_type)
+            checkpoint = document.ingestion or {}
+            segment_start = checkpoint.get("segment", 0)
+            chunk_count = checkpoint.get("chunk_count", 0)
+
+            await self._set_status(document_id, "ingesting")
+            logger.info(f"Ingesting document {document_id} from segment {segment_start}")
+
+            try:
+                # Bỏ phần đã ghi sau checkpoint cuối cùng (nếu lần trước bị dừng giữa chừng)
+                await db.document_chunks.delete_many({"sha256": document.sha256, "seq": {"$gte": chunk_count}})
+                await asyncio.to_thread(self._truncate_vectors, document.sha256, chunk_count)
+
+                segments = iter_segments(self._blob_path(document.sha256), kind, start=segment_start)
+                batch: List[Tuple[Optional[int], str]] = []
+                next_segment = segment_start
+                while True:
+                    segment = await asyncio.to_thread(next, segments, None)
+                    if segment is None:
+                        break
+                    index, page, text = segment
+                    for chunk in chunk_text(text, settings.INGEST_CHUNK_WORDS, settings.INGEST_CHUNK_OVERLAP):
+                        batch.append((page if page is not None else index + 1, chunk))
+                    next_segment = index + 1
+
+                    if len(batch) >= settings.INGEST_BATCH_SIZE:
+                        chunk_count = await self._flush_batch(document_id, document.sha256, batch, chunk_count, next_segment)
+                        batch = []
+
+                chunk_count = await self._flush_batch(document_id, document.sha256, batch, chunk_count, next_segment)
+                await self._set_status(document_id, "ready", chunk_count=chunk_count)
+                logger.info(f"Document {document_id} ingested: {chunk_count} chunks")
+
+            except asyncio.CancelledError:
+                # Giữ status "ingesting" để lần khởi động sau tiếp tục từ checkpoint
+                raise
+            except Exception as e:
+                logger.error(f"Error ingesting document {document_id}: {e}")
+                await self._set_status(document_id, "error", error=str(e))
+
+    async def _flush_batch(
+        self,
+        document_id: str,
+        sha256: str,
+        batch: List[Tuple[Optional[int], str]],
+        chunk_count: int,
+        next_segment: int
+    ) -> int:
+        """Ghi một batch chunk: vector -> chunk -> checkpoint"""
+        db = await get_database()
+
+        if batch:
+            vectors = await asyncio.to_thread(embedder.embed_many, [text for _, text in batch])
+            await asyncio.to_thread(self._append_vectors, sha256, vectors)
+            await db.document_chunks.insert_many([
+                {
+                    "sha256": sha256,
+                    "seq": chunk_count + offset,
+                    "page": page,
+                    "text": text
+                }
+                for offset, (page, text) in enumerate(batch)
+            ], ordered=False)
+            chunk_count += len(batch)
+
+        await db.documents.update_one(
+            {"_id": ObjectId(document_id)},
+            {
+                "$set": {
+                    "ingestion": {"segment": next_segment, "chunk_count": chunk_count},
+                    "chunk_count": chunk_count,
+                    "updated_at": datetime.utcnow()
+                }
+            }
+        )
+        return chunk_count
+
+    async def _set_status(self, document_id: str, status: str, chunk_count: Optional[int] = None, error: Optional[str] = None):
+        db = await get_database()
+
+        update_data = {"status": status, "error": error, "updated_at": datetime.utcnow()}
+        if chunk_count is not None:
+            update_data["chunk_count"] = chunk_count
+        await db.documents.update_one({"_id": ObjectId(document_id)}, {"$set": update_data})
+
+    def _append_vectors(self, sha256: str, vectors: np.ndarray):
+        path = self._vector_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as f:
+            f.write(vectors.astype(np.float32).tobytes())
+
+    def _truncate_vectors(self, sha256: str, chunk_count: int):
+        path = self._vector_path(sha256)
+        if not os.path.exists(path):
+            return
+        with open(path, "r+b") as f:
+            f.truncate(chunk_count * embedder.dim * 4)
+
+    def _score_vectors(self, sha256: str, query: np.ndarray, top_k: int) -> List[Tuple[float, int]]:
+        """Tính cosine giữa query và toàn bộ chunk của một file (đọc qua memmap)"""
+        path = self._vector_path(sha256)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return []
+
+        vectors = np.memmap(path, dtype=np.float32, mode="r")
+        vectors = vectors[: (vectors.shape[0] // embedder.dim) * embedder.dim].reshape(-1, embedder.dim)
+        best: List[Tuple[float, int]] = []
+        for start in range(0, vectors.shape[0], _SCORE_BLOCK_ROWS):
+            scores = vectors[start:start + _SCORE_BLOCK_ROWS] @ query
+            k = min(top_k, scores.shape[0])
+            for i in np.argpartition(-scores, k - 1)[:k]:
+                best.append((float(scores[i]), start + int(i)))
+        return heapq.nlargest(top_k, best)
+
+    async def retrieve(self, query: str, document_ids: List[str], top_k: Optional[int] = None) -> List[DocumentReference]:
+        """Tìm các đoạn liên quan nhất trong tài liệu để làm căn cứ sinh nội dung"""
+        db = await get_database()
+        top_k = top_k or settings.RAG_TOP_K
+
+        object_ids = [ObjectId(i) for i in document_ids if ObjectId.is_valid(i)]
+        if not object_ids or not query.strip():
+            return []
+
+        documents = await db.documents.find(
+            {"_id": {"$in": object_ids}, "status": "ready"},
+            projection={"filename": 1, "sha256": 1}
+        ).to_list(length=None)
+
+        query_vector = embedder.embed(query)
+        candidates = []
+        for document_data in documents:
+            scored = await asyncio.to_thread(self._score_vectors, document_data["sha256"], query_vector, top_k)
+            candidates.extend((score, seq, document_data) for score, seq in scored)
+
+        top = heapq.nlargest(top_k, candidates, key=lambda item: item[0])
+        if not top:
+            return []
+
+        chunk_filter = {"$or": [{"sha256": doc["sha256"], "seq": seq} for _, seq, doc in top]}
+        chunks = {}
+        async for chunk in db.document_chunks.find(chunk_filter, projection={"sha256": 1, "seq": 1, "page": 1, "text": 1}):
+            chunks[(chunk["sha256"], chunk["seq"])] = chunk
+
+        references = []
+        for score, seq, document_data in top:
+            chunk = chunks.get((document_data["sha256"], seq))
+            if not chunk:
+                continue
+            references.append(DocumentReference(
+                ref=len(references) + 1,
+                document_id=str(document_data["_id"]),
+                filename=document_data["filename"],
+                page=chunk.get("page"),
+                text=chunk["text"],
+                score=score
+            ))
+        return references
+
+# Singleton instance
+document_service = DocumentService()
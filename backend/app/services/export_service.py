@@ -0,0 +1,244 @@
+from typing import Callable, Dict, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from functools import partial
+from bson import ObjectId
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import uuid
+
+from app.db.database import get_database
+from app.core.config import settings
+from app.models.slide import SlideExportRequest
+from app.services.rendering import FORMATS, RENDER_VERSION, TEMPLATES, render_lecture
+from app.services.slide_rendering import SLIDE_FORMATS, SLIDE_TEMPLATES, render_slides
+
+logger = logging.getLogger(__name__)
+
+_LECTURE_FIELDS = {
+    "title": 1, "subject": 1, "grade": 1, "description": 1, "content": 1,
+    "metadata.references": 1, "updated_at": 1
+}
+_SLIDE_FIELDS = {"title": 1, "subject": 1, "slides": 1, "updated_at": 1}
+
+
+class ExportError(Exception):
+    """Render file xuất thất bại"""
+
+
+class ExportService:
+    """Xuất bài giảng/slide ra file, cache trên đĩa theo (id, updated_at, format, template)"""
+
+    def __init__(self):
+        self.cache_dir = settings.EXPORT_CACHE_DIRECTORY
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._errors: Dict[str, str] = {}
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if settings.EXPORT_WORKERS <= 0:
+            return None
+        if self._pool is None:
+            # spawn: process con không kế thừa kết nối MongoDB và các thread của app
+            self._pool = ProcessPoolExecutor(
+                max_workers=settings.EXPORT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def shutdown(self):
+        """Dừng process pool (gọi khi tắt ứng dụng)"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def cache_path(self, kind: str, doc_id: str, updated_at: datetime, template: str, extension: str) -> str:
+        version = int(updated_at.timestamp() * 1000)
+        return os.path.join(self.cache_dir, kind, doc_id, f"{version}-{template}-v{RENDER_VERSION}{extension}")
+
+    async def _render(self, render, path: str):
+        """Chạy render(tmp_path) trong process pool, ghi file tạm rồi rename"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        pool = self._get_pool()
+        try:
+            if pool is None:
+                await asyncio.to_thread(render, tmp_path)
+            else:
+                await asyncio.get_running_loop().run_in_executor(pool, render, tmp_path)
+            os.replace(tmp_path, path)
+        except BrokenProcessPool as e:
+            # Process con bị kill (ví dụ hết bộ nhớ): tạo pool mới cho lần sau
+            self._pool = None
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise ExportError(str(e)) from e
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise ExportError(str(e)) from e
+        await asyncio.to_thread(self._prune, os.path.dirname(path), os.path.basename(path))
+
+    def _start_render(self, path: str, render) -> asyncio.Task:
+        """Gộp các request render cùng một file (chỉ render một lần)"""
+        task = self._pending.get(path)
+        if task is None:
+            self._errors.pop(path, None)
+            task = asyncio.create_task(self._render(render, path))
+            self._pending[path] = task
+            task.add_done_callback(partial(self._render_done, path))
+        return task
+
+    def _render_done(self, path: str, task: asyncio.Task):
+        self._pending.pop(path, None)
+        if not task.cancelled() and task.exception() is not None:
+            # Giữ lỗi để request kiểm tra trạng thái render nền nhận được
+            self._errors[path] = str(task.exception())
+            logger.error(f"Error rendering export {path}: {task.exception()}")
+
+    def _prune(self, directory: str, current: str):
+        """Xóa các bản render cũ của cùng tài liệu và giới hạn dung lượng cache"""
+        version = current.split("-", 1)[0]
+        for name in os.listdir(directory):
+            if not name.startswith(f"{version}-") and not name.endswith(".tmp"):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+        max_bytes = settings.EXPORT_CACHE_MAX_BYTES
+        if max_bytes <= 0:
+            return
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                file_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                files.append((stat.st_atime, stat.st_size, file_path))
+                total += stat.st_size
+        # Xóa các file ít được tải gần đây nhất
+        for _, size, file_path in sorted(files):
+            if total <= max_bytes:
+                break
+            if file_path.endswith(".tmp"):
+                continue
+            try:
+                os.remove(file_path)
+                total -= size
+            except OSError:
+                pass
+
+    async def _export(
+        self,
+        kind: str,
+        doc_id: str,
+        fields: dict,
+        template: str,
+        extension: str,
+        make_render,
+        lookup_fields: Optional[dict] = None,
+        background: Optional[Callable[[dict], bool]] = None
+    ) -> Optional[Tuple[str, str, bool]]:
+        """
+        Lấy file xuất của tài liệu, render nếu chưa có trong cache.
+
+        Trả về (đường dẫn, tên file tải về, đã sẵn sàng) hoặc None nếu không có
+        tài liệu. Nếu background(doc) đúng, việc render chạy nền và hàm trả về
+        ngay với ready=False.
+        """
+        if not ObjectId.is_valid(doc_id):
+            return None
+
+        db = await get_database()
+        # Chỉ đọc updated_at để kiểm tra cache, tránh tải cả nội dung
+        doc = await db[kind].find_one({"_id": ObjectId(doc_id)}, projection=lookup_fields or {"title": 1, "updated_at": 1})
+        if not doc:
+            return None
+        run_in_background = bool(background and background(doc))
+
+        filename = f"{doc.get('title') or 'download'}{extension}"
+        path = self.cache_path(kind, doc_id, doc["updated_at"], template, extension)
+        if os.path.exists(path):
+            return path, filename, True
+
+        if path in self._errors and path not in self._pending:
+            raise ExportError(self._errors.pop(path))
+
+        task = self._pending.get(path)
+        if task is None:
+            doc = await db[kind].find_one({"_id": ObjectId(doc_id)}, projection=fields)
+            if not doc:
+                return None
+            # updated_at đọc cùng nội dung, để key cache khớp với nội dung được render
+            path = self.cache_path(kind, doc_id, doc["updated_at"], template, extension)
+            if os.path.exists(path):
+                return path, filename, True
+            task = self._start_render(path, make_render(doc))
+
+        if run_in_background:
+            return path, filename, False
+
+        # Client ngắt kết nối không hủy việc render cho các request khác
+        await asyncio.shield(task)
+        return path, filename, True
+
+    async def export_lecture(self, lecture_id: str, fmt: str, template: str) -> Optional[Tuple[str, str]]:
+        """Lấy file xuất của bài giảng (render nếu chưa có), trả về (đường dẫn, tên file tải về)"""
+        if template not in TEMPLATES:
+            raise ValueError(f"Unknown template: {template}")
+
+        def make_render(lecture: dict):
+            payload = {
+                "title": lecture.get("title"),
+                "subject": lecture.get("subject"),
+                "grade": lecture.get("grade"),
+                "description": lecture.get("description"),
+                "content": lecture.get("content"),
+                "metadata": lecture.get("metadata") or {}
+            }
+            return partial(render_lecture, payload, fmt, template, font_directory=settings.EXPORT_FONT_DIRECTORY)
+
+        exported = await self._export("lectures", lecture_id, _LECTURE_FIELDS, template, FORMATS[fmt][0], make_render)
+        return exported[:2] if exported else None
+
+    async def export_slides(self, request: SlideExportRequest) -> Optional[Tuple[str, str, bool]]:
+        """
+        Lấy file xuất của bộ slide, trả về (đường dẫn, tên file tải về, đã sẵn sàng).
+
+        Bộ slide lớn hơn EXPORT_BACKGROUND_SLIDES được render nền: lần gọi đầu
+        trả về ready=False, client gọi lại cho tới khi file sẵn sàng.
+        """
+        fmt, template = request.format, request.template
+        if fmt not in SLIDE_FORMATS:
+            raise ValueError(f"Unknown format: {fmt}")
+        if template not in SLIDE_TEMPLATES:
+            raise ValueError(f"Unknown template: {template}")
+
+        def make_render(deck: dict):
+            payload = {
+                "title": deck.get("title"),
+                "subject": deck.get("subject"),
+                "slides": deck.get("slides") or []
+            }
+            return partial(render_slides, payload, fmt, template, font_directory=settings.EXPORT_FONT_DIRECTORY)
+
+        return await self._export(
+            "slides", request.slide_id, _SLIDE_FIELDS, template, SLIDE_FORMATS[fmt][0], make_render,
+            lookup_fields={"title": 1, "updated_at": 1, "slide_count": 1},
+            background=lambda doc: doc.get("slide_count", 0) > settings.EXPORT_BACKGROUND_SLIDES
+        )
+
+    def discard(self, kind: str, doc_id: str):
+        """Xóa toàn bộ file xuất của một tài liệu (khi tài liệu bị xóa)"""
+        shutil.rmtree(os.path.join(self.cache_dir, kind, doc_id), ignore_errors=True)
+
+# Singleton instance
+export_service = ExportService()
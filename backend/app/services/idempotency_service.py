@@ -0,0 +1,188 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import json
+import logging
+
+from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
+
+from app.db.database import get_database
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Khóa của request đang chạy trong task hiện tại (để service gắn job id)
+_current_key: ContextVar[Optional[str]] = ContextVar("idempotency_key", default=None)
+
+# Giây giữa hai lần đọc lại khóa đang chạy ở worker khác
+_POLL_INTERVAL = 0.5
+_MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeyError(Exception):
+    """Idempotency-Key không hợp lệ"""
+
+
+class IdempotencyMismatchError(Exception):
+    """Idempotency-Key đã được dùng cho một request có nội dung khác"""
+
+
+class IdempotencyInProgressError(Exception):
+    """Request cùng Idempotency-Key vẫn đang chạy sau thời gian chờ"""
+
+
+def fingerprint(payload: Any) -> str:
+    """Dấu vân tay của nội dung request (JSON chuẩn hóa, sha256)"""
+    if isinstance(payload, BaseModel):
+        payload = payload.model_dump()
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class IdempotencyService:
+    """
+    Idempotency-Key cho các API tạo (sinh bài giảng/slide, chat).
+
+    Lần đầu một khóa được dùng, một bản ghi in_progress được chèn vào
+    collection idempotency_keys (khóa _id unique giữa mọi worker) rồi request
+    mới thực sự chạy; kết quả được lưu lại tới khi hết hạn (index TTL theo
+    expires_at). Request lặp lại cùng khóa:
+
+    - đã xong: trả lại kết quả đã lưu, không gọi LLM lần nữa
+    - đang chạy và đã có job (vd. bài giảng đã được tạo): trả 202 với job đó
+    - đang chạy chưa có job: chờ kết quả tối đa IDEMPOTENCY_WAIT_SECONDS
+
+    Request lỗi thì bản ghi bị xóa để lần thử lại được chạy. Bản ghi in_progress
+    của worker đã chết được tiếp quản sau IDEMPOTENCY_LOCK_SECONDS.
+
+    Khóa gắn với người gọi (caller): client khác gửi trùng Idempotency-Key
+    không nhận được kết quả đã lưu của người khác.
+    """
+
+    def __init__(self):
+        # Báo cho các request cùng khóa trong process khi request đang chạy kết thúc
+        self._events: Dict[str, asyncio.Event] = {}
+
+    async def run(
+        self,
+        key: Optional[str],
+        scope: str,
+        payload: Any,
+        execute: Callable[[], Awaitable[Any]],
+        job_response: Optional[Callable[[str], Any]] = None,
+        caller: Optional[str] = None
+    ) -> Tuple[Any, Optional[str]]:
+        """
+        Chạy execute() đúng một lần cho mỗi (scope, caller, key), trả về (kết quả, trạng thái phát lại).
+
+        Trạng thái phát lại: None nếu vừa chạy, "replayed" nếu trả kết quả đã lưu,
+        "in_progress" nếu trả job_response(job_id) của request đang chạy.
+        """
+        if not key or settings.IDEMPOTENCY_TTL <= 0:
+            return await execute(), None
+        if len(key) > _MAX_KEY_LENGTH:
+            raise IdempotencyKeyError(f"Idempotency-Key tối đa {_MAX_KEY_LENGTH} ký tự")
+
+        record_id = f"{scope}:{caller}:{key}" if caller else f"{scope}:{key}"
+        request_fingerprint = fingerprint(payload)
+        db = await get_database()
+        deadline = asyncio.get_running_loop().time() + settings.IDEMPOTENCY_WAIT_SECONDS
+
+        while True:
+            if await self._claim(db, record_id, request_fingerprint):
+                return await self._execute(db, record_id, execute), None
+
+            record = await db.idempotency_keys.find_one({"_id": record_id})
+            if record is None:
+                continue  # Vừa bị xóa (request trước lỗi hoặc hết hạn): thử giữ lại
+            if record["fingerprint"] != request_fingerprint:
+                raise IdempotencyMismatchError("Idempotency-Key đã được dùng cho một request khác")
+            if record["status"] == "completed":
+                return record["response"], "replayed"
+            if record.get("job_id") and job_response is not None:
+                return job_response(record["job_id"]), "in_progress"
+            if record["locked_until"] < datetime.utcnow() and await self._take_over(db, record):
+                logger.warning(f"Taking over stale idempotency key {record_id}")
+                return await self._execute(db, record_id, execute), None
+
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                raise IdempotencyInProgressError("Request với Idempotency-Key này vẫn đang được xử lý")
+            event = self._events.get(record_id)
+            try:
+                if event is not None:
+                    await asyncio.wait_for(event.wait(), timeout=remaining)
+                else:
+                    await asyncio.sleep(min(remaining, _POLL_INTERVAL))
+            except asyncio.TimeoutError:
+                pass
+
+    async def attach_job(self, job_id: str):
+        """Gắn id của tài liệu đang sinh vào request hiện tại (nếu request có Idempotency-Key)"""
+        record_id = _current_key.get()
+        if record_id is None:
+            return
+        db = await get_database()
+        await db.idempotency_keys.update_one(
+            {"_id": record_id, "status": "in_progress"},
+            {"$set": {"job_id": job_id}}
+        )
+
+    async def _claim(self, db, record_id: str, request_fingerprint: str) -> bool:
+        now = datetime.utcnow()
+        try:
+            await db.idempotency_keys.insert_one({
+                "_id": record_id,
+                "fingerprint": request_fingerprint,
+                "status": "in_progress",
+                "job_id": None,
+                "locked_until": now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=settings.IDEMPOTENCY_TTL)
+            })
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def _take_over(self, db, record: dict) -> bool:
+        now = datetime.utcnow()
+        result = await db.idempotency_keys.update_one(
+            {"_id": record["_id"], "status": "in_progress", "locked_until": record["locked_until"]},
+            {"$set": {"locked_until": now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)}}
+        )
+        return result.modified_count == 1
+
+    async def _execute(self, db, record_id: str, execute: Callable[[], Awaitable[Any]]) -> Any:
+        self._events[record_id] = asyncio.Event()
+        token = _current_key.set(record_id)
+        try:
+            result = await execute()
+        except BaseException:
+            # Lần thử lại được chạy lại từ đầu
+            await asyncio.shield(db.idempotency_keys.delete_one({"_id": record_id}))
+            raise
+        else:
+            stored = result.model_dump() if isinstance(result, BaseModel) else result
+            now = datetime.utcnow()
+            try:
+                await db.idempotency_keys.update_one(
+                    {"_id": record_id},
+                    {"$set": {
+                        "status": "completed",
+                        "response": stored,
+                        "completed_at": now,
+                        "expires_at": now + timedelta(seconds=settings.IDEMPOTENCY_TTL)
+                    }}
+                )
+            except Exception as e:
+                logger.error(f"Error storing idempotent response for {record_id}: {e}")
+            return result
+        finally:
+            _current_key.reset(token)
+            self._events.pop(record_id).set()
+
+# Singleton instance
+idempotency_service = IdempotencyService()
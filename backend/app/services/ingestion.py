@@ -0,0 +1,124 @@
+"""
+Trích xuất văn bản và chia chunk cho tài liệu upload.
+
+Mọi hàm ở đây đều đọc file theo từng phần (trang PDF, đoạn DOCX, block
+văn bản) để bộ nhớ không phụ thuộc kích thước file. Mỗi phần được gọi là
+một "segment" và có chỉ số ổn định giữa các lần chạy, nhờ đó ingestion có
+thể tiếp tục từ checkpoint sau khi process bị tắt giữa chừng.
+"""
+import codecs
+import os
+import re
+import zipfile
+from typing import Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+
+# Kích thước block khi đọc file văn bản thuần
+TEXT_BLOCK_SIZE = 64 * 1024
+# Số ký tự tối đa gom vào một segment DOCX
+DOCX_SEGMENT_CHARS = 16 * 1024
+
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# (segment_index, page_number, text)
+Segment = Tuple[int, Optional[int], str]
+
+TEXT_EXTENSIONS = {".txt", ".md", ".markdown", ".csv"}
+SUPPORTED_EXTENSIONS = TEXT_EXTENSIONS | {".pdf", ".docx"}
+
+
+def detect_kind(filename: str, content_type: Optional[str] = None) -> Optional[str]:
+    """Xác định loại tài liệu: text, pdf, docx (None nếu không hỗ trợ)"""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext == ".pdf" or content_type == "application/pdf":
+        return "pdf"
+    if ext == ".docx" or (content_type or "").endswith("wordprocessingml.document"):
+        return "docx"
+    if ext in TEXT_EXTENSIONS or (content_type or "").startswith("text/"):
+        return "text"
+    return None
+
+
+def iter_segments(path: str, kind: str, start: int = 0) -> Iterator[Segment]:
+    """Duyệt các segment của file, bỏ qua các segment có chỉ số < start"""
+    if kind == "pdf":
+        iterator = _iter_pdf(path)
+    elif kind == "docx":
+        iterator = _iter_docx(path)
+    else:
+        iterator = _iter_text(path)
+
+    for segment in iterator:
+        if segment[0] >= start:
+            yield segment
+
+
+def _iter_text(path: str) -> Iterator[Segment]:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    index = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(TEXT_BLOCK_SIZE)
+            final = not block
+            pending += decoder.decode(block, final=final)
+            if final:
+                break
+            # Cắt tại ranh giới đoạn văn gần nhất để không chia đôi câu
+            cut = pending.rfind("\n\n")
+            if cut == -1:
+                cut = pending.rfind("\n")
+            if cut <= 0:
+                continue
+            yield index, None, pending[:cut]
+            pending = pending[cut:]
+            index += 1
+    if pending.strip():
+        yield index, None, pending
+
+
+def _iter_pdf(path: str) -> Iterator[Segment]:
+    from pypdf import PdfReader  # Import lazy: chỉ cần khi có file PDF
+
+    reader = PdfReader(path)
+    for index, page in enumerate(reader.pages):
+        yield index, index + 1, page.extract_text() or ""
+
+
+def _iter_docx(path: str) -> Iterator[Segment]:
+    index = 0
+    parts: List[str] = []
+    size = 0
+    with zipfile.ZipFile(path) as archive:
+        with archive.open("word/document.xml") as xml_file:
+            for _, elem in ElementTree.iterparse(xml_file, events=("end",)):
+                if elem.tag != f"{_WORD_NS}p":
+                    continue
+                text = "".join(node.text or "" for node in elem.iter(f"{_WORD_NS}t"))
+                elem.clear()
+                if not text:
+                    continue
+                parts.append(text)
+                size += len(text)
+                if size >= DOCX_SEGMENT_CHARS:
+                    yield index, None, "\n".join(parts)
+                    index += 1
+                    parts, size = [], 0
+    if parts:
+        yield index, None, "\n".join(parts)
+
+
+def chunk_text(text: str, chunk_words: int, overlap: int) -> List[str]:
+    """Chia văn bản thành các chunk theo số từ, có phần chồng lấn"""
+    words = re.split(r"\s+", text.strip())
+    words = [w for w in words if w]
+    if not words:
+        return []
+
+    step = max(1, chunk_words - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_words]))
+        if start + chunk_words >= len(words):
+            break
+    return chunks
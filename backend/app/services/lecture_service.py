@@ -1,15 +1,38 @@
 from typing import Optional, List, Tuple
 from datetime import datetime
 from bson import ObjectId
+import asyncio
 import httpx
 import logging
 
 from app.db.database import get_database
-from app.models.lecture import Lecture, LectureCreateRequest, LectureUpdateRequest, LectureGenerationRequest
+from app.models.lecture import (
+    Lecture, LectureCreateRequest, LectureUpdateRequest, LectureGenerationRequest,
+    LectureSectionRegenerateRequest, LectureSectionGenerationRequest
+)
+from app.models.document import DocumentReference
+from app.core import deadline
 from app.core.config import settings
+from app.core.clock import utcnow_ms
+from app.core.resilience import resilient_caller
+from app.services.cache_service import cache_service
+from app.services.document_service import document_service
+from app.services.export_service import export_service
+from app.services.idempotency_service import idempotency_service
+from app.services.search_service import search_service
+from app.services.sections import merge_section, section_context, split_sections
+from app.services.version_service import VERSIONED_FIELDS, version_service, VersionNotFoundError
 
 logger = logging.getLogger(__name__)
 
+class LectureSectionNotFoundError(Exception):
+    """Không có bài giảng hoặc phần cần sinh lại không tồn tại"""
+
+
+class LectureConflictError(Exception):
+    """Bài giảng đã bị sửa kể từ phiên bản client đang giữ (updated_at)"""
+
+
 class LectureService:
     def __init__(self):
         self.agent_url = settings.AGENT_MAIN_URL
@@ -31,55 +54,133 @@ class LectureService:
         
         result = await db.lectures.insert_one(lecture.model_dump(by_alias=True))
         lecture_id = str(result.inserted_id)
+        await idempotency_service.attach_job(lecture_id)
         
         try:
-            # Gọi agent để sinh nội dung bài giảng
-            content = await self._generate_lecture_content(request)
-            
-            # Cập nhật nội dung và status
-            await db.lectures.update_one(
-                {"_id": ObjectId(lecture_id)},
-                {
-                    "$set": {
-                        "content": content,
-                        "status": "completed",
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
-            
+            await self.generate_content(lecture_id, request)
+        except asyncio.CancelledError:
+            # Client bỏ đi hoặc hết deadline: không để bài giảng kẹt ở generating
+            await asyncio.shield(self.mark_error(lecture_id))
+            raise
         except Exception as e:
             logger.error(f"Error generating lecture content: {e}")
-            # Cập nhật status thành error
-            await db.lectures.update_one(
-                {"_id": ObjectId(lecture_id)},
-                {
-                    "$set": {
-                        "status": "error",
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
+            await self.mark_error(lecture_id)
             raise
         
         return lecture_id
     
+    async def generate_content(
+        self,
+        lecture_id: str,
+        request: LectureCreateRequest,
+        course_context: Optional[str] = None,
+        client: Optional[httpx.AsyncClient] = None
+    ) -> str:
+        """
+        Sinh nội dung cho bài giảng đã tạo (status generating) và lưu lại,
+        trả về nội dung. Lỗi được ném ra, status do bên gọi cập nhật.
+        """
+        db = await get_database()
+        
+        # Lấy đoạn trích từ tài liệu của giáo viên (nếu có) làm căn cứ
+        references = []
+        if request.document_ids:
+            references = await document_service.retrieve(
+                f"{request.title} {request.subject} {request.requirements}",
+                request.document_ids
+            )
+        
+        # Gọi agent để sinh nội dung bài giảng
+        content, citations = await self._generate_lecture_content(request, references, course_context, client)
+        
+        # Cập nhật nội dung và status
+        update_data = {
+            "content": content,
+            "status": "completed",
+            "updated_at": datetime.utcnow()
+        }
+        if references:
+            update_data["metadata.references"] = [ref.model_dump() for ref in references]
+            update_data["metadata.citations"] = citations
+        
+        await db.lectures.update_one(
+            {"_id": ObjectId(lecture_id)},
+            {"$set": update_data}
+        )
+        await cache_service.invalidate("lectures", lecture_id)
+        await search_service.refresh("lectures", lecture_id)
+        await version_service.record("lectures", lecture_id, source="generate")
+        return content
+    
+    async def mark_error(self, lecture_id: str):
+        """Đánh dấu bài giảng sinh lỗi"""
+        db = await get_database()
+        await db.lectures.update_one(
+            {"_id": ObjectId(lecture_id)},
+            {
+                "$set": {
+                    "status": "error",
+                    "updated_at": datetime.utcnow()
+                }
+            }
+        )
+        await cache_service.invalidate("lectures", lecture_id)
+    
     async def get_lecture(self, lecture_id: str) -> Optional[Lecture]:
         """Lấy chi tiết bài giảng"""
+        lecture_data = await self.get_lecture_document(lecture_id)
+        return Lecture(**lecture_data) if lecture_data else None
+    
+    async def get_lecture_document(self, lecture_id: str) -> Optional[dict]:
+        """Lấy document bài giảng thô (không dựng model), đọc qua cache"""
+        if not ObjectId.is_valid(lecture_id):
+            return None
         db = await get_database()
         
         try:
-            lecture_data = await db.lectures.find_one({"_id": ObjectId(lecture_id)})
-            if lecture_data:
-                return Lecture(**lecture_data)
-            return None
+            return await cache_service.get(
+                "lectures", lecture_id,
+                lambda: db.lectures.find_one({"_id": ObjectId(lecture_id)})
+            )
         except Exception as e:
             logger.error(f"Error getting lecture {lecture_id}: {e}")
             return None
     
+    async def get_lecture_header(self, lecture_id: str, use_cache: bool = False) -> Optional[dict]:
+        """Đọc updated_at và status (không tải nội dung), dùng cho ETag"""
+        if not ObjectId.is_valid(lecture_id):
+            return None
+        if use_cache:
+            cached = cache_service.peek_header("lectures", lecture_id)
+            if cached is not None:
+                return cached
+        db = await get_database()
+        return await db.lectures.find_one(
+            {"_id": ObjectId(lecture_id)},
+            projection={"updated_at": 1, "status": 1}
+        )
+    
+    async def get_lecture_page_headers(self, user_id: Optional[str] = None, page: int = 1, per_page: int = 20) -> Tuple[List[Tuple[str, datetime]], int]:
+        """(id, updated_at) của một trang danh sách bài giảng và tổng số, dùng cho ETag"""
+        db = await get_database("list")
+        
+        filter_query = {}
+        if user_id:
+            filter_query["user_id"] = user_id
+        
+        total_count = await db.lectures.count_documents(filter_query)
+        skip = (page - 1) * per_page
+        cursor = db.lectures.find(filter_query, projection={"updated_at": 1}).sort("created_at", -1).skip(skip).limit(per_page)
+        return [(str(doc["_id"]), doc.get("updated_at")) async for doc in cursor], total_count
+    
     async def get_lectures(self, user_id: Optional[str] = None, page: int = 1, per_page: int = 20) -> Tuple[List[Lecture], int]:
         """Lấy danh sách bài giảng với phân trang"""
-        db = await get_database()
+        docs, total_count = await self.get_lecture_documents(user_id, page, per_page)
+        return [Lecture(**lecture_data) for lecture_data in docs], total_count
+    
+    async def get_lecture_documents(self, user_id: Optional[str] = None, page: int = 1, per_page: int = 20, projection: Optional[dict] = None) -> Tuple[List[dict], int]:
+        """Lấy danh sách document bài giảng thô với phân trang"""
+        db = await get_database("list")
         
         try:
             # Tạo filter
@@ -92,67 +193,116 @@ class LectureService:
             
             # Lấy dữ liệu với phân trang
             skip = (page - 1) * per_page
-            cursor = db.lectures.find(filter_query).sort("created_at", -1).skip(skip).limit(per_page)
-            
-            lectures = []
-            async for lecture_data in cursor:
-                lectures.append(Lecture(**lecture_data))
+            cursor = db.lectures.find(filter_query, projection=projection).sort("created_at", -1).skip(skip).limit(per_page)
             
-            return lectures, total_count
+            return [lecture_data async for lecture_data in cursor], total_count
             
         except Exception as e:
             logger.error(f"Error getting lectures: {e}")
             return [], 0
     
-    async def update_lecture(self, lecture_id: str, request: LectureUpdateRequest) -> bool:
-        """Cập nhật bài giảng"""
+    async def update_lecture(
+        self,
+        lecture_id: str,
+        request: LectureUpdateRequest,
+        expected_updated_at: Optional[List[datetime]] = None
+    ) -> Optional[datetime]:
+        """
+        Cập nhật bài giảng trong một lệnh find_one_and_update, trả về updated_at
+        mới (None nếu không tồn tại).
+        
+        expected_updated_at: các phiên bản client chấp nhận (If-Match); bài
+        giảng đã đổi sang phiên bản khác -> LectureConflictError.
+        """
+        if not ObjectId.is_valid(lecture_id):
+            return None
         db = await get_database()
         
+        # Tạo update data
+        update_data = {}
+        if request.title is not None:
+            update_data["title"] = request.title
+        if request.subject is not None:
+            update_data["subject"] = request.subject
+        if request.grade is not None:
+            update_data["grade"] = request.grade
+        if request.description is not None:
+            update_data["description"] = request.description
+        if request.requirements is not None:
+            update_data["requirements"] = request.requirements
+        if request.content is not None:
+            update_data["content"] = request.content
+        if request.status is not None:
+            update_data["status"] = request.status
+        
+        update_data["updated_at"] = utcnow_ms()
+        
+        # Đọc kèm nội dung trước khi sửa (field của lịch sử và index tìm kiếm); các field
+        # đều là $set cấp cao nhất nên nội dung sau khi sửa ghép được mà không đọc lại
+        projection = {**search_service.projection("lectures"), **dict.fromkeys(VERSIONED_FIELDS["lectures"], 1)}
         try:
-            # Tạo update data
-            update_data = {}
-            if request.title is not None:
-                update_data["title"] = request.title
-            if request.subject is not None:
-                update_data["subject"] = request.subject
-            if request.grade is not None:
-                update_data["grade"] = request.grade
-            if request.description is not None:
-                update_data["description"] = request.description
-            if request.requirements is not None:
-                update_data["requirements"] = request.requirements
-            if request.content is not None:
-                update_data["content"] = request.content
-            if request.status is not None:
-                update_data["status"] = request.status
-            
-            update_data["updated_at"] = datetime.utcnow()
-            
-            result = await db.lectures.update_one(
-                {"_id": ObjectId(lecture_id)},
-                {"$set": update_data}
+            lecture = await db.lectures.find_one_and_update(
+                self._precondition_filter(lecture_id, expected_updated_at),
+                {"$set": update_data},
+                projection=projection
             )
-            
-            return result.modified_count > 0
-            
         except Exception as e:
             logger.error(f"Error updating lecture {lecture_id}: {e}")
-            return False
+            raise
+        
+        if lecture is None:
+            await self._precondition_failed(lecture_id, expected_updated_at)
+            return None
+        
+        await cache_service.invalidate("lectures", lecture_id)
+        updated = {**lecture, **update_data}
+        search_service.index_document("lectures", updated)
+        await version_service.record_update("lectures", lecture_id, lecture, updated)
+        return update_data["updated_at"]
     
-    async def delete_lecture(self, lecture_id: str) -> bool:
-        """Xóa bài giảng"""
+    async def delete_lecture(self, lecture_id: str, expected_updated_at: Optional[List[datetime]] = None) -> bool:
+        """Xóa bài giảng trong một lệnh find_one_and_delete (có thể kèm điều kiện If-Match)"""
+        if not ObjectId.is_valid(lecture_id):
+            return False
         db = await get_database()
         
         try:
-            result = await db.lectures.delete_one({"_id": ObjectId(lecture_id)})
-            return result.deleted_count > 0
+            lecture = await db.lectures.find_one_and_delete(
+                self._precondition_filter(lecture_id, expected_updated_at),
+                projection={"_id": 1}
+            )
         except Exception as e:
             logger.error(f"Error deleting lecture {lecture_id}: {e}")
+            raise
+        
+        if lecture is None:
+            await self._precondition_failed(lecture_id, expected_updated_at)
             return False
+        
+        await cache_service.invalidate("lectures", lecture_id)
+        search_service.remove("lectures", lecture_id)
+        export_service.discard("lectures", lecture_id)
+        await version_service.delete_versions("lectures", lecture_id)
+        return True
+    
+    def _precondition_filter(self, lecture_id: str, expected_updated_at: Optional[List[datetime]]) -> dict:
+        filter_query = {"_id": ObjectId(lecture_id)}
+        if expected_updated_at is not None:
+            filter_query["updated_at"] = {"$in": expected_updated_at}
+        return filter_query
+    
+    async def _precondition_failed(self, lecture_id: str, expected_updated_at: Optional[List[datetime]]):
+        """Lệnh ghi có điều kiện If-Match không khớp: phân biệt không tồn tại với đã bị sửa"""
+        if expected_updated_at is not None and await self.get_lecture_header(lecture_id):
+            raise LectureConflictError("Bài giảng đã được chỉnh sửa bởi người khác")
     
     async def search_lectures(self, query: str, user_id: Optional[str] = None) -> List[Lecture]:
         """Tìm kiếm bài giảng"""
-        db = await get_database()
+        return [Lecture(**lecture_data) for lecture_data in await self.search_lecture_documents(query, user_id)]
+    
+    async def search_lecture_documents(self, query: str, user_id: Optional[str] = None, projection: Optional[dict] = None) -> List[dict]:
+        """Tìm kiếm bài giảng, trả về document thô"""
+        db = await get_database("list")
         
         try:
             # Tạo filter
@@ -167,37 +317,148 @@ class LectureService:
             if user_id:
                 filter_query["user_id"] = user_id
             
-            cursor = db.lectures.find(filter_query).sort("created_at", -1).limit(20)
-            
-            lectures = []
-            async for lecture_data in cursor:
-                lectures.append(Lecture(**lecture_data))
+            cursor = db.lectures.find(filter_query, projection=projection).sort("created_at", -1).limit(20)
             
-            return lectures
+            return [lecture_data async for lecture_data in cursor]
             
         except Exception as e:
             logger.error(f"Error searching lectures: {e}")
             return []
     
-    async def _generate_lecture_content(self, request: LectureCreateRequest) -> str:
-        """Gọi agent để sinh nội dung bài giảng"""
+    async def get_sections(self, lecture_id: str) -> Optional[Tuple[List[dict], datetime]]:
+        """Dàn ý bài giảng: danh sách phần (tiêu đề, nội dung) và updated_at"""
+        if not ObjectId.is_valid(lecture_id):
+            return None
+        db = await get_database()
+        
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                payload = LectureGenerationRequest(
-                    title=request.title,
-                    subject=request.subject,
-                    grade=request.grade,
-                    requirements=request.requirements
-                ).model_dump()
-                
-                response = await client.post(
-                    f"{self.agent_url}/generate/lecture",
-                    json=payload
+            lecture = await db.lectures.find_one(
+                {"_id": ObjectId(lecture_id)},
+                projection={"content": 1, "updated_at": 1}
+            )
+            if not lecture:
+                return None
+            return split_sections(lecture.get("content")), lecture["updated_at"]
+        except Exception as e:
+            logger.error(f"Error getting sections of lecture {lecture_id}: {e}")
+            return None
+    
+    async def regenerate_section(self, lecture_id: str, index: int, request: LectureSectionRegenerateRequest) -> dict:
+        """
+        Sinh lại một phần của bài giảng và ghép vào đúng chỗ.
+        
+        Agent chỉ nhận phần cần sinh lại cùng dàn ý và một đoạn ngắn của phần
+        trước/sau. Lệnh ghi chỉ áp dụng nếu bài giảng không đổi trong lúc sinh.
+        """
+        if not ObjectId.is_valid(lecture_id):
+            raise LectureSectionNotFoundError("Không tìm thấy bài giảng")
+        db = await get_database()
+        
+        lecture = await db.lectures.find_one(
+            {"_id": ObjectId(lecture_id)},
+            projection={"title": 1, "subject": 1, "grade": 1, "content": 1, "updated_at": 1}
+        )
+        if not lecture:
+            raise LectureSectionNotFoundError("Không tìm thấy bài giảng")
+        if request.updated_at is not None and lecture["updated_at"] != request.updated_at:
+            raise LectureConflictError("Bài giảng đã được chỉnh sửa bởi người khác")
+        
+        sections = split_sections(lecture.get("content"))
+        if not 0 <= index < len(sections):
+            raise LectureSectionNotFoundError("Không tìm thấy phần bài giảng")
+        section = sections[index]
+        
+        payload = LectureSectionGenerationRequest(
+            lecture_title=lecture.get("title") or "",
+            subject=lecture.get("subject") or "",
+            grade=lecture.get("grade"),
+            section_title=section["title"],
+            section_content=section["text"],
+            instructions=request.instructions,
+            **section_context(sections, index, settings.REGENERATION_CONTEXT_CHARS)
+        )
+        new_text = await self._generate_section_content(payload)
+        
+        update_data = merge_section(lecture["content"], section, new_text)
+        update_data["updated_at"] = utcnow_ms()
+        # Lưu nội dung trước khi sinh lại để giáo viên có thể khôi phục
+        await version_service.checkpoint("lectures", lecture_id)
+        result = await db.lectures.update_one(
+            {"_id": ObjectId(lecture_id), "updated_at": lecture["updated_at"]},
+            {"$set": update_data}
+        )
+        if result.matched_count == 0:
+            raise LectureConflictError("Bài giảng vừa thay đổi trong lúc sinh lại, vui lòng thử lại")
+        
+        await cache_service.invalidate("lectures", lecture_id)
+        search_service.schedule_refresh("lectures", lecture_id)
+        await version_service.record("lectures", lecture_id, source="regenerate")
+        return {
+            "title": section["title"],
+            "content": new_text.strip(),
+            "total_sections": len(sections),
+            "updated_at": update_data["updated_at"]
+        }
+    
+    async def restore_version(self, lecture_id: str, version: int) -> dict:
+        """
+        Khôi phục nội dung bài giảng về một phiên bản cũ.
+        
+        Lịch sử không bị cắt: nội dung khôi phục được lưu thành phiên bản mới.
+        """
+        entry = await version_service.get_version("lectures", lecture_id, version)
+        db = await get_database()
+        
+        await version_service.checkpoint("lectures", lecture_id)
+        update_data = dict(entry["state"])
+        update_data["updated_at"] = utcnow_ms()
+        result = await db.lectures.update_one({"_id": ObjectId(lecture_id)}, {"$set": update_data})
+        if result.matched_count == 0:
+            raise VersionNotFoundError("Không tìm thấy bài giảng")
+        
+        await cache_service.invalidate("lectures", lecture_id)
+        await search_service.refresh("lectures", lecture_id)
+        new_version = await version_service.record("lectures", lecture_id, source="restore")
+        return {"version": new_version, "restored_from": version, "updated_at": update_data["updated_at"]}
+    
+    async def _generate_lecture_content(
+        self,
+        request: LectureCreateRequest,
+        references: List[DocumentReference] = None,
+        course_context: Optional[str] = None,
+        client: Optional[httpx.AsyncClient] = None
+    ) -> Tuple[str, List[int]]:
+        """
+        Gọi agent để sinh nội dung bài giảng, trả về (nội dung, các trích dẫn đã dùng)
+        
+        client: dùng chung kết nối khi sinh nhiều bài (khóa học); mặc định mở client riêng.
+        """
+        try:
+            payload = LectureGenerationRequest(
+                title=request.title,
+                subject=request.subject,
+                grade=request.grade,
+                requirements=request.requirements,
+                references=[ref.model_dump() for ref in references or []],
+                course_context=course_context
+            ).model_dump()
+            
+            url = f"{self.agent_url}/generate/lecture"
+            if client is None:
+                async with httpx.AsyncClient(timeout=60.0) as own_client:
+                    response = await resilient_caller.call(
+                        "agent.lecture",
+                        lambda: own_client.post(url, json=payload, headers=deadline.headers())
+                    )
+            else:
+                response = await resilient_caller.call(
+                    "agent.lecture",
+                    lambda: client.post(url, json=payload, headers=deadline.headers())
                 )
-                response.raise_for_status()
-                
-                result = response.json()
-                return result.get("content", "")
+            response.raise_for_status()
+            
+            result = response.json()
+            return result.get("content", ""), result.get("citations", [])
                 
         except httpx.RequestError as e:
             logger.error(f"Error calling agent for lecture generation: {e}")
@@ -205,6 +466,32 @@ class LectureService:
         except Exception as e:
             logger.error(f"Unexpected error generating lecture: {e}")
             raise Exception("Đã xảy ra lỗi khi sinh nội dung bài giảng")
+    
+    async def _generate_section_content(self, payload: LectureSectionGenerationRequest) -> str:
+        """Gọi agent để sinh lại một phần bài giảng"""
+        try:
+            async with httpx.AsyncClient(timeout=60.0) as client:
+                response = await resilient_caller.call(
+                    "agent.lecture_section",
+                    lambda: client.post(
+                        f"{self.agent_url}/generate/lecture-section",
+                        json=payload.model_dump(),
+                        headers=deadline.headers()
+                    )
+                )
+                response.raise_for_status()
+                
+                content = response.json().get("content") or ""
+                if not content.strip():
+                    raise ValueError("Empty section content")
+                return content
+                
+        except httpx.RequestError as e:
+            logger.error(f"Error calling agent for section regeneration: {e}")
+            raise Exception("Không thể kết nối tới dịch vụ sinh nội dung")
+        except Exception as e:
+            logger.error(f"Unexpected error regenerating section: {e}")
+            raise Exception("Đã xảy ra lỗi khi sinh lại phần bài giảng")
 
 # Singleton instance
 lecture_service = LectureService()
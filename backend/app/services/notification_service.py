@@ -0,0 +1,223 @@
+from typing import Dict, List, Optional, Set, Tuple
+from collections import OrderedDict, deque
+from datetime import datetime
+from pymongo.errors import OperationFailure
+import asyncio
+import logging
+
+from app.db.database import get_database
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_KINDS = ("lectures", "slides")
+
+_FIELDS = {"user_id": 1, "status": 1, "title": 1, "updated_at": 1}
+
+# Chỉ lấy các field cần cho event; giữ nguyên _id của change event (resume token)
+_PIPELINE = [
+    {"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}},
+    {"$project": {
+        "operationType": 1,
+        "documentKey": 1,
+        **{f"fullDocument.{field}": 1 for field in _FIELDS}
+    }}
+]
+
+# Mã lỗi khi MongoDB không hỗ trợ change stream (standalone, không phải replica set)
+_UNSUPPORTED_CODES = {40573, 40324, 20}
+# Resume token quá cũ, oplog đã bị ghi đè
+_HISTORY_LOST_CODES = {286, 280}
+# Số tài liệu tối đa nhớ chủ sở hữu (để gửi event xóa đúng user); ít dùng nhất bị bỏ trước
+_MAX_OWNERS = 100000
+
+
+class Subscriber:
+    """Một client đang nghe (SSE hoặc WebSocket), có hàng đợi giới hạn riêng"""
+
+    def __init__(self, user_id: Optional[str], kinds: Set[str]):
+        self.user_key = user_id or ""
+        self.kinds = kinds
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.NOTIFY_QUEUE_SIZE)
+
+    def push(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Client đọc chậm: bỏ các event đang chờ thay vì chặn việc phát cho
+            # client khác, báo client tải lại dữ liệu
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"id": event["id"], "type": "reset", "reason": "overflow"})
+
+
+class NotificationService:
+    """
+    Phát thay đổi trạng thái bài giảng/slide tới client theo user.
+
+    Đọc thay đổi bằng MongoDB change stream (tiếp tục từ resume token khi mất
+    kết nối); với MongoDB standalone thì chuyển sang poll theo updated_at.
+    Mỗi event có id tăng dần và được giữ trong buffer để client kết nối lại
+    (Last-Event-ID) nhận tiếp các event bị lỡ.
+
+    Change stream không có nội dung của tài liệu đã xóa, nên chủ sở hữu được
+    nhớ từ các event trước đó của tài liệu; event xóa chỉ gửi cho chủ sở
+    hữu, không biết chủ sở hữu thì bỏ qua.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+        self._buffer: deque = deque(maxlen=settings.NOTIFY_BUFFER_SIZE)
+        self._seq = 0
+        self._owners: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._tasks: List[asyncio.Task] = []
+        self.mode: Optional[str] = None  # change_stream, polling
+
+    def start(self):
+        """Bắt đầu theo dõi thay đổi (gọi khi khởi động)"""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._watch(kind)) for kind in NOTIFY_KINDS]
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def subscribe(self, user_id: Optional[str], kinds: Optional[Set[str]] = None, last_event_id: Optional[int] = None) -> Subscriber:
+        """Đăng ký nhận event; nếu có last_event_id thì gửi lại các event bị lỡ"""
+        subscriber = Subscriber(user_id, set(kinds or NOTIFY_KINDS))
+        self._subscribers.setdefault(subscriber.user_key, set()).add(subscriber)
+
+        if last_event_id is not None and last_event_id < self._seq:
+            oldest = self._buffer[0][1]["id"] if self._buffer else self._seq + 1
+            if last_event_id + 1 < oldest:
+                # Event cần gửi lại không còn trong buffer
+                subscriber.push({"id": self._seq, "type": "reset", "reason": "expired"})
+            else:
+                for user_key, event in self._buffer:
+                    if event["id"] > last_event_id and self._matches(subscriber, user_key, event):
+                        subscriber.push(event)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._subscribers.get(subscriber.user_key)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                self._subscribers.pop(subscriber.user_key, None)
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _matches(self, subscriber: Subscriber, user_key: str, event: dict) -> bool:
+        return event["kind"] in subscriber.kinds and user_key == subscriber.user_key
+
+    def publish(self, kind: str, doc_id: str, operation: str, doc: Optional[dict] = None):
+        """Phát một event thay đổi tới client của chủ sở hữu tài liệu"""
+        owner = (kind, doc_id)
+        if doc is None:
+            # Tài liệu đã xóa: chỉ biết chủ sở hữu qua các event trước đó
+            user_key = self._owners.pop(owner, None)
+            if user_key is None:
+                return
+        else:
+            user_key = doc.get("user_id") or ""
+            self._owners.pop(owner, None)
+            self._owners[owner] = user_key
+            while len(self._owners) > _MAX_OWNERS:
+                self._owners.popitem(last=False)
+
+        self._seq += 1
+        event = {"id": self._seq, "type": "change", "kind": kind, "doc_id": doc_id, "operation": operation}
+        if doc is not None:
+            updated_at = doc.get("updated_at")
+            event.update(
+                status=doc.get("status"),
+                title=doc.get("title"),
+                updated_at=updated_at.isoformat() if isinstance(updated_at, datetime) else updated_at
+            )
+        self._buffer.append((user_key, event))
+
+        for subscriber in list(self._subscribers.get(user_key, ())):
+            if self._matches(subscriber, user_key, event):
+                subscriber.push(event)
+
+    def _reset_all(self, reason: str):
+        """Báo mọi client tải lại (có thể đã lỡ thay đổi)"""
+        for subscribers in self._subscribers.values():
+            for subscriber in subscribers:
+                subscriber.push({"id": self._seq, "type": "reset", "reason": reason})
+
+    async def _watch(self, kind: str):
+        db = await get_database()
+        resume_token = None
+        while True:
+            try:
+                async with db[kind].watch(_PIPELINE, full_document="updateLookup", resume_after=resume_token) as stream:
+                    self.mode = "change_stream"
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self._on_change(kind, change)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code in _UNSUPPORTED_CODES:
+                    logger.info(f"Change streams unavailable ({e}); polling {kind} every {settings.NOTIFY_POLL_INTERVAL}s")
+                    self.mode = "polling"
+                    await self._poll(kind)
+                    return
+                if e.code in _HISTORY_LOST_CODES:
+                    logger.warning(f"Change stream history lost for {kind}, restarting from now")
+                    resume_token = None
+                    self._reset_all("history_lost")
+                    continue
+                logger.error(f"Change stream error on {kind}: {e}")
+                await asyncio.sleep(settings.NOTIFY_RETRY_DELAY)
+            except Exception as e:
+                # Mất kết nối: mở lại change stream từ resume token cuối
+                logger.error(f"Change stream error on {kind}: {e}")
+                await asyncio.sleep(settings.NOTIFY_RETRY_DELAY)
+
+    def _on_change(self, kind: str, change: dict):
+        doc_id = str(change["documentKey"]["_id"])
+        operation = change["operationType"]
+        doc = change.get("fullDocument")
+        if operation == "delete" or doc is None:
+            # Tài liệu đã bị xóa trước khi change stream đọc được
+            self.publish(kind, doc_id, "delete")
+        else:
+            self.publish(kind, doc_id, operation, doc)
+
+    async def _poll(self, kind: str):
+        """Poll các tài liệu có updated_at mới (không phát hiện được tài liệu bị xóa)"""
+        db = await get_database()
+        since = datetime.utcnow()
+        # Tài liệu đã phát tại đúng mốc since (updated_at trùng millisecond)
+        seen_at_since: Set[str] = set()
+        while True:
+            await asyncio.sleep(settings.NOTIFY_POLL_INTERVAL)
+            if not self._subscribers:
+                # Không có ai nghe: bỏ qua truy vấn
+                since, seen_at_since = datetime.utcnow(), set()
+                continue
+            try:
+                cursor = db[kind].find(
+                    {"updated_at": {"$gte": since}},
+                    projection=_FIELDS
+                ).sort("updated_at", 1).limit(500)
+                async for doc in cursor:
+                    doc_id = str(doc["_id"])
+                    updated_at = doc.get("updated_at")
+                    if updated_at == since and doc_id in seen_at_since:
+                        continue
+                    if updated_at != since:
+                        since, seen_at_since = updated_at, set()
+                    seen_at_since.add(doc_id)
+                    self.publish(kind, doc_id, "update", doc)
+            except Exception as e:
+                logger.error(f"Error polling {kind} changes: {e}")
+
+# Singleton instance
+notification_service = NotificationService()
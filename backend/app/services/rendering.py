@@ -0,0 +1,530 @@
+"""
+Render bài giảng ra Markdown, HTML, DOCX và PDF.
+
+Nội dung bài giảng có thể là chuỗi Markdown (do LLM sinh) hoặc dàn ý có cấu
+trúc (dict/list). Cả hai được chuẩn hóa về một danh sách block (heading,
+đoạn văn, danh sách, trích dẫn, code) rồi mới render, nên mọi định dạng cho
+cùng một bố cục.
+
+Các hàm ở đây là hàm thuần, nhận dữ liệu dạng dict và ghi ra file, để có thể
+chạy trong process pool (không dùng tới event loop hay MongoDB).
+"""
+import html
+import logging
+import os
+import re
+from typing import Any, List, Optional, Tuple
+
+# format -> (phần mở rộng, media type)
+FORMATS = {
+    "markdown": (".md", "text/markdown; charset=utf-8"),
+    "html": (".html", "text/html; charset=utf-8"),
+    "docx": (".docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    "pdf": (".pdf", "application/pdf"),
+}
+FORMAT_ALIASES = {"md": "markdown", "htm": "html", "word": "docx"}
+
+TEMPLATES = {
+    "default": {
+        "font_size": 11,
+        "heading_sizes": (20, 16, 13, 12),
+        "accent": (31, 78, 121),
+        "margin": 20,
+        "line_height": 1.5,
+    },
+    "compact": {
+        "font_size": 9.5,
+        "heading_sizes": (16, 13, 11, 10),
+        "accent": (40, 40, 40),
+        "margin": 12,
+        "line_height": 1.3,
+    },
+}
+
+# Tăng khi thay đổi renderer để cache cũ không còn được dùng
+RENDER_VERSION = 1
+
+_GRADE_LABELS = {
+    "elementary": "Tiểu học",
+    "middle": "THCS",
+    "high": "THPT",
+    "university": "Đại học",
+}
+
+# Tên hiển thị cho các khóa thường gặp trong dàn ý có cấu trúc
+_SECTION_LABELS = {
+    "objectives": "Mục tiêu bài học",
+    "introduction": "Giới thiệu",
+    "content": "Nội dung",
+    "activities": "Hoạt động",
+    "methods": "Phương pháp giảng dạy",
+    "exercises": "Bài tập",
+    "questions": "Câu hỏi kiểm tra",
+    "summary": "Tổng kết",
+    "homework": "Bài tập về nhà",
+    "references": "Tài liệu tham khảo",
+}
+# Các khóa chỉ chứa danh sách phần con, không tạo heading riêng
+_TRANSPARENT_KEYS = {"sections", "parts", "items"}
+
+# Block: (loại, cấp, nội dung)
+#   heading: cấp 1-4; bullet/number: cấp lồng nhau (0 = ngoài cùng)
+#   paragraph, quote, code: cấp 0; rule: nội dung rỗng
+Block = Tuple[str, int, str]
+# Span: (text, bold, italic, code)
+Span = Tuple[str, bool, bool, bool]
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_BULLET_RE = re.compile(r"^(\s*)[-*+•]\s+(.*)$")
+_NUMBER_RE = re.compile(r"^(\s*)\d+[.)]\s+(.*)$")
+_RULE_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_INLINE_RE = re.compile(r"(\*\*(.+?)\*\*|__(.+?)__|\*(.+?)\*|`(.+?)`)")
+
+
+def normalize_format(fmt: str) -> Optional[str]:
+    """Chuẩn hóa tên định dạng (None nếu không hỗ trợ)"""
+    fmt = (fmt or "").lower().strip()
+    fmt = FORMAT_ALIASES.get(fmt, fmt)
+    return fmt if fmt in FORMATS else None
+
+
+def parse_markdown(text: str, base_level: int = 0) -> List[Block]:
+    """Tách Markdown thành block; heading được cộng thêm base_level"""
+    blocks: List[Block] = []
+    paragraph: List[str] = []
+    code: Optional[List[str]] = None
+
+    def flush():
+        if paragraph:
+            blocks.append(("paragraph", 0, " ".join(paragraph)))
+            paragraph.clear()
+
+    for raw in (text or "").splitlines():
+        line = raw.rstrip()
+        if code is not None:
+            if line.strip().startswith("```"):
+                blocks.append(("code", 0, "\n".join(code)))
+                code = None
+            else:
+                code.append(raw)
+            continue
+        if line.strip().startswith("```"):
+            flush()
+            code = []
+            continue
+        if not line.strip():
+            flush()
+            continue
+
+        match = _HEADING_RE.match(line)
+        if match:
+            flush()
+            blocks.append(("heading", min(len(match.group(1)) + base_level, 4), match.group(2)))
+            continue
+        if _RULE_RE.match(line):
+            flush()
+            blocks.append(("rule", 0, ""))
+            continue
+        match = _BULLET_RE.match(line)
+        if match:
+            flush()
+            blocks.append(("bullet", len(match.group(1).expandtabs(4)) // 2, match.group(2)))
+            continue
+        match = _NUMBER_RE.match(line)
+        if match:
+            flush()
+            blocks.append(("number", len(match.group(1).expandtabs(4)) // 2, match.group(2)))
+            continue
+        if line.lstrip().startswith(">"):
+            flush()
+            blocks.append(("quote", 0, line.lstrip()[1:].strip()))
+            continue
+        paragraph.append(line.strip())
+
+    if code is not None:
+        blocks.append(("code", 0, "\n".join(code)))
+    flush()
+    return blocks
+
+
+def section_label(key: str) -> str:
+    return _SECTION_LABELS.get(key.lower(), key.replace("_", " ").strip().capitalize())
+
+
+def _structured_blocks(value: Any, level: int, blocks: List[Block]):
+    """Chuyển dàn ý có cấu trúc (dict/list lồng nhau) thành block"""
+    if value is None:
+        return
+    if isinstance(value, str):
+        blocks.extend(parse_markdown(value, base_level=level - 1))
+        return
+    if isinstance(value, dict):
+        title = value.get("title") or value.get("heading")
+        if title and isinstance(title, str):
+            blocks.append(("heading", min(level, 4), title))
+            level += 1
+        for key, item in value.items():
+            if key in ("title", "heading"):
+                continue
+            if key.lower() in _TRANSPARENT_KEYS or key.lower() in ("content", "body", "text"):
+                _structured_blocks(item, level, blocks)
+            else:
+                blocks.append(("heading", min(level, 4), section_label(key)))
+                _structured_blocks(item, level + 1, blocks)
+        return
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            if isinstance(item, (dict, list, tuple)):
+                _structured_blocks(item, level, blocks)
+            elif item is not None:
+                blocks.append(("bullet", 0, str(item)))
+        return
+    blocks.append(("paragraph", 0, str(value)))
+
+
+def lecture_blocks(lecture: dict) -> List[Block]:
+    """Block của toàn bộ tài liệu: tiêu đề, thông tin chung, nội dung, tài liệu tham khảo"""
+    blocks: List[Block] = [("heading", 1, lecture.get("title") or "Bài giảng")]
+
+    info = [f"**Môn học:** {lecture.get('subject') or ''}"]
+    grade = lecture.get("grade")
+    if grade:
+        info.append(f"**Cấp độ:** {_GRADE_LABELS.get(grade, grade)}")
+    blocks.append(("paragraph", 0, " · ".join(info)))
+    if lecture.get("description"):
+        blocks.append(("quote", 0, lecture["description"]))
+
+    content = lecture.get("content")
+    if isinstance(content, str):
+        content_blocks = parse_markdown(content)
+        if any(kind == "heading" and level == 1 for kind, level, _ in content_blocks):
+            # Nội dung có heading cấp 1 riêng: hạ một cấp để tiêu đề tài liệu là duy nhất
+            content_blocks = parse_markdown(content, base_level=1)
+        blocks.extend(content_blocks)
+    else:
+        _structured_blocks(content, 2, blocks)
+
+    references = (lecture.get("metadata") or {}).get("references") or []
+    if references:
+        blocks.append(("heading", 2, "Tài liệu tham khảo"))
+        for ref in references:
+            page = f", trang {ref['page']}" if ref.get("page") else ""
+            blocks.append(("bullet", 0, f"[{ref.get('ref')}] {ref.get('filename', '')}{page}"))
+    return blocks
+
+
+def parse_inline(text: str) -> List[Span]:
+    """Tách định dạng inline: **đậm**, *nghiêng*, `code`"""
+    spans: List[Span] = []
+    pos = 0
+    for match in _INLINE_RE.finditer(text):
+        if match.start() > pos:
+            spans.append((text[pos:match.start()], False, False, False))
+        bold, bold2, italic, code = match.group(2, 3, 4, 5)
+        if bold or bold2:
+            spans.append((bold or bold2, True, False, False))
+        elif italic:
+            spans.append((italic, False, True, False))
+        else:
+            spans.append((code, False, False, True))
+        pos = match.end()
+    if pos < len(text):
+        spans.append((text[pos:], False, False, False))
+    return spans
+
+
+# ---------------------------------------------------------------- Markdown
+
+def _numbered(blocks: List[Block]):
+    """Duyệt block kèm số thứ tự cho các mục danh sách đánh số"""
+    counters: dict = {}
+    for kind, level, text in blocks:
+        if kind == "number":
+            for deeper in [lvl for lvl in counters if lvl > level]:
+                del counters[deeper]
+            counters[level] = counters.get(level, 0) + 1
+            yield kind, level, text, counters[level]
+        else:
+            if kind != "bullet":
+                counters.clear()
+            yield kind, level, text, 0
+
+
+def _blocks_to_markdown(blocks: List[Block]) -> str:
+    lines: List[str] = []
+    for kind, level, text, number in _numbered(blocks):
+        if kind == "heading":
+            lines += ["", f"{'#' * level} {text}", ""]
+        elif kind == "paragraph":
+            lines += [text, ""]
+        elif kind == "bullet":
+            lines.append(f"{'  ' * level}- {text}")
+        elif kind == "number":
+            lines.append(f"{'   ' * level}{number}. {text}")
+        elif kind == "quote":
+            lines += [f"> {text}", ""]
+        elif kind == "code":
+            lines += ["```", text, "```", ""]
+        elif kind == "rule":
+            lines += ["---", ""]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip() + "\n"
+
+
+def render_markdown(lecture: dict, template: str) -> str:
+    return _blocks_to_markdown(lecture_blocks(lecture))
+
+
+# ---------------------------------------------------------------- HTML
+
+def _inline_html(text: str) -> str:
+    parts = []
+    for span, bold, italic, code in parse_inline(text):
+        span = html.escape(span)
+        if code:
+            span = f"<code>{span}</code>"
+        elif bold:
+            span = f"<strong>{span}</strong>"
+        elif italic:
+            span = f"<em>{span}</em>"
+        parts.append(span)
+    return "".join(parts)
+
+
+def _html_css(template: str) -> str:
+    t = TEMPLATES[template]
+    h1, h2, h3, h4 = t["heading_sizes"]
+    accent = "#%02x%02x%02x" % t["accent"]
+    return (
+        f"body{{font-family:'DejaVu Sans',Arial,sans-serif;font-size:{t['font_size']}pt;"
+        f"line-height:{t['line_height']};max-width:48em;margin:{t['margin']}mm auto;padding:0 1em;color:#222}}"
+        f"h1,h2,h3,h4{{color:{accent};line-height:1.25}}"
+        f"h1{{font-size:{h1}pt}}h2{{font-size:{h2}pt}}h3{{font-size:{h3}pt}}h4{{font-size:{h4}pt}}"
+        "blockquote{margin:0 0 1em;padding:.25em 1em;border-left:3px solid #ccc;color:#555}"
+        "pre{background:#f5f5f5;padding:.75em;overflow:auto}code{font-family:'DejaVu Sans Mono',monospace}"
+        "@media print{body{margin:0;max-width:none}}"
+    )
+
+
+def render_html(lecture: dict, template: str) -> str:
+    body: List[str] = []
+    # Stack các danh sách đang mở: (thẻ, cấp)
+    lists: List[Tuple[str, int]] = []
+
+    def close_lists(level: int = -1, tag: Optional[str] = None):
+        while lists and (lists[-1][1] > level or (lists[-1][1] == level and lists[-1][0] != tag)):
+            body.append(f"</li></{lists.pop()[0]}>")
+
+    for kind, level, text in lecture_blocks(lecture):
+        if kind in ("bullet", "number"):
+            tag = "ul" if kind == "bullet" else "ol"
+            close_lists(level, tag)
+            if lists and lists[-1][1] == level:
+                body.append(f"</li><li>{_inline_html(text)}")
+            else:
+                body.append(f"<{tag}><li>{_inline_html(text)}")
+                lists.append((tag, level))
+            continue
+
+        close_lists()
+        if kind == "heading":
+            body.append(f"<h{level}>{_inline_html(text)}</h{level}>")
+        elif kind == "paragraph":
+            body.append(f"<p>{_inline_html(text)}</p>")
+        elif kind == "quote":
+            body.append(f"<blockquote>{_inline_html(text)}</blockquote>")
+        elif kind == "code":
+            body.append(f"<pre><code>{html.escape(text)}</code></pre>")
+        elif kind == "rule":
+            body.append("<hr>")
+    close_lists()
+
+    title = html.escape(lecture.get("title") or "Bài giảng")
+    return (
+        "<!DOCTYPE html>\n<html lang=\"vi\">\n<head>\n<meta charset=\"utf-8\">\n"
+        f"<title>{title}</title>\n<style>{_html_css(template)}</style>\n</head>\n<body>\n"
+        + "\n".join(body)
+        + "\n</body>\n</html>\n"
+    )
+
+
+# ---------------------------------------------------------------- DOCX
+
+def _docx_runs(paragraph, text: str, size=None):
+    from docx.shared import Pt
+
+    for span, bold, italic, code in parse_inline(text):
+        run = paragraph.add_run(span)
+        run.bold = bold or None
+        run.italic = italic or None
+        if code:
+            run.font.name = "Courier New"
+        if size:
+            run.font.size = Pt(size)
+
+
+def render_docx(lecture: dict, template: str, path: str):
+    from docx import Document
+    from docx.shared import Mm, Pt, RGBColor
+
+    t = TEMPLATES[template]
+    document = Document()
+    for section in document.sections:
+        section.left_margin = section.right_margin = Mm(t["margin"])
+        section.top_margin = section.bottom_margin = Mm(t["margin"])
+    normal = document.styles["Normal"]
+    normal.font.size = Pt(t["font_size"])
+    normal.paragraph_format.line_spacing = t["line_height"]
+    for level, size in enumerate(t["heading_sizes"], start=1):
+        style = document.styles["Title" if level == 1 else f"Heading {level - 1}"]
+        style.font.size = Pt(size)
+        style.font.color.rgb = RGBColor(*t["accent"])
+
+    for kind, level, text, number in _numbered(lecture_blocks(lecture)):
+        if kind == "heading":
+            # Heading cấp 1 của tài liệu dùng style Title
+            _docx_runs(document.add_heading("", level=0 if level == 1 else level - 1), text)
+        elif kind == "paragraph":
+            _docx_runs(document.add_paragraph(), text)
+        elif kind == "bullet":
+            style = f"List Bullet {min(level + 1, 3)}" if level else "List Bullet"
+            _docx_runs(document.add_paragraph(style=style), text)
+        elif kind == "number":
+            # Tự đánh số để mỗi danh sách bắt đầu lại từ 1
+            paragraph = document.add_paragraph()
+            paragraph.paragraph_format.left_indent = Mm(6 * (level + 1))
+            paragraph.paragraph_format.first_line_indent = Mm(-6)
+            paragraph.add_run(f"{number}.\t")
+            _docx_runs(paragraph, text)
+        elif kind == "quote":
+            _docx_runs(document.add_paragraph(style="Quote"), text)
+        elif kind == "code":
+            run = document.add_paragraph().add_run(text)
+            run.font.name = "Courier New"
+            run.font.size = Pt(t["font_size"] - 1)
+        elif kind == "rule":
+            document.add_paragraph("―" * 20)
+
+    core = document.core_properties
+    core.title = lecture.get("title") or ""
+    core.subject = lecture.get("subject") or ""
+    document.save(path)
+
+
+# ---------------------------------------------------------------- PDF
+
+# style -> các file font thử lần lượt (gói fonts-dejavu-core không có bản nghiêng)
+_FONT_FILES = {
+    "": ("DejaVuSans.ttf",),
+    "B": ("DejaVuSans-Bold.ttf", "DejaVuSans.ttf"),
+    "I": ("DejaVuSans-Oblique.ttf", "DejaVuSans.ttf"),
+    "BI": ("DejaVuSans-BoldOblique.ttf", "DejaVuSans-Bold.ttf", "DejaVuSans.ttf"),
+}
+_MONO_FONT_FILE = "DejaVuSansMono.ttf"
+
+
+def register_pdf_fonts(pdf, font_directory: str) -> Tuple[str, str, bool]:
+    """Đăng ký font Unicode; trả về (font chữ, font code, có hỗ trợ Unicode)"""
+    paths = {}
+    for style, names in _FONT_FILES.items():
+        candidates = [os.path.join(font_directory, name) for name in names]
+        paths[style] = next((p for p in candidates if os.path.exists(p)), None)
+    if paths[""] is None:
+        # Không có font Unicode: dùng font chuẩn của PDF (mất dấu tiếng Việt)
+        return "helvetica", "courier", False
+
+    for style, font_path in paths.items():
+        pdf.add_font("DejaVu", style, font_path)
+    mono_path = os.path.join(font_directory, _MONO_FONT_FILE)
+    if os.path.exists(mono_path):
+        pdf.add_font("DejaVuMono", "", mono_path)
+        return "DejaVu", "DejaVuMono", True
+    return "DejaVu", "DejaVu", True
+
+
+def render_pdf(lecture: dict, template: str, path: str, font_directory: str):
+    from fpdf import FPDF
+
+    # fontTools ghi log INFO cho mỗi lần subset font
+    logging.getLogger("fontTools").setLevel(logging.WARNING)
+    t = TEMPLATES[template]
+    pdf = FPDF(format="A4")
+    pdf.set_margins(t["margin"], t["margin"], t["margin"])
+    pdf.set_auto_page_break(True, margin=t["margin"])
+    pdf.set_title(lecture.get("title") or "")
+    font, mono, unicode_ok = register_pdf_fonts(pdf, font_directory)
+
+    def clean(text: str) -> str:
+        if unicode_ok:
+            return text
+        return text.encode("latin-1", "replace").decode("latin-1")
+
+    size = t["font_size"]
+    line = size * 0.3528 * t["line_height"]  # pt -> mm
+    margin = t["margin"]
+    pdf.add_page()
+
+    def write_inline(text: str, style: str = "", text_size: float = size, height: float = line):
+        for span, bold, italic, code in parse_inline(text):
+            span_style = style + ("B" if bold and "B" not in style else "") + ("I" if italic and "I" not in style else "")
+            pdf.set_font(mono if code else font, "" if code else span_style, text_size)
+            pdf.write(height, clean(span))
+
+    for kind, level, text, number in _numbered(lecture_blocks(lecture)):
+        pdf.set_left_margin(margin)
+        pdf.set_x(margin)
+        if kind == "heading":
+            heading_size = t["heading_sizes"][min(level, 4) - 1]
+            pdf.ln(line * 0.6)
+            pdf.set_text_color(*t["accent"])
+            write_inline(text, "B", heading_size, heading_size * 0.3528 * 1.3)
+            pdf.set_text_color(0, 0, 0)
+            pdf.ln(heading_size * 0.3528 * 1.5)
+        elif kind == "paragraph":
+            write_inline(text)
+            pdf.ln(line * 1.5)
+        elif kind in ("bullet", "number"):
+            indent = margin + 6 * (level + 1)
+            if kind == "bullet":
+                marker = "•" if unicode_ok else "-"
+            else:
+                marker = f"{number}."
+            pdf.set_font(font, "", size)
+            pdf.set_x(indent - pdf.get_string_width(marker) - 1.5)
+            pdf.write(line, marker)
+            pdf.set_left_margin(indent)
+            pdf.set_x(indent)
+            write_inline(text)
+            pdf.ln(line * 1.2)
+        elif kind == "quote":
+            pdf.set_left_margin(margin + 6)
+            pdf.set_x(margin + 6)
+            pdf.set_text_color(85, 85, 85)
+            write_inline(text, "I")
+            pdf.set_text_color(0, 0, 0)
+            pdf.ln(line * 1.5)
+        elif kind == "code":
+            pdf.set_font(mono, "", size - 1)
+            pdf.multi_cell(0, line, clean(text), fill=False)
+            pdf.ln(line * 0.5)
+        elif kind == "rule":
+            y = pdf.get_y() + line / 2
+            pdf.line(margin, y, pdf.w - margin, y)
+            pdf.ln(line)
+
+    pdf.output(path)
+
+
+def render_lecture(lecture: dict, fmt: str, template: str, path: str, font_directory: str = ""):
+    """Render bài giảng ra file ở path (chạy được trong process pool)"""
+    if fmt == "markdown":
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(render_markdown(lecture, template))
+    elif fmt == "html":
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(render_html(lecture, template))
+    elif fmt == "docx":
+        render_docx(lecture, template, path)
+    elif fmt == "pdf":
+        render_pdf(lecture, template, path, font_directory)
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
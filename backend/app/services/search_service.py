@@ -0,0 +1,236 @@
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from bson import ObjectId
+import asyncio
+import logging
+import time
+
+from app.db.database import get_database, read_lag
+from app.core.config import settings
+from app.core.hybrid_index import HybridIndex
+from app.services.suggestion_service import suggestion_service
+
+logger = logging.getLogger(__name__)
+
+# Số ký tự nội dung tối đa đưa vào index cho mỗi tài liệu
+_BODY_CHARS = 4000
+
+_PROJECTIONS = {
+    "lectures": {
+        "title": 1, "subject": 1, "grade": 1, "description": 1, "requirements": 1,
+        "content": 1, "user_id": 1, "status": 1, "created_at": 1, "updated_at": 1
+    },
+    "slides": {
+        "title": 1, "subject": 1, "description": 1, "requirements": 1, "slides": 1,
+        "slide_count": 1, "user_id": 1, "status": 1, "created_at": 1, "updated_at": 1
+    }
+}
+
+
+def _flatten(value: Any, parts: List[str], budget: int) -> int:
+    """Gom các chuỗi trong nội dung có cấu trúc (dict/list) cho đến khi hết budget"""
+    if budget <= 0:
+        return budget
+    if isinstance(value, str):
+        parts.append(value[:budget])
+        return budget - len(value)
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            budget = _flatten(item, parts, budget)
+            if budget <= 0:
+                break
+    return budget
+
+
+def _document_body(kind: str, doc: dict) -> str:
+    parts = [doc.get("description") or "", doc.get("requirements") or ""]
+    if kind == "lectures":
+        _flatten(doc.get("content"), parts, _BODY_CHARS)
+    else:
+        slide_parts: List[str] = []
+        _flatten([[s.get("title", ""), s.get("content", "")] for s in doc.get("slides") or []], slide_parts, _BODY_CHARS)
+        parts.extend(slide_parts)
+    return " ".join(p for p in parts if p)
+
+
+def _document_meta(kind: str, doc: dict) -> dict:
+    meta = {
+        "id": str(doc["_id"]),
+        "title": doc.get("title", ""),
+        "subject": doc.get("subject", ""),
+        "description": doc.get("description"),
+        "status": doc.get("status"),
+        "created_at": doc["created_at"].isoformat() if doc.get("created_at") else None
+    }
+    if kind == "lectures":
+        meta["grade"] = doc.get("grade")
+    else:
+        meta["slide_count"] = doc.get("slide_count", 0)
+    return meta
+
+
+class SearchService:
+    """Tìm kiếm hybrid (BM25 + embedding) trên bài giảng và slides"""
+
+    def __init__(self):
+        self.indexes: Dict[str, HybridIndex] = {"lectures": HybridIndex(), "slides": HybridIndex()}
+        self.ready = False
+        self._last_sync: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self._scheduled: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    def _index_document(self, kind: str, doc: dict):
+        self.indexes[kind].upsert(
+            str(doc["_id"]),
+            title=doc.get("title") or "",
+            body=_document_body(kind, doc),
+            meta=_document_meta(kind, doc),
+            subject=doc.get("subject"),
+            grade=doc.get("grade"),
+            user_id=doc.get("user_id")
+        )
+
+    async def _load(self, since: Optional[datetime] = None) -> int:
+        db = await get_database("search")
+        count = 0
+        for kind, projection in _PROJECTIONS.items():
+            filter_query = {"updated_at": {"$gte": since}} if since else {}
+            cursor = db[kind].find(filter_query, projection=projection, batch_size=500)
+            async for doc in cursor:
+                self._index_document(kind, doc)
+                if since:
+                    suggestion_service.index_document(kind, doc)
+                count += 1
+                updated_at = doc.get("updated_at")
+                if updated_at and (self._last_sync is None or updated_at > self._last_sync):
+                    self._last_sync = updated_at
+                if count % 500 == 0:
+                    # Nhường event loop khi build index lớn
+                    await asyncio.sleep(0)
+        return count
+
+    async def build(self):
+        """Build toàn bộ index từ MongoDB"""
+        started = time.perf_counter()
+        count = await self._load()
+        self.ready = True
+        logger.info(f"Search index built: {count} documents in {time.perf_counter() - started:.1f}s")
+
+    async def _run(self):
+        try:
+            await self.build()
+        except Exception as e:
+            logger.error(f"Error building search index: {e}")
+            return
+        # Đồng bộ định kỳ các thay đổi từ replica khác
+        while settings.SEARCH_SYNC_INTERVAL > 0:
+            await asyncio.sleep(settings.SEARCH_SYNC_INTERVAL)
+            try:
+                # Lùi mốc thêm độ trễ tối đa của secondary để không bỏ sót thay đổi chưa kịp sao chép
+                since = self._last_sync - timedelta(seconds=1 + read_lag("search")) if self._last_sync else None
+                await self._load(since)
+            except Exception as e:
+                logger.error(f"Error syncing search index: {e}")
+
+    def start(self):
+        """Build index trong background (gọi khi khởi động)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = list(self._scheduled.values())
+        if self._task:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def refresh(self, kind: str, doc_id: str):
+        """Cập nhật index tìm kiếm và index gợi ý cho một tài liệu sau khi ghi"""
+        try:
+            db = await get_database()
+            doc = await db[kind].find_one({"_id": ObjectId(doc_id)}, projection=_PROJECTIONS[kind])
+            if doc:
+                self.index_document(kind, doc)
+            else:
+                self.remove(kind, doc_id)
+        except Exception as e:
+            logger.error(f"Error refreshing search index for {kind}/{doc_id}: {e}")
+
+    def projection(self, kind: str) -> dict:
+        """Các field index cần (đọc kèm khi ghi để gọi index_document không phải đọc lại)"""
+        return dict(_PROJECTIONS[kind])
+
+    def index_document(self, kind: str, doc: dict):
+        """Cập nhật index tìm kiếm và index gợi ý từ document đã có sẵn (không đọc lại MongoDB)"""
+        self._index_document(kind, doc)
+        suggestion_service.index_document(kind, doc)
+
+    def schedule_refresh(self, kind: str, doc_id: str):
+        """
+        Cập nhật index sau SEARCH_REFRESH_DELAY giây, gộp các lần ghi liên tiếp.
+
+        Dùng cho các thao tác sửa từng phần (ví dụ một slide trong bộ slide) để
+        không phải đọc lại toàn bộ tài liệu sau mỗi lần sửa.
+        """
+        key = (kind, doc_id)
+        if key in self._scheduled:
+            return
+
+        async def run():
+            try:
+                await asyncio.sleep(settings.SEARCH_REFRESH_DELAY)
+            finally:
+                self._scheduled.pop(key, None)
+            await self.refresh(kind, doc_id)
+
+        self._scheduled[key] = asyncio.create_task(run())
+
+    def remove(self, kind: str, doc_id: str):
+        self.indexes[kind].remove(doc_id)
+        suggestion_service.remove(kind, doc_id)
+
+    async def search(
+        self,
+        query: str,
+        kinds: List[str],
+        limit: int = 5,
+        subject: Optional[str] = None,
+        grade: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> Dict[str, List[dict]]:
+        """Tìm kiếm hybrid, trả về {kind: [meta + score]}"""
+        db = await get_database("search")
+        results: Dict[str, List[dict]] = {}
+
+        for kind in kinds:
+            hits = self.indexes[kind].search(
+                query,
+                limit=limit,
+                subject=subject,
+                # Slides không có cấp độ
+                grade=grade if kind == "lectures" else None,
+                user_id=user_id
+            )
+            if not hits:
+                results[kind] = []
+                continue
+
+            # Bỏ các tài liệu đã bị xóa bởi replica khác
+            ids = [ObjectId(doc_id) for doc_id, _, _ in hits]
+            existing = {str(d["_id"]) async for d in db[kind].find({"_id": {"$in": ids}}, projection={"_id": 1})}
+            items = []
+            for doc_id, score, meta in hits:
+                if doc_id not in existing:
+                    self.remove(kind, doc_id)
+                    continue
+                items.append({**meta, "score": round(score, 6)})
+            results[kind] = items
+
+        return results
+
+# Singleton instance
+search_service = SearchService()
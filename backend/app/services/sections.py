@@ -0,0 +1,140 @@
+"""
+Tách nội dung bài giảng thành các phần (section) để sinh lại từng phần.
+
+Nội dung dạng Markdown được chia theo heading cấp cao nhất của phần thân
+(bỏ qua một heading cấp 1 duy nhất vì đó là tiêu đề bài); nội dung có cấu
+trúc được chia theo phần tử của "sections" hoặc theo từng khóa của dict.
+Mỗi section ghi lại vị trí của nó (khoảng ký tự hoặc đường dẫn MongoDB) để
+ghép nội dung mới vào đúng chỗ.
+"""
+import re
+from typing import Any, Dict, List, Optional
+
+from app.services.rendering import section_label
+
+_HEADING_LINE_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$", re.MULTILINE)
+# Ký tự không dùng được trong đường dẫn field của MongoDB
+_UNSAFE_KEY_RE = re.compile(r"[.$]")
+
+
+# Section: {title, text, start, end, path, value}
+#   text: nội dung dạng Markdown gửi cho agent
+#   start/end: khoảng ký tự (nội dung Markdown); path: field MongoDB (nội dung có cấu trúc)
+#   value: giá trị gốc tại path
+Section = Dict[str, Any]
+
+
+def _value_text(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        parts = []
+        for key, item in value.items():
+            if key in ("title", "heading"):
+                continue
+            text = _value_text(item)
+            if key in ("content", "body", "text"):
+                parts.append(text)
+            else:
+                parts.append(f"### {section_label(key)}\n{text}")
+        return "\n\n".join(p for p in parts if p)
+    if isinstance(value, (list, tuple)):
+        return "\n".join(
+            f"- {item}" if not isinstance(item, (dict, list, tuple)) else _value_text(item)
+            for item in value if item is not None
+        )
+    return "" if value is None else str(value)
+
+
+def _markdown_sections(content: str) -> List[Section]:
+    headings = [(m.start(), len(m.group(1)), m.group(2)) for m in _HEADING_LINE_RE.finditer(content)]
+    if not headings:
+        return []
+
+    levels = [level for _, level, _ in headings]
+    # Một heading cấp 1 duy nhất là tiêu đề bài, các phần nằm ở cấp thấp hơn
+    if levels.count(1) == 1 and len(set(levels)) > 1:
+        headings = [h for h in headings if h[1] != 1]
+    top = min(level for _, level, _ in headings)
+
+    starts = [(start, title) for start, level, title in headings if level == top]
+    sections = []
+    for i, (start, title) in enumerate(starts):
+        end = starts[i + 1][0] if i + 1 < len(starts) else len(content)
+        # Phần cuối kết thúc trước heading cấp cao hơn (nếu có)
+        for h_start, level, _ in headings:
+            if start < h_start < end and level < top:
+                end = h_start
+                break
+        sections.append({"title": title, "text": content[start:end].rstrip(), "start": start, "end": end, "path": None})
+    return sections
+
+
+def _structured_sections(content: Any) -> List[Section]:
+    sections = []
+    if isinstance(content, dict):
+        items = content.get("sections")
+        if isinstance(items, list):
+            for i, item in enumerate(items):
+                title = item.get("title") if isinstance(item, dict) else None
+                sections.append({
+                    "title": title or f"Phần {i + 1}", "text": _value_text(item),
+                    "path": f"content.sections.{i}", "value": item
+                })
+        for key, value in content.items():
+            if key in ("title", "heading", "sections") or _UNSAFE_KEY_RE.search(key):
+                continue
+            sections.append({"title": section_label(key), "text": _value_text(value), "path": f"content.{key}", "value": value})
+    elif isinstance(content, list):
+        for i, item in enumerate(content):
+            title = item.get("title") if isinstance(item, dict) else None
+            sections.append({
+                "title": title or f"Phần {i + 1}", "text": _value_text(item),
+                "path": f"content.{i}", "value": item
+            })
+    return sections
+
+
+def split_sections(content: Any) -> List[Section]:
+    """Danh sách các phần của nội dung bài giảng theo thứ tự xuất hiện"""
+    if isinstance(content, str):
+        return _markdown_sections(content)
+    return _structured_sections(content)
+
+
+def merge_section(content: Any, section: Section, new_text: str) -> dict:
+    """
+    Trả về lệnh $set để ghép nội dung mới của section vào bài giảng.
+
+    Nội dung Markdown phải ghi lại cả chuỗi; nội dung có cấu trúc chỉ ghi
+    field của section.
+    """
+    if section["path"] is None:
+        text = new_text.strip()
+        if not _HEADING_LINE_RE.match(text):
+            # Giữ heading cũ để dàn ý không đổi khi nội dung mới thiếu tiêu đề
+            text = f"{section['text'].splitlines()[0]}\n\n{text}"
+        suffix = content[section["end"]:]
+        if suffix:
+            text += "\n\n"
+        return {"content": content[:section["start"]] + text + suffix}
+
+    value = section["value"]
+    if isinstance(value, dict):
+        return {f"{section['path']}.content": new_text.strip()}
+    if isinstance(value, list) and all(not isinstance(item, (dict, list)) for item in value):
+        # Danh sách gạch đầu dòng: giữ dạng list
+        items = [re.sub(r"^\s*(?:[-*+•]|\d+[.)])\s+", "", line).strip() for line in new_text.splitlines()]
+        return {section["path"]: [item for item in items if item]}
+    return {section["path"]: new_text.strip()}
+
+
+def section_context(sections: List[Section], index: int, chars: int) -> dict:
+    """Ngữ cảnh tối thiểu quanh section: dàn ý, cuối phần trước, đầu phần sau"""
+    previous: Optional[Section] = sections[index - 1] if index > 0 else None
+    following: Optional[Section] = sections[index + 1] if index + 1 < len(sections) else None
+    return {
+        "outline": [s["title"] for s in sections],
+        "previous_context": previous["text"][-chars:] if previous else "",
+        "next_context": following["text"][:chars] if following else ""
+    }
@@ -0,0 +1,282 @@
+"""
+Render bộ slide (danh sách SlideContent) ra PPTX và PDF.
+
+Cả hai định dạng dùng chung bố cục 16:9: slide tiêu đề/kết luận có nền màu
+nhấn, slide nội dung có tiêu đề, gạch nhấn và phần thân dạng danh sách. Nội
+dung mỗi slide là Markdown đơn giản (gạch đầu dòng, đánh số, **đậm**), được
+tách block bằng parser của module rendering.
+
+Giống rendering, các hàm ở đây chỉ nhận dict và ghi file để chạy trong
+process pool.
+"""
+import logging
+from typing import List, Tuple
+
+from app.services.rendering import Block, parse_inline, parse_markdown, register_pdf_fonts
+
+SLIDE_FORMATS = {
+    "pptx": (".pptx", "application/vnd.openxmlformats-officedocument.presentationml.presentation"),
+    "pdf": (".pdf", "application/pdf"),
+}
+
+SLIDE_TEMPLATES = {
+    "default": {
+        "background": (255, 255, 255),
+        "title": (31, 78, 121),
+        "text": (34, 34, 34),
+        "accent": (31, 78, 121),
+        "cover_background": (31, 78, 121),
+        "cover_text": (255, 255, 255),
+    },
+    "creative": {
+        "background": (255, 248, 240),
+        "title": (204, 85, 0),
+        "text": (51, 51, 51),
+        "accent": (255, 153, 51),
+        "cover_background": (204, 85, 0),
+        "cover_text": (255, 255, 255),
+    },
+    "minimal": {
+        "background": (255, 255, 255),
+        "title": (20, 20, 20),
+        "text": (60, 60, 60),
+        "accent": (190, 190, 190),
+        "cover_background": (255, 255, 255),
+        "cover_text": (20, 20, 20),
+    },
+}
+# slide_style của SlideFromLectureRequest dùng tên "professional"
+SLIDE_TEMPLATE_ALIASES = {"professional": "default"}
+
+# Kích thước slide 16:9 (inch)
+SLIDE_WIDTH = 13.333
+SLIDE_HEIGHT = 7.5
+MARGIN = 0.6
+TITLE_TOP = 0.4
+TITLE_HEIGHT = 1.0
+BODY_TOP = 1.75
+BODY_HEIGHT = SLIDE_HEIGHT - BODY_TOP - 0.6
+
+_COVER_TYPES = {"title", "conclusion"}
+
+
+def normalize_slide_template(template: str) -> str:
+    template = (template or "default").lower().strip()
+    return SLIDE_TEMPLATE_ALIASES.get(template, template)
+
+
+def _body_blocks(content: str) -> List[Block]:
+    return [b for b in parse_markdown(content or "") if b[0] != "rule"]
+
+
+def _body_font_size(blocks: List[Block]) -> int:
+    """Giảm cỡ chữ theo lượng nội dung để phần thân vừa một slide"""
+    lines = sum(1 + len(text) // 90 for _, _, text in blocks)
+    if lines <= 6:
+        return 24
+    if lines <= 9:
+        return 20
+    if lines <= 13:
+        return 16
+    return 13
+
+
+def _markers(blocks: List[Block]) -> List[Tuple[Block, str]]:
+    """Ký hiệu đầu dòng cho từng block (•, 1., ...)"""
+    result = []
+    counters: dict = {}
+    for block in blocks:
+        kind, level, _ = block
+        if kind == "number":
+            counters[level] = counters.get(level, 0) + 1
+            result.append((block, f"{counters[level]}."))
+            continue
+        if kind != "bullet":
+            counters.clear()
+        result.append((block, "•" if kind == "bullet" else ""))
+    return result
+
+
+# ---------------------------------------------------------------- PPTX
+
+def _pptx_text(text_frame, blocks: List[Block], size: int, color):
+    from pptx.dml.color import RGBColor
+    from pptx.util import Pt
+
+    for i, ((kind, level, text), marker) in enumerate(_markers(blocks)):
+        # Text frame mới luôn có sẵn một paragraph rỗng
+        paragraph = text_frame.paragraphs[0] if i == 0 else text_frame.add_paragraph()
+        paragraph.space_after = Pt(size * 0.35)
+        prefix = "    " * level + (f"{marker} " if marker else "")
+        spans = [(prefix, False, False, False)] + parse_inline(text) if prefix else parse_inline(text)
+        for span, bold, italic, code in spans:
+            run = paragraph.add_run()
+            run.text = span
+            run.font.size = Pt(size)
+            run.font.bold = bold or kind == "heading"
+            run.font.italic = italic or kind == "quote"
+            run.font.color.rgb = RGBColor(*color)
+            if code or kind == "code":
+                run.font.name = "Courier New"
+
+
+def _pptx_fill(shape, color):
+    from pptx.dml.color import RGBColor
+
+    shape.fill.solid()
+    shape.fill.fore_color.rgb = RGBColor(*color)
+    shape.line.fill.background()
+
+
+def render_pptx(deck: dict, template: str, path: str):
+    from pptx import Presentation
+    from pptx.dml.color import RGBColor
+    from pptx.enum.shapes import MSO_SHAPE
+    from pptx.enum.text import MSO_ANCHOR, PP_ALIGN
+    from pptx.util import Inches
+
+    t = SLIDE_TEMPLATES[template]
+    presentation = Presentation()
+    presentation.slide_width = Inches(SLIDE_WIDTH)
+    presentation.slide_height = Inches(SLIDE_HEIGHT)
+    blank = presentation.slide_layouts[6]
+    slides = deck.get("slides") or [{"title": deck.get("title") or "", "content": deck.get("subject") or "", "slide_type": "title"}]
+
+    for number, item in enumerate(slides, start=1):
+        slide = presentation.slides.add_slide(blank)
+        cover = item.get("slide_type") in _COVER_TYPES
+        background = slide.background.fill
+        background.solid()
+        background.fore_color.rgb = RGBColor(*(t["cover_background"] if cover else t["background"]))
+
+        if cover:
+            box = slide.shapes.add_textbox(Inches(MARGIN), Inches(2.0), Inches(SLIDE_WIDTH - 2 * MARGIN), Inches(1.8))
+            frame = box.text_frame
+            frame.word_wrap = True
+            frame.vertical_anchor = MSO_ANCHOR.BOTTOM
+            _pptx_text(frame, [("heading", 0, item.get("title") or "")], 40, t["cover_text"])
+            frame.paragraphs[0].alignment = PP_ALIGN.CENTER
+
+            body = _body_blocks(item.get("content"))
+            if body:
+                box = slide.shapes.add_textbox(Inches(MARGIN + 1), Inches(4.0), Inches(SLIDE_WIDTH - 2 * MARGIN - 2), Inches(2.5))
+                frame = box.text_frame
+                frame.word_wrap = True
+                _pptx_text(frame, body, min(_body_font_size(body), 20), t["cover_text"])
+                for paragraph in frame.paragraphs:
+                    paragraph.alignment = PP_ALIGN.CENTER
+        else:
+            box = slide.shapes.add_textbox(Inches(MARGIN), Inches(TITLE_TOP), Inches(SLIDE_WIDTH - 2 * MARGIN), Inches(TITLE_HEIGHT))
+            frame = box.text_frame
+            frame.word_wrap = True
+            frame.vertical_anchor = MSO_ANCHOR.BOTTOM
+            _pptx_text(frame, [("heading", 0, item.get("title") or "")], 30, t["title"])
+
+            bar = slide.shapes.add_shape(MSO_SHAPE.RECTANGLE, Inches(MARGIN), Inches(TITLE_TOP + TITLE_HEIGHT + 0.1), Inches(2.0), Inches(0.06))
+            _pptx_fill(bar, t["accent"])
+
+            body = _body_blocks(item.get("content"))
+            if body:
+                box = slide.shapes.add_textbox(Inches(MARGIN), Inches(BODY_TOP), Inches(SLIDE_WIDTH - 2 * MARGIN), Inches(BODY_HEIGHT))
+                frame = box.text_frame
+                frame.word_wrap = True
+                _pptx_text(frame, body, _body_font_size(body), t["text"])
+
+        footer = slide.shapes.add_textbox(Inches(SLIDE_WIDTH - 1.6), Inches(SLIDE_HEIGHT - 0.5), Inches(1.2), Inches(0.35))
+        _pptx_text(footer.text_frame, [("paragraph", 0, f"{number}/{len(slides)}")], 11, t["cover_text"] if cover else t["accent"])
+        footer.text_frame.paragraphs[0].alignment = PP_ALIGN.RIGHT
+
+        if item.get("notes"):
+            slide.notes_slide.notes_text_frame.text = item["notes"]
+
+    presentation.core_properties.title = deck.get("title") or ""
+    presentation.core_properties.subject = deck.get("subject") or ""
+    presentation.save(path)
+
+
+# ---------------------------------------------------------------- PDF
+
+def render_slides_pdf(deck: dict, template: str, path: str, font_directory: str):
+    from fpdf import FPDF
+
+    logging.getLogger("fontTools").setLevel(logging.WARNING)
+
+    t = SLIDE_TEMPLATES[template]
+    mm = 25.4
+    width, height = SLIDE_WIDTH * mm, SLIDE_HEIGHT * mm
+    pdf = FPDF(orientation="L", unit="mm", format=(height, width))
+    pdf.set_auto_page_break(False)
+    pdf.set_title(deck.get("title") or "")
+    font, mono, unicode_ok = register_pdf_fonts(pdf, font_directory)
+
+    def clean(text: str) -> str:
+        if unicode_ok:
+            return text
+        return text.encode("latin-1", "replace").decode("latin-1")
+
+    def write_blocks(blocks: List[Block], left: float, top: float, box_width: float, size: float, color, center: bool = False):
+        line = size * 0.3528 * 1.3
+        pdf.set_text_color(*color)
+        pdf.set_y(top)
+        for (kind, level, text), marker in _markers(blocks):
+            if center:
+                pdf.set_font(font, "I" if kind == "quote" else "", size)
+                pdf.set_x(left)
+                plain = "".join(span for span, _, _, _ in parse_inline(text))
+                pdf.multi_cell(box_width, line, clean(plain), align="C")
+                pdf.ln(line * 0.3)
+                continue
+
+            indent = left + level * 8
+            pdf.set_left_margin(indent)
+            pdf.set_right_margin(width - left - box_width)
+            pdf.set_x(indent)
+            if marker:
+                pdf.set_font(font, "", size)
+                marker = marker if unicode_ok or marker != "•" else "-"
+                pdf.write(line, clean(f"{marker} "))
+            for span, bold, italic, code in parse_inline(text):
+                style = ("B" if bold or kind == "heading" else "") + ("I" if italic or kind == "quote" else "")
+                pdf.set_font(mono if code or kind == "code" else font, "" if code or kind == "code" else style, size)
+                pdf.write(line, clean(span))
+            pdf.ln(line * 1.35)
+        pdf.set_left_margin(0)
+        pdf.set_right_margin(0)
+
+    slides = deck.get("slides") or [{"title": deck.get("title") or "", "content": deck.get("subject") or "", "slide_type": "title"}]
+    for number, item in enumerate(slides, start=1):
+        pdf.add_page()
+        cover = item.get("slide_type") in _COVER_TYPES
+        pdf.set_fill_color(*(t["cover_background"] if cover else t["background"]))
+        pdf.rect(0, 0, width, height, style="F")
+        body = _body_blocks(item.get("content"))
+        left = MARGIN * mm
+        box_width = width - 2 * left
+
+        if cover:
+            write_blocks([("heading", 0, item.get("title") or "")], left, 2.3 * mm, box_width, 40, t["cover_text"], center=True)
+            if body:
+                write_blocks(body, left + mm, 4.0 * mm, box_width - 2 * mm, min(_body_font_size(body), 20), t["cover_text"], center=True)
+        else:
+            write_blocks([("heading", 0, item.get("title") or "")], left, (TITLE_TOP + 0.45) * mm, box_width, 30, t["title"])
+            pdf.set_fill_color(*t["accent"])
+            pdf.rect(left, (TITLE_TOP + TITLE_HEIGHT + 0.1) * mm, 2.0 * mm, 0.06 * mm, style="F")
+            if body:
+                write_blocks(body, left, BODY_TOP * mm, box_width, _body_font_size(body), t["text"])
+
+        pdf.set_font(font, "", 11)
+        pdf.set_text_color(*(t["cover_text"] if cover else t["accent"]))
+        pdf.set_xy(width - 1.6 * mm, height - 0.5 * mm)
+        pdf.cell(1.2 * mm, 0.35 * mm, f"{number}/{len(slides)}", align="R")
+
+    pdf.output(path)
+
+
+def render_slides(deck: dict, fmt: str, template: str, path: str, font_directory: str = ""):
+    """Render bộ slide ra file ở path (chạy được trong process pool)"""
+    if fmt == "pptx":
+        render_pptx(deck, template, path)
+    elif fmt == "pdf":
+        render_slides_pdf(deck, template, path, font_directory)
+    else:
+        raise ValueError(f"Unsupported slide export format: {fmt}")
@@ -1,16 +1,43 @@
 from typing import Optional, List, Tuple
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
+import asyncio
 import httpx
 import logging
 
 from app.db.database import get_database
-from app.models.slide import Slide, SlideCreateRequest, SlideUpdateRequest, SlideFromLectureRequest, SlideGenerationRequest
+from app.models.slide import (
+    Slide, SlideContent, SlideCreateRequest, SlideUpdateRequest, SlideFromLectureRequest, SlideGenerationRequest,
+    SlideItemUpdateRequest, SlideItemInsertRequest, SlideItemMoveRequest, SlideItemRegenerateRequest,
+    SlideItemGenerationRequest
+)
 from app.models.lecture import Lecture
+from app.core import deadline
 from app.core.config import settings
+from app.core.clock import utcnow_ms
+from app.core.resilience import resilient_caller
+from app.services.cache_service import cache_service
+from app.services.export_service import export_service
+from app.services.idempotency_service import idempotency_service
+from app.services.lecture_service import lecture_service
+from app.services.search_service import search_service
+from app.services.version_service import VERSIONED_FIELDS, version_service, VersionNotFoundError
 
 logger = logging.getLogger(__name__)
 
+# Số phần tử tối đa cho tham số n của $slice (lấy "phần còn lại" của mảng)
+_MAX_SLICE = 2 ** 31 - 1
+
+
+class SlideItemNotFoundError(Exception):
+    """Không có bộ slide hoặc vị trí slide không tồn tại"""
+
+
+class SlideConflictError(Exception):
+    """Bộ slide đã bị sửa kể từ phiên bản client đang giữ (updated_at)"""
+
+
 class SlideService:
     def __init__(self):
         self.agent_url = settings.AGENT_MAIN_URL
@@ -33,6 +60,7 @@ class SlideService:
         
         result = await db.slides.insert_one(slide.model_dump(by_alias=True))
         slide_id = str(result.inserted_id)
+        await idempotency_service.attach_job(slide_id)
         
         try:
             # Gọi agent để sinh nội dung slide
@@ -50,19 +78,17 @@ class SlideService:
                     }
                 }
             )
+            await cache_service.invalidate("slides", slide_id)
+            await search_service.refresh("slides", slide_id)
+            await version_service.record("slides", slide_id, source="generate")
             
+        except asyncio.CancelledError:
+            # Client bỏ đi hoặc hết deadline: không để slide kẹt ở generating
+            await asyncio.shield(self._mark_error(slide_id))
+            raise
         except Exception as e:
             logger.error(f"Error generating slide content: {e}")
-            # Cập nhật status thành error
-            await db.slides.update_one(
-                {"_id": ObjectId(slide_id)},
-                {
-                    "$set": {
-                        "status": "error",
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
+            await self._mark_error(slide_id)
             raise
         
         return slide_id
@@ -72,12 +98,10 @@ class SlideService:
         db = await get_database()
         
         # Lấy thông tin bài giảng
-        lecture_data = await db.lectures.find_one({"_id": ObjectId(request.lecture_id)})
-        if not lecture_data:
+        lecture = await lecture_service.get_lecture(request.lecture_id)
+        if not lecture:
             raise Exception("Không tìm thấy bài giảng")
         
-        lecture = Lecture(**lecture_data)
-        
         # Tạo slide record
         slide = Slide(
             user_id=request.user_id,
@@ -92,6 +116,7 @@ class SlideService:
         
         result = await db.slides.insert_one(slide.model_dump(by_alias=True))
         slide_id = str(result.inserted_id)
+        await idempotency_service.attach_job(slide_id)
         
         try:
             # Gọi agent để sinh slide từ lecture
@@ -109,39 +134,76 @@ class SlideService:
                     }
                 }
             )
+            await cache_service.invalidate("slides", slide_id)
+            await search_service.refresh("slides", slide_id)
+            await version_service.record("slides", slide_id, source="generate")
             
+        except asyncio.CancelledError:
+            # Client bỏ đi hoặc hết deadline: không để slide kẹt ở generating
+            await asyncio.shield(self._mark_error(slide_id))
+            raise
         except Exception as e:
             logger.error(f"Error generating slide from lecture: {e}")
-            # Cập nhật status thành error
-            await db.slides.update_one(
-                {"_id": ObjectId(slide_id)},
-                {
-                    "$set": {
-                        "status": "error",
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
+            await self._mark_error(slide_id)
             raise
         
         return slide_id
     
+    async def _mark_error(self, slide_id: str):
+        """Đánh dấu slide sinh lỗi"""
+        db = await get_database()
+        await db.slides.update_one(
+            {"_id": ObjectId(slide_id)},
+            {
+                "$set": {
+                    "status": "error",
+                    "updated_at": datetime.utcnow()
+                }
+            }
+        )
+        await cache_service.invalidate("slides", slide_id)
+    
     async def get_slide(self, slide_id: str) -> Optional[Slide]:
         """Lấy chi tiết slide"""
+        slide_data = await self.get_slide_document(slide_id)
+        return Slide(**slide_data) if slide_data else None
+    
+    async def get_slide_document(self, slide_id: str) -> Optional[dict]:
+        """Lấy document slide thô (không dựng model), đọc qua cache"""
+        if not ObjectId.is_valid(slide_id):
+            return None
         db = await get_database()
         
         try:
-            slide_data = await db.slides.find_one({"_id": ObjectId(slide_id)})
-            if slide_data:
-                return Slide(**slide_data)
-            return None
+            return await cache_service.get(
+                "slides", slide_id,
+                lambda: db.slides.find_one({"_id": ObjectId(slide_id)})
+            )
         except Exception as e:
             logger.error(f"Error getting slide {slide_id}: {e}")
             return None
     
+    async def get_slide_page_headers(self, user_id: Optional[str] = None, page: int = 1, per_page: int = 20) -> Tuple[List[Tuple[str, datetime]], int]:
+        """(id, updated_at) của một trang danh sách slide và tổng số, dùng cho ETag"""
+        db = await get_database("list")
+        
+        filter_query = {}
+        if user_id:
+            filter_query["user_id"] = user_id
+        
+        total_count = await db.slides.count_documents(filter_query)
+        skip = (page - 1) * per_page
+        cursor = db.slides.find(filter_query, projection={"updated_at": 1}).sort("created_at", -1).skip(skip).limit(per_page)
+        return [(str(doc["_id"]), doc.get("updated_at")) async for doc in cursor], total_count
+    
     async def get_slides(self, user_id: Optional[str] = None, page: int = 1, per_page: int = 20) -> Tuple[List[Slide], int]:
         """Lấy danh sách slides với phân trang"""
-        db = await get_database()
+        docs, total_count = await self.get_slide_documents(user_id, page, per_page)
+        return [Slide(**slide_data) for slide_data in docs], total_count
+    
+    async def get_slide_documents(self, user_id: Optional[str] = None, page: int = 1, per_page: int = 20, projection: Optional[dict] = None) -> Tuple[List[dict], int]:
+        """Lấy danh sách document slide thô với phân trang"""
+        db = await get_database("list")
         
         try:
             # Tạo filter
@@ -154,70 +216,408 @@ class SlideService:
             
             # Lấy dữ liệu với phân trang
             skip = (page - 1) * per_page
-            cursor = db.slides.find(filter_query).sort("created_at", -1).skip(skip).limit(per_page)
+            cursor = db.slides.find(filter_query, projection=projection).sort("created_at", -1).skip(skip).limit(per_page)
             
-            slides = []
-            async for slide_data in cursor:
-                slides.append(Slide(**slide_data))
-            
-            return slides, total_count
+            return [slide_data async for slide_data in cursor], total_count
             
         except Exception as e:
             logger.error(f"Error getting slides: {e}")
             return [], 0
     
-    async def update_slide(self, slide_id: str, request: SlideUpdateRequest) -> bool:
-        """Cập nhật slide"""
+    async def update_slide(
+        self,
+        slide_id: str,
+        request: SlideUpdateRequest,
+        expected_updated_at: Optional[List[datetime]] = None
+    ) -> Optional[datetime]:
+        """
+        Cập nhật slide trong một lệnh find_one_and_update, trả về updated_at mới
+        (None nếu không tồn tại).
+        
+        expected_updated_at: các phiên bản client chấp nhận (If-Match); bộ slide
+        đã đổi sang phiên bản khác -> SlideConflictError.
+        """
+        if not ObjectId.is_valid(slide_id):
+            return None
         db = await get_database()
         
+        # Tạo update data
+        update_data = {}
+        if request.title is not None:
+            update_data["title"] = request.title
+        if request.subject is not None:
+            update_data["subject"] = request.subject
+        if request.presentation_type is not None:
+            update_data["presentation_type"] = request.presentation_type
+        if request.duration is not None:
+            update_data["duration"] = request.duration
+        if request.description is not None:
+            update_data["description"] = request.description
+        if request.requirements is not None:
+            update_data["requirements"] = request.requirements
+        if request.slides is not None:
+            update_data["slides"] = [slide.model_dump() for slide in request.slides]
+            update_data["slide_count"] = len(request.slides)
+        if request.status is not None:
+            update_data["status"] = request.status
+        
+        update_data["updated_at"] = utcnow_ms()
+        
+        # Đọc kèm nội dung trước khi sửa (field của lịch sử và index tìm kiếm); các field
+        # đều là $set cấp cao nhất nên nội dung sau khi sửa ghép được mà không đọc lại
+        projection = {**search_service.projection("slides"), **dict.fromkeys(VERSIONED_FIELDS["slides"], 1)}
         try:
-            # Tạo update data
-            update_data = {}
-            if request.title is not None:
-                update_data["title"] = request.title
-            if request.subject is not None:
-                update_data["subject"] = request.subject
-            if request.presentation_type is not None:
-                update_data["presentation_type"] = request.presentation_type
-            if request.duration is not None:
-                update_data["duration"] = request.duration
-            if request.description is not None:
-                update_data["description"] = request.description
-            if request.requirements is not None:
-                update_data["requirements"] = request.requirements
-            if request.slides is not None:
-                update_data["slides"] = [slide.model_dump() for slide in request.slides]
-                update_data["slide_count"] = len(request.slides)
-            if request.status is not None:
-                update_data["status"] = request.status
-            
-            update_data["updated_at"] = datetime.utcnow()
-            
-            result = await db.slides.update_one(
-                {"_id": ObjectId(slide_id)},
-                {"$set": update_data}
+            deck = await db.slides.find_one_and_update(
+                self._precondition_filter(slide_id, expected_updated_at),
+                {"$set": update_data},
+                projection=projection
             )
-            
-            return result.modified_count > 0
-            
         except Exception as e:
             logger.error(f"Error updating slide {slide_id}: {e}")
-            return False
+            raise
+        
+        if deck is None:
+            await self._precondition_failed(slide_id, expected_updated_at)
+            return None
+        
+        await cache_service.invalidate("slides", slide_id)
+        updated = {**deck, **update_data}
+        search_service.index_document("slides", updated)
+        await version_service.record_update("slides", slide_id, deck, updated)
+        return update_data["updated_at"]
+    
+    def _precondition_filter(self, slide_id: str, expected_updated_at: Optional[List[datetime]]) -> dict:
+        filter_query = {"_id": ObjectId(slide_id)}
+        if expected_updated_at is not None:
+            filter_query["updated_at"] = {"$in": expected_updated_at}
+        return filter_query
+    
+    async def _precondition_failed(self, slide_id: str, expected_updated_at: Optional[List[datetime]]):
+        """Lệnh ghi có điều kiện If-Match không khớp: phân biệt không tồn tại với đã bị sửa"""
+        if expected_updated_at is not None and await self.get_slide_header(slide_id):
+            raise SlideConflictError("Slide đã được chỉnh sửa bởi người khác")
+    
+    async def get_slide_header(self, slide_id: str, use_cache: bool = False) -> Optional[dict]:
+        """
+        Đọc updated_at, status và slide_count (không tải mảng slides).
+        
+        use_cache: dùng bản trong cache nếu có (cho ETag); kiểm tra xung đột
+        khi ghi luôn đọc MongoDB.
+        """
+        if not ObjectId.is_valid(slide_id):
+            return None
+        if use_cache:
+            cached = cache_service.peek_header("slides", slide_id)
+            if cached is not None:
+                return cached
+        db = await get_database()
+        return await db.slides.find_one(
+            {"_id": ObjectId(slide_id)},
+            projection={"updated_at": 1, "status": 1, "slide_count": 1}
+        )
+
+    async def _write_failed(self, slide_id: str, index: Optional[int], expected_updated_at: Optional[datetime]):
+        """Xác định lý do một lệnh ghi không khớp document nào"""
+        header = await self.get_slide_header(slide_id)
+        if not header or (index is not None and not 0 <= index < header.get("slide_count", 0)):
+            raise SlideItemNotFoundError("Không tìm thấy slide")
+        if expected_updated_at is not None and header.get("updated_at") != expected_updated_at:
+            raise SlideConflictError("Slide đã được chỉnh sửa bởi người khác")
+        raise SlideConflictError("Slide vừa thay đổi, vui lòng thử lại")
+
+    def _filter(self, slide_id: str, index: Optional[int], expected_updated_at: Optional[datetime]) -> dict:
+        if not ObjectId.is_valid(slide_id):
+            raise SlideItemNotFoundError("Không tìm thấy slide")
+        filter_query = {"_id": ObjectId(slide_id)}
+        if index is not None:
+            filter_query[f"slides.{index}"] = {"$exists": True}
+        if expected_updated_at is not None:
+            filter_query["updated_at"] = expected_updated_at
+        return filter_query
+
+    async def get_slide_item(self, slide_id: str, index: int) -> Optional[dict]:
+        """Lấy một slide trong bộ slide (chỉ đọc phần tử cần thiết bằng $slice)"""
+        db = await get_database()
+        
+        try:
+            deck = await db.slides.find_one(
+                {"_id": ObjectId(slide_id)},
+                projection={"title": 1, "slide_count": 1, "updated_at": 1, "slides": {"$slice": [index, 1]}}
+            )
+            if not deck or not deck.get("slides") or index >= deck.get("slide_count", 0):
+                return None
+            return {
+                "title": deck.get("title"),
+                "slide": deck["slides"][0],
+                "total_slides": deck.get("slide_count", 0),
+                "updated_at": deck["updated_at"]
+            }
+        except Exception as e:
+            logger.error(f"Error getting slide item {slide_id}/{index}: {e}")
+            return None
+
+    async def update_slide_item(
+        self,
+        slide_id: str,
+        index: int,
+        request: SlideItemUpdateRequest
+    ) -> dict:
+        """Cập nhật các trường của một slide bằng positional $set, trả về slide sau khi sửa"""
+        db = await get_database()
+        
+        update_data = {}
+        for field in ("title", "content", "slide_type", "notes"):
+            value = getattr(request, field)
+            if value is not None:
+                update_data[f"slides.{index}.{field}"] = value
+        
+        update_data["updated_at"] = utcnow_ms()
+        await version_service.ensure_baseline("slides", slide_id)
+        deck = await db.slides.find_one_and_update(
+            self._filter(slide_id, index, request.updated_at),
+            {"$set": update_data},
+            projection={"slide_count": 1, "updated_at": 1, "slides": {"$slice": [index, 1]}},
+            return_document=ReturnDocument.AFTER
+        )
+        if deck is None:
+            await self._write_failed(slide_id, index, request.updated_at)
+        
+        await cache_service.invalidate("slides", slide_id)
+        search_service.schedule_refresh("slides", slide_id)
+        version_service.schedule_record("slides", slide_id)
+        return {
+            "slide": deck["slides"][0],
+            "total_slides": deck.get("slide_count", 0),
+            "updated_at": deck["updated_at"]
+        }
+
+    async def regenerate_slide_item(self, slide_id: str, index: int, request: SlideItemRegenerateRequest) -> dict:
+        """
+        Sinh lại một slide, chỉ gửi cho agent slide đó và hai slide liền kề.
+        
+        Kết quả được ghi bằng positional $set, chỉ khi bộ slide không đổi trong
+        lúc sinh; trả về slide sau khi sửa.
+        """
+        db = await get_database()
+        
+        start = max(index - 1, 0)
+        deck = await db.slides.find_one(
+            self._filter(slide_id, index, request.updated_at),
+            projection={
+                "title": 1, "subject": 1, "presentation_type": 1, "slide_count": 1, "updated_at": 1,
+                "slides": {"$slice": [start, index - start + 2]}
+            }
+        )
+        if deck is None:
+            await self._write_failed(slide_id, index, request.updated_at)
+        
+        window = deck["slides"]
+        current = index - start
+        payload = SlideItemGenerationRequest(
+            deck_title=deck.get("title") or "",
+            subject=deck.get("subject") or "",
+            presentation_type=deck.get("presentation_type"),
+            slide=window[current],
+            slide_number=index + 1,
+            total_slides=deck.get("slide_count", 0),
+            previous_slide=window[current - 1] if current > 0 else None,
+            next_slide=window[current + 1] if current + 1 < len(window) else None,
+            instructions=request.instructions
+        )
+        generated = await self._generate_slide_item(payload)
+        
+        new_slide = SlideContent(
+            title=generated.get("title") or window[current].get("title") or "",
+            content=generated.get("content") or "",
+            slide_type=generated.get("slide_type") or window[current].get("slide_type") or "content",
+            notes=generated.get("notes")
+        ).model_dump()
+        updated_at = utcnow_ms()
+        # Lưu nội dung trước khi sinh lại để giáo viên có thể khôi phục
+        await version_service.checkpoint("slides", slide_id)
+        result = await db.slides.update_one(
+            self._filter(slide_id, index, deck["updated_at"]),
+            {"$set": {f"slides.{index}": new_slide, "updated_at": updated_at}}
+        )
+        if result.matched_count == 0:
+            raise SlideConflictError("Slide vừa thay đổi trong lúc sinh lại, vui lòng thử lại")
+        
+        await cache_service.invalidate("slides", slide_id)
+        search_service.schedule_refresh("slides", slide_id)
+        await version_service.record("slides", slide_id, source="regenerate")
+        return {
+            "slide": new_slide,
+            "total_slides": deck.get("slide_count", 0),
+            "updated_at": updated_at
+        }
+
+    async def insert_slide_item(self, slide_id: str, request: SlideItemInsertRequest) -> Tuple[int, int, datetime]:
+        """Chèn một slide vào vị trí (1-based) bằng $push/$position, trả về (vị trí, tổng số slide, updated_at)"""
+        db = await get_database()
+        
+        push = {"$each": [request.slide.model_dump()]}
+        index = None
+        if request.position is not None:
+            index = request.position - 1
+            push["$position"] = index
+        
+        updated_at = utcnow_ms()
+        filter_query = self._filter(slide_id, None, request.updated_at)
+        await version_service.ensure_baseline("slides", slide_id)
+        if index:
+            # Chỉ chèn vào vị trí đã tồn tại (hoặc ngay sau slide cuối)
+            filter_query["slide_count"] = {"$gte": index}
+        deck = await db.slides.find_one_and_update(
+            filter_query,
+            {
+                "$push": {"slides": push},
+                "$inc": {"slide_count": 1},
+                "$set": {"updated_at": updated_at}
+            },
+            projection={"slide_count": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if deck is None:
+            await self._write_failed(slide_id, index - 1 if index else None, request.updated_at)
+        if index is None:
+            index = deck["slide_count"] - 1
+        
+        await cache_service.invalidate("slides", slide_id)
+        search_service.schedule_refresh("slides", slide_id)
+        version_service.schedule_record("slides", slide_id)
+        return index + 1, deck["slide_count"], updated_at
+
+    async def delete_slide_item(self, slide_id: str, index: int, expected_updated_at: Optional[datetime] = None) -> datetime:
+        """Xóa một slide theo vị trí bằng pipeline update ($slice + $concatArrays trên server)"""
+        db = await get_database()
+        
+        updated_at = utcnow_ms()
+        await version_service.ensure_baseline("slides", slide_id)
+        result = await db.slides.update_one(
+            self._filter(slide_id, index, expected_updated_at),
+            [{
+                "$set": {
+                    "slides": {
+                        "$concatArrays": [
+                            {"$slice": ["$slides", index]},
+                            {"$slice": ["$slides", index + 1, _MAX_SLICE]}
+                        ]
+                    },
+                    "slide_count": {"$subtract": ["$slide_count", 1]},
+                    "updated_at": updated_at
+                }
+            }]
+        )
+        if result.matched_count == 0:
+            await self._write_failed(slide_id, index, expected_updated_at)
+        
+        await cache_service.invalidate("slides", slide_id)
+        search_service.schedule_refresh("slides", slide_id)
+        version_service.schedule_record("slides", slide_id)
+        return updated_at
+
+    async def move_slide_item(self, slide_id: str, index: int, request: SlideItemMoveRequest) -> datetime:
+        """Di chuyển một slide tới vị trí mới (1-based) trong một lệnh update"""
+        db = await get_database()
+        
+        target = request.to_position - 1
+        header = await self.get_slide_header(slide_id)
+        if not header or not 0 <= index < header.get("slide_count", 0) or not 0 <= target < header.get("slide_count", 0):
+            raise SlideItemNotFoundError("Không tìm thấy slide")
+        
+        updated_at = utcnow_ms()
+        await version_service.ensure_baseline("slides", slide_id)
+        result = await db.slides.update_one(
+            self._filter(slide_id, index, request.updated_at),
+            [
+                {
+                    "$set": {
+                        "_moved": {"$slice": ["$slides", index, 1]},
+                        "slides": {
+                            "$concatArrays": [
+                                {"$slice": ["$slides", index]},
+                                {"$slice": ["$slides", index + 1, _MAX_SLICE]}
+                            ]
+                        }
+                    }
+                },
+                {
+                    "$set": {
+                        "slides": {
+                            "$concatArrays": [
+                                {"$slice": ["$slides", target]},
+                                "$_moved",
+                                {"$slice": ["$slides", target, _MAX_SLICE]}
+                            ]
+                        },
+                        "updated_at": updated_at
+                    }
+                },
+                {"$project": {"_moved": 0}}
+            ]
+        )
+        if result.matched_count == 0:
+            await self._write_failed(slide_id, index, request.updated_at)
+        
+        await cache_service.invalidate("slides", slide_id)
+        search_service.schedule_refresh("slides", slide_id)
+        version_service.schedule_record("slides", slide_id)
+        return updated_at
+    
+    async def restore_version(self, slide_id: str, version: int) -> dict:
+        """
+        Khôi phục bộ slide về một phiên bản cũ.
+        
+        Lịch sử không bị cắt: nội dung khôi phục được lưu thành phiên bản mới.
+        """
+        entry = await version_service.get_version("slides", slide_id, version)
+        db = await get_database()
+        
+        await version_service.checkpoint("slides", slide_id)
+        update_data = dict(entry["state"])
+        update_data["slide_count"] = len(update_data.get("slides") or [])
+        update_data["updated_at"] = utcnow_ms()
+        result = await db.slides.update_one({"_id": ObjectId(slide_id)}, {"$set": update_data})
+        if result.matched_count == 0:
+            raise VersionNotFoundError("Không tìm thấy slide")
+        
+        await cache_service.invalidate("slides", slide_id)
+        await search_service.refresh("slides", slide_id)
+        new_version = await version_service.record("slides", slide_id, source="restore")
+        return {"version": new_version, "restored_from": version, "updated_at": update_data["updated_at"]}
     
-    async def delete_slide(self, slide_id: str) -> bool:
-        """Xóa slide"""
+    async def delete_slide(self, slide_id: str, expected_updated_at: Optional[List[datetime]] = None) -> bool:
+        """Xóa slide trong một lệnh find_one_and_delete (có thể kèm điều kiện If-Match)"""
+        if not ObjectId.is_valid(slide_id):
+            return False
         db = await get_database()
         
         try:
-            result = await db.slides.delete_one({"_id": ObjectId(slide_id)})
-            return result.deleted_count > 0
+            deck = await db.slides.find_one_and_delete(
+                self._precondition_filter(slide_id, expected_updated_at),
+                projection={"_id": 1}
+            )
         except Exception as e:
             logger.error(f"Error deleting slide {slide_id}: {e}")
+            raise
+        
+        if deck is None:
+            await self._precondition_failed(slide_id, expected_updated_at)
             return False
+        
+        await cache_service.invalidate("slides", slide_id)
+        search_service.remove("slides", slide_id)
+        export_service.discard("slides", slide_id)
+        await version_service.delete_versions("slides", slide_id)
+        return True
     
     async def search_slides(self, query: str, user_id: Optional[str] = None) -> List[Slide]:
         """Tìm kiếm slides"""
-        db = await get_database()
+        return [Slide(**slide_data) for slide_data in await self.search_slide_documents(query, user_id)]
+    
+    async def search_slide_documents(self, query: str, user_id: Optional[str] = None, projection: Optional[dict] = None) -> List[dict]:
+        """Tìm kiếm slides, trả về document thô"""
+        db = await get_database("list")
         
         try:
             # Tạo filter
@@ -232,13 +632,9 @@ class SlideService:
             if user_id:
                 filter_query["user_id"] = user_id
             
-            cursor = db.slides.find(filter_query).sort("created_at", -1).limit(20)
-            
-            slides = []
-            async for slide_data in cursor:
-                slides.append(Slide(**slide_data))
+            cursor = db.slides.find(filter_query, projection=projection).sort("created_at", -1).limit(20)
             
-            return slides
+            return [slide_data async for slide_data in cursor]
             
         except Exception as e:
             logger.error(f"Error searching slides: {e}")
@@ -256,9 +652,13 @@ class SlideService:
                     requirements=request.requirements
                 ).model_dump()
                 
-                response = await client.post(
-                    f"{self.agent_url}/generate/slide",
-                    json=payload
+                response = await resilient_caller.call(
+                    "agent.slide",
+                    lambda: client.post(
+                        f"{self.agent_url}/generate/slide",
+                        json=payload,
+                        headers=deadline.headers()
+                    )
                 )
                 response.raise_for_status()
                 
@@ -286,9 +686,13 @@ class SlideService:
                     "slide_style": request.slide_style
                 }
                 
-                response = await client.post(
-                    f"{self.agent_url}/generate/slide-from-lecture",
-                    json=payload
+                response = await resilient_caller.call(
+                    "agent.slide_from_lecture",
+                    lambda: client.post(
+                        f"{self.agent_url}/generate/slide-from-lecture",
+                        json=payload,
+                        headers=deadline.headers()
+                    )
                 )
                 response.raise_for_status()
                 
@@ -301,6 +705,32 @@ class SlideService:
         except Exception as e:
             logger.error(f"Unexpected error generating slide from lecture: {e}")
             raise Exception("Đã xảy ra lỗi khi sinh slide từ bài giảng")
+    
+    async def _generate_slide_item(self, payload: SlideItemGenerationRequest) -> dict:
+        """Gọi agent để sinh lại một slide"""
+        try:
+            async with httpx.AsyncClient(timeout=60.0) as client:
+                response = await resilient_caller.call(
+                    "agent.slide_item",
+                    lambda: client.post(
+                        f"{self.agent_url}/generate/slide-item",
+                        json=payload.model_dump(),
+                        headers=deadline.headers()
+                    )
+                )
+                response.raise_for_status()
+                
+                slide = response.json().get("slide")
+                if not isinstance(slide, dict):
+                    raise ValueError("Invalid slide")
+                return slide
+                
+        except httpx.RequestError as e:
+            logger.error(f"Error calling agent for slide regeneration: {e}")
+            raise Exception("Không thể kết nối tới dịch vụ sinh nội dung")
+        except Exception as e:
+            logger.error(f"Unexpected error regenerating slide: {e}")
+            raise Exception("Đã xảy ra lỗi khi sinh lại slide")
 
 # Singleton instance
 slide_service = SlideService()
@@ -0,0 +1,177 @@
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import json
+import logging
+import os
+
+from app.db.database import get_database, read_lag
+from app.core.config import settings
+from app.core.prefix_index import PrefixIndex
+
+logger = logging.getLogger(__name__)
+
+_KINDS = ("lectures", "slides")
+_PROJECTION = {"title": 1, "subject": 1, "user_id": 1, "slide_count": 1, "updated_at": 1}
+
+
+class SuggestionService:
+    """Gợi ý tìm kiếm theo prefix tiêu đề/môn học, không truy vấn MongoDB"""
+
+    def __init__(self):
+        # Index chung (key None) và index riêng cho từng user
+        self.indexes: Dict[str, Dict[Optional[str], PrefixIndex]] = {kind: {None: PrefixIndex()} for kind in _KINDS}
+        self._owners: Dict[str, Dict[str, Optional[str]]] = {kind: {} for kind in _KINDS}
+        self._records: Dict[str, Dict[str, dict]] = {kind: {} for kind in _KINDS}
+        self.ready = False
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(settings.INDEX_DIRECTORY, "suggestions.json")
+
+    def _add_record(self, kind: str, record: dict):
+        doc_id = record["id"]
+        self.remove(kind, doc_id)
+
+        meta = {
+            "id": doc_id,
+            "title": record.get("title") or "",
+            "subject": record.get("subject") or "",
+            "type": "lecture" if kind == "lectures" else "slide"
+        }
+        if kind == "slides":
+            meta["slide_count"] = record.get("slide_count", 0)
+
+        user_id = record.get("user_id")
+        targets = [None] if not user_id else [None, user_id]
+        for key in targets:
+            index = self.indexes[kind].setdefault(key, PrefixIndex())
+            index.add(doc_id, meta["title"], meta["subject"], meta, rank=record.get("rank", 0.0))
+
+        self._owners[kind][doc_id] = user_id
+        self._records[kind][doc_id] = record
+        self._dirty = True
+
+    def index_document(self, kind: str, doc: dict):
+        """Cập nhật gợi ý cho một tài liệu (doc lấy từ MongoDB)"""
+        updated_at = doc.get("updated_at")
+        self._add_record(kind, {
+            "id": str(doc["_id"]),
+            "title": doc.get("title"),
+            "subject": doc.get("subject"),
+            "user_id": doc.get("user_id"),
+            "slide_count": doc.get("slide_count", 0),
+            "rank": updated_at.timestamp() if updated_at else 0.0
+        })
+
+    def remove(self, kind: str, doc_id: str):
+        if doc_id not in self._owners[kind]:
+            return
+        user_id = self._owners[kind].pop(doc_id)
+        self._records[kind].pop(doc_id, None)
+        self.indexes[kind][None].remove(doc_id)
+        if user_id and user_id in self.indexes[kind]:
+            user_index = self.indexes[kind][user_id]
+            user_index.remove(doc_id)
+            if not len(user_index):
+                del self.indexes[kind][user_id]
+        self._dirty = True
+
+    def suggest(self, kind: str, query: str, user_id: Optional[str] = None, limit: int = 5) -> List[dict]:
+        index = self.indexes[kind].get(user_id if user_id else None)
+        if index is None:
+            return []
+        return index.suggest(query, limit)
+
+    def _snapshot_data(self) -> dict:
+        self._dirty = False
+        return {
+            "saved_at": datetime.utcnow().isoformat(),
+            "records": {kind: list(self._records[kind].values()) for kind in _KINDS}
+        }
+
+    def _write_snapshot(self, data: dict):
+        """Ghi snapshot xuống đĩa (ghi file tạm rồi rename để không hỏng file cũ)"""
+        path = self.snapshot_path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read_snapshot(self) -> Optional[dict]:
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    async def _load_snapshot(self) -> Optional[datetime]:
+        # Đọc file trong thread, chèn vào trie trên event loop (tránh tranh chấp với các lần ghi)
+        data = await asyncio.to_thread(self._read_snapshot)
+        if not data:
+            return None
+        for kind in _KINDS:
+            for i, record in enumerate(data.get("records", {}).get(kind, [])):
+                self._add_record(kind, record)
+                if i % 1000 == 999:
+                    await asyncio.sleep(0)
+        self._dirty = False
+        return datetime.fromisoformat(data["saved_at"])
+
+    async def _catch_up(self, since: Optional[datetime]):
+        """Đồng bộ các thay đổi xảy ra sau thời điểm snapshot"""
+        db = await get_database("suggest")
+        for kind in _KINDS:
+            filter_query = {"updated_at": {"$gte": since - timedelta(seconds=5 + read_lag("suggest"))}} if since else {}
+            async for doc in db[kind].find(filter_query, projection=_PROJECTION, batch_size=1000):
+                self.index_document(kind, doc)
+
+            if since:
+                # Bỏ các tài liệu đã bị xóa trong lúc service tắt
+                existing = {str(doc["_id"]) async for doc in db[kind].find({}, projection={"_id": 1}, batch_size=5000)}
+                for doc_id in list(self._owners[kind]):
+                    if doc_id not in existing:
+                        self.remove(kind, doc_id)
+
+    async def _run(self):
+        try:
+            since = await self._load_snapshot()
+            if since:
+                # Snapshot đã đủ để phục vụ gợi ý trong lúc đồng bộ
+                self.ready = True
+            await self._catch_up(since)
+            for kind in _KINDS:
+                self.indexes[kind][None].warm()
+                await asyncio.sleep(0)
+            self.ready = True
+            logger.info(f"Suggestion index ready: {sum(len(self._owners[k]) for k in _KINDS)} documents")
+        except Exception as e:
+            logger.error(f"Error loading suggestion index: {e}")
+            return
+
+        while settings.SUGGEST_SNAPSHOT_INTERVAL > 0:
+            await asyncio.sleep(settings.SUGGEST_SNAPSHOT_INTERVAL)
+            if self._dirty:
+                try:
+                    # Chụp dữ liệu trên event loop, ghi file trong thread
+                    await asyncio.to_thread(self._write_snapshot, self._snapshot_data())
+                except Exception as e:
+                    logger.error(f"Error saving suggestion snapshot: {e}")
+
+    def start(self):
+        """Nạp snapshot và đồng bộ trong background (gọi khi khởi động)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.ready and self._dirty:
+            self._write_snapshot(self._snapshot_data())
+
+# Singleton instance
+suggestion_service = SuggestionService()
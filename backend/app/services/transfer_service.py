@@ -0,0 +1,330 @@
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+import zlib
+
+from bson import ObjectId, json_util
+from pydantic import ValidationError
+from pymongo import InsertOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from app.db.database import get_database
+from app.models.chat import ChatMessage, ChatSession
+from app.models.lecture import Lecture
+from app.models.slide import Slide
+from app.services.archive_service import archive_service
+from app.services.cache_service import cache_service
+from app.services.search_service import search_service
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard là tùy chọn
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_KINDS = ("lectures", "slides", "chats")
+IMPORT_MODES = ("insert", "upsert")
+
+# Loại bản ghi trong file NDJSON -> (collection, model kiểm tra)
+_RECORD_TYPES = {
+    "lecture": ("lectures", Lecture),
+    "slide": ("slides", Slide),
+    "chat_session": ("chat_sessions", ChatSession),
+    "chat_message": ("chat_messages", ChatMessage),
+}
+_KIND_RECORD = {"lectures": "lecture", "slides": "slide", "chats": "chat_session"}
+# Trạng thái lưu trữ lạnh là cục bộ: tin nhắn được xuất kèm session
+_SESSION_LOCAL_FIELDS = ("archived_at", "archived_messages", "archived_bytes", "rehydrated_at")
+_JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS
+_DUPLICATE_KEY = 11000
+_MAX_REPORTED_ERRORS = 100
+_EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+class BulkImportError(Exception):
+    """Tham số import không hợp lệ hoặc không đọc được dữ liệu gửi lên"""
+
+
+def _line(record_type: str, doc: dict) -> bytes:
+    return json_util.dumps({"type": record_type, "data": doc}, json_options=_JSON_OPTIONS).encode() + b"\n"
+
+
+def parse_resume_token(token: Optional[str]) -> Optional[Tuple[str, ObjectId]]:
+    """'lectures:<id>' -> ('lectures', ObjectId); xuất tiếp sau bản ghi này"""
+    if not token:
+        return None
+    kind, _, doc_id = token.partition(":")
+    if kind not in EXPORT_KINDS or not ObjectId.is_valid(doc_id):
+        raise BulkImportError(f"Invalid resume token: {token}")
+    return kind, ObjectId(doc_id)
+
+
+def _decompressor(encoding: Optional[str]):
+    """Hàm giải nén từng chunk theo Content-Encoding (zstd, gzip) hoặc None"""
+    encoding = (encoding or "").lower()
+    if encoding in ("", "identity"):
+        return None
+    if encoding == "zstd":
+        if zstandard is None:
+            raise BulkImportError("zstd is not supported (zstandard is not installed)")
+        return zstandard.ZstdDecompressor().decompressobj().decompress
+    if encoding == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress
+    raise BulkImportError(f"Unsupported encoding: {encoding}")
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], encoding: Optional[str] = None) -> AsyncIterator[bytes]:
+    """Tách luồng bytes (có thể nén) thành từng dòng, không giữ cả file trong bộ nhớ"""
+    decompress = _decompressor(encoding)
+    pending = b""
+    async for chunk in chunks:
+        if decompress is not None:
+            chunk = decompress(chunk)
+        if not chunk:
+            continue
+        pending += chunk
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+class _ImportReport:
+    def __init__(self, skip: int):
+        self.lines = skip  # Số dòng đã đọc (kể cả các dòng bỏ qua khi resume)
+        self.checkpoint = skip  # Mọi dòng đến đây đã được ghi xong
+        self.inserted = 0
+        self.upserted = 0
+        self.replaced = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors: List[dict] = []
+        self.by_type: Dict[str, int] = {}
+
+    def error(self, line: int, message: str):
+        self.invalid += 1
+        if len(self.errors) < _MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self) -> dict:
+        return {
+            "lines": self.lines,
+            "checkpoint": self.checkpoint,
+            "inserted": self.inserted,
+            "upserted": self.upserted,
+            "replaced": self.replaced,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "by_type": dict(self.by_type),
+            "errors": list(self.errors),
+        }
+
+
+class TransferService:
+    """
+    Xuất/nhập hàng loạt bài giảng, slide và chat dạng NDJSON.
+
+    Mỗi dòng là {"type": "lecture" | "slide" | "chat_session" | "chat_message",
+    "data": document} theo MongoDB Extended JSON (giữ ObjectId, datetime) nên
+    xuất rồi nhập lại cho ra đúng document. Xuất đọc theo cursor (bộ nhớ không
+    đổi); nhập kiểm tra từng dòng bằng model Pydantic rồi ghi theo lô bằng
+    bulk_write.
+    """
+
+    async def export_lines(
+        self,
+        kinds: Iterable[str] = EXPORT_KINDS,
+        user_id: Optional[str] = None,
+        resume_after: Optional[str] = None
+    ) -> AsyncIterator[bytes]:
+        """Các dòng NDJSON theo thứ tự kinds, mỗi loại theo _id tăng dần"""
+        kinds = list(kinds)
+        unknown = set(kinds) - set(EXPORT_KINDS)
+        if unknown:
+            raise BulkImportError(f"Unknown kinds: {', '.join(sorted(unknown))}")
+        resume = parse_resume_token(resume_after)
+        # Xuất khối lượng lớn: đọc từ secondary nếu có
+        db = await get_database("list")
+
+        started = resume is None
+        for kind in EXPORT_KINDS:
+            if kind not in kinds:
+                continue
+            filter_query: dict = {}
+            if not started:
+                if kind != resume[0]:
+                    continue
+                filter_query["_id"] = {"$gt": resume[1]}
+                started = True
+            if user_id:
+                filter_query["user_id"] = user_id
+            if kind == "chats":
+                filter_query["status"] = {"$ne": "deleted"}
+                collection = db.chat_sessions
+            else:
+                collection = db[kind]
+
+            cursor = collection.find(filter_query).sort("_id", 1).batch_size(500)
+            async for doc in cursor:
+                if kind != "chats":
+                    yield _line(_KIND_RECORD[kind], doc)
+                    continue
+                for field in _SESSION_LOCAL_FIELDS:
+                    doc.pop(field, None)
+                yield _line("chat_session", doc)
+                session_id = str(doc["_id"])
+                for message in await archive_service.archived_messages(session_id):
+                    yield _line("chat_message", message)
+                async for message in db.chat_messages.find({"session_id": session_id}).sort("created_at", 1):
+                    yield _line("chat_message", message)
+
+    async def export_stream(
+        self,
+        kinds: Iterable[str] = EXPORT_KINDS,
+        user_id: Optional[str] = None,
+        resume_after: Optional[str] = None,
+        compress: bool = False
+    ) -> AsyncIterator[bytes]:
+        """Gom các dòng thành chunk ~64KB; compress=True nén zstd theo frame liên tục (flush mỗi chunk)"""
+        compressor = None
+        if compress:
+            if zstandard is None:
+                raise BulkImportError("zstd is not supported (zstandard is not installed)")
+            compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+        buffer: List[bytes] = []
+        size = 0
+        async for line in self.export_lines(kinds, user_id, resume_after):
+            buffer.append(line)
+            size += len(line)
+            if size >= _EXPORT_CHUNK_BYTES:
+                chunk = b"".join(buffer)
+                buffer, size = [], 0
+                if compressor is not None:
+                    chunk = compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+                yield chunk
+        chunk = b"".join(buffer)
+        if compressor is not None:
+            chunk = compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+        if chunk:
+            yield chunk
+
+    async def import_lines(
+        self,
+        lines: AsyncIterator[bytes],
+        mode: str = "upsert",
+        ordered: bool = False,
+        batch_size: int = 1000,
+        skip: int = 0,
+        on_progress: Optional[Callable[[dict], None]] = None
+    ) -> dict:
+        """
+        Nhập các dòng NDJSON, ghi theo lô batch_size bản ghi.
+
+        mode: insert (bỏ qua _id đã có) hoặc upsert (ghi đè theo _id, chạy lại
+        được nhiều lần). skip: bỏ qua số dòng đầu (resume từ checkpoint của lần
+        trước). Dòng không hợp lệ được ghi vào báo cáo, không dừng quá trình.
+        """
+        if mode not in IMPORT_MODES:
+            raise BulkImportError(f"Unknown mode: {mode}")
+        if batch_size < 1:
+            raise BulkImportError("batch_size must be positive")
+
+        db = await get_database()
+        report = _ImportReport(skip)
+        batch: Dict[str, List[Tuple[str, dict]]] = {}
+        batch_count = 0
+        line_number = 0
+
+        async for raw in lines:
+            line_number += 1
+            if line_number <= skip:
+                continue
+            report.lines = line_number
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                record = json_util.loads(raw, json_options=_JSON_OPTIONS)
+                record_type = record.get("type")
+                if record_type not in _RECORD_TYPES:
+                    raise ValueError(f"unknown type {record_type!r}")
+                collection, model = _RECORD_TYPES[record_type]
+                data = record.get("data") or {}
+                if record_type == "chat_session":
+                    for field in _SESSION_LOCAL_FIELDS:
+                        data.pop(field, None)
+                # Field ngoài model được giữ nguyên, field của model được chuẩn hóa
+                doc = {**data, **model(**data).model_dump(by_alias=True)}
+            except ValidationError as e:
+                first = e.errors()[0]
+                field = ".".join(str(part) for part in first["loc"])
+                report.error(line_number, f"{e.title}.{field}: {first['msg']}")
+                continue
+            except (ValueError, TypeError, AttributeError) as e:
+                report.error(line_number, str(e).splitlines()[0] if str(e) else type(e).__name__)
+                continue
+
+            batch.setdefault(collection, []).append((record_type, doc))
+            batch_count += 1
+            if batch_count >= batch_size:
+                await self._flush(db, batch, mode, ordered, report)
+                report.checkpoint = line_number
+                batch, batch_count = {}, 0
+                if on_progress is not None:
+                    on_progress(report.as_dict())
+
+        if batch:
+            await self._flush(db, batch, mode, ordered, report)
+        report.checkpoint = report.lines
+        if on_progress is not None:
+            on_progress(report.as_dict())
+        return report.as_dict()
+
+    async def _flush(self, db, batch: Dict[str, List[Tuple[str, dict]]], mode: str, ordered: bool, report: _ImportReport):
+        # Session trước tin nhắn để dữ liệu nhất quán nếu bị dừng giữa chừng
+        for collection in sorted(batch, key=lambda name: name != "chat_sessions"):
+            records = batch[collection]
+            docs = [doc for _, doc in records]
+            if mode == "upsert":
+                operations = [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs]
+            else:
+                operations = [InsertOne(doc) for doc in docs]
+            await self._bulk_write(db[collection], operations, ordered, report)
+
+            for record_type, _ in records:
+                report.by_type[record_type] = report.by_type.get(record_type, 0) + 1
+            if collection in ("lectures", "slides"):
+                for doc in docs:
+                    await cache_service.invalidate(collection, str(doc["_id"]))
+                    search_service.index_document(collection, doc)
+
+    async def _bulk_write(self, collection, operations: list, ordered: bool, report: _ImportReport):
+        while operations:
+            try:
+                result = await collection.bulk_write(operations, ordered=ordered)
+            except BulkWriteError as e:
+                details = e.details
+                errors = details.get("writeErrors", [])
+                if any(error.get("code") != _DUPLICATE_KEY for error in errors):
+                    raise
+                self._count(report, details.get("nInserted", 0), details.get("nUpserted", 0), details.get("nMatched", 0))
+                report.duplicates += len(errors)
+                if ordered and errors:
+                    # Lô có thứ tự dừng ở lỗi đầu tiên: ghi tiếp phần còn lại
+                    operations = operations[errors[0]["index"] + 1:]
+                    continue
+                return
+            self._count(report, result.inserted_count, result.upserted_count, result.matched_count)
+            return
+
+    @staticmethod
+    def _count(report: _ImportReport, inserted: int, upserted: int, matched: int):
+        report.inserted += inserted
+        report.upserted += upserted
+        report.replaced += matched
+
+# Singleton instance
+transfer_service = TransferService()
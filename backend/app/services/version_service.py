@@ -0,0 +1,293 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import logging
+
+from app.db.database import get_database
+from app.core.config import settings
+from app.core.clock import utcnow_ms
+from app.core.patch import apply_patch, json_size, make_patch
+
+logger = logging.getLogger(__name__)
+
+# Các field được lưu lịch sử (nội dung do giáo viên/agent soạn)
+VERSIONED_FIELDS = {
+    "lectures": ("title", "subject", "grade", "description", "requirements", "content"),
+    "slides": ("title", "subject", "presentation_type", "duration", "description", "requirements", "slides"),
+}
+VERSION_COLLECTIONS = {"lectures": "lecture_versions", "slides": "slide_versions"}
+
+_HEADER_FIELDS = {"version": 1, "type": 1, "snapshot_version": 1, "chain_bytes": 1, "size": 1, "source": 1, "created_at": 1}
+
+
+class VersionNotFoundError(Exception):
+    """Không có tài liệu hoặc phiên bản cần tìm"""
+
+
+def version_state(kind: str, doc: dict) -> dict:
+    """Phần nội dung của tài liệu được lưu trong lịch sử"""
+    return {field: doc.get(field) for field in VERSIONED_FIELDS[kind]}
+
+
+class VersionService:
+    """
+    Lịch sử phiên bản bài giảng/slide.
+
+    Mỗi phiên bản là một snapshot đầy đủ hoặc một patch so với phiên bản liền
+    trước. Snapshot được ghi sau mỗi VERSION_SNAPSHOT_INTERVAL phiên bản hoặc
+    khi tổng kích thước patch từ snapshot gần nhất vượt kích thước tài liệu,
+    nên dựng lại một phiên bản chỉ cần đọc một snapshot và một số ít patch.
+    """
+
+    def __init__(self):
+        self._scheduled: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    def _collection(self, db, kind: str):
+        return db[VERSION_COLLECTIONS[kind]]
+
+    async def _latest(self, collection, oid: ObjectId) -> Optional[dict]:
+        return await collection.find_one({"doc_id": oid}, projection=_HEADER_FIELDS, sort=[("version", -1)])
+
+    async def _state_at(self, collection, oid: ObjectId, version: int) -> Optional[dict]:
+        """Dựng lại nội dung của một phiên bản từ snapshot gần nhất và các patch sau nó"""
+        snapshot = await collection.find_one(
+            {"doc_id": oid, "type": "snapshot", "version": {"$lte": version}},
+            projection={"version": 1, "state": 1},
+            sort=[("version", -1)]
+        )
+        if not snapshot:
+            return None
+        state = snapshot["state"]
+        cursor = collection.find(
+            {"doc_id": oid, "version": {"$gt": snapshot["version"], "$lte": version}},
+            projection={"patch": 1}
+        ).sort("version", 1)
+        async for delta in cursor:
+            state = apply_patch(state, delta["patch"])
+        return state
+
+    async def _insert(self, collection, oid: ObjectId, version: int, state: dict, latest: Optional[dict], base: Optional[dict], source: str) -> bool:
+        """Ghi phiên bản mới, trả về False nếu số phiên bản đã bị process khác dùng"""
+        size = json_size(state)
+        entry = {"doc_id": oid, "version": version, "size": size, "source": source, "created_at": utcnow_ms()}
+
+        patch = make_patch(base, state) if latest else None
+        patch_bytes = json_size(patch) if patch is not None else 0
+        chain_bytes = (latest or {}).get("chain_bytes", 0) + patch_bytes
+        snapshot_version = (latest or {}).get("snapshot_version", 0)
+        if (
+            patch is None
+            or version - snapshot_version >= settings.VERSION_SNAPSHOT_INTERVAL
+            # Dựng lại từ chuỗi patch tốn hơn đọc một snapshot
+            or chain_bytes > size
+        ):
+            entry.update(type="snapshot", state=state, snapshot_version=version, chain_bytes=0)
+        else:
+            entry.update(type="delta", patch=patch, snapshot_version=snapshot_version, chain_bytes=chain_bytes)
+
+        try:
+            await collection.insert_one(entry)
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def _apply_retention(self, collection, oid: ObjectId, current: int):
+        """Xóa phiên bản vượt VERSION_MAX_COUNT hoặc cũ hơn VERSION_MAX_AGE_DAYS (luôn giữ phiên bản mới nhất)"""
+        keep_from = 1
+        if settings.VERSION_MAX_COUNT > 0:
+            keep_from = current - settings.VERSION_MAX_COUNT + 1
+        if settings.VERSION_MAX_AGE_DAYS > 0:
+            cutoff = datetime.utcnow() - timedelta(days=settings.VERSION_MAX_AGE_DAYS)
+            recent = await collection.find_one(
+                {"doc_id": oid, "created_at": {"$gte": cutoff}},
+                projection={"version": 1},
+                sort=[("version", 1)]
+            )
+            keep_from = max(keep_from, recent["version"] if recent else current)
+
+        oldest = await collection.find_one({"doc_id": oid}, projection={"version": 1}, sort=[("version", 1)])
+        if not oldest or keep_from <= oldest["version"]:
+            return
+
+        # Phiên bản cũ nhất còn giữ phải là snapshot để dựng lại được
+        first = await collection.find_one({"doc_id": oid, "version": keep_from}, projection={"type": 1})
+        if first and first["type"] != "snapshot":
+            state = await self._state_at(collection, oid, keep_from)
+            await collection.update_one(
+                {"_id": first["_id"]},
+                {
+                    "$set": {"type": "snapshot", "state": state, "snapshot_version": keep_from, "chain_bytes": 0},
+                    "$unset": {"patch": ""}
+                }
+            )
+            # chain_bytes của các patch sau đó giữ nguyên (ước lượng dư, chỉ làm snapshot kế tiếp đến sớm hơn)
+            await collection.update_many(
+                {"doc_id": oid, "version": {"$gt": keep_from}, "snapshot_version": {"$lt": keep_from}},
+                {"$set": {"snapshot_version": keep_from}}
+            )
+        await collection.delete_many({"doc_id": oid, "version": {"$lt": keep_from}})
+
+    async def ensure_baseline(self, kind: str, doc_id: str):
+        """
+        Lưu nội dung hiện tại làm phiên bản đầu tiên nếu tài liệu chưa có lịch sử.
+
+        Gọi trước khi sửa để tài liệu tạo trước khi có lịch sử vẫn khôi phục
+        được về nội dung ban đầu.
+        """
+        if not ObjectId.is_valid(doc_id):
+            return
+        try:
+            db = await get_database()
+            collection = self._collection(db, kind)
+            oid = ObjectId(doc_id)
+            if await collection.find_one({"doc_id": oid}, projection={"_id": 1}):
+                return
+            doc = await db[kind].find_one({"_id": oid}, projection=dict.fromkeys(VERSIONED_FIELDS[kind], 1))
+            if doc:
+                await self._insert(collection, oid, 1, version_state(kind, doc), None, None, "initial")
+        except Exception as e:
+            logger.error(f"Error saving baseline version of {kind} {doc_id}: {e}")
+
+    async def checkpoint(self, kind: str, doc_id: str):
+        """
+        Đảm bảo nội dung hiện tại đã nằm trong lịch sử trước một thay đổi lớn
+        (sửa cả tài liệu, sinh lại, khôi phục): ghi ngay phiên bản đang chờ.
+        """
+        task = self._scheduled.pop((kind, doc_id), None)
+        if task:
+            task.cancel()
+            await self.record(kind, doc_id)
+        else:
+            await self.ensure_baseline(kind, doc_id)
+
+    async def record(self, kind: str, doc_id: str, source: str = "edit") -> Optional[int]:
+        """Lưu nội dung hiện tại của tài liệu thành phiên bản mới (nếu có thay đổi), trả về số phiên bản"""
+        try:
+            db = await get_database()
+            oid = ObjectId(doc_id)
+            doc = await db[kind].find_one({"_id": oid}, projection=dict.fromkeys(VERSIONED_FIELDS[kind], 1))
+            if not doc:
+                return None
+            return await self._record_state(self._collection(db, kind), oid, version_state(kind, doc), source)
+        except Exception as e:
+            logger.error(f"Error recording version of {kind} {doc_id}: {e}")
+        return None
+
+    async def record_update(self, kind: str, doc_id: str, before: dict, after: dict):
+        """
+        Ghi lịch sử cho một lần sửa cả tài liệu từ nội dung trước và sau lệnh ghi
+        (không đọc lại tài liệu).
+
+        Nội dung trước khi sửa được lưu nếu tài liệu chưa có lịch sử hoặc đang
+        có phiên bản chờ ghi, như checkpoint nhưng sau lệnh ghi.
+        """
+        task = self._scheduled.pop((kind, doc_id), None)
+        if task:
+            task.cancel()
+        try:
+            db = await get_database()
+            collection = self._collection(db, kind)
+            oid = ObjectId(doc_id)
+            if task:
+                await self._record_state(collection, oid, version_state(kind, before), "edit")
+            elif not await collection.find_one({"doc_id": oid}, projection={"_id": 1}):
+                await self._insert(collection, oid, 1, version_state(kind, before), None, None, "initial")
+            await self._record_state(collection, oid, version_state(kind, after), "edit")
+        except Exception as e:
+            logger.error(f"Error recording version of {kind} {doc_id}: {e}")
+
+    async def _record_state(self, collection, oid: ObjectId, state: dict, source: str) -> Optional[int]:
+        # Hai lần ghi đồng thời có thể cùng chọn một số phiên bản: index unique chặn, thử lại
+        for _ in range(3):
+            latest = await self._latest(collection, oid)
+            base = await self._state_at(collection, oid, latest["version"]) if latest else None
+            if latest and base == state:
+                return latest["version"]
+            version = latest["version"] + 1 if latest else 1
+            if await self._insert(collection, oid, version, state, latest, base, source):
+                await self._apply_retention(collection, oid, version)
+                return version
+        logger.warning(f"Could not record version of {collection.name} {oid}: concurrent writes")
+        return None
+
+    def schedule_record(self, kind: str, doc_id: str, source: str = "edit"):
+        """
+        Lưu phiên bản sau VERSION_RECORD_DELAY giây, gộp các lần sửa liên tiếp.
+
+        Dùng cho các thao tác sửa từng slide để một loạt chỉnh sửa nhỏ thành
+        một phiên bản và request không phải đọc lại cả tài liệu.
+        """
+        key = (kind, doc_id)
+        if key in self._scheduled:
+            return
+
+        async def run():
+            try:
+                await asyncio.sleep(settings.VERSION_RECORD_DELAY)
+            finally:
+                self._scheduled.pop(key, None)
+            await self.record(kind, doc_id, source)
+
+        self._scheduled[key] = asyncio.create_task(run())
+
+    async def flush(self):
+        """Ghi ngay các phiên bản đang chờ (gọi khi tắt ứng dụng)"""
+        tasks = list(self._scheduled.items())
+        self._scheduled.clear()
+        for _, task in tasks:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in tasks), return_exceptions=True)
+        for (kind, doc_id), _ in tasks:
+            await self.record(kind, doc_id)
+
+    async def list_versions(self, kind: str, doc_id: str, page: int = 1, per_page: int = 20) -> Tuple[List[dict], int]:
+        """Danh sách phiên bản (mới nhất trước), không kèm nội dung"""
+        if not ObjectId.is_valid(doc_id):
+            return [], 0
+        db = await get_database()
+        collection = self._collection(db, kind)
+
+        try:
+            filter_query = {"doc_id": ObjectId(doc_id)}
+            total = await collection.count_documents(filter_query)
+            cursor = collection.find(
+                filter_query,
+                projection={"version": 1, "type": 1, "size": 1, "source": 1, "created_at": 1}
+            ).sort("version", -1).skip((page - 1) * per_page).limit(per_page)
+            return [version async for version in cursor], total
+        except Exception as e:
+            logger.error(f"Error listing versions of {kind} {doc_id}: {e}")
+            return [], 0
+
+    async def get_version(self, kind: str, doc_id: str, version: int) -> dict:
+        """Một phiên bản kèm nội dung đã dựng lại"""
+        if not ObjectId.is_valid(doc_id):
+            raise VersionNotFoundError("Không tìm thấy phiên bản")
+        db = await get_database()
+        collection = self._collection(db, kind)
+        oid = ObjectId(doc_id)
+
+        header = await collection.find_one({"doc_id": oid, "version": version}, projection=_HEADER_FIELDS)
+        if not header:
+            raise VersionNotFoundError("Không tìm thấy phiên bản")
+        state = await self._state_at(collection, oid, version)
+        if state is None:
+            raise VersionNotFoundError("Không tìm thấy phiên bản")
+        header["state"] = state
+        return header
+
+    async def delete_versions(self, kind: str, doc_id: str):
+        """Xóa lịch sử của tài liệu (khi tài liệu bị xóa)"""
+        task = self._scheduled.pop((kind, doc_id), None)
+        if task:
+            task.cancel()
+        try:
+            db = await get_database()
+            await self._collection(db, kind).delete_many({"doc_id": ObjectId(doc_id)})
+        except Exception as e:
+            logger.error(f"Error deleting versions of {kind} {doc_id}: {e}")
+
+# Singleton instance
+version_service = VersionService()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Chạy một lượt lưu trữ lạnh tin nhắn chat (giống job định kỳ của backend).
+
+- archive: chuyển tin nhắn của session không hoạt động quá
+  CHAT_ARCHIVE_AFTER_DAYS ngày hoặc đã xóa vào chat_archives
+- purge: xóa hẳn session đã xóa quá --purge-days ngày (mặc định
+  CHAT_PURGE_DELETED_AFTER_DAYS)
+
+Chạy từ thư mục backend:
+    python -m scripts.archive_chats --batches 10
+    python -m scripts.archive_chats --purge-days 0 --no-archive
+"""
+import argparse
+import asyncio
+
+from app.core.config import settings
+from app.db.database import close_db_connection, connect_to_db
+from app.services.archive_service import archive_service
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batches", type=int, default=1, help=f"Số lượt, mỗi lượt tối đa {settings.CHAT_ARCHIVE_BATCH_SIZE} session")
+    parser.add_argument("--purge-days", type=int, default=None, help="Xóa hẳn session đã xóa cũ hơn số ngày này")
+    parser.add_argument("--no-archive", action="store_true", help="Chỉ xóa hẳn, không lưu trữ")
+    args = parser.parse_args()
+
+    await connect_to_db()
+    try:
+        archived = purged = 0
+        for _ in range(args.batches):
+            batch_archived = 0 if args.no_archive else await archive_service.archive_inactive()
+            batch_purged = await archive_service.purge_deleted(args.purge_days)
+            archived += batch_archived
+            purged += batch_purged
+            if not batch_archived and not batch_purged:
+                break
+        print(f"archived {archived} sessions, purged {purged} deleted sessions")
+    finally:
+        await close_db_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+So sánh chi phí CPU khi trả về chi tiết/danh sách slide và bài giảng.
+
+- pydantic: đường cũ, dựng Slide(**doc), chép sang SlideResponse rồi để
+  FastAPI kiểm tra lại qua response_model và encode bằng json.
+- fast: DocumentSerializer chọn field trên document thô và ghi bytes bằng
+  orjson (đường hiện tại của các API đọc).
+
+Hai đường được kiểm tra cho ra cùng JSON trước khi đo.
+
+Chạy từ thư mục backend:
+    python -m scripts.benchmark_serialization --slides 20 100 500 --repeat 200
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.core.fast_json import DocumentSerializer, FastJSONResponse
+from app.models.lecture import Lecture, LectureResponse
+from app.models.slide import Slide, SlideContent, SlideResponse
+
+_WORDS = (
+    "bài học khái niệm ví dụ bài tập ôn tập kiểm tra thảo luận nhóm thực hành mục tiêu kiến thức kỹ năng "
+    "phương pháp đánh giá hoạt động trò chơi câu hỏi trắc nghiệm tự luận chương phần nội dung tổng kết"
+).split()
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(_WORDS, k=words))
+
+
+def _slide_document(rng: random.Random, slide_count: int) -> dict:
+    now = datetime.utcnow().replace(microsecond=rng.randrange(1000) * 1000)
+    return {
+        "_id": ObjectId(),
+        "user_id": "bench",
+        "title": _text(rng, 6),
+        "subject": "Sinh học",
+        "presentation_type": "lecture",
+        "duration": 45,
+        "description": _text(rng, 20),
+        "requirements": _text(rng, 30),
+        "slides": [
+            {
+                "title": _text(rng, 5),
+                "content": "\n".join(f"- {_text(rng, 12)}" for _ in range(5)),
+                "slide_type": "content",
+                "notes": _text(rng, 25)
+            }
+            for _ in range(slide_count)
+        ],
+        "slide_count": slide_count,
+        "status": "completed",
+        "created_at": now - timedelta(hours=1),
+        "updated_at": now,
+        "metadata": {"generated_by": "ai_agent"}
+    }
+
+
+def _lecture_document(rng: random.Random, paragraphs: int) -> dict:
+    now = datetime.utcnow().replace(microsecond=rng.randrange(1000) * 1000)
+    return {
+        "_id": ObjectId(),
+        "user_id": "bench",
+        "title": _text(rng, 6),
+        "subject": "Sinh học",
+        "grade": "high",
+        "description": _text(rng, 20),
+        "requirements": _text(rng, 30),
+        "content": "\n\n".join(f"## {_text(rng, 4)}\n\n{_text(rng, 80)}" for _ in range(paragraphs)),
+        "status": "completed",
+        "created_at": now - timedelta(hours=1),
+        "updated_at": now,
+        "metadata": {"generated_by": "ai_agent"}
+    }
+
+
+def _slide_response(doc: dict) -> SlideResponse:
+    slide = Slide(**doc)
+    return SlideResponse(
+        id=str(slide.id),
+        title=slide.title,
+        subject=slide.subject,
+        presentation_type=slide.presentation_type,
+        duration=slide.duration,
+        description=slide.description,
+        requirements=slide.requirements,
+        slides=slide.slides,
+        slide_count=slide.slide_count,
+        status=slide.status,
+        created_at=slide.created_at,
+        updated_at=slide.updated_at,
+        source_lecture_id=slide.source_lecture_id
+    )
+
+
+def _lecture_response(doc: dict) -> LectureResponse:
+    lecture = Lecture(**doc)
+    return LectureResponse(
+        id=str(lecture.id),
+        title=lecture.title,
+        subject=lecture.subject,
+        grade=lecture.grade,
+        description=lecture.description,
+        requirements=lecture.requirements,
+        content=lecture.content,
+        status=lecture.status,
+        created_at=lecture.created_at,
+        updated_at=lecture.updated_at,
+        metadata=lecture.metadata
+    )
+
+
+def _pydantic_path(build, response_model):
+    field = create_response_field(name="bench", type_=response_model)
+
+    async def render(doc: dict) -> bytes:
+        # Giống FastAPI khi endpoint trả về model: validate theo response_model rồi encode
+        content = await serialize_response(field=field, response_content=build(doc), is_coroutine=True)
+        return JSONResponse(content).body
+
+    return render
+
+
+def _fast_path(serializer: DocumentSerializer):
+    async def render(doc: dict) -> bytes:
+        return FastJSONResponse(serializer(doc)).body
+
+    return render
+
+
+async def _measure(render, doc: dict, repeat: int) -> float:
+    """Thời gian CPU trung vị (ms) cho một lần render"""
+    samples = []
+    for _ in range(repeat):
+        start = time.process_time()
+        await render(doc)
+        samples.append((time.process_time() - start) * 1000)
+    return statistics.median(samples)
+
+
+async def _compare(label: str, doc: dict, slow, fast, repeat: int):
+    slow_body, fast_body = await slow(doc), await fast(doc)
+    if json.loads(slow_body) != json.loads(fast_body):
+        raise SystemExit(f"{label}: output mismatch between pydantic and fast paths")
+
+    slow_ms = await _measure(slow, doc, repeat)
+    fast_ms = await _measure(fast, doc, repeat)
+    print(
+        f"{label:<28} {len(fast_body) / 1024:>9.1f} KB"
+        f"  pydantic {slow_ms:>8.3f} ms  fast {fast_ms:>8.3f} ms"
+        f"  saved {slow_ms - fast_ms:>8.3f} ms ({slow_ms / max(fast_ms, 1e-9):.1f}x)"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slides", type=int, nargs="+", default=[20, 100, 500], help="Số slide của mỗi bộ thử")
+    parser.add_argument("--paragraphs", type=int, default=40, help="Số phần của bài giảng thử")
+    parser.add_argument("--repeat", type=int, default=200, help="Số lần đo mỗi trường hợp")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    slow_slide = _pydantic_path(_slide_response, SlideResponse)
+    fast_slide = _fast_path(DocumentSerializer(SlideResponse, Slide, nested={"slides": SlideContent}))
+    for count in args.slides:
+        await _compare(f"slide deck ({count} slides)", _slide_document(rng, count), slow_slide, fast_slide, args.repeat)
+
+    lecture = _lecture_document(rng, args.paragraphs)
+    await _compare(
+        f"lecture ({args.paragraphs} sections)", lecture,
+        _pydantic_path(_lecture_response, LectureResponse),
+        _fast_path(DocumentSerializer(LectureResponse, Lecture)),
+        args.repeat
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
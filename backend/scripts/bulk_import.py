@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Nhập file NDJSON (định dạng của GET /api/v1/bulk/export) vào MongoDB.
+
+Đọc file theo từng khối (.ndjson, .ndjson.zst, .ndjson.gz), kiểm tra từng dòng
+bằng model Pydantic và ghi theo lô bằng bulk_write. Sau mỗi lô, checkpoint
+được ghi vào <file>.progress; chạy lại với --resume để tiếp tục từ đó.
+
+Chạy từ thư mục backend:
+    python -m scripts.bulk_import backup.ndjson.zst --mode upsert --batch-size 2000
+    python -m scripts.bulk_import backup.ndjson.zst --resume
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from app.db.database import close_db_connection, connect_to_db
+from app.services.transfer_service import transfer_service, iter_lines
+
+_READ_SIZE = 1024 * 1024
+
+
+def _encoding(path: str):
+    if path.endswith(".zst"):
+        return "zstd"
+    if path.endswith(".gz"):
+        return "gzip"
+    return None
+
+
+async def _read_chunks(path: str):
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, _READ_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _load_checkpoint(progress_path: str) -> int:
+    try:
+        with open(progress_path) as f:
+            return int(json.load(f).get("checkpoint", 0))
+    except (OSError, ValueError):
+        return 0
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="File NDJSON (.ndjson, .ndjson.zst, .ndjson.gz)")
+    parser.add_argument("--mode", choices=["insert", "upsert"], default="upsert")
+    parser.add_argument("--ordered", action="store_true", help="Ghi theo thứ tự trong mỗi lô")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--resume", action="store_true", help="Tiếp tục từ checkpoint trong <file>.progress")
+    args = parser.parse_args()
+
+    progress_path = args.path + ".progress"
+    skip = _load_checkpoint(progress_path) if args.resume else 0
+    if skip:
+        print(f"Resuming after line {skip}")
+
+    started = time.perf_counter()
+
+    def on_progress(report: dict):
+        with open(progress_path, "w") as f:
+            json.dump(report, f, default=str)
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        written = report["inserted"] + report["upserted"] + report["replaced"]
+        print(
+            f"line {report['checkpoint']:>10}  written {written:>10}  duplicates {report['duplicates']:>8}"
+            f"  invalid {report['invalid']:>6}  {(report['checkpoint'] - skip) / elapsed:>9.0f} lines/s",
+            flush=True
+        )
+
+    await connect_to_db()
+    try:
+        report = await transfer_service.import_lines(
+            iter_lines(_read_chunks(args.path), _encoding(args.path)),
+            mode=args.mode,
+            ordered=args.ordered,
+            batch_size=args.batch_size,
+            skip=skip,
+            on_progress=on_progress
+        )
+    finally:
+        await close_db_connection()
+
+    for error in report["errors"]:
+        print(f"line {error['line']}: {error['error']}", file=sys.stderr)
+    print(json.dumps({key: value for key, value in report.items() if key != "errors"}, indent=2))
+    if not report["invalid"]:
+        os.remove(progress_path)
+    return 1 if report["invalid"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Đánh giá chất lượng và độ trễ của tìm kiếm hybrid.
+
+Nạp bộ tài liệu có gán nhãn trong search_eval_queries.json cùng N tài liệu
+nhiễu sinh ngẫu nhiên, sau đó đo recall@k và độ trễ (p50/p95) cho từng chế
+độ xếp hạng: lexical (BM25), vector và hybrid (RRF).
+
+Chạy từ thư mục backend:
+    python -m scripts.evaluate_search --distractors 100000 --k 5
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+from app.core.hybrid_index import HybridIndex
+
+_DATASET = os.path.join(os.path.dirname(__file__), "search_eval_queries.json")
+
+_SUBJECTS = ["Toán học", "Sinh học", "Vật lý", "Hóa học", "Lịch sử", "Địa lý", "Ngữ văn", "Tiếng Anh", "Tin học"]
+_GRADES = ["elementary", "middle", "high", "university"]
+_VOCAB = (
+    "bài học khái niệm ví dụ bài tập ôn tập kiểm tra thảo luận nhóm thực hành mục tiêu kiến thức kỹ năng "
+    "phương pháp đánh giá hoạt động trò chơi câu hỏi trắc nghiệm tự luận chương phần nội dung tổng kết "
+    "hình học đại số biểu đồ bản đồ khí hậu dân số văn bản nhân vật tác phẩm thuật toán chương trình dữ liệu "
+    "môi trường năng lượng vật chất chuyển động sinh vật hệ sinh thái nguyên tố hợp chất thí nghiệm quan sát"
+).split()
+
+
+def _distractor(rng: random.Random, i: int) -> dict:
+    words = rng.choices(_VOCAB, k=rng.randint(20, 60))
+    return {
+        "id": f"D{i}",
+        "title": " ".join(rng.choices(_VOCAB, k=rng.randint(3, 7))),
+        "subject": rng.choice(_SUBJECTS),
+        "grade": rng.choice(_GRADES),
+        "body": " ".join(words)
+    }
+
+
+def _index_document(index: HybridIndex, doc: dict):
+    index.upsert(
+        doc["id"],
+        title=doc["title"],
+        body=doc["body"],
+        meta={"title": doc["title"]},
+        subject=doc.get("subject"),
+        grade=doc.get("grade"),
+        user_id=doc.get("user_id")
+    )
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate hybrid search recall and latency")
+    parser.add_argument("--distractors", type=int, default=10000, help="Số tài liệu nhiễu")
+    parser.add_argument("--k", type=int, default=5, help="recall@k")
+    parser.add_argument("--repeat", type=int, default=5, help="Số lần lặp khi đo độ trễ")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with open(_DATASET, encoding="utf-8") as f:
+        dataset = json.load(f)
+
+    rng = random.Random(args.seed)
+    index = HybridIndex()
+
+    started = time.perf_counter()
+    for i in range(args.distractors):
+        _index_document(index, _distractor(rng, i))
+    for doc in dataset["documents"]:
+        _index_document(index, doc)
+    print(f"Indexed {len(index)} documents in {time.perf_counter() - started:.1f}s")
+
+    print(f"{'mode':<8} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode in ("lexical", "vector", "hybrid"):
+        recalls = []
+        latencies = []
+        for item in dataset["queries"]:
+            hits = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                hits = index.search(item["query"], limit=args.k, subject=item.get("subject"), mode=mode)
+                latencies.append((time.perf_counter() - t0) * 1000)
+            found = {doc_id for doc_id, _, _ in hits}
+            relevant = set(item["relevant"])
+            recalls.append(len(found & relevant) / len(relevant))
+
+        print(
+            f"{mode:<8} {statistics.mean(recalls):>10.3f} "
+            f"{_percentile(latencies, 50):>8.2f} {_percentile(latencies, 95):>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
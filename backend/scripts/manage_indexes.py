@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Quản lý index MongoDB theo danh mục trong app.db.indexes.
+
+Lệnh:
+    report   đối chiếu index thực tế: thiếu, thừa, chưa dùng ($indexStats), dư thừa
+    apply    tạo index còn thiếu; --drop-extra xóa index không khai báo
+    explain  chạy explain() cho mọi dạng truy vấn của service, thoát với mã 1 nếu có COLLSCAN
+    js       in các lệnh createIndex cho database/init.js
+
+Chạy từ thư mục backend (đọc MONGODB_URL/DATABASE_NAME từ .env):
+    python -m scripts.manage_indexes report
+    python -m scripts.manage_indexes explain
+"""
+import argparse
+import asyncio
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.core.config import settings
+from app.db.indexes import ensure_indexes, explain_query_shapes, indexes_by_collection, reconcile
+
+
+def _print_report(report: dict):
+    labels = {
+        "missing": "Thiếu (khai báo nhưng chưa tạo)",
+        "extra": "Thừa (không khai báo)",
+        "unused": "Chưa dùng từ khi mongod khởi động",
+        "redundant": "Dư thừa (là tiền tố của index khác)",
+    }
+    for key, label in labels.items():
+        entries = report[key]
+        print(f"{label}: {len(entries)}")
+        for entry in entries:
+            detail = ""
+            if "serves" in entry:
+                detail = f"  <- {entry['serves']}"
+            elif "covered_by" in entry:
+                detail = f"  <- {', '.join(entry['covered_by'])}"
+            elif entry.get("since"):
+                detail = f"  (since {entry['since']:%Y-%m-%d %H:%M})"
+            print(f"  {entry['collection']}.{entry['name']}{detail}")
+
+
+async def _report(database, args) -> int:
+    report = await reconcile(database)
+    _print_report(report)
+    return 1 if report["missing"] else 0
+
+
+async def _apply(database, args) -> int:
+    created = await ensure_indexes(database)
+    for collection, names in created.items():
+        print(f"{collection}: {', '.join(names)}")
+    if args.drop_extra:
+        report = await reconcile(database)
+        for entry in report["extra"]:
+            await database[entry["collection"]].drop_index(entry["name"])
+            print(f"dropped {entry['collection']}.{entry['name']}")
+    return 0
+
+
+async def _explain(database, args) -> int:
+    results = await explain_query_shapes(database)
+    failures = 0
+    for result in results:
+        status = "COLLSCAN" if result["collscan"] else "ok"
+        failures += result["collscan"]
+        print(f"{status:<9} {result['collection']:<18} {result['source']:<45} {' <- '.join(result['stages'])}")
+    print(f"{len(results)} query shapes, {failures} collection scans")
+    return 1 if failures else 0
+
+
+def _js(args) -> int:
+    for collection, specs in indexes_by_collection().items():
+        print(f"// {collection}")
+        for spec in specs:
+            print(f"{spec.to_js()}  // {spec.serves}")
+    return 0
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["report", "apply", "explain", "js"], nargs="?", default="report")
+    parser.add_argument("--drop-extra", action="store_true", help="apply: xóa index không có trong danh mục")
+    parser.add_argument("--url", default=settings.MONGODB_URL)
+    parser.add_argument("--database", default=settings.DATABASE_NAME)
+    args = parser.parse_args()
+
+    if args.command == "js":
+        return _js(args)
+
+    client = AsyncIOMotorClient(args.url)
+    try:
+        database = client[args.database]
+        if args.command == "explain":
+            # explain cần index đã có mới cho ra kế hoạch như môi trường thật
+            await ensure_indexes(database)
+            return await _explain(database, args)
+        if args.command == "apply":
+            return await _apply(database, args)
+        return await _report(database, args)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -7,38 +7,60 @@ db = db.getSiblingDB('edubot');
 // Create collections with initial setup
 print('Creating collections...');
 
-// Chat sessions collection
+// Index: sinh từ backend/app/db/indexes.py (python -m scripts.manage_indexes js),
+// giữ khớp với các index backend tạo khi khởi động
 db.createCollection('chat_sessions');
-db.chat_sessions.createIndex({ user_id: 1 });
-db.chat_sessions.createIndex({ created_at: -1 });
-db.chat_sessions.createIndex({ status: 1 });
+db.chat_sessions.createIndex({ user_id: 1, status: 1, updated_at: -1 });
+db.chat_sessions.createIndex({ updated_at: -1 });
+db.chat_sessions.createIndex({ archived_at: 1, updated_at: 1 });
+db.chat_sessions.createIndex({ status: 1, updated_at: 1 });
 
-// Chat messages collection
 db.createCollection('chat_messages');
 db.chat_messages.createIndex({ session_id: 1, created_at: 1 });
-db.chat_messages.createIndex({ sender: 1 });
 
-// Lectures collection
+// Tin nhắn chat đã lưu trữ (NDJSON nén theo session)
+db.createCollection('chat_archives');
+db.chat_archives.createIndex({ session_id: 1, part: 1 }, { unique: true });
+
 db.createCollection('lectures');
-db.lectures.createIndex({ user_id: 1 });
-db.lectures.createIndex({ subject: 1 });
+db.lectures.createIndex({ user_id: 1, created_at: -1 });
 db.lectures.createIndex({ created_at: -1 });
-db.lectures.createIndex({ status: 1 });
-db.lectures.createIndex({ title: "text", description: "text" });
+db.lectures.createIndex({ updated_at: 1 });
 
-// Slides collection
 db.createCollection('slides');
-db.slides.createIndex({ user_id: 1 });
-db.slides.createIndex({ subject: 1 });
+db.slides.createIndex({ user_id: 1, created_at: -1 });
 db.slides.createIndex({ created_at: -1 });
-db.slides.createIndex({ status: 1 });
-db.slides.createIndex({ source_lecture_id: 1 });
-db.slides.createIndex({ title: "text", description: "text" });
+db.slides.createIndex({ updated_at: 1 });
+
+// Version history collections (lịch sử phiên bản bài giảng/slide)
+db.createCollection('lecture_versions');
+db.lecture_versions.createIndex({ doc_id: 1, version: 1 }, { unique: true });
+db.createCollection('slide_versions');
+db.slide_versions.createIndex({ doc_id: 1, version: 1 }, { unique: true });
+
+// Courses collection (sinh cả khóa học)
+db.createCollection('courses');
+db.courses.createIndex({ user_id: 1, created_at: -1 });
+db.courses.createIndex({ created_at: -1 });
+db.courses.createIndex({ status: 1 });
+
+// Documents collection (tài liệu upload cho RAG)
+db.createCollection('documents');
+db.documents.createIndex({ user_id: 1, created_at: -1 });
+db.documents.createIndex({ created_at: -1 });
+db.documents.createIndex({ sha256: 1, status: 1 });
+db.documents.createIndex({ status: 1 });
+
+db.createCollection('document_chunks');
+db.document_chunks.createIndex({ sha256: 1, seq: 1 }, { unique: true });
+
+// Idempotency keys (kết quả các API tạo theo Idempotency-Key, tự hết hạn)
+db.createCollection('idempotency_keys');
+db.idempotency_keys.createIndex({ expires_at: 1 }, { expireAfterSeconds: 0 });
 
 // Users collection (optional for future use)
 db.createCollection('users');
 db.users.createIndex({ email: 1 }, { unique: true });
-db.users.createIndex({ created_at: -1 });
 
 // Insert sample data for testing
 print('Inserting sample data...');
@@ -167,8 +189,11 @@ print('Database initialization completed successfully!');
 print('Collections created:');
 print('- chat_sessions');
 print('- chat_messages'); 
+print('- chat_archives');
 print('- lectures');
 print('- slides');
+print('- documents');
+print('- document_chunks');
 print('- users');
 print('');
 print('Sample data inserted for testing.');
@@ -1,4 +1,5 @@
 import axios from 'axios'
+import { getClientId } from './clientId'
 
 const API_BASE_URL = '/api/v1'
 
@@ -6,7 +7,8 @@ const apiClient = axios.create({
   baseURL: API_BASE_URL,
   timeout: 30000,
   headers: {
-    'Content-Type': 'application/json'
+    'Content-Type': 'application/json',
+    'X-User-Id': getClientId()
   }
 })
 
@@ -0,0 +1,22 @@
+// Định danh trình duyệt (ứng dụng chưa có đăng nhập), gửi qua header X-User-Id
+// để backend giới hạn tần suất theo từng giáo viên thay vì chung một IP proxy
+const STORAGE_KEY = 'edubot_client_id'
+
+const generateId = () => {
+  if (window.crypto?.randomUUID) return window.crypto.randomUUID()
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+}
+
+export const getClientId = () => {
+  try {
+    let clientId = localStorage.getItem(STORAGE_KEY)
+    if (!clientId) {
+      clientId = generateId()
+      localStorage.setItem(STORAGE_KEY, clientId)
+    }
+    return clientId
+  } catch (error) {
+    // localStorage bị chặn (chế độ riêng tư): dùng id theo phiên
+    return generateId()
+  }
+}
@@ -0,0 +1,22 @@
+const API_BASE_URL = '/api/v1'
+
+const notificationService = {
+  // Nhận thay đổi trạng thái bài giảng/slide qua Server-Sent Events.
+  // onChange(event) được gọi khi có thay đổi; event.type === 'reset' nghĩa là
+  // cần tải lại toàn bộ dữ liệu. Trả về hàm hủy đăng ký.
+  subscribe: (onChange, { kinds = [], userId = null } = {}) => {
+    const params = new URLSearchParams()
+    if (kinds.length) params.set('kinds', kinds.join(','))
+    if (userId) params.set('user_id', userId)
+
+    // EventSource tự kết nối lại và gửi Last-Event-ID để nhận các event bị lỡ
+    const source = new EventSource(`${API_BASE_URL}/notifications/stream?${params}`)
+    const handle = (message) => onChange(JSON.parse(message.data))
+    source.addEventListener('change', handle)
+    source.addEventListener('reset', handle)
+
+    return () => source.close()
+  }
+}
+
+export default notificationService
@@ -1,4 +1,5 @@
 import axios from 'axios'
+import { getClientId } from './clientId'
 
 const API_BASE_URL = '/api/v1'
 
@@ -6,7 +7,8 @@ const apiClient = axios.create({
   baseURL: API_BASE_URL,
   timeout: 60000, // Longer timeout cho việc tạo slides
   headers: {
-    'Content-Type': 'application/json'
+    'Content-Type': 'application/json',
+    'X-User-Id': getClientId()
   }
 })
 
@@ -37,9 +39,17 @@ const slideService = {
   },
 
   // Xuất slide ra file PowerPoint
-  exportSlide: (slideId, format = 'pptx') => {
-    return apiClient.get(`/slides/${slideId}/export`, {
-      params: { format },
+  // Bộ slide lớn được render nền: chờ tới khi file sẵn sàng rồi mới tải
+  exportSlide: async (slideId, format = 'pptx', template = 'default') => {
+    const params = { format, template }
+    let status = await apiClient.get(`/slides/${slideId}/export`, { params })
+    while (status.data.status !== 'ready') {
+      const retryAfter = Number(status.headers['retry-after'] || 2)
+      await new Promise(resolve => setTimeout(resolve, retryAfter * 1000))
+      status = await apiClient.get(`/slides/${slideId}/export`, { params })
+    }
+    return apiClient.get(`/slides/${slideId}/download`, {
+      params,
       responseType: 'blob'
     })
   },